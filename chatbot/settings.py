@@ -183,6 +183,13 @@ REST_FRAMEWORK = {
 # CELERY_TASK_SERIALIZER = 'json'
 # CELERY_RESULT_SERIALIZER = 'json'
 # CELERY_TIMEZONE = 'Asia/Tehran'
+# ارزیابی زمان‌بندی‌شده هشدارها (بدون Celery: python manage.py evaluate_alerts در cron)
+# CELERY_BEAT_SCHEDULE = {
+#     'evaluate-financial-alerts': {
+#         'task': 'financial_system.tasks.evaluate_alerts',
+#         'schedule': 3600.0,
+#     },
+# }
 
 # settings.py
 
@@ -3,6 +3,7 @@ import logging
 from django.db import transaction
 from financial_system.models.document_models import DocumentHeader, DocumentItem
 from financial_system.models.coding_models import ChartOfAccounts
+from financial_system.services.report_cache import ledger_batch, mark_ledger_changed
 from ..models import FinancialFile, ImportJob
 from users.models import Company, FinancialPeriod
 
@@ -18,7 +19,7 @@ class DataCleanupService:
     def delete_imported_data(self) -> dict:
         """حذف داده‌های ایمپورت شده قبلی برای شرکت و دوره مشخص"""
         try:
-            with transaction.atomic():
+            with transaction.atomic(), ledger_batch():
                 # شمارش داده‌های قبل از حذف
                 document_count = DocumentHeader.objects.filter(
                     company=self.company,
@@ -41,6 +42,7 @@ class DataCleanupService:
                     company=self.company,
                     period=self.period
                 ).delete()[0]
+                mark_ledger_changed(self.company.id, self.period.id)
                 
                 logger.info(f"داده‌های ایمپورت شده حذف شدند: {deleted_documents} سند، {deleted_items} آرتیکل")
                 
@@ -90,7 +92,7 @@ class DataCleanupService:
     def delete_all_data(self) -> dict:
         """حذف کامل تمام داده‌های چهار جدول اصلی"""
         try:
-            with transaction.atomic():
+            with transaction.atomic(), ledger_batch():
                 # شمارش داده‌های قبل از حذف
                 stats_before = self._get_all_data_stats()
                 
@@ -106,6 +108,8 @@ class DataCleanupService:
                     period=self.period
                 ).delete()[0]
                 
+                mark_ledger_changed(self.company.id, self.period.id)
+                
                 # 3. حذف فایل‌های ایمپورت شده
                 deleted_files = FinancialFile.objects.filter(
                     company=self.company,
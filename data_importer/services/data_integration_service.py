@@ -7,6 +7,9 @@ from django.utils import timezone
 from financial_system.models.document_models import DocumentHeader, DocumentItem
 from financial_system.models.coding_models import ChartOfAccounts
 from financial_system.services.balance_control_service import BalanceControlService
+from financial_system.services.live_updates import publish
+from financial_system.services.report_cache import get_ledger_version, ledger_batch, mark_ledger_changed
+from financial_system.services.risk_scoring import RiskScoringService
 from .data_cleanup_service import DataCleanupService
 from ..models import FinancialFile, ImportJob
 
@@ -393,6 +396,7 @@ class DataIntegrationService:
                             # اگر delete_existing_data=True باشد، سند تکراری حذف می‌شود
                             logger.info(f"🗑️ حذف سند تکراری: {document_number}")
                             existing_document.delete()
+                            mark_ledger_changed(self.company.id, self.period.id)
                             logger.info(f"✅ سند تکراری حذف شد: {document_number}")
                             
                             # ایجاد سربرگ سند جدید
@@ -598,11 +602,23 @@ class DataIntegrationService:
             
             # مرحله 4: ایجاد اسناد
             self.update_job_progress(75, 'ایجاد اسناد مالی')
-            result = self.create_documents_from_dataframe(df, delete_existing_data=delete_existing_data)
+            # یک افزایش نسخه دفتر برای کل ورود اطلاعات (به جای یک بار برای هر آرتیکل)
+            previous_version = get_ledger_version(self.company.id, self.period.id)
+            with ledger_batch():
+                result = self.create_documents_from_dataframe(df, delete_existing_data=delete_existing_data)
+            
+            # مرحله 5: امتیازدهی ریسک اسناد جدید
+            self.update_job_progress(90, 'امتیازدهی ریسک اسناد')
+            self._score_risk(previous_version, rebuild=delete_existing_data)
             
             # مرحله 4: تکمیل
             self.update_job_progress(100, 'تکمیل عملیات')
             self.import_job.complete(result)
+            publish(self.company.id, self.period.id, 'import_completed', {
+                'document_count': result['document_count'],
+                'item_count': result['item_count'],
+                'status': result['status']
+            })
             
             # علامت‌گذاری فایل به عنوان وارد شده
             self.financial_file.mark_as_imported({
@@ -630,6 +646,14 @@ class DataIntegrationService:
                 self.import_job.fail(str(e))
             raise
     
+    def _score_risk(self, previous_version: int, rebuild: bool = False):
+        """به‌روزرسانی افزایشی جدول ریسک؛ خطای امتیازدهی ورود اطلاعات را متوقف نمی‌کند"""
+        try:
+            scoring = RiskScoringService(self.company, self.period).score_import(previous_version, rebuild=rebuild)
+            logger.info(f"امتیازدهی ریسک: {scoring['scored_documents']} سند")
+        except Exception as e:
+            logger.error(f"خطا در امتیازدهی ریسک اسناد: {e}")
+    
     def create_complete_chart_of_accounts_hierarchy(self, df: pd.DataFrame) -> dict:
         """ایجاد سلسله مراتب کامل حساب‌ها از تمام داده‌های اکسل"""
         results = {
@@ -2,6 +2,7 @@
 from django.db import transaction
 from django.db.models import Q
 from financial_system.models import DocumentHeader, DocumentItem, ChartOfAccounts
+from financial_system.services.report_cache import ledger_batch, mark_ledger_changed
 from typing import List, Dict, Set
 import logging
 from datetime import datetime
@@ -88,13 +89,13 @@ class RollbackManager:
                 
                 rollback_stats['documents_rolled_back'] = imported_documents.count()
                 
-                # حذف آرتیکل‌های مرتبط
-                for doc in imported_documents:
-                    items_count = DocumentItem.objects.filter(document=doc).count()
-                    DocumentItem.objects.filter(document=doc).delete()
-                    rollback_stats['items_rolled_back'] += items_count
-                
-                imported_documents.delete()
+                # حذف آرتیکل‌های مرتبط با یک DELETE
+                imported_items = DocumentItem.objects.filter(document__in=imported_documents)
+                rollback_stats['items_rolled_back'] = imported_items.count()
+                with ledger_batch():
+                    imported_items.delete()
+                    imported_documents.delete()
+                    mark_ledger_changed(self.company_id, self.period_id)
             
             # حذف حساب‌های ایجاد شده در این سشن
             if self.backup_data['created_accounts']:
@@ -107,7 +108,9 @@ class RollbackManager:
                 created_accounts.delete()
             
             # بازگرداندن داده‌های پشتیبان‌گیری شده
-            self._restore_backup_data()
+            with ledger_batch():
+                self._restore_backup_data()
+                mark_ledger_changed(self.company_id, self.period_id)
             
             self.logger.info(f"Rollback انجام شد: {reason}. آمار: {rollback_stats}")
             
@@ -1,6 +1,6 @@
 # financial_system/admin.py
 from django.contrib import admin
-from .models import Company, FinancialPeriod, ChartOfAccounts, DocumentHeader, DocumentItem
+from .models import Company, FinancialPeriod, ChartOfAccounts, DocumentHeader, DocumentItem, StructuringRule
 
 @admin.register(Company)
 class CompanyAdmin(admin.ModelAdmin):
@@ -21,4 +21,9 @@ class DocumentItemInline(admin.TabularInline):
 class DocumentHeaderAdmin(admin.ModelAdmin):
     list_display = ['document_number', 'document_type', 'document_date', 'company', 'total_debit', 'total_credit']
     list_filter = ['document_type', 'company', 'document_date']
-    inlines = [DocumentItemInline]
\ No newline at end of file
+    inlines = [DocumentItemInline]
+
+@admin.register(StructuringRule)
+class StructuringRuleAdmin(admin.ModelAdmin):
+    list_display = ['company', 'account_prefix', 'threshold_amount', 'window_days', 'min_items', 'is_active']
+    list_filter = ['is_active', 'company']
\ No newline at end of file
@@ -12,11 +12,15 @@ import logging
 import json
 import time
 from typing import Dict, List, Any, Optional
-from django.core.cache import cache
 from django.db.models import Sum, Count, Avg, Q
 from django.utils import timezone
 from datetime import datetime, timedelta
-import math
+from decimal import Decimal
+
+from financial_system.services.account_baselines import AccountBaselineService, baseline_versions
+from financial_system.services.account_hierarchy import MINOR_UNITS
+from financial_system.services.amount_sketch import MAD_SCALE, AmountSketch
+from financial_system.services.report_cache import cached_report
 
 logger = logging.getLogger(__name__)
 
@@ -43,33 +47,15 @@ class DashboardService:
             دیکشنری با تمام داده‌های داشبورد
         """
         try:
-            # استفاده از کش برای بهبود عملکرد
-            cache_key = f"advanced_dashboard_{company_id}_{period_id}_{user_id}"
-            cached_data = cache.get(cache_key)
-            
-            if cached_data:
-                logger.debug(f"داده‌های داشبورد از کش بازیابی شد: {cache_key}")
-                return cached_data
-            
-            # جمع‌آوری داده‌های مختلف داشبورد
-            dashboard_data = {
-                'overview': cls.get_overview_stats(company_id, period_id),
-                'financial_trends': cls.get_financial_trends(company_id, period_id),
-                'account_analysis': cls.get_account_analysis(company_id, period_id),
-                'risk_indicators': cls.get_risk_indicators(company_id, period_id),
-                'performance_metrics': cls.get_performance_metrics(company_id, period_id),
-                'ai_insights': cls.get_ai_insights(company_id, period_id),
-                'widgets': cls.get_available_widgets(user_id),
-                'metadata': {
-                    'company_id': company_id,
-                    'period_id': period_id,
-                    'generated_at': timezone.now().isoformat(),
-                    'user_id': user_id
-                }
-            }
-            
-            # ذخیره در کش به مدت 5 دقیقه
-            cache.set(cache_key, dashboard_data, 300)
+            # داده‌های مالی زیر نسخه دفتر کش و بین کاربران شرکت مشترک است؛ فقط ویجت‌ها شخصی‌اند.
+            # ناهنجاری‌های خط مبنا به دوره‌های پیشین وابسته‌اند و نسخه دفتر آن‌ها هم جزء کلید است.
+            dashboard_data = dict(cached_report(
+                'advanced_dashboard', company_id, period_id,
+                lambda: cls._compute_dashboard_data(company_id, period_id),
+                params={'baseline_versions': baseline_versions(company_id, period_id)}
+            ))
+            dashboard_data['widgets'] = cls.get_available_widgets(user_id)
+            dashboard_data['metadata'] = {**dashboard_data['metadata'], 'user_id': user_id}
             
             return dashboard_data
             
@@ -77,6 +63,23 @@ class DashboardService:
             logger.error(f"خطا در دریافت داده‌های داشبورد: {e}")
             return {'error': str(e)}
     
+    @classmethod
+    def _compute_dashboard_data(cls, company_id: int, period_id: int) -> Dict[str, Any]:
+        """جمع‌آوری داده‌های مالی داشبورد (مستقل از کاربر)"""
+        return {
+            'overview': cls.get_overview_stats(company_id, period_id),
+            'financial_trends': cls.get_financial_trends(company_id, period_id),
+            'account_analysis': cls.get_account_analysis(company_id, period_id),
+            'risk_indicators': cls.get_risk_indicators(company_id, period_id),
+            'performance_metrics': cls.get_performance_metrics(company_id, period_id),
+            'ai_insights': cls.get_ai_insights(company_id, period_id),
+            'metadata': {
+                'company_id': company_id,
+                'period_id': period_id,
+                'generated_at': timezone.now().isoformat()
+            }
+        }
+    
     @classmethod
     def get_overview_stats(cls, company_id: int, period_id: int) -> Dict[str, Any]:
         """دریافت آمار کلی مالی"""
@@ -366,12 +369,16 @@ class DashboardService:
             # تحلیل تعادل مالی
             balance_analysis = cls._analyze_balance(company_id, period_id)
             
+            # مقایسه حساب‌ها با خط مبنای دوره‌های پیشین
+            baseline_anomalies = cls._detect_baseline_anomalies(company_id, period_id)
+            
             return {
                 'account_concentration': account_concentration,
                 'anomalies': anomalies,
                 'balance_analysis': balance_analysis,
+                'baseline_anomalies': baseline_anomalies,
                 'overall_risk_level': cls._calculate_overall_risk(
-                    account_concentration, anomalies, balance_analysis
+                    account_concentration, anomalies, balance_analysis, baseline_anomalies
                 )
             }
             
@@ -385,20 +392,25 @@ class DashboardService:
         try:
             from financial_system.models.document_models import DocumentItem
             
-            # محاسبه سهم هر حساب از کل حجم معاملات
-            account_volumes = DocumentItem.objects.filter(
+            items = DocumentItem.objects.filter(
                 document__company_id=company_id, document__period_id=period_id
-            ).values('account__code', 'account__name').annotate(
-                volume=Sum('debit') + Sum('credit')
-            ).order_by('-volume')
+            )
             
-            total_volume = sum(item['volume'] or 0 for item in account_volumes)
+            # حجم کل و ۵ حساب برتر هر دو در پایگاه داده (ORDER BY ... LIMIT)
+            totals = items.aggregate(debit=Sum('debit'), credit=Sum('credit'))
+            total_volume = (totals['debit'] or 0) + (totals['credit'] or 0)
             
             if total_volume == 0:
                 return {'risk_level': 'low', 'concentration_ratio': 0}
             
+            account_volumes = list(
+                items.values('account__code', 'account__name').annotate(
+                    volume=Sum('debit') + Sum('credit')
+                ).order_by('-volume')[:5]
+            )
+            
             # محاسبه نسبت تمرکز (سهم 5 حساب برتر)
-            top_5_volume = sum(item['volume'] or 0 for item in account_volumes[:5])
+            top_5_volume = sum(item['volume'] or 0 for item in account_volumes)
             concentration_ratio = (top_5_volume / total_volume) * 100
             
             # تعیین سطح ریسک
@@ -419,7 +431,7 @@ class DashboardService:
                         'volume': item['volume'] or 0,
                         'percentage': (item['volume'] or 0) / total_volume * 100
                     }
-                    for item in account_volumes[:5]
+                    for item in account_volumes
                 ]
             }
             
@@ -433,30 +445,36 @@ class DashboardService:
         try:
             from financial_system.models.document_models import DocumentItem
             
-            # تحلیل اندازه معاملات
-            transaction_sizes = DocumentItem.objects.filter(
+            items = DocumentItem.objects.filter(
                 document__company_id=company_id, document__period_id=period_id
-            ).values_list('debit', 'credit')
+            )
             
-            amounts = []
-            for debit, credit in transaction_sizes:
-                if debit:
-                    amounts.append(debit)
-                if credit:
-                    amounts.append(credit)
+            # یک پیمایش گروه‌بندی‌شده: تعداد، جمع و جمع مربعات دقیق به همراه خلاصه چندک‌ها
+            sketch = AmountSketch.from_queryset(items, ('debit', 'credit'))
             
-            if not amounts:
+            if not sketch.count:
                 return {'anomaly_count': 0, 'risk_level': 'low'}
             
-            # محاسبه آمارهای پایه
-            mean = sum(amounts) / len(amounts)
-            std_dev = math.sqrt(sum((x - mean) ** 2 for x in amounts) / len(amounts))
+            # محاسبه آمارهای پایه (ریال)
+            mean = sketch.mean() / MINOR_UNITS
+            std_dev = sketch.std() / MINOR_UNITS
             
-            # تشخیص ناهنجاری‌ها (3 انحراف معیار)
+            # تشخیص ناهنجاری‌ها (3 انحراف معیار) با شمارش دقیق در پایگاه داده
             threshold = mean + 3 * std_dev
-            anomalies = [x for x in amounts if x > threshold]
+            limit = Decimal(str(round(threshold, 2)))
+            exceeded = items.aggregate(
+                debit=Count('id', filter=Q(debit__gt=limit)),
+                credit=Count('id', filter=Q(credit__gt=limit))
+            )
+            anomaly_count = exceeded['debit'] + exceeded['credit']
+            
+            anomaly_ratio = anomaly_count / sketch.count * 100
             
-            anomaly_ratio = len(anomalies) / len(amounts) * 100
+            # آمار مقاوم: میانه، MAD و صدک‌ها از خلاصه چندک‌ها
+            median = sketch.quantile(0.5) / MINOR_UNITS
+            mad = sketch.median_absolute_deviation() / MINOR_UNITS
+            robust_threshold = median + 3 * MAD_SCALE * mad
+            percentiles = sketch.quantiles([0.5, 0.9, 0.95, 0.99]) / MINOR_UNITS
             
             # تعیین سطح ریسک
             if anomaly_ratio > 5:
@@ -467,17 +485,60 @@ class DashboardService:
                 risk_level = 'low'
             
             return {
-                'anomaly_count': len(anomalies),
+                'anomaly_count': anomaly_count,
                 'anomaly_ratio': anomaly_ratio,
                 'risk_level': risk_level,
                 'threshold': threshold,
-                'mean_amount': mean
+                'mean_amount': mean,
+                'std_dev': std_dev,
+                'median_amount': median,
+                'mad': mad,
+                'robust_threshold': robust_threshold,
+                'robust_anomaly_count': round(sketch.count_above(robust_threshold * MINOR_UNITS)),
+                'percentiles': dict(zip(['p50', 'p90', 'p95', 'p99'], percentiles.tolist()))
             }
             
         except Exception as e:
             logger.error(f"خطا در تشخیص ناهنجاری‌ها: {e}")
             return {'anomaly_count': 0, 'risk_level': 'low'}
     
+    @classmethod
+    def _detect_baseline_anomalies(cls, company_id: int, period_id: int) -> Dict[str, Any]:
+        """ناهنجاری حساب‌ها در برابر خط مبنای بین‌دوره‌ای (بدون دوره پیشین: سطح ریسک نامشخص)"""
+        try:
+            from users.models import FinancialPeriod
+            
+            period = FinancialPeriod.objects.select_related('company').get(pk=period_id, company_id=company_id)
+            scores = AccountBaselineService(period.company, period).score()
+            
+            if not scores['baseline_periods']:
+                return {'risk_level': 'unknown', 'baseline_periods': 0}
+            
+            outlier_accounts = len(scores['amount_outliers']['accounts'])
+            flagged = outlier_accounts + len(scores['volume_anomalies']) + len(scores['timing_shifts'])
+            
+            # تعیین سطح ریسک
+            if flagged > 10:
+                risk_level = 'high'
+            elif flagged > 3:
+                risk_level = 'medium'
+            else:
+                risk_level = 'low'
+            
+            return {
+                'risk_level': risk_level,
+                'baseline_periods': len(scores['baseline_periods']),
+                'baseline_accounts': scores['baseline_accounts'],
+                'amount_outlier_count': scores['amount_outliers']['count'],
+                'outlier_accounts': scores['amount_outliers']['accounts'],
+                'volume_anomalies': scores['volume_anomalies'],
+                'timing_shifts': scores['timing_shifts']
+            }
+            
+        except Exception as e:
+            logger.error(f"خطا در مقایسه با خط مبنای حساب‌ها: {e}")
+            return {'risk_level': 'unknown', 'baseline_periods': 0}
+    
     @classmethod
     def _analyze_balance(cls, company_id: int, period_id: int) -> Dict[str, Any]:
         """تحلیل تعادل مالی"""
@@ -516,8 +577,9 @@ class DashboardService:
             return {'risk_level': 'unknown', 'imbalance_ratio': 0}
     
     @classmethod
-    def _calculate_overall_risk(cls, concentration: Dict, anomalies: Dict, balance: Dict) -> str:
-        """محاسبه سطح ریسک کلی"""
+    def _calculate_overall_risk(cls, concentration: Dict, anomalies: Dict, balance: Dict,
+                                baseline: Optional[Dict] = None) -> str:
+        """محاسبه سطح ریسک کلی (خط مبنا فقط وقتی دوره پیشین وجود دارد در میانگین شرکت می‌کند)"""
         risk_scores = {
             'high': 3,
             'medium': 2,
@@ -525,13 +587,17 @@ class DashboardService:
             'unknown': 2
         }
         
-        total_score = (
-            risk_scores.get(concentration.get('risk_level', 'unknown'), 2) +
-            risk_scores.get(anomalies.get('risk_level', 'unknown'), 2) +
-            risk_scores.get(balance.get('risk_level', 'unknown'), 2)
-        )
+        levels = [
+            concentration.get('risk_level', 'unknown'),
+            anomalies.get('risk_level', 'unknown'),
+            balance.get('risk_level', 'unknown')
+        ]
+        if baseline and baseline.get('risk_level', 'unknown') != 'unknown':
+            levels.append(baseline['risk_level'])
+        
+        total_score = sum(risk_scores.get(level, 2) for level in levels)
         
-        avg_score = total_score / 3
+        avg_score = total_score / len(levels)
         
         if avg_score >= 2.5:
             return 'high'
@@ -715,7 +781,7 @@ class RealTimeDataService:
             return {
                 'new_documents': cls._get_recent_documents_count(company_id, period_id),
                 'pending_tasks': cls._get_pending_tasks_count(company_id),
-                'system_alerts': cls._get_system_alerts(),
+                'system_alerts': cls._get_system_alerts(company_id, period_id),
                 'last_update': timezone.now().isoformat()
             }
         except Exception as e:
@@ -744,17 +810,28 @@ class RealTimeDataService:
         return 0
     
     @classmethod
-    def _get_system_alerts(cls) -> List[Dict[str, Any]]:
-        """دریافت هشدارهای سیستم"""
-        return [
-            {
-                'id': 1,
-                'title': 'بررسی تعادل حساب‌ها',
-                'message': 'بررسی مانده حساب‌های کل توصیه می‌شود',
-                'level': 'info',
-                'timestamp': timezone.now().isoformat()
-            }
-        ]
+    def _get_system_alerts(cls, company_id: int, period_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+        """هشدارهای پیش‌محاسبه‌شده آخرین ارزیابی زمان‌بندی‌شده (بدون اجرای تحلیل)"""
+        try:
+            from financial_system.services.history_store import latest_alert_run
+            
+            entry = latest_alert_run(company_id, period_id)
+            if entry is None:
+                return []
+            levels = {'بسیار بالا': 'critical', 'بالا': 'warning', 'متوسط': 'info', 'پایین': 'info'}
+            return [
+                {
+                    'id': record.id,
+                    'title': record.title,
+                    'message': record.details.get('description', ''),
+                    'level': levels.get(record.severity, 'info'),
+                    'timestamp': record.created_at.isoformat()
+                }
+                for record in entry.alerts.order_by('-priority_score', 'id')[:limit]
+            ]
+        except Exception as e:
+            logger.error(f"خطا در دریافت هشدارهای سیستم: {e}")
+            return []
 
 
 # سرویس‌های کمکی برای استفاده آسان
@@ -15,6 +15,8 @@ from django.views.generic import TemplateView
 from django.utils import timezone
 import json
 
+from financial_system.services.account_baselines import baseline_versions
+from financial_system.services.report_cache import ledger_etag
 from .services import DashboardService, RealTimeDataService
 
 logger = logging.getLogger(__name__)
@@ -64,6 +66,7 @@ class AdvancedDashboardView(TemplateView):
 
 
 @login_required
+@ledger_etag('advanced_dashboard', per_user=True, extra_params=baseline_versions)
 def dashboard_data_api(request):
     """API برای دریافت داده‌های داشبورد"""
     if request.method != 'GET':
@@ -119,6 +122,7 @@ def realtime_updates_api(request):
 
 
 @login_required
+@ledger_etag('dashboard_widget', extra_params=baseline_versions)
 def widget_data_api(request, widget_id):
     """API برای دریافت داده‌های یک ویجت خاص"""
     if request.method != 'GET':
@@ -21,6 +21,7 @@ from financial_system.services.intelligent_recommendations import IntelligentRec
 from financial_system.services.liquidity_ratios import LiquidityRatioAnalyzer, LiquidityRatioTool
 from financial_system.services.leverage_ratios import LeverageRatioAnalyzer, LeverageRatioTool
 from financial_system.services.profitability_ratios import ProfitabilityRatioAnalyzer, ProfitabilityRatioTool
+from financial_system.services.ratio_engine import period_financials
 
 from users.models import Company, FinancialPeriod, FinancialFile, Document
 
@@ -539,7 +540,7 @@ class FinancialQAAgent:
             company = Company.objects.get(id=company_id)
             period = FinancialPeriod.objects.get(id=period_id)
             
-            analyzer = LiquidityRatioAnalyzer(company, period)
+            analyzer = LiquidityRatioAnalyzer(company, period, financials=period_financials(company, period))
             result = analyzer.calculate_all_liquidity_ratios()
             
             return {
@@ -581,7 +582,7 @@ class FinancialQAAgent:
             company = Company.objects.get(id=company_id)
             period = FinancialPeriod.objects.get(id=period_id)
             
-            analyzer = LeverageRatioAnalyzer(company, period)
+            analyzer = LeverageRatioAnalyzer(company, period, financials=period_financials(company, period))
             result = analyzer.calculate_all_leverage_ratios()
             
             return {
@@ -623,7 +624,7 @@ class FinancialQAAgent:
             company = Company.objects.get(id=company_id)
             period = FinancialPeriod.objects.get(id=period_id)
             
-            analyzer = ProfitabilityRatioAnalyzer(company, period)
+            analyzer = ProfitabilityRatioAnalyzer(company, period, financials=period_financials(company, period))
             result = analyzer.calculate_all_profitability_ratios()
             
             return {
@@ -1,14 +1,18 @@
 # financial_system/analyzers/balance_sheet_analyzer.py
 from ..core.langchain_tools import register_financial_tool
-from django.db.models import Sum, Q
-from financial_system.models import DocumentItem, ChartOfAccounts
+from django.db.models import Sum
+from financial_system.models import DocumentItem
+from financial_system.services.account_hierarchy import to_minor_units, from_minor_units, prefix_mask
 from decimal import Decimal
 from typing import Dict, Any
+import numpy as np
 
 class BalanceSheetAnalyzer:
     def __init__(self, company_id: int, period_id: int):
         self.company_id = company_id
         self.period_id = period_id
+        self._codes = np.array([], dtype=str)
+        self._balances = np.array([], dtype=np.int64)
     
     @register_financial_tool(
         name="analyze_balance_sheet",
@@ -30,6 +34,9 @@ class BalanceSheetAnalyzer:
         self.period_id = period_id
         
         try:
+            # یک کوئری برای کل گزارش
+            self._load_balances()
+            
             # محاسبه کل دارایی‌ها
             total_assets = self._calculate_total_assets()
             
@@ -53,54 +60,44 @@ class BalanceSheetAnalyzer:
         except Exception as e:
             return f"خطا در تحلیل ترازنامه: {str(e)}"
     
+    def _load_balances(self):
+        """بارگذاری مانده تمام حساب‌ها با یک کوئری گروه‌بندی‌شده
+
+        مانده هر حساب با علامت طبیعی آن نگهداری می‌شود (دارایی: بدهکار - بستانکار،
+        سایر: بستانکار - بدهکار) و تمام جمع‌ها و نسبت‌ها از همین بردار محاسبه می‌شوند.
+        """
+        rows = list(
+            DocumentItem.objects.filter(
+                document__company_id=self.company_id,
+                document__period_id=self.period_id,
+                account__is_active=True
+            ).values('account_id', 'account__code').annotate(
+                total_debit=Sum('debit'),
+                total_credit=Sum('credit')
+            ).order_by()
+        )
+
+        self._codes = np.array([row['account__code'] for row in rows], dtype=str)
+        debit = to_minor_units([row['total_debit'] for row in rows])
+        credit = to_minor_units([row['total_credit'] for row in rows])
+        is_asset = prefix_mask(self._codes, ('1', '2'))
+        self._balances = np.where(is_asset, debit - credit, credit - debit)
+
     def _calculate_total_assets(self) -> Decimal:
         """محاسبه کل دارایی‌ها"""
         asset_codes = ['1', '2']  # دارایی‌های جاری و ثابت
-        total = Decimal('0')
-        
-        for code in asset_codes:
-            accounts = ChartOfAccounts.objects.filter(
-                code__startswith=code,
-                is_active=True
-            )
-            for account in accounts:
-                balance = self._get_account_balance(account.code)
-                if balance > 0:  # فقط مانده‌های مثبت دارایی
-                    total += balance
-        
-        return total
-    
+        balances = self._balances[prefix_mask(self._codes, asset_codes)]
+        return from_minor_units(balances[balances > 0].sum())  # فقط مانده‌های مثبت دارایی
+
     def _calculate_total_liabilities(self) -> Decimal:
         """محاسبه کل بدهی‌ها"""
         liability_codes = ['3']  # بدهی‌های جاری و بلندمدت
-        total = Decimal('0')
-        
-        for code in liability_codes:
-            accounts = ChartOfAccounts.objects.filter(
-                code__startswith=code,
-                is_active=True
-            )
-            for account in accounts:
-                balance = abs(self._get_account_balance(account.code))
-                total += balance
-        
-        return total
-    
+        return from_minor_units(np.abs(self._balances[prefix_mask(self._codes, liability_codes)]).sum())
+
     def _calculate_total_equity(self) -> Decimal:
         """محاسبه کل حقوق صاحبان سهام"""
         equity_codes = ['5']  # حقوق صاحبان سهام
-        total = Decimal('0')
-        
-        for code in equity_codes:
-            accounts = ChartOfAccounts.objects.filter(
-                code__startswith=code,
-                is_active=True
-            )
-            for account in accounts:
-                balance = self._get_account_balance(account.code)
-                total += balance
-        
-        return total
+        return from_minor_units(self._balances[prefix_mask(self._codes, equity_codes)].sum())
     
     def _check_balance_sheet_equality(self, total_assets: Decimal, total_liabilities: Decimal, total_equity: Decimal) -> Dict[str, Any]:
         """کنترل معادله ترازنامه"""
@@ -136,26 +133,6 @@ class BalanceSheetAnalyzer:
             }
         }
     
-    def _get_account_balance(self, account_code: str) -> Decimal:
-        """دریافت مانده حساب"""
-        transactions = DocumentItem.objects.filter(
-            document__company_id=self.company_id,
-            document__period_id=self.period_id,
-            account__code=account_code
-        ).aggregate(
-            total_debit=Sum('debit'),
-            total_credit=Sum('credit')
-        )
-        
-        debit = transactions['total_debit'] or Decimal('0')
-        credit = transactions['total_credit'] or Decimal('0')
-        
-        # تشخیص ماهیت حساب بر اساس کد
-        if account_code.startswith(('1', '2')):  # دارایی
-            return debit - credit
-        else:  # بدهی و حقوق صاحبان سهام
-            return credit - debit
-    
     def _calculate_current_assets_ratio(self) -> Decimal:
         """محاسبه نسبت دارایی‌های جاری"""
         current_assets = self._calculate_category_total(['11', '12', '13'])
@@ -186,14 +163,7 @@ class BalanceSheetAnalyzer:
     
     def _calculate_category_total(self, codes: list) -> Decimal:
         """محاسبه جمع یک دسته از حساب‌ها"""
-        total = Decimal('0')
-        for code in codes:
-            accounts = ChartOfAccounts.objects.filter(
-                code__startswith=code,            is_active=True     )
-            for account in accounts:
-                balance = abs(self._get_account_balance(account.code))
-                total += balance
-        return total
+        return from_minor_units(np.abs(self._balances[prefix_mask(self._codes, codes)]).sum())
     
     def _format_balance_sheet_report(self, total_assets, total_liabilities, total_equity, balance_check, structure_analysis) -> str:
         """قالب‌بندی گزارش ترازنامه"""
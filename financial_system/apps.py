@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FinancialSystemConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "financial_system"
+
+    def ready(self):
+        """ثبت سیگنال‌های نسخه دفتر"""
+        from . import signals  # noqa
@@ -97,9 +97,10 @@ class FinancialHelpSystem:
             'fraud_detection_tools': [
                 ('threshold_hit_detection', 'شناسایی اسناد با مبالغ برابر یا بیشتر از سقف مجاز انتقال وجه', 'تشخیص تقلب'),
                 ('round_number_bias_detection', 'شناسایی اسناد با مبالغی که رقم آخرشان صفر است (Round-Number Bias)', 'تشخیص تقلب'),
-                ('end_of_period_rush_detection', 'شناسایی اسنادی که در روزهای پایانی دوره ثبت شده‌اند (End-of-Period Rush)', 'تشخیص تقلب'),
+                ('end_of_period_rush_detection', 'شناسایی تمرکز ثبت اسناد در روزهای پایانی دوره و ماه‌ها، جمعه‌ها و تعطیلات رسمی (End-of-Period Rush)', 'تشخیص تقلب'),
                 ('duplicate_document_detection', 'شناسایی اسناد تکراری در یک دوره مالی', 'تشخیص تقلب'),
-                ('description_similarity_detection', 'شناسایی اسناد با توصیف‌های مشابه (تشابه بیش از 90%)', 'تشخیص تقلب')
+                ('description_similarity_detection', 'شناسایی اسناد با توصیف‌های مشابه (تشابه بیش از 90%)', 'تشخیص تقلب'),
+                ('fraud_risk_ranking', 'رتبه‌بندی اسناد و حساب‌ها بر اساس امتیاز ریسک تقلب محاسبه‌شده هنگام ورود اطلاعات', 'تشخیص تقلب')
             ],
             'integrity_compliance_tools': [
                 ('integrity_check', 'بررسی یکپارچگی داده‌های مالی و انطباق با استانداردها', 'انطباق و یکپارچگی'),
@@ -0,0 +1,21 @@
+# financial_system/management/commands/evaluate_alerts.py
+from django.core.management.base import BaseCommand, CommandError
+
+from financial_system.services.financial_alert_system import FinancialAlertSystem
+
+
+class Command(BaseCommand):
+    help = 'ارزیابی گروهی هشدارهای مالی دوره‌های فعال و ذخیره در جدول تاریخچه (برای اجرای زمان‌بندی‌شده)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append', dest='company_ids', help='شناسه شرکت (قابل تکرار)')
+        parser.add_argument('--force', action='store_true', help='ارزیابی دوره‌های بدون تغییر دفتر')
+
+    def handle(self, *args, **options):
+        result = FinancialAlertSystem().evaluate_all(options['company_ids'], force=options['force'])
+        if not result['success']:
+            raise CommandError(result['error'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['evaluated_periods']} دوره ارزیابی شد، {result['skipped_periods']} دوره بدون تغییر، "
+            f"{len(result['failed_periods'])} خطا، {result['total_alerts']} هشدار"
+        ))
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:34
+
+from django.db import migrations, models
+
+
+def build_account_paths(apps, schema_editor):
+    ChartOfAccounts = apps.get_model("financial_system", "ChartOfAccounts")
+    rows = list(ChartOfAccounts.objects.values_list("id", "parent_id"))
+    children = {}
+    for account_id, parent_id in rows:
+        children.setdefault(parent_id, []).append(account_id)
+
+    accounts = []
+    stack = [(account_id, "/") for account_id in children.get(None, [])]
+    while stack:
+        account_id, parent_path = stack.pop()
+        path = f"{parent_path}{account_id}/"
+        accounts.append(ChartOfAccounts(id=account_id, path=path, depth=path.count("/") - 2))
+        stack.extend((child_id, path) for child_id in children.get(account_id, []))
+
+    ChartOfAccounts.objects.bulk_update(accounts, ["path", "depth"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("financial_system", "0005_change_document_date_to_charfield"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chartofaccounts",
+            name="depth",
+            field=models.PositiveSmallIntegerField(default=0, verbose_name="عمق"),
+        ),
+        migrations.AddField(
+            model_name="chartofaccounts",
+            name="path",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default="",
+                max_length=255,
+                verbose_name="مسیر سلسله مراتب",
+            ),
+        ),
+        migrations.RunPython(build_account_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:37
+
+from django.db import migrations, models
+
+from financial_system.models.document_models import make_date_key
+
+
+def fill_date_keys(apps, schema_editor):
+    DocumentHeader = apps.get_model("financial_system", "DocumentHeader")
+    headers = []
+    for header_id, document_date in DocumentHeader.objects.values_list("id", "document_date").iterator():
+        headers.append(DocumentHeader(id=header_id, date_key=make_date_key(document_date)))
+        if len(headers) >= 1000:
+            DocumentHeader.objects.bulk_update(headers, ["date_key"])
+            headers = []
+    if headers:
+        DocumentHeader.objects.bulk_update(headers, ["date_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("financial_system", "0006_chartofaccounts_path"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentheader",
+            name="date_key",
+            field=models.IntegerField(db_index=True, default=0, verbose_name="کلید تاریخ"),
+        ),
+        migrations.AddIndex(
+            model_name="documentheader",
+            index=models.Index(
+                fields=["company", "period", "date_key"],
+                name="doc_company_period_date_idx",
+            ),
+        ),
+        migrations.RunPython(fill_date_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("financial_system", "0007_documentheader_date_key"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="documentitem",
+            index=models.Index(
+                fields=["account", "document", "row_number"],
+                name="item_account_doc_row_idx",
+            ),
+        ),
+    ]
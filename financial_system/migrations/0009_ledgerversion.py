@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0018_alter_company_fiscal_year_end_and_more"),
+        ("financial_system", "0008_documentitem_account_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LedgerVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.BigIntegerField(default=0, verbose_name="نسخه")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="آخرین تغییر"),
+                ),
+                (
+                    "company",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="users.company",
+                    ),
+                ),
+                (
+                    "period",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="users.financialperiod",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "نسخه دفتر",
+                "verbose_name_plural": "نسخه‌های دفتر",
+                "unique_together": {("company", "period")},
+            },
+        ),
+    ]
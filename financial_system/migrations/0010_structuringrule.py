@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0018_alter_company_fiscal_year_end_and_more"),
+        ("financial_system", "0009_ledgerversion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StructuringRule",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "account_prefix",
+                    models.CharField(
+                        blank=True, max_length=50, verbose_name="پیشوند کد حساب"
+                    ),
+                ),
+                (
+                    "threshold_amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=15, verbose_name="سقف مجاز"
+                    ),
+                ),
+                (
+                    "window_days",
+                    models.PositiveIntegerField(default=7, verbose_name="طول بازه (روز)"),
+                ),
+                (
+                    "min_items",
+                    models.PositiveIntegerField(default=2, verbose_name="حداقل تعداد آرتیکل"),
+                ),
+                ("is_active", models.BooleanField(default=True, verbose_name="فعال")),
+                (
+                    "company",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="structuring_rules",
+                        to="users.company",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "قاعده تفکیک مبالغ",
+                "verbose_name_plural": "قواعد تفکیک مبالغ",
+                "unique_together": {("company", "account_prefix")},
+            },
+        ),
+    ]
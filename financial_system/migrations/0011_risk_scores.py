@@ -0,0 +1,74 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0018_alter_company_fiscal_year_end_and_more"),
+        ("financial_system", "0010_structuringrule"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RiskScoringState",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("last_document_id", models.BigIntegerField(default=0, verbose_name="آخرین سند")),
+                ("ledger_version", models.BigIntegerField(default=0, verbose_name="نسخه دفتر")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="آخرین امتیازدهی")),
+                ("company", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="users.company")),
+                ("period", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="users.financialperiod")),
+            ],
+            options={
+                "verbose_name": "وضعیت امتیازدهی ریسک",
+                "verbose_name_plural": "وضعیت\u200cهای امتیازدهی ریسک",
+                "unique_together": {("company", "period")},
+            },
+        ),
+        migrations.CreateModel(
+            name="DocumentRiskScore",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("item_count", models.IntegerField(default=0, verbose_name="تعداد آرتیکل")),
+                ("total_amount", models.BigIntegerField(default=0, verbose_name="جمع مبالغ (واحد جزء)")),
+                ("round_share", models.FloatField(default=0, verbose_name="سهم مبالغ گرد")),
+                ("is_end_of_period", models.BooleanField(default=False, verbose_name="پایان دوره")),
+                ("fingerprint", models.CharField(max_length=32, verbose_name="اثر انگشت آرتیکل\u200cها")),
+                ("is_duplicate", models.BooleanField(default=False, verbose_name="تکراری")),
+                ("max_zscore", models.FloatField(default=0, verbose_name="بیشینه z مبالغ")),
+                ("risk_score", models.FloatField(default=0, verbose_name="امتیاز ریسک")),
+                ("company", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="users.company")),
+                ("document", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name="risk_score", to="financial_system.documentheader")),
+                ("period", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="users.financialperiod")),
+            ],
+            options={
+                "verbose_name": "امتیاز ریسک سند",
+                "verbose_name_plural": "امتیازهای ریسک اسناد",
+                "indexes": [models.Index(fields=["company", "period", "-risk_score"], name="risk_doc_score_idx"), models.Index(fields=["company", "period", "fingerprint"], name="risk_doc_fingerprint_idx"), models.Index(fields=["company", "period", "is_end_of_period"], name="risk_doc_eop_idx")],
+            },
+        ),
+        migrations.CreateModel(
+            name="AccountRiskProfile",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("item_count", models.IntegerField(default=0, verbose_name="تعداد آرتیکل")),
+                ("amount_sum", models.BigIntegerField(default=0, verbose_name="جمع مبالغ (واحد جزء)")),
+                ("amount_sum_squares", models.FloatField(default=0, verbose_name="جمع مربعات مبالغ")),
+                ("round_count", models.IntegerField(default=0, verbose_name="تعداد مبالغ گرد")),
+                ("end_of_period_count", models.IntegerField(default=0, verbose_name="تعداد آرتیکل\u200cهای پایان دوره")),
+                ("outlier_count", models.IntegerField(default=0, verbose_name="تعداد مبالغ پرت")),
+                ("max_zscore", models.FloatField(default=0, verbose_name="بیشینه z مبالغ")),
+                ("account", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="financial_system.chartofaccounts")),
+                ("company", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="users.company")),
+                ("period", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="users.financialperiod")),
+            ],
+            options={
+                "verbose_name": "نمایه ریسک حساب",
+                "verbose_name_plural": "نمایه\u200cهای ریسک حساب\u200cها",
+                "unique_together": {("company", "period", "account")},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0018_alter_company_fiscal_year_end_and_more"),
+        ("financial_system", "0011_risk_scores"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AccountBaseline",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("item_count", models.IntegerField(default=0, verbose_name="تعداد آرتیکل")),
+                ("amount_sum", models.BigIntegerField(default=0, verbose_name="جمع مبالغ (واحد جزء)")),
+                ("monthly_volume", models.JSONField(default=list, verbose_name="گردش ماه\u200cهای شمسی (۱۲ عدد، واحد جزء)")),
+                ("monthly_count", models.JSONField(default=list, verbose_name="تعداد آرتیکل ماه\u200cهای شمسی (۱۲ عدد)")),
+                ("day_counts", models.JSONField(default=list, verbose_name="توزیع روز ماه (۳۱ عدد)")),
+                ("histogram_offset", models.IntegerField(default=0, verbose_name="نخستین سطل هیستوگرام مبالغ")),
+                ("histogram", models.JSONField(default=list, verbose_name="هیستوگرام لگاریتمی مبالغ")),
+                ("ledger_version", models.BigIntegerField(default=0, verbose_name="نسخه دفتر")),
+                ("account", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="financial_system.chartofaccounts")),
+                ("company", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="users.company")),
+                ("period", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="users.financialperiod")),
+            ],
+            options={
+                "verbose_name": "خط مبنای حساب",
+                "verbose_name_plural": "خطوط مبنای حساب\u200cها",
+                "unique_together": {("company", "period", "account")},
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.7 on 2026-10-19 01:10
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0018_alter_company_fiscal_year_end_and_more"),
+        ("financial_system", "0012_account_baselines"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HistoryEntry",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("kind", models.CharField(choices=[("alerts", "اجرای هشدار"), ("report", "گزارش"), ("model_improvement", "بهبود مدل")], max_length=32, verbose_name="نوع")),
+                ("reference", models.CharField(blank=True, max_length=100, verbose_name="شناسه مرجع")),
+                ("total_count", models.IntegerField(default=0, verbose_name="تعداد موارد")),
+                ("high_priority_count", models.IntegerField(default=0, verbose_name="تعداد موارد با اولویت بالا")),
+                ("summary", models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name="خلاصه")),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now, verbose_name="زمان ثبت")),
+                ("company", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to="users.company")),
+                ("period", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to="users.financialperiod")),
+            ],
+            options={
+                "verbose_name": "ورودی تاریخچه",
+                "verbose_name_plural": "تاریخچه",
+            },
+        ),
+        migrations.CreateModel(
+            name="AlertRecord",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("alert_type", models.CharField(max_length=64, verbose_name="نوع هشدار")),
+                ("severity", models.CharField(max_length=16, verbose_name="شدت")),
+                ("priority_score", models.IntegerField(default=0, verbose_name="امتیاز اولویت")),
+                ("title", models.CharField(max_length=255, verbose_name="عنوان")),
+                ("details", models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name="جزئیات")),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now, verbose_name="زمان ثبت")),
+                ("company", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="users.company")),
+                ("entry", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="alerts", to="financial_system.historyentry")),
+                ("period", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="users.financialperiod")),
+            ],
+            options={
+                "verbose_name": "هشدار",
+                "verbose_name_plural": "هشدارها",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="historyentry",
+            index=models.Index(fields=["kind", "company", "-created_at"], name="history_kind_company_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="historyentry",
+            index=models.Index(fields=["kind", "period", "-created_at"], name="history_kind_period_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="historyentry",
+            index=models.Index(fields=["kind", "-created_at"], name="history_kind_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="alertrecord",
+            index=models.Index(fields=["company", "period", "-created_at"], name="alert_company_period_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="alertrecord",
+            index=models.Index(fields=["company", "severity", "-created_at"], name="alert_company_severity_idx"),
+        ),
+    ]
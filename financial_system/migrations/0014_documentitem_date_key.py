@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:20
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_item_date_keys(apps, schema_editor):
+    DocumentHeader = apps.get_model("financial_system", "DocumentHeader")
+    DocumentItem = apps.get_model("financial_system", "DocumentItem")
+    DocumentItem.objects.update(
+        date_key=Subquery(DocumentHeader.objects.filter(pk=OuterRef("document_id")).values("date_key")[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("financial_system", "0013_history_store"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="documentitem",
+            name="item_account_doc_row_idx",
+        ),
+        migrations.AddField(
+            model_name="documentitem",
+            name="date_key",
+            field=models.IntegerField(default=0, verbose_name="کلید تاریخ"),
+        ),
+        migrations.AddIndex(
+            model_name="documentitem",
+            index=models.Index(
+                fields=["account", "date_key", "document", "row_number"],
+                name="item_account_date_idx",
+            ),
+        ),
+        migrations.RunPython(fill_item_date_keys, migrations.RunPython.noop),
+    ]
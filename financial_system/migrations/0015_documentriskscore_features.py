@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 11:05
+
+from django.db import migrations, models
+
+
+def reset_risk_state(apps, schema_editor):
+    # ویژگی‌های جدید برای اسناد امتیازدهی‌شده قبلی خالی‌اند؛ جدول ریسک در اولین استفاده بازسازی می‌شود
+    RiskScoringState = apps.get_model("financial_system", "RiskScoringState")
+    RiskScoringState.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("financial_system", "0014_documentitem_date_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentriskscore",
+            name="max_amount",
+            field=models.BigIntegerField(default=0, verbose_name="بیشینه مبلغ آرتیکل (واحد جزء)"),
+        ),
+        migrations.AddField(
+            model_name="documentriskscore",
+            name="description_signature",
+            field=models.BinaryField(default=b"", verbose_name="امضای MinHash شرح"),
+        ),
+        migrations.AddIndex(
+            model_name="documentriskscore",
+            index=models.Index(fields=["company", "period", "-max_amount"], name="risk_doc_amount_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="documentriskscore",
+            index=models.Index(fields=["company", "period", "-round_share"], name="risk_doc_round_idx"),
+        ),
+        migrations.RunPython(reset_risk_state, migrations.RunPython.noop),
+    ]
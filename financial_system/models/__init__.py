@@ -1,5 +1,8 @@
 # financial_system/models/__init__.py
 from .base_models import Company, FinancialPeriod
 from .coding_models import ChartOfAccounts
-from .document_models import DocumentHeader, DocumentItem
+from .control_models import StructuringRule
+from .history_models import AlertRecord, HistoryEntry
+from .risk_models import AccountBaseline, AccountRiskProfile, DocumentRiskScore, RiskScoringState
+from .document_models import DocumentHeader, DocumentItem, LedgerVersion
 from .transaction_models import FinancialTransaction
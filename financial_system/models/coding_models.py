@@ -1,5 +1,7 @@
 # financial_system/models/coding_models.py
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
 
 class ChartOfAccounts(models.Model):
     ACCOUNT_LEVELS = [
@@ -9,19 +11,98 @@ class ChartOfAccounts(models.Model):
         ('PROJECT', 'پروژه'),
         ('COST_CENTER', 'مرکز هزینه'),
     ]
-    
+
+    # جداکننده مسیر سلسله مراتب: مسیر هر حساب به شکل /شناسه_ریشه/.../شناسه_خود/ است
+    PATH_SEPARATOR = '/'
+
     code = models.CharField(max_length=50, verbose_name='کد حساب')
     name = models.CharField(max_length=200, verbose_name='نام حساب')
     level = models.CharField(max_length=20, choices=ACCOUNT_LEVELS)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True)
+    path = models.CharField(max_length=255, blank=True, default='', db_index=True, verbose_name='مسیر سلسله مراتب')
+    depth = models.PositiveSmallIntegerField(default=0, verbose_name='عمق')
     is_active = models.BooleanField(default=True)
     description = models.TextField(blank=True, verbose_name='توضیحات')
     created_at = models.DateTimeField(auto_now_add=True)
-    
+
     class Meta:
         verbose_name = 'سرفصل حساب'
         verbose_name_plural = 'سرفصل‌های حساب'
         unique_together = ('code', 'level')
-    
+
     def __str__(self):
-        return f"{self.code} - {self.name}"
\ No newline at end of file
+        return f"{self.code} - {self.name}"
+
+    def save(self, *args, **kwargs):
+        """ذخیره حساب و نگهداری مسیر سلسله مراتب خود و زیرشاخه‌ها"""
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._refresh_path()
+
+    def _refresh_path(self):
+        """محاسبه مجدد مسیر و عمق؛ در صورت تغییر، مسیر زیرشاخه‌ها با یک UPDATE اصلاح می‌شود"""
+        sep = self.PATH_SEPARATOR
+        parent_path = sep
+        if self.parent_id:
+            parent_path = ChartOfAccounts.objects.filter(pk=self.parent_id).values_list('path', flat=True).first()
+            if not parent_path:
+                # والد قدیمی که هنوز مسیر ندارد
+                parent = ChartOfAccounts.objects.get(pk=self.parent_id)
+                parent._refresh_path()
+                parent_path = parent.path
+            if f"{sep}{self.pk}{sep}" in parent_path:
+                raise ValueError(f"حساب {self.code} نمی‌تواند زیرمجموعه یکی از زیرشاخه‌های خود باشد")
+
+        new_path = f"{parent_path}{self.pk}{sep}"
+        new_depth = new_path.count(sep) - 2
+        old_path = ChartOfAccounts.objects.filter(pk=self.pk).values_list('path', flat=True).first() or ''
+
+        if old_path == new_path and self.depth == new_depth:
+            self.path = new_path
+            return
+
+        ChartOfAccounts.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+        if old_path:
+            old_depth = old_path.count(sep) - 2
+            ChartOfAccounts.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (new_depth - old_depth),
+            )
+        self.path = new_path
+        self.depth = new_depth
+
+    def get_ancestor_ids(self, include_self=False):
+        """شناسه اجداد از ریشه به پایین، بدون نیاز به کوئری"""
+        ids = [int(part) for part in self.path.strip(self.PATH_SEPARATOR).split(self.PATH_SEPARATOR) if part]
+        return ids if include_self else ids[:-1]
+
+    def get_ancestors(self, include_self=False):
+        """اجداد حساب به ترتیب از ریشه"""
+        return ChartOfAccounts.objects.filter(pk__in=self.get_ancestor_ids(include_self)).order_by('depth')
+
+    def get_descendants(self, include_self=True):
+        """تمام زیرشاخه‌های حساب با یک کوئری روی مسیر"""
+        queryset = ChartOfAccounts.objects.filter(path__startswith=self.path)
+        if not include_self:
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset
+
+    @classmethod
+    def rebuild_paths(cls):
+        """بازسازی کامل مسیرها از روی parent (برای داده‌های قدیمی یا ترمیم)"""
+        sep = cls.PATH_SEPARATOR
+        rows = list(cls.objects.values_list('id', 'parent_id'))
+        children = {}
+        for account_id, parent_id in rows:
+            children.setdefault(parent_id, []).append(account_id)
+
+        paths = {}
+        stack = [(account_id, sep) for account_id in children.get(None, [])]
+        while stack:
+            account_id, parent_path = stack.pop()
+            paths[account_id] = f"{parent_path}{account_id}{sep}"
+            stack.extend((child_id, paths[account_id]) for child_id in children.get(account_id, []))
+
+        accounts = [cls(id=account_id, path=path, depth=path.count(sep) - 2) for account_id, path in paths.items()]
+        cls.objects.bulk_update(accounts, ['path', 'depth'], batch_size=1000)
+        return len(accounts)
@@ -0,0 +1,21 @@
+# financial_system/models/control_models.py
+from django.db import models
+from users.models import Company
+
+
+class StructuringRule(models.Model):
+    """قاعده شناسایی تفکیک مبالغ (structuring) هر شرکت؛ پیشوند خالی یعنی همه حساب‌ها"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='structuring_rules')
+    account_prefix = models.CharField(max_length=50, blank=True, verbose_name='پیشوند کد حساب')
+    threshold_amount = models.DecimalField(max_digits=15, decimal_places=2, verbose_name='سقف مجاز')
+    window_days = models.PositiveIntegerField(default=7, verbose_name='طول بازه (روز)')
+    min_items = models.PositiveIntegerField(default=2, verbose_name='حداقل تعداد آرتیکل')
+    is_active = models.BooleanField(default=True, verbose_name='فعال')
+
+    class Meta:
+        verbose_name = 'قاعده تفکیک مبالغ'
+        verbose_name_plural = 'قواعد تفکیک مبالغ'
+        unique_together = ('company', 'account_prefix')
+
+    def __str__(self):
+        return f"{self.company} - {self.account_prefix or '*'}"
@@ -3,6 +3,31 @@ from django.db import models
 from users.models import Company, FinancialPeriod
 from .coding_models import ChartOfAccounts
 
+PERSIAN_DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩', '01234567890123456789')
+
+
+def make_date_key(value) -> int:
+    """تبدیل تاریخ شمسی متنی (مانند ۱۴۰۲/۰۱/۱۵) به عدد صحیح YYYYMMDD؛ برای تاریخ نامعتبر صفر"""
+    if not value:
+        return 0
+    text = str(value).strip().translate(PERSIAN_DIGITS)
+    for separator in ('-', '.', ' '):
+        text = text.replace(separator, '/')
+    parts = [part for part in text.split('/') if part]
+    try:
+        if len(parts) == 3:
+            year, month, day = (int(part) for part in parts)
+        elif len(parts) == 1 and len(parts[0]) == 8:
+            year, month, day = int(parts[0][:4]), int(parts[0][4:6]), int(parts[0][6:])
+        else:
+            return 0
+    except ValueError:
+        return 0
+    if not (1 <= month <= 12 and 1 <= day <= 31):
+        return 0
+    return year * 10000 + month * 100 + day
+
+
 class DocumentHeader(models.Model):
     DOCUMENT_TYPES = [
         ('SANAD', 'سند حسابداری'),
@@ -20,14 +45,29 @@ class DocumentHeader(models.Model):
     total_debit = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     total_credit = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     is_balanced = models.BooleanField(default=False)
+    date_key = models.IntegerField(default=0, db_index=True, verbose_name='کلید تاریخ')
     
     class Meta:
         verbose_name = 'سربرگ سند'
         verbose_name_plural = 'سربرگ اسناد'
         unique_together = ('company', 'period', 'document_number')
+        indexes = [
+            models.Index(fields=['company', 'period', 'date_key'], name='doc_company_period_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.document_number} - {self.document_date}"
+    
+    def save(self, *args, **kwargs):
+        """ذخیره سند با کلید تاریخ عددی همگام با تاریخ شمسی (در سربرگ و آرتیکل‌ها)"""
+        adding = self._state.adding
+        self.date_key = make_date_key(self.document_date)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'document_date' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'date_key'}
+        super().save(*args, **kwargs)
+        if not adding and (update_fields is None or 'document_date' in update_fields):
+            self.items.exclude(date_key=self.date_key).update(date_key=self.date_key)
 
 class DocumentItem(models.Model):
     document = models.ForeignKey(DocumentHeader, on_delete=models.CASCADE, related_name='items')
@@ -38,10 +78,39 @@ class DocumentItem(models.Model):
     description = models.TextField(verbose_name='شرح')
     cost_center = models.CharField(max_length=50, blank=True, verbose_name='مرکز هزینه')
     project_code = models.CharField(max_length=50, blank=True, verbose_name='کد پروژه')
+    # رونوشت کلید تاریخ سربرگ تا دفتر حساب بدون join روی نمایه (حساب، تاریخ) مرتب و صفحه‌بندی شود
+    date_key = models.IntegerField(default=0, verbose_name='کلید تاریخ')
     
     class Meta:
         verbose_name = 'آرتیکل سند'
         verbose_name_plural = 'آرتیکل‌های اسناد'
+        indexes = [
+            models.Index(fields=['account', 'date_key', 'document', 'row_number'], name='item_account_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.document.document_number} - ردیف {self.row_number}"
+    
+    def save(self, *args, **kwargs):
+        """ذخیره آرتیکل با کلید تاریخ سربرگ"""
+        self.date_key = self.document.date_key
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'date_key'}
+        super().save(*args, **kwargs)
+
+
+class LedgerVersion(models.Model):
+    """نسخه صعودی دفتر هر شرکت و دوره؛ با هر ورود، ویرایش، حذف یا اصلاح خودکار اسناد افزایش می‌یابد"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    period = models.ForeignKey(FinancialPeriod, on_delete=models.CASCADE)
+    version = models.BigIntegerField(default=0, verbose_name='نسخه')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='آخرین تغییر')
+
+    class Meta:
+        verbose_name = 'نسخه دفتر'
+        verbose_name_plural = 'نسخه‌های دفتر'
+        unique_together = ('company', 'period')
+
+    def __str__(self):
+        return f"{self.company_id}/{self.period_id} - v{self.version}"
@@ -0,0 +1,56 @@
+# financial_system/models/history_models.py
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+from users.models import Company, FinancialPeriod
+
+
+class HistoryEntry(models.Model):
+    """ورودی تاریخچه پایدار سیستم‌های تحلیلی (اجرای هشدار، گزارش تولیدشده، بهبود مدل)"""
+    KIND_ALERTS = 'alerts'
+    KIND_REPORT = 'report'
+    KIND_IMPROVEMENT = 'model_improvement'
+    KIND_CHOICES = [
+        (KIND_ALERTS, 'اجرای هشدار'),
+        (KIND_REPORT, 'گزارش'),
+        (KIND_IMPROVEMENT, 'بهبود مدل'),
+    ]
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES, verbose_name='نوع')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, null=True, blank=True)
+    period = models.ForeignKey(FinancialPeriod, on_delete=models.CASCADE, null=True, blank=True)
+    reference = models.CharField(max_length=100, blank=True, verbose_name='شناسه مرجع')
+    total_count = models.IntegerField(default=0, verbose_name='تعداد موارد')
+    high_priority_count = models.IntegerField(default=0, verbose_name='تعداد موارد با اولویت بالا')
+    summary = models.JSONField(default=dict, encoder=DjangoJSONEncoder, verbose_name='خلاصه')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='زمان ثبت')
+
+    class Meta:
+        verbose_name = 'ورودی تاریخچه'
+        verbose_name_plural = 'تاریخچه'
+        indexes = [
+            models.Index(fields=['kind', 'company', '-created_at'], name='history_kind_company_idx'),
+            models.Index(fields=['kind', 'period', '-created_at'], name='history_kind_period_idx'),
+            models.Index(fields=['kind', '-created_at'], name='history_kind_created_idx'),
+        ]
+
+
+class AlertRecord(models.Model):
+    """یک هشدار از یک اجرای ارزیابی هشدار؛ ستون‌های پرکاربرد برای فیلتر، بقیه در جزئیات"""
+    entry = models.ForeignKey(HistoryEntry, on_delete=models.CASCADE, related_name='alerts')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    period = models.ForeignKey(FinancialPeriod, on_delete=models.CASCADE)
+    alert_type = models.CharField(max_length=64, verbose_name='نوع هشدار')
+    severity = models.CharField(max_length=16, verbose_name='شدت')
+    priority_score = models.IntegerField(default=0, verbose_name='امتیاز اولویت')
+    title = models.CharField(max_length=255, verbose_name='عنوان')
+    details = models.JSONField(default=dict, encoder=DjangoJSONEncoder, verbose_name='جزئیات')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='زمان ثبت')
+
+    class Meta:
+        verbose_name = 'هشدار'
+        verbose_name_plural = 'هشدارها'
+        indexes = [
+            models.Index(fields=['company', 'period', '-created_at'], name='alert_company_period_idx'),
+            models.Index(fields=['company', 'severity', '-created_at'], name='alert_company_severity_idx'),
+        ]
@@ -0,0 +1,87 @@
+# financial_system/models/risk_models.py
+from django.db import models
+from users.models import Company, FinancialPeriod
+from .coding_models import ChartOfAccounts
+from .document_models import DocumentHeader
+
+
+class DocumentRiskScore(models.Model):
+    """ویژگی‌ها و امتیاز ریسک هر سند که در مرحله ورود اطلاعات محاسبه می‌شود"""
+    document = models.OneToOneField(DocumentHeader, on_delete=models.CASCADE, related_name='risk_score')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    period = models.ForeignKey(FinancialPeriod, on_delete=models.CASCADE)
+    item_count = models.IntegerField(default=0, verbose_name='تعداد آرتیکل')
+    total_amount = models.BigIntegerField(default=0, verbose_name='جمع مبالغ (واحد جزء)')
+    max_amount = models.BigIntegerField(default=0, verbose_name='بیشینه مبلغ آرتیکل (واحد جزء)')
+    round_share = models.FloatField(default=0, verbose_name='سهم مبالغ گرد')
+    is_end_of_period = models.BooleanField(default=False, verbose_name='پایان دوره')
+    fingerprint = models.CharField(max_length=32, verbose_name='اثر انگشت آرتیکل‌ها')
+    is_duplicate = models.BooleanField(default=False, verbose_name='تکراری')
+    max_zscore = models.FloatField(default=0, verbose_name='بیشینه z مبالغ')
+    description_signature = models.BinaryField(default=b'', verbose_name='امضای MinHash شرح')
+    risk_score = models.FloatField(default=0, verbose_name='امتیاز ریسک')
+
+    class Meta:
+        verbose_name = 'امتیاز ریسک سند'
+        verbose_name_plural = 'امتیازهای ریسک اسناد'
+        indexes = [
+            models.Index(fields=['company', 'period', '-risk_score'], name='risk_doc_score_idx'),
+            models.Index(fields=['company', 'period', 'fingerprint'], name='risk_doc_fingerprint_idx'),
+            models.Index(fields=['company', 'period', 'is_end_of_period'], name='risk_doc_eop_idx'),
+            models.Index(fields=['company', 'period', '-max_amount'], name='risk_doc_amount_idx'),
+            models.Index(fields=['company', 'period', '-round_share'], name='risk_doc_round_idx'),
+        ]
+
+
+class AccountRiskProfile(models.Model):
+    """خط مبنای تجمعی مبالغ هر حساب در دوره (تعداد، جمع و جمع مربعات) و ویژگی‌های ریسک آن"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    period = models.ForeignKey(FinancialPeriod, on_delete=models.CASCADE)
+    account = models.ForeignKey(ChartOfAccounts, on_delete=models.CASCADE)
+    item_count = models.IntegerField(default=0, verbose_name='تعداد آرتیکل')
+    amount_sum = models.BigIntegerField(default=0, verbose_name='جمع مبالغ (واحد جزء)')
+    amount_sum_squares = models.FloatField(default=0, verbose_name='جمع مربعات مبالغ')
+    round_count = models.IntegerField(default=0, verbose_name='تعداد مبالغ گرد')
+    end_of_period_count = models.IntegerField(default=0, verbose_name='تعداد آرتیکل‌های پایان دوره')
+    outlier_count = models.IntegerField(default=0, verbose_name='تعداد مبالغ پرت')
+    max_zscore = models.FloatField(default=0, verbose_name='بیشینه z مبالغ')
+
+    class Meta:
+        verbose_name = 'نمایه ریسک حساب'
+        verbose_name_plural = 'نمایه‌های ریسک حساب‌ها'
+        unique_together = ('company', 'period', 'account')
+
+
+class RiskScoringState(models.Model):
+    """آخرین سند امتیازدهی‌شده و نسخه دفتری که جدول ریسک با آن همگام است"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    period = models.ForeignKey(FinancialPeriod, on_delete=models.CASCADE)
+    last_document_id = models.BigIntegerField(default=0, verbose_name='آخرین سند')
+    ledger_version = models.BigIntegerField(default=0, verbose_name='نسخه دفتر')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='آخرین امتیازدهی')
+
+    class Meta:
+        verbose_name = 'وضعیت امتیازدهی ریسک'
+        verbose_name_plural = 'وضعیت‌های امتیازدهی ریسک'
+        unique_together = ('company', 'period')
+
+
+class AccountBaseline(models.Model):
+    """نمایه فشرده هر حساب در یک دوره برای خط مبنای بین‌دوره‌ای (آرایه‌ها به صورت فهرست JSON)"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    period = models.ForeignKey(FinancialPeriod, on_delete=models.CASCADE)
+    account = models.ForeignKey(ChartOfAccounts, on_delete=models.CASCADE)
+    item_count = models.IntegerField(default=0, verbose_name='تعداد آرتیکل')
+    amount_sum = models.BigIntegerField(default=0, verbose_name='جمع مبالغ (واحد جزء)')
+    monthly_volume = models.JSONField(default=list, verbose_name='گردش ماه‌های شمسی (۱۲ عدد، واحد جزء)')
+    monthly_count = models.JSONField(default=list, verbose_name='تعداد آرتیکل ماه‌های شمسی (۱۲ عدد)')
+    day_counts = models.JSONField(default=list, verbose_name='توزیع روز ماه (۳۱ عدد)')
+    histogram_offset = models.IntegerField(default=0, verbose_name='نخستین سطل هیستوگرام مبالغ')
+    histogram = models.JSONField(default=list, verbose_name='هیستوگرام لگاریتمی مبالغ')
+    ledger_version = models.BigIntegerField(default=0, verbose_name='نسخه دفتر')
+
+    class Meta:
+        verbose_name = 'خط مبنای حساب'
+        verbose_name_plural = 'خطوط مبنای حساب‌ها'
+        unique_together = ('company', 'period', 'account')
+
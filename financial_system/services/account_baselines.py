@@ -0,0 +1,360 @@
+# financial_system/services/account_baselines.py
+"""
+خط مبنای بین‌دوره‌ای حساب‌ها برای تشخیص ناهنجاری
+برای هر حساب در هر دوره یک نمایه فشرده نگهداری می‌شود: گردش و تعداد آرتیکل ماه‌های شمسی، توزیع روز ماه
+و هیستوگرام لگاریتمی مبالغ (۱۶ سطل در هر دهه). نمایه دوره‌ها با نسخه دفتر همگام می‌مانند و فقط پس از
+تغییر دفتر همان دوره از تصویر ستونی بازسازی می‌شوند. خط مبنای یک دوره از ادغام نمایه دوره‌های پیشین
+شرکت ساخته می‌شود و امتیازدهی دوره جاری (z مقاوم مبالغ بر پایه میانه و MAD، جهش گردش ماهانه و جابجایی
+توزیع روزها) روی ماتریس‌های حساب × سطل و بدون پیمایش حساب‌ها انجام می‌شود.
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.db import transaction
+
+from financial_system.models.coding_models import ChartOfAccounts
+from financial_system.models.risk_models import AccountBaseline
+from financial_system.services.account_hierarchy import from_minor_units
+from financial_system.services.amount_sketch import MAD_SCALE
+from financial_system.services.ledger_snapshot import LedgerSnapshot
+from financial_system.services.report_cache import get_ledger_version, get_ledger_versions
+from users.models import Company, FinancialPeriod
+
+logger = logging.getLogger(__name__)
+
+# هیستوگرام لگاریتمی مبالغ (واحد جزء): ۱۶ سطل در هر دهه تا ۱۰^۱۹
+BINS_PER_DECADE = 16
+HISTOGRAM_BINS = 19 * BINS_PER_DECADE
+
+# تعداد دوره‌های پیشین خط مبنا و حداقل نمونه‌ها برای امتیازدهی
+BASELINE_PERIODS = 4
+MIN_BASELINE_ITEMS = 30
+MIN_BASELINE_MONTHS = 3
+
+# آستانه z مقاوم مبالغ (Iglewicz-Hoaglin)، آستانه z گردش ماهانه و فاصله توزیع روزها
+AMOUNT_ZSCORE = 3.5
+VOLUME_ZSCORE = 3.0
+TIMING_DISTANCE = 0.35
+END_OF_MONTH_DAY = 25
+
+# کف MAD در مقیاس log10 (حدود ۱۲٪ تغییر نسبی)
+_MIN_LOG_MAD = 0.05
+
+
+def amount_bins(amounts: np.ndarray) -> np.ndarray:
+    """سطل هیستوگرام لگاریتمی مبالغ مثبت (واحد جزء)"""
+    logs = np.log10(np.maximum(np.asarray(amounts, dtype=np.float64), 1))
+    return np.clip((logs * BINS_PER_DECADE).astype(np.int64), 0, HISTOGRAM_BINS - 1)
+
+
+def histogram_median_mad(histogram: np.ndarray):
+    """میانه و MAD هر سطر هیستوگرام (حساب × سطل) در مقیاس log10 با درون‌یابی داخل سطل"""
+    histogram = np.asarray(histogram, dtype=np.float64)
+    cumulative = histogram.cumsum(axis=1)
+    half = cumulative[:, -1:] / 2
+    position = np.argmax(cumulative >= half, axis=1)
+    rows = np.arange(histogram.shape[0])
+    before = np.where(position > 0, cumulative[rows, position - 1], 0)
+    counts = np.maximum(histogram[rows, position], 1)
+    medians = (position + np.clip((half[:, 0] - before) / counts, 0, 1)) / BINS_PER_DECADE
+
+    centers = (np.arange(histogram.shape[1]) + 0.5) / BINS_PER_DECADE
+    deviations = np.abs(centers[None, :] - medians[:, None])
+    order = np.argsort(deviations, axis=1)
+    ordered = np.take_along_axis(histogram, order, axis=1).cumsum(axis=1)
+    index = np.argmax(ordered >= half, axis=1)
+    mads = np.take_along_axis(deviations, order, axis=1)[rows, index]
+    return medians, np.maximum(mads, _MIN_LOG_MAD)
+
+
+class BaselineProfiles:
+    """نمایه حساب‌ها به صورت ماتریس: حساب × ماه (به ازای هر دوره)، حساب × روز و حساب × سطل مبلغ"""
+
+    def __init__(self, accounts, counts, sums, monthly_volume, monthly_count, day_counts, histogram):
+        self.accounts = np.asarray(accounts, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.sums = np.asarray(sums, dtype=np.int64)
+        self.monthly_volume = np.asarray(monthly_volume, dtype=np.int64)
+        self.monthly_count = np.asarray(monthly_count, dtype=np.int64)
+        self.day_counts = np.asarray(day_counts, dtype=np.int64).reshape(self.accounts.size, 31)
+        self.histogram = np.asarray(histogram, dtype=np.int64).reshape(self.accounts.size, HISTOGRAM_BINS)
+
+    def __len__(self) -> int:
+        return int(self.accounts.size)
+
+    @classmethod
+    def from_snapshot(cls, snapshot: LedgerSnapshot) -> 'BaselineProfiles':
+        """نمایه حساب‌های یک دوره با چند bincount روی تصویر ستونی"""
+        amounts = snapshot.amounts
+        positive = amounts > 0
+        positions = snapshot.account_position[positive]
+        amounts = amounts[positive]
+        date_keys = snapshot.date_keys[positive]
+        size = snapshot.accounts_index.size
+
+        # ماه و روز فقط برای آرتیکل‌های با تاریخ معتبر شمارش می‌شوند
+        dated = date_keys > 0
+        months = np.clip(date_keys // 100 % 100, 1, 12) - 1
+        days = np.clip(date_keys % 100, 1, 31) - 1
+        month_slots = positions[dated] * 12 + months[dated]
+        sums = np.zeros(size, dtype=np.int64)
+        np.add.at(sums, positions, amounts)
+        monthly_volume = np.zeros(size * 12, dtype=np.int64)
+        np.add.at(monthly_volume, month_slots, amounts[dated])
+        return cls(
+            snapshot.accounts_index,
+            np.bincount(positions, minlength=size),
+            sums,
+            monthly_volume.reshape(size, 12),
+            np.bincount(month_slots, minlength=size * 12).reshape(size, 12),
+            np.bincount(positions[dated] * 31 + days[dated], minlength=size * 31),
+            np.bincount(positions * HISTOGRAM_BINS + amount_bins(amounts), minlength=size * HISTOGRAM_BINS),
+        )
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict], periods: List[int]) -> 'BaselineProfiles':
+        """ادغام نمایه‌های ذخیره‌شده چند دوره؛ ماه‌های هر دوره جدا می‌مانند (حساب × (دوره × ۱۲))"""
+        accounts = np.unique(np.array([row['account_id'] for row in rows], dtype=np.int64))
+        size, period_count = accounts.size, max(len(periods), 1)
+        counts = np.zeros(size, dtype=np.int64)
+        sums = np.zeros(size, dtype=np.int64)
+        monthly_volume = np.zeros((size, period_count, 12), dtype=np.int64)
+        monthly_count = np.zeros((size, period_count, 12), dtype=np.int64)
+        day_counts = np.zeros((size, 31), dtype=np.int64)
+        histogram = np.zeros((size, HISTOGRAM_BINS), dtype=np.int64)
+
+        period_position = {period_id: index for index, period_id in enumerate(periods)}
+        for row in rows:
+            account = np.searchsorted(accounts, row['account_id'])
+            period = period_position[row['period_id']]
+            counts[account] += row['item_count']
+            sums[account] += row['amount_sum']
+            monthly_volume[account, period] = row['monthly_volume']
+            monthly_count[account, period] = row['monthly_count']
+            day_counts[account] += row['day_counts']
+            offset = row['histogram_offset']
+            histogram[account, offset:offset + len(row['histogram'])] += row['histogram']
+        return cls(accounts, counts, sums, monthly_volume.reshape(size, period_count * 12),
+                   monthly_count.reshape(size, period_count * 12), day_counts, histogram)
+
+    def to_models(self, company: Company, period: FinancialPeriod, ledger_version: int) -> List[AccountBaseline]:
+        """ردیف‌های ذخیره‌سازی؛ هیستوگرام فقط از نخستین تا آخرین سطل غیرصفر نگهداری می‌شود"""
+        baselines = []
+        for index, account_id in enumerate(self.accounts.tolist()):
+            occupied = np.flatnonzero(self.histogram[index])
+            start, end = (int(occupied[0]), int(occupied[-1]) + 1) if occupied.size else (0, 0)
+            baselines.append(AccountBaseline(
+                company=company,
+                period=period,
+                account_id=account_id,
+                item_count=int(self.counts[index]),
+                amount_sum=int(self.sums[index]),
+                monthly_volume=self.monthly_volume[index].tolist(),
+                monthly_count=self.monthly_count[index].tolist(),
+                day_counts=self.day_counts[index].tolist(),
+                histogram_offset=start,
+                histogram=self.histogram[index, start:end].tolist(),
+                ledger_version=ledger_version,
+            ))
+        return baselines
+
+
+class AccountBaselineService:
+    """نگهداری نمایه دوره‌ها و امتیازدهی دوره جاری در برابر خط مبنای دوره‌های پیشین"""
+
+    def __init__(self, company: Company, period: FinancialPeriod, baseline_periods: int = BASELINE_PERIODS):
+        self.company = company
+        self.period = period
+        self.baseline_periods = baseline_periods
+
+    def previous_periods(self) -> List[FinancialPeriod]:
+        """دوره‌های پیشین شرکت (جدیدترین اول) که پیش از شروع دوره جاری پایان یافته‌اند"""
+        return list(
+            FinancialPeriod.objects.filter(
+                company=self.company, end_date__lt=self.period.start_date
+            ).order_by('-end_date')[:self.baseline_periods]
+        )
+
+    def refresh(self, period: FinancialPeriod, snapshot: Optional[LedgerSnapshot] = None) -> bool:
+        """بازسازی نمایه یک دوره در صورت تغییر نسخه دفتر؛ True اگر بازسازی انجام شد"""
+        version = get_ledger_version(self.company.id, period.id)
+        stored = AccountBaseline.objects.filter(
+            company=self.company, period=period
+        ).values_list('ledger_version', flat=True).first()
+        if stored == version:
+            return False
+
+        profiles = BaselineProfiles.from_snapshot(snapshot or LedgerSnapshot.load(self.company, period))
+        with transaction.atomic():
+            AccountBaseline.objects.filter(company=self.company, period=period).delete()
+            AccountBaseline.objects.bulk_create(profiles.to_models(self.company, period, version), batch_size=1000)
+        logger.info(f"نمایه خط مبنای حساب‌ها بازسازی شد: {self.company.id}/{period.id} ({len(profiles)} حساب)")
+        return True
+
+    def baseline(self, periods: Optional[List[FinancialPeriod]] = None) -> BaselineProfiles:
+        """خط مبنای ادغام‌شده دوره‌های پیشین (نمایه‌های کهنه پیش از ادغام به‌روز می‌شوند)"""
+        periods = self.previous_periods() if periods is None else periods
+        for period in periods:
+            self.refresh(period)
+        period_ids = [period.id for period in periods]
+        rows = list(AccountBaseline.objects.filter(company=self.company, period_id__in=period_ids).values(
+            'account_id', 'period_id', 'item_count', 'amount_sum', 'monthly_volume', 'monthly_count',
+            'day_counts', 'histogram_offset', 'histogram'
+        ))
+        return BaselineProfiles.from_rows(rows, period_ids)
+
+    def score(self, limit: int = 20) -> Dict:
+        """امتیازدهی برداری دوره جاری: مبالغ پرت هر حساب، جهش گردش ماهانه و جابجایی توزیع روزها"""
+        snapshot = LedgerSnapshot.load(self.company, self.period)
+        self.refresh(self.period, snapshot)
+        periods = self.previous_periods()
+        baseline = self.baseline(periods)
+        current = BaselineProfiles.from_snapshot(snapshot)
+        result = {
+            'baseline_periods': [{'id': period.id, 'name': period.name} for period in periods],
+            'baseline_accounts': len(baseline),
+            'amount_outliers': {'count': 0, 'item_ids': [], 'accounts': []},
+            'volume_anomalies': [],
+            'timing_shifts': [],
+        }
+        if not len(baseline) or not len(current):
+            return result
+
+        # نگاشت حساب‌های دوره جاری به سطر خط مبنا (-1 برای حساب بدون سابقه)
+        match = np.searchsorted(baseline.accounts, current.accounts)
+        match = np.minimum(match, baseline.accounts.size - 1)
+        match = np.where(baseline.accounts[match] == current.accounts, match, -1)
+        names = self._account_names(current.accounts)
+
+        result['amount_outliers'] = self._amount_outliers(snapshot, baseline, match, names, limit)
+        result['volume_anomalies'] = self._volume_anomalies(current, baseline, match, names)[:limit]
+        result['timing_shifts'] = self._timing_shifts(current, baseline, match, names)[:limit]
+        return result
+
+    @staticmethod
+    def _account_names(accounts: np.ndarray) -> Dict[int, tuple]:
+        return {
+            account_id: (code, name)
+            for account_id, code, name in ChartOfAccounts.objects.filter(
+                id__in=accounts.tolist()
+            ).values_list('id', 'code', 'name')
+        }
+
+    def _amount_outliers(self, snapshot: LedgerSnapshot, baseline: BaselineProfiles, match, names, limit) -> Dict:
+        """z مقاوم log مبلغ هر آرتیکل نسبت به میانه و MAD هیستوگرام حساب در خط مبنا"""
+        medians, mads = histogram_median_mad(baseline.histogram)
+        usable = (match >= 0) & (baseline.counts[np.maximum(match, 0)] >= MIN_BASELINE_ITEMS)
+
+        amounts = snapshot.amounts
+        positions = snapshot.account_position
+        rows = np.flatnonzero((amounts > 0) & usable[positions])
+        if not rows.size:
+            return {'count': 0, 'item_ids': [], 'accounts': []}
+        baseline_rows = match[positions[rows]]
+        zscores = (np.log10(amounts[rows].astype(np.float64)) - medians[baseline_rows]) / (MAD_SCALE * mads[baseline_rows])
+
+        flagged = zscores >= AMOUNT_ZSCORE
+        order = np.argsort(-zscores[flagged], kind='stable')
+        per_account = np.bincount(positions[rows][flagged], minlength=snapshot.accounts_index.size)
+        max_zscores = np.zeros(snapshot.accounts_index.size)
+        np.maximum.at(max_zscores, positions[rows], zscores)
+
+        accounts = []
+        for position in np.argsort(-per_account, kind='stable')[:limit].tolist():
+            if not per_account[position]:
+                break
+            account_id = int(snapshot.accounts_index[position])
+            code, name = names.get(account_id, ('', ''))
+            baseline_row = match[position]
+            accounts.append({
+                'account_code': code,
+                'account_name': name,
+                'outlier_count': int(per_account[position]),
+                'max_zscore': round(float(max_zscores[position]), 2),
+                'baseline_median': float(from_minor_units(round(10 ** medians[baseline_row]))),
+            })
+        return {
+            'count': int(flagged.sum()),
+            'item_ids': snapshot.item_ids[rows[flagged][order][:limit * 10]].tolist(),
+            'accounts': accounts,
+        }
+
+    def _volume_anomalies(self, current: BaselineProfiles, baseline: BaselineProfiles, match, names) -> List[Dict]:
+        """جهش گردش و تعداد ماهانه نسبت به میانه و MAD (log) ماه‌های فعال دوره‌های پیشین"""
+        known = np.flatnonzero(match >= 0)
+        if not known.size:
+            return []
+        history_volume = baseline.monthly_volume[match[known]].astype(np.float64)
+        history_count = baseline.monthly_count[match[known]].astype(np.float64)
+        active = history_volume > 0
+        enough = active.sum(axis=1) >= MIN_BASELINE_MONTHS
+
+        def robust(history):
+            logs = np.where(active, np.log10(np.maximum(history, 1)), np.nan)
+            with np.errstate(all='ignore'):
+                medians = np.nanmedian(logs, axis=1)
+                mads = np.nanmedian(np.abs(logs - medians[:, None]), axis=1)
+            return medians, np.maximum(np.nan_to_num(mads), _MIN_LOG_MAD)
+
+        volume_median, volume_mad = robust(history_volume)
+        count_median, count_mad = robust(history_count)
+        volumes = current.monthly_volume[known].astype(np.float64)
+        counts = current.monthly_count[known].astype(np.float64)
+        with np.errstate(all='ignore'):
+            volume_z = (np.log10(np.maximum(volumes, 1)) - volume_median[:, None]) / (MAD_SCALE * volume_mad[:, None])
+            count_z = (np.log10(np.maximum(counts, 1)) - count_median[:, None]) / (MAD_SCALE * count_mad[:, None])
+        flagged = (volumes > 0) & enough[:, None] & ((volume_z >= VOLUME_ZSCORE) | (count_z >= VOLUME_ZSCORE))
+
+        anomalies = []
+        for row, month in zip(*np.nonzero(flagged)):
+            account_id = int(current.accounts[known[row]])
+            code, name = names.get(account_id, ('', ''))
+            anomalies.append({
+                'account_code': code,
+                'account_name': name,
+                'month': int(month) + 1,
+                'volume': float(from_minor_units(volumes[row, month])),
+                'baseline_volume': float(from_minor_units(round(10 ** volume_median[row]))),
+                'volume_zscore': round(float(volume_z[row, month]), 2),
+                'count': int(counts[row, month]),
+                'count_zscore': round(float(count_z[row, month]), 2),
+            })
+        return sorted(anomalies, key=lambda anomaly: anomaly['volume_zscore'], reverse=True)
+
+    def _timing_shifts(self, current: BaselineProfiles, baseline: BaselineProfiles, match, names) -> List[Dict]:
+        """فاصله تغییرات کل (نیم L1) توزیع روز ماه دوره جاری و خط مبنا"""
+        known = np.flatnonzero(match >= 0)
+        if not known.size:
+            return []
+        present = current.day_counts[known].astype(np.float64)
+        history = baseline.day_counts[match[known]].astype(np.float64)
+        present_total, history_total = present.sum(axis=1), history.sum(axis=1)
+        enough = (present_total >= MIN_BASELINE_ITEMS) & (history_total >= MIN_BASELINE_ITEMS)
+        present_share = present / np.maximum(present_total, 1)[:, None]
+        history_share = history / np.maximum(history_total, 1)[:, None]
+        distances = np.abs(present_share - history_share).sum(axis=1) / 2
+
+        shifts = []
+        for row in np.flatnonzero(enough & (distances >= TIMING_DISTANCE)).tolist():
+            account_id = int(current.accounts[known[row]])
+            code, name = names.get(account_id, ('', ''))
+            shifts.append({
+                'account_code': code,
+                'account_name': name,
+                'distance': round(float(distances[row]), 3),
+                'end_of_month_share': round(float(present_share[row, END_OF_MONTH_DAY - 1:].sum()), 3),
+                'baseline_end_of_month_share': round(float(history_share[row, END_OF_MONTH_DAY - 1:].sum()), 3),
+                'items_count': int(present_total[row]),
+            })
+        return sorted(shifts, key=lambda shift: shift['distance'], reverse=True)
+
+
+def baseline_versions(company_id: int, period_id: int) -> Dict[str, int]:
+    """نسخه دفتر دوره‌های خط مبنای یک دوره؛ جزء کلید کش و ETag گزارش‌هایی که با خط مبنا مقایسه می‌کنند"""
+    period = FinancialPeriod.objects.select_related('company').filter(pk=period_id, company_id=company_id).first()
+    if period is None:
+        return {}
+    period_ids = [previous.id for previous in AccountBaselineService(period.company, period).previous_periods()]
+    return {str(key): version for key, version in get_ledger_versions(company_id, period_ids).items()}
@@ -0,0 +1,136 @@
+# financial_system/services/account_hierarchy.py
+"""
+تجمیع سلسله مراتبی حساب‌ها (کل ← معین ← تفصیلی)
+درخت کدینگ یک بار از روی مسیر ذخیره‌شده (path) بارگذاری می‌شود و گردش هر حساب
+با عملیات برداری NumPy به تمام اجداد آن منتقل می‌شود؛ بدون کوئری به ازای هر گره.
+"""
+
+from decimal import Decimal
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast, Round
+
+from financial_system.models.coding_models import ChartOfAccounts
+
+# مبالغ در محاسبات برداری به صورت عدد صحیح (ریال × ۱۰۰) نگهداری می‌شوند تا جمع‌ها دقیق بمانند
+MINOR_UNITS = 100
+
+
+def to_minor_units(values: Sequence) -> np.ndarray:
+    """تبدیل مبالغ Decimal به آرایه int64 بر حسب واحد جزء"""
+    return np.array(
+        [int((Decimal(value or 0) * MINOR_UNITS).to_integral_value()) for value in values],
+        dtype=np.int64,
+    )
+
+
+def from_minor_units(value) -> Decimal:
+    """تبدیل مقدار واحد جزء به Decimal ریالی"""
+    return Decimal(int(value)) / MINOR_UNITS
+
+
+def minor_units_expression(field_name: str):
+    """عبارت SQL برای خواندن مستقیم مبلغ به صورت عدد صحیح واحد جزء (بدون ساخت Decimal در پایتون)"""
+    return Cast(Round(F(field_name) * MINOR_UNITS), output_field=BigIntegerField())
+
+
+def prefix_mask(codes: np.ndarray, prefixes: Iterable[str]) -> np.ndarray:
+    """ماسک کدهای حسابی که با یکی از پیشوندها شروع می‌شوند"""
+    mask = np.zeros(codes.shape, dtype=bool)
+    for prefix in prefixes:
+        mask |= np.char.startswith(codes, prefix)
+    return mask
+
+
+class AccountHierarchy:
+    """نمای ستونی درخت حساب‌ها برای تجمیع گردش در همه سطوح"""
+
+    def __init__(self, queryset=None):
+        queryset = queryset if queryset is not None else ChartOfAccounts.objects.all()
+        rows = list(
+            queryset.order_by('path', 'code').values_list(
+                'id', 'code', 'name', 'level', 'parent_id', 'path', 'depth'
+            )
+        )
+
+        self.size = len(rows)
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.codes = [row[1] for row in rows]
+        self.names = [row[2] for row in rows]
+        self.levels = np.array([row[3] for row in rows], dtype=object)
+        self.parent_ids = [row[4] for row in rows]
+        self.paths = [row[5] for row in rows]
+        self.depths = np.array([row[6] for row in rows], dtype=np.int64)
+        self.index = {account_id: position for position, account_id in enumerate(self.ids.tolist())}
+
+        self._sort_order = np.argsort(self.ids, kind='stable')
+        self._sorted_ids = self.ids[self._sort_order]
+
+        # جفت‌های (گره، جد) شامل خود گره؛ یک بار ساخته می‌شود و برای هر تجمیع استفاده می‌شود
+        pair_node: List[int] = []
+        pair_ancestor: List[int] = []
+        sort_keys = []
+        for position, path in enumerate(self.paths):
+            ancestors = [
+                self.index.get(int(part))
+                for part in path.split(ChartOfAccounts.PATH_SEPARATOR) if part
+            ] or [position]
+            ancestors = [ancestor for ancestor in ancestors if ancestor is not None]
+            pair_node.extend([position] * len(ancestors))
+            pair_ancestor.extend(ancestors)
+            sort_keys.append([self.codes[ancestor] for ancestor in ancestors])
+        # ترتیب درختی (پیمایش عمقی) بر اساس کد حساب در هر سطح
+        self.tree_order = sorted(range(self.size), key=sort_keys.__getitem__)
+        self._pair_node = np.array(pair_node, dtype=np.int64)
+        self._pair_ancestor = np.array(pair_ancestor, dtype=np.int64)
+
+        parent_positions = [self.index[parent_id] for parent_id in self.parent_ids if parent_id in self.index]
+        self.has_children = np.bincount(
+            np.array(parent_positions, dtype=np.int64), minlength=self.size
+        ) > 0
+
+    def positions(self, account_ids) -> np.ndarray:
+        """موقعیت هر شناسه حساب در درخت؛ برای حساب‌های ناشناخته -1"""
+        account_ids = np.asarray(account_ids, dtype=np.int64)
+        if not self.size or not account_ids.size:
+            return np.full(account_ids.shape, -1, dtype=np.int64)
+        found = np.searchsorted(self._sorted_ids, account_ids)
+        found = np.clip(found, 0, self.size - 1)
+        matched = self._sorted_ids[found] == account_ids
+        return np.where(matched, self._sort_order[found], -1)
+
+    def own_totals(self, account_ids, values) -> np.ndarray:
+        """جمع مقادیر به ازای هر گره (فقط گردش مستقیم همان حساب)"""
+        positions = self.positions(account_ids)
+        values = np.asarray(values, dtype=np.int64)
+        known = positions >= 0
+        totals = np.zeros(self.size, dtype=np.int64)
+        np.add.at(totals, positions[known], values[known])
+        return totals
+
+    def rollup(self, account_ids, *columns) -> List[np.ndarray]:
+        """تجمیع هر ستون در تمام سطوح: مقدار هر گره = جمع خود و همه زیرشاخه‌ها"""
+        results = []
+        for values in columns:
+            own = self.own_totals(account_ids, values)
+            rolled = np.zeros(self.size, dtype=np.int64)
+            np.add.at(rolled, self._pair_ancestor, own[self._pair_node])
+            results.append(rolled)
+        return results
+
+    def node(self, position: int) -> Dict:
+        """اطلاعات توصیفی یک گره"""
+        parent_id = self.parent_ids[position]
+        parent_position = self.index.get(parent_id)
+        return {
+            'account_id': int(self.ids[position]),
+            'account_code': self.codes[position],
+            'account_name': self.names[position],
+            'account_level': self.levels[position],
+            'parent_id': parent_id,
+            'parent_code': self.codes[parent_position] if parent_position is not None else None,
+            'depth': int(self.depths[position]),
+            'has_children': bool(self.has_children[position]),
+        }
@@ -0,0 +1,177 @@
+# financial_system/services/account_ledger.py
+"""
+دفتر معین/کل یک حساب (یا زیردرخت آن) با مانده جاری و صفحه‌بندی کلیدی (Keyset)
+صفحه‌ها با کرسر روی ستون‌های خود آرتیکل (کلید تاریخ، سند، ردیف) و مقایسه سطری «(کلید) > (کرسر)» خوانده
+می‌شوند، نه با OFFSET. نمایه (حساب، کلید تاریخ، سند، ردیف) ترتیب دفتر را فقط برای یک حساب پوشش می‌دهد، پس
+دفتر زیردرخت برای هر حساب جداگانه حداکثر یک صفحه روی همین نمایه می‌خواند و نتایج را به ترتیب ادغام می‌کند؛
+هزینه هر صفحه به عمق آن بستگی ندارد (برای زیردرخت متناسب با تعداد حساب‌های آن است). مانده پایان هر صفحه در
+کرسر امضاشده بعدی حمل می‌شود و فقط برای صفحه اول (یا پرش به یک تاریخ) مانده ابتدا با یک کوئری تجمیعی محاسبه می‌شود.
+"""
+
+import heapq
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+from django.core import signing
+from django.db.models import F, Func, IntegerField, Sum, Value
+from django.db.models.lookups import GreaterThan
+
+from financial_system.models.coding_models import ChartOfAccounts
+from financial_system.models.document_models import DocumentItem, make_date_key
+from financial_system.services.account_hierarchy import from_minor_units, minor_units_expression
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+CURSOR_SALT = 'financial_system.account_ledger'
+
+# ترتیب ثابت آرتیکل‌ها در دفتر؛ شناسه آرتیکل برای ردیف‌های هم‌شماره یکتا بودن کلید را تضمین می‌کند
+LEDGER_ORDER = ('date_key', 'document_id', 'row_number', 'id')
+
+LEDGER_FIELDS = (
+    'id', 'document_id', 'row_number', 'description', 'cost_center',
+    'date_key', 'document__document_date', 'document__document_number',
+    'account__code', 'account__name', 'debit_minor', 'credit_minor'
+)
+
+
+class RowValue(Func):
+    """مقدار سطری (a, b, ...) برای مقایسه چندستونی کلید در یک شرط"""
+    template = '(%(expressions)s)'
+    arg_joiner = ', '
+    output_field = IntegerField()
+
+
+def ledger_key(row: Dict) -> Tuple[int, int, int, int]:
+    """کلید ترتیب دفتر یک ردیف"""
+    return tuple(row[field] for field in LEDGER_ORDER)
+
+
+class AccountLedger:
+    """دفتر حساب برای یک شرکت و دوره مالی"""
+
+    def __init__(self, company_id: int, period_id: int, account: ChartOfAccounts, include_subtree: bool = True):
+        self.company_id = company_id
+        self.period_id = period_id
+        self.account = account
+        self.include_subtree = include_subtree
+
+    def items(self):
+        """آرتیکل‌های حساب (و در صورت نیاز تمام زیرحساب‌ها) در دوره"""
+        queryset = DocumentItem.objects.filter(
+            document__company_id=self.company_id,
+            document__period_id=self.period_id
+        )
+        if self.include_subtree:
+            return queryset.filter(account__in=self.account.get_descendants(include_self=True))
+        return queryset.filter(account=self.account)
+
+    def account_ids(self) -> List[int]:
+        """شناسه حساب‌های دفتر (خود حساب یا تمام زیردرخت آن)"""
+        if self.include_subtree:
+            return list(self.account.get_descendants(include_self=True).values_list('id', flat=True))
+        return [self.account.id]
+
+    @staticmethod
+    def after(key: Tuple[int, int, int, int]) -> GreaterThan:
+        """شرط کلیدی «بعد از» با مقایسه سطری (date_key, document_id, row_number, id) > کرسر"""
+        return GreaterThan(
+            RowValue(*[F(field) for field in LEDGER_ORDER]),
+            RowValue(*[Value(int(value)) for value in key])
+        )
+
+    def _rows(self, queryset, limit: int) -> List[Dict]:
+        """
+        حداکثر limit ردیف بعدی دفتر به ترتیب کلید.
+        هر حساب با یک کوئری محدود روی نمایه (حساب، کلید تاریخ، سند، ردیف) خوانده و جریان‌های مرتب ادغام می‌شوند.
+        """
+        rows = queryset.annotate(
+            debit_minor=minor_units_expression('debit'),
+            credit_minor=minor_units_expression('credit')
+        ).order_by(*LEDGER_ORDER).values(*LEDGER_FIELDS)
+        per_account = [list(rows.filter(account_id=account_id)[:limit]) for account_id in self.account_ids()]
+        if len(per_account) == 1:
+            return per_account[0]
+        return list(islice(heapq.merge(*per_account, key=ledger_key), limit))
+
+    def balance_before(self, date_key: int) -> int:
+        """مانده (بدهکار مثبت، واحد جزء) آرتیکل‌های پیش از یک کلید تاریخ"""
+        totals = self.items().filter(date_key__lt=date_key).aggregate(
+            debit=Sum(minor_units_expression('debit')),
+            credit=Sum(minor_units_expression('credit'))
+        )
+        return (totals['debit'] or 0) - (totals['credit'] or 0)
+
+    def page(self, cursor: Optional[str] = None, start_date: Optional[str] = None,
+             page_size: int = DEFAULT_PAGE_SIZE) -> Dict:
+        """یک صفحه از دفتر با مانده جاری هر ردیف و کرسر صفحه بعد"""
+        page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+        queryset = DocumentItem.objects.filter(
+            document__company_id=self.company_id,
+            document__period_id=self.period_id
+        )
+
+        if cursor:
+            key, balance = self.decode_cursor(cursor)
+            queryset = queryset.filter(self.after(key))
+        else:
+            start_key = make_date_key(start_date) if start_date else 0
+            balance = self.balance_before(start_key) if start_key else 0
+            if start_key:
+                queryset = queryset.filter(date_key__gte=start_key)
+
+        rows = self._rows(queryset, page_size + 1)
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        opening_balance = balance
+        items: List[Dict] = []
+        for row in rows:
+            balance += row['debit_minor'] - row['credit_minor']
+            items.append({
+                'item_id': row['id'],
+                'document_id': row['document_id'],
+                'document_number': row['document__document_number'],
+                'document_date': row['document__document_date'],
+                'row_number': row['row_number'],
+                'account_code': row['account__code'],
+                'account_name': row['account__name'],
+                'description': row['description'],
+                'cost_center': row['cost_center'],
+                'debit': from_minor_units(row['debit_minor']),
+                'credit': from_minor_units(row['credit_minor']),
+                'balance': from_minor_units(balance),
+            })
+
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = self.encode_cursor(ledger_key(last), balance)
+
+        return {
+            'account_code': self.account.code,
+            'account_name': self.account.name,
+            'include_subtree': self.include_subtree,
+            'opening_balance': from_minor_units(opening_balance),
+            'closing_balance': from_minor_units(balance),
+            'items': items,
+            'has_more': has_more,
+            'next_cursor': next_cursor,
+        }
+
+    def encode_cursor(self, key: Tuple[int, int, int, int], balance: int) -> str:
+        """کرسر امضاشده شامل کلید آخرین ردیف و مانده جاری تا آن ردیف"""
+        return signing.dumps(
+            [self.company_id, self.period_id, self.account.id, self.include_subtree, *key, int(balance)],
+            salt=CURSOR_SALT, compress=True
+        )
+
+    def decode_cursor(self, cursor: str) -> Tuple[Tuple[int, int, int, int], int]:
+        """خواندن کرسر؛ کرسر دستکاری‌شده یا متعلق به دفتر دیگر ValueError می‌دهد"""
+        try:
+            values = signing.loads(cursor, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            raise ValueError('کرسر صفحه‌بندی نامعتبر است')
+        if values[:4] != [self.company_id, self.period_id, self.account.id, self.include_subtree]:
+            raise ValueError('کرسر صفحه‌بندی متعلق به این دفتر نیست')
+        return tuple(values[4:8]), values[8]
@@ -5,16 +5,24 @@
 """
 
 from typing import Dict, List, Any
-from decimal import Decimal
-from users.models import Company, FinancialPeriod, FinancialFile, Document
+from financial_system.services.ratio_engine import PeriodFinancials, period_financials
+from users.models import Company, FinancialPeriod
 
 
 class ActivityRatioAnalyzer:
     """تحلیل‌گر نسبت‌های فعالیت"""
     
-    def __init__(self, company: Company, period: FinancialPeriod):
+    def __init__(self, company: Company, period: FinancialPeriod, financials: PeriodFinancials = None):
         self.company = company
         self.period = period
+        self._financials = financials
+    
+    @property
+    def financials(self) -> PeriodFinancials:
+        """اقلام صورت‌های مالی دوره از اسناد ثبت‌شده (نمونه مشترک نسخه جاری دفتر)"""
+        if self._financials is None:
+            self._financials = period_financials(self.company, self.period)
+        return self._financials
     
     def calculate_all_activity_ratios(self) -> Dict[str, Any]:
         """محاسبه تمام نسبت‌های فعالیت"""
@@ -22,18 +30,21 @@ class ActivityRatioAnalyzer:
         # جمع‌آوری داده‌های مورد نیاز
         financial_data = self._collect_financial_data()
         
-        # محاسبه نسبت‌ها
+        # مقادیر نسبت‌ها از موتور برداری؛ متدهای زیر فقط تفسیر و جزئیات را می‌سازند
+        values = self.financials.ratios('activity')
         ratios = {
-            'inventory_turnover': self._calculate_inventory_turnover(financial_data),
-            'days_inventory_outstanding': self._calculate_days_inventory_outstanding(financial_data),
-            'receivables_turnover': self._calculate_receivables_turnover(financial_data),
-            'days_sales_outstanding': self._calculate_days_sales_outstanding(financial_data),
-            'payables_turnover': self._calculate_payables_turnover(financial_data),
-            'days_payables_outstanding': self._calculate_days_payables_outstanding(financial_data),
-            'cash_conversion_cycle': self._calculate_cash_conversion_cycle(financial_data),
-            'asset_turnover': self._calculate_asset_turnover(financial_data),
-            'fixed_asset_turnover': self._calculate_fixed_asset_turnover(financial_data),
-            'working_capital_turnover': self._calculate_working_capital_turnover(financial_data)
+            'inventory_turnover': self._calculate_inventory_turnover(financial_data, values['inventory_turnover']),
+            'days_inventory_outstanding': self._calculate_days_inventory_outstanding(values),
+            'receivables_turnover': self._calculate_receivables_turnover(financial_data, values['receivables_turnover']),
+            'days_sales_outstanding': self._calculate_days_sales_outstanding(values),
+            'payables_turnover': self._calculate_payables_turnover(financial_data, values['payables_turnover']),
+            'days_payables_outstanding': self._calculate_days_payables_outstanding(values),
+            'cash_conversion_cycle': self._calculate_cash_conversion_cycle(values),
+            'asset_turnover': self._calculate_asset_turnover(financial_data, values['asset_turnover']),
+            'fixed_asset_turnover': self._calculate_fixed_asset_turnover(financial_data, values['fixed_asset_turnover']),
+            'working_capital_turnover': self._calculate_working_capital_turnover(
+                financial_data, values['working_capital_turnover']
+            )
         }
         
         # تحلیل و ارزیابی
@@ -49,43 +60,38 @@ class ActivityRatioAnalyzer:
         }
     
     def _collect_financial_data(self) -> Dict[str, Any]:
-        """جمع‌آوری داده‌های مالی مورد نیاز"""
+        """جمع‌آوری داده‌های مالی مورد نیاز از مانده‌های ثبت‌شده دوره"""
         
-        # این بخش باید با مدل‌های واقعی یکپارچه شود
-        # فعلاً از داده‌های نمونه استفاده می‌کنیم
+        fin = self.financials
         
         return {
             'income_statement': {
-                'revenue': Decimal('8000000000'),  # 8 میلیارد
-                'cost_of_goods_sold': Decimal('5000000000'),  # 5 میلیارد
+                'revenue': fin.line('revenue'),
+                'cost_of_goods_sold': fin.line('cost_of_goods_sold'),
             },
             'balance_sheet': {
-                'total_assets': Decimal('10000000000'),  # 10 میلیارد
-                'fixed_assets': Decimal('7500000000'),  # 7.5 میلیارد
-                'current_assets': Decimal('2500000000'),  # 2.5 میلیارد
-                'inventory': Decimal('800000000'),  # 800 میلیون
-                'accounts_receivable': Decimal('600000000'),  # 600 میلیون
-                'accounts_payable': Decimal('400000000'),  # 400 میلیون
-                'current_liabilities': Decimal('1500000000'),  # 1.5 میلیارد
+                'total_assets': fin.line('total_assets'),
+                'fixed_assets': fin.line('fixed_assets'),
+                'current_assets': fin.line('current_assets'),
+                'inventory': fin.line('inventory'),
+                'accounts_receivable': fin.line('accounts_receivable'),
+                'accounts_payable': fin.line('accounts_payable'),
+                'current_liabilities': fin.line('current_liabilities'),
             },
             'operating_data': {
-                'average_inventory': Decimal('750000000'),  # 750 میلیون
-                'average_receivables': Decimal('550000000'),  # 550 میلیون
-                'average_payables': Decimal('380000000'),  # 380 میلیون
+                # میانگین مانده پایان ماه‌های دوره
+                'average_inventory': fin.average('inventory'),
+                'average_receivables': fin.average('accounts_receivable'),
+                'average_payables': fin.average('accounts_payable'),
             }
         }
     
-    def _calculate_inventory_turnover(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه گردش موجودی"""
+    def _calculate_inventory_turnover(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """گردش موجودی"""
         
         cost_of_goods_sold = data['income_statement']['cost_of_goods_sold']
         average_inventory = data['operating_data']['average_inventory']
         
-        if average_inventory == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = cost_of_goods_sold / average_inventory
-        
         assessment = self._assess_inventory_turnover(ratio)
         
         return {
@@ -100,7 +106,7 @@ class ActivityRatioAnalyzer:
             }
         }
     
-    def _assess_inventory_turnover(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_inventory_turnover(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی گردش موجودی"""
         
         value = float(ratio)
@@ -131,15 +137,11 @@ class ActivityRatioAnalyzer:
                 'interpretation': 'گردش موجودی بسیار پایین - شرکت در معرض ریسک موجودی‌های راکد قرار دارد'
             }
     
-    def _calculate_days_inventory_outstanding(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه دوره گردش موجودی (روز)"""
+    def _calculate_days_inventory_outstanding(self, values: Dict[str, float]) -> Dict[str, Any]:
+        """دوره گردش موجودی (روز)"""
         
-        inventory_turnover = self._calculate_inventory_turnover(data)['ratio']
-        
-        if inventory_turnover == 0:
-            days = Decimal('0')
-        else:
-            days = Decimal('365') / Decimal(str(inventory_turnover))
+        inventory_turnover = values['inventory_turnover']
+        days = values['days_inventory_outstanding']
         
         assessment = self._assess_days_inventory_outstanding(days)
         
@@ -154,7 +156,7 @@ class ActivityRatioAnalyzer:
             }
         }
     
-    def _assess_days_inventory_outstanding(self, days: Decimal) -> Dict[str, Any]:
+    def _assess_days_inventory_outstanding(self, days: float) -> Dict[str, Any]:
         """ارزیابی دوره گردش موجودی"""
         
         value = float(days)
@@ -185,17 +187,12 @@ class ActivityRatioAnalyzer:
                 'interpretation': 'دوره گردش موجودی بسیار طولانی - شرکت در معرض ریسک موجودی‌های راکد قرار دارد'
             }
     
-    def _calculate_receivables_turnover(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه گردش حساب‌های دریافتنی"""
+    def _calculate_receivables_turnover(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """گردش حساب‌های دریافتنی"""
         
         revenue = data['income_statement']['revenue']
         average_receivables = data['operating_data']['average_receivables']
         
-        if average_receivables == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = revenue / average_receivables
-        
         assessment = self._assess_receivables_turnover(ratio)
         
         return {
@@ -210,7 +207,7 @@ class ActivityRatioAnalyzer:
             }
         }
     
-    def _assess_receivables_turnover(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_receivables_turnover(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی گردش حساب‌های دریافتنی"""
         
         value = float(ratio)
@@ -241,15 +238,11 @@ class ActivityRatioAnalyzer:
                 'interpretation': 'گردش حساب‌های دریافتنی بسیار پایین - شرکت در معرض ریسک مطالبات معوق قرار دارد'
             }
     
-    def _calculate_days_sales_outstanding(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه دوره وصول مطالبات (روز)"""
-        
-        receivables_turnover = self._calculate_receivables_turnover(data)['ratio']
+    def _calculate_days_sales_outstanding(self, values: Dict[str, float]) -> Dict[str, Any]:
+        """دوره وصول مطالبات (روز)"""
         
-        if receivables_turnover == 0:
-            days = Decimal('0')
-        else:
-            days = Decimal('365') / Decimal(str(receivables_turnover))
+        receivables_turnover = values['receivables_turnover']
+        days = values['days_sales_outstanding']
         
         assessment = self._assess_days_sales_outstanding(days)
         
@@ -264,7 +257,7 @@ class ActivityRatioAnalyzer:
             }
         }
     
-    def _assess_days_sales_outstanding(self, days: Decimal) -> Dict[str, Any]:
+    def _assess_days_sales_outstanding(self, days: float) -> Dict[str, Any]:
         """ارزیابی دوره وصول مطالبات"""
         
         value = float(days)
@@ -295,17 +288,12 @@ class ActivityRatioAnalyzer:
                 'interpretation': 'دوره وصول مطالبات بسیار طولانی - شرکت در معرض ریسک مطالبات معوق قرار دارد'
             }
     
-    def _calculate_payables_turnover(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه گردش حساب‌های پرداختنی"""
+    def _calculate_payables_turnover(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """گردش حساب‌های پرداختنی"""
         
         cost_of_goods_sold = data['income_statement']['cost_of_goods_sold']
         average_payables = data['operating_data']['average_payables']
         
-        if average_payables == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = cost_of_goods_sold / average_payables
-        
         assessment = self._assess_payables_turnover(ratio)
         
         return {
@@ -320,7 +308,7 @@ class ActivityRatioAnalyzer:
             }
         }
     
-    def _assess_payables_turnover(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_payables_turnover(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی گردش حساب‌های پرداختنی"""
         
         value = float(ratio)
@@ -351,15 +339,11 @@ class ActivityRatioAnalyzer:
                 'interpretation': 'گردش حساب‌های پرداختنی بسیار بالا - شرکت در معرض ریسک نقدینگی قرار دارد'
             }
     
-    def _calculate_days_payables_outstanding(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه دوره پرداخت بدهی‌ها (روز)"""
+    def _calculate_days_payables_outstanding(self, values: Dict[str, float]) -> Dict[str, Any]:
+        """دوره پرداخت بدهی‌ها (روز)"""
         
-        payables_turnover = self._calculate_payables_turnover(data)['ratio']
-        
-        if payables_turnover == 0:
-            days = Decimal('0')
-        else:
-            days = Decimal('365') / Decimal(str(payables_turnover))
+        payables_turnover = values['payables_turnover']
+        days = values['days_payables_outstanding']
         
         assessment = self._assess_days_payables_outstanding(days)
         
@@ -374,7 +358,7 @@ class ActivityRatioAnalyzer:
             }
         }
     
-    def _assess_days_payables_outstanding(self, days: Decimal) -> Dict[str, Any]:
+    def _assess_days_payables_outstanding(self, days: float) -> Dict[str, Any]:
         """ارزیابی دوره پرداخت بدهی‌ها"""
         
         value = float(days)
@@ -405,14 +389,13 @@ class ActivityRatioAnalyzer:
                 'interpretation': 'دوره پرداخت بدهی‌ها بسیار کوتاه - شرکت در معرض ریسک نقدینگی قرار دارد'
             }
     
-    def _calculate_cash_conversion_cycle(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه چرخه تبدیل نقدی"""
-        
-        dio = self._calculate_days_inventory_outstanding(data)['ratio']
-        dso = self._calculate_days_sales_outstanding(data)['ratio']
-        dpo = self._calculate_days_payables_outstanding(data)['ratio']
+    def _calculate_cash_conversion_cycle(self, values: Dict[str, float]) -> Dict[str, Any]:
+        """چرخه تبدیل نقدی"""
         
-        ccc = Decimal(str(dio)) + Decimal(str(dso)) - Decimal(str(dpo))
+        dio = values['days_inventory_outstanding']
+        dso = values['days_sales_outstanding']
+        dpo = values['days_payables_outstanding']
+        ccc = values['cash_conversion_cycle']
         
         assessment = self._assess_cash_conversion_cycle(ccc)
         
@@ -429,7 +412,7 @@ class ActivityRatioAnalyzer:
             }
         }
     
-    def _assess_cash_conversion_cycle(self, ccc: Decimal) -> Dict[str, Any]:
+    def _assess_cash_conversion_cycle(self, ccc: float) -> Dict[str, Any]:
         """ارزیابی چرخه تبدیل نقدی"""
         
         value = float(ccc)
@@ -460,17 +443,12 @@ class ActivityRatioAnalyzer:
                 'interpretation': 'چرخه تبدیل نقدی بسیار طولانی - شرکت در معرض ریسک نقدینگی جدی قرار دارد'
             }
     
-    def _calculate_asset_turnover(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه گردش دارایی‌ها"""
+    def _calculate_asset_turnover(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """گردش دارایی‌ها"""
         
         revenue = data['income_statement']['revenue']
         total_assets = data['balance_sheet']['total_assets']
         
-        if total_assets == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = revenue / total_assets
-        
         assessment = self._assess_asset_turnover(ratio)
         
         return {
@@ -485,7 +463,7 @@ class ActivityRatioAnalyzer:
             }
         }
     
-    def _assess_asset_turnover(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_asset_turnover(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی گردش دارایی‌ها"""
         
         value = float(ratio)
@@ -516,17 +494,12 @@ class ActivityRatioAnalyzer:
                 'interpretation': 'گردش دارایی‌ها بسیار پایین - شرکت استفاده ناکارآمدی از دارایی‌ها دارد'
             }
     
-    def _calculate_fixed_asset_turnover(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه گردش دارایی‌های ثابت"""
+    def _calculate_fixed_asset_turnover(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """گردش دارایی‌های ثابت"""
         
         revenue = data['income_statement']['revenue']
         fixed_assets = data['balance_sheet']['fixed_assets']
         
-        if fixed_assets == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = revenue / fixed_assets
-        
         assessment = self._assess_fixed_asset_turnover(ratio)
         
         return {
@@ -541,7 +514,7 @@ class ActivityRatioAnalyzer:
             }
         }
     
-    def _assess_fixed_asset_turnover(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_fixed_asset_turnover(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی گردش دارایی‌های ثابت"""
         
         value = float(ratio)
@@ -572,20 +545,14 @@ class ActivityRatioAnalyzer:
                 'interpretation': 'گردش دارایی‌های ثابت بسیار پایین - شرکت استفاده ناکارآمدی از دارایی‌های ثابت دارد'
             }
     
-    def _calculate_working_capital_turnover(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه گردش سرمایه در گردش"""
+    def _calculate_working_capital_turnover(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """گردش سرمایه در گردش"""
         
         revenue = data['income_statement']['revenue']
         current_assets = data['balance_sheet']['current_assets']
         current_liabilities = data['balance_sheet']['current_liabilities']
-        
         working_capital = current_assets - current_liabilities
         
-        if working_capital == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = revenue / working_capital
-        
         assessment = self._assess_working_capital_turnover(ratio)
         
         return {
@@ -602,7 +569,7 @@ class ActivityRatioAnalyzer:
             }
         }
     
-    def _assess_working_capital_turnover(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_working_capital_turnover(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی گردش سرمایه در گردش"""
         
         value = float(ratio)
@@ -891,7 +858,7 @@ class ActivityRatioTool:
             company = Company.objects.get(id=company_id)
             period = FinancialPeriod.objects.get(id=period_id)
             
-            analyzer = ActivityRatioAnalyzer(company, period)
+            analyzer = ActivityRatioAnalyzer(company, period, financials=period_financials(company, period))
             result = analyzer.calculate_all_activity_ratios()
             
             return {
@@ -5,13 +5,15 @@
 """
 
 from typing import Dict, List, Any, Optional
-from datetime import datetime, timedelta
+from datetime import datetime
 from decimal import Decimal
 import json
 import logging
 import pandas as pd
 from users.models import User, Company, FinancialPeriod
 from financial_system.models import FinancialData, RatioAnalysis, ReportTemplate
+from financial_system.models.history_models import HistoryEntry
+from financial_system.services import history_store
 
 
 class AdvancedReportingSystem:
@@ -20,7 +22,6 @@ class AdvancedReportingSystem:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self.report_templates = {}
-        self.report_history = []
     
     def generate_comprehensive_report(self, company_id: int, period_id: int, 
                                    report_type: str = 'comprehensive') -> Dict[str, Any]:
@@ -1130,40 +1131,36 @@ class AdvancedReportingSystem:
         """ذخیره گزارش در تاریخچه"""
         
         try:
-            self.report_history.append({
-                'report_id': report.get('report_id'),
-                'company_id': report.get('company_id'),
-                'company_name': report.get('company_name'),
-                'period_id': report.get('period_id'),
-                'report_type': report.get('report_type'),
-                'generation_date': report.get('generation_date'),
-                'timestamp': datetime.now()
-            })
+            history_store.record_entry(
+                HistoryEntry.KIND_REPORT,
+                company_id=report.get('company_id'),
+                period_id=report.get('period_id'),
+                reference=report.get('report_id'),
+                summary={
+                    'company_name': report.get('company_name'),
+                    'report_type': report.get('report_type'),
+                    'generation_date': report.get('generation_date')
+                }
+            )
             
-            # محدود کردن تاریخچه به ۱۰۰ گزارش اخیر
-            if len(self.report_history) > 100:
-                self.report_history = self.report_history[-100:]
-                
         except Exception as e:
             self.logger.error(f"خطا در ذخیره گزارش در تاریخچه: {str(e)}")
     
     def get_report_history(self, company_id: Optional[int] = None, days_back: int = 90) -> List[Dict[str, Any]]:
         """دریافت تاریخچه گزارش‌ها"""
         
-        cutoff_date = datetime.now() - timedelta(days=days_back)
-        
-        filtered_history = [
-            entry for entry in self.report_history
-            if entry.get('timestamp', datetime.min) >= cutoff_date
+        return [
+            {
+                'report_id': entry.reference,
+                'company_id': entry.company_id,
+                'company_name': entry.summary.get('company_name'),
+                'period_id': entry.period_id,
+                'report_type': entry.summary.get('report_type'),
+                'generation_date': entry.summary.get('generation_date'),
+                'timestamp': entry.created_at
+            }
+            for entry in history_store.history(HistoryEntry.KIND_REPORT, company_id, days_back=days_back)
         ]
-        
-        if company_id:
-            filtered_history = [
-                entry for entry in filtered_history
-                if entry.get('company_id') == company_id
-            ]
-        
-        return filtered_history
 
 
 # ابزار LangChain برای گزارش‌دهی پیشرفته
@@ -0,0 +1,145 @@
+# financial_system/services/amount_sketch.py
+"""
+خلاصه آماری جریانی مبالغ (quantile sketch)
+مبالغ (واحد جزء) در سطل‌های لگاریتمی-خطی با دو رقم بامعنا شمارش می‌شوند؛ کلید سطل (تعداد ارقام،
+دو رقم اول) در خود SQL ساخته می‌شود و کل خلاصه با یک کوئری GROUP BY به همراه تعداد، جمع و جمع
+مربعات دقیق به دست می‌آید. چندک‌ها (میانه، صدک‌ها) و MAD با خطای نسبی کمتر از ۱۰٪ از همین سطل‌ها
+محاسبه می‌شوند و خلاصه‌ها قابل ادغام‌اند.
+"""
+
+from typing import Dict, Iterable, Sequence, Tuple
+
+import numpy as np
+from django.db.models import Case, CharField, Count, FloatField, IntegerField, Sum, When
+from django.db.models.functions import Cast, Length, Substr
+
+from financial_system.services.account_hierarchy import minor_units_expression
+
+# ضریب تبدیل MAD به انحراف معیار در توزیع نرمال
+MAD_SCALE = 1.4826
+
+
+class AmountSketch:
+    """هیستوگرام لگاریتمی-خطی مبالغ مثبت با آمار دقیق تعداد، جمع و جمع مربعات"""
+
+    def __init__(self):
+        self.buckets: Dict[Tuple[int, int], int] = {}
+        self.count = 0
+        self.total = 0
+        self.sum_squares = 0.0
+
+    @staticmethod
+    def bucket_of(value: int) -> Tuple[int, int]:
+        """کلید سطل یک مبلغ: (تعداد ارقام، دو رقم اول)"""
+        text = str(int(value))
+        return len(text), int(text[:2])
+
+    @staticmethod
+    def bucket_bounds(length: int, lead: int) -> Tuple[int, int]:
+        """بازه [پایین، بالا) مبالغ یک سطل"""
+        scale = 10 ** (length - len(str(lead)))
+        return lead * scale, (lead + 1) * scale
+
+    def add_bucket(self, length: int, lead: int, count: int, total: int = 0, sum_squares: float = 0.0) -> None:
+        key = (int(length), int(lead))
+        self.buckets[key] = self.buckets.get(key, 0) + int(count)
+        self.count += int(count)
+        self.total += int(total or 0)
+        self.sum_squares += float(sum_squares or 0)
+
+    def add(self, values: Iterable[int]) -> None:
+        """افزودن مبالغ (واحد جزء) به صورت جریانی؛ مقادیر غیرمثبت نادیده گرفته می‌شوند"""
+        values = np.asarray(list(values) if not isinstance(values, np.ndarray) else values, dtype=np.int64)
+        values = values[values > 0]
+        for value in values.tolist():
+            self.add_bucket(*self.bucket_of(value), 1, value, float(value) ** 2)
+
+    def merge(self, other: 'AmountSketch') -> 'AmountSketch':
+        for (length, lead), count in other.buckets.items():
+            self.add_bucket(length, lead, count)
+        self.total += other.total
+        self.sum_squares += other.sum_squares
+        return self
+
+    @classmethod
+    def from_queryset(cls, queryset, fields: Sequence[str] = ('debit', 'credit')) -> 'AmountSketch':
+        """خلاصه مبالغ مثبت چند ستون با یک کوئری گروه‌بندی‌شده روی کلید سطل‌ها"""
+        keys, annotations = {}, {'rows': Count('id')}
+        for field in fields:
+            positive = {f'{field}__gt': 0}
+            minor = minor_units_expression(field)
+            text = Cast(minor, output_field=CharField())
+            keys[f'{field}_length'] = Case(When(**positive, then=Length(text)), default=None, output_field=IntegerField())
+            keys[f'{field}_lead'] = Case(
+                When(**positive, then=Cast(Substr(text, 1, 2), output_field=IntegerField())),
+                default=None, output_field=IntegerField()
+            )
+            annotations[f'{field}_total'] = Sum(Case(When(**positive, then=minor), default=0))
+            as_float = Cast(minor, output_field=FloatField())
+            annotations[f'{field}_squares'] = Sum(
+                Case(When(**positive, then=as_float * as_float), default=0.0, output_field=FloatField())
+            )
+
+        sketch = cls()
+        rows = queryset.annotate(**keys).values(*keys).annotate(**annotations).order_by()
+        for row in rows:
+            for field in fields:
+                if row[f'{field}_length'] is not None:
+                    sketch.add_bucket(
+                        row[f'{field}_length'], row[f'{field}_lead'], row['rows'],
+                        row[f'{field}_total'], row[f'{field}_squares']
+                    )
+        return sketch
+
+    def _histogram(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """مرزهای پایین و بالا و تعداد سطل‌ها به ترتیب صعودی"""
+        if not self.buckets:
+            empty = np.array([], dtype=np.float64)
+            return empty, empty, empty
+        bounds = [self.bucket_bounds(length, lead) for length, lead in self.buckets]
+        lower = np.array([bound[0] for bound in bounds], dtype=np.float64)
+        upper = np.array([bound[1] for bound in bounds], dtype=np.float64)
+        counts = np.array(list(self.buckets.values()), dtype=np.float64)
+        order = np.argsort(lower)
+        return lower[order], upper[order], counts[order]
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def std(self) -> float:
+        """انحراف معیار جامعه از جمع و جمع مربعات دقیق"""
+        if not self.count:
+            return 0.0
+        mean = self.mean()
+        return float(np.sqrt(max(self.sum_squares / self.count - mean * mean, 0.0)))
+
+    def quantiles(self, probabilities: Sequence[float]) -> np.ndarray:
+        """چندک‌ها با درون‌یابی خطی داخل سطل"""
+        lower, upper, counts = self._histogram()
+        if not counts.size:
+            return np.zeros(len(probabilities))
+        cumulative = np.cumsum(counts)
+        ranks = np.clip(np.asarray(probabilities, dtype=np.float64), 0, 1) * cumulative[-1]
+        positions = np.minimum(np.searchsorted(cumulative, ranks, side='left'), counts.size - 1)
+        before = np.where(positions > 0, cumulative[positions - 1], 0)
+        fraction = np.clip((ranks - before) / counts[positions], 0, 1)
+        return lower[positions] + fraction * (upper[positions] - lower[positions])
+
+    def quantile(self, probability: float) -> float:
+        return float(self.quantiles([probability])[0])
+
+    def median_absolute_deviation(self) -> float:
+        """MAD تقریبی: میانه وزنی فاصله مرکز سطل‌ها از میانه"""
+        lower, upper, counts = self._histogram()
+        if not counts.size:
+            return 0.0
+        deviations = np.abs((lower + upper) / 2 - self.quantile(0.5))
+        order = np.argsort(deviations)
+        cumulative = np.cumsum(counts[order])
+        return float(deviations[order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+
+    def count_above(self, threshold: float) -> float:
+        """تعداد تقریبی مبالغ بزرگ‌تر از آستانه (سطل مرزی به نسبت بازه)"""
+        lower, upper, counts = self._histogram()
+        share = np.clip((upper - threshold) / (upper - lower), 0, 1)
+        return float((counts * share).sum())
@@ -0,0 +1,72 @@
+# financial_system/services/audit_snapshot.py
+"""
+تصویر حسابرسی دوره
+آرتیکل‌ها (تصویر ستونی دفتر)، سربرگ اسناد و شرح آرتیکل‌های نامزد تکرار یک دوره یک بار در نخ اصلی
+بارگذاری می‌شوند تا تمام خانواده‌های تست حسابرسی بدون کوئری مجدد و به صورت هم‌زمان روی همین آرایه‌ها اجرا شوند.
+"""
+
+from typing import Dict
+
+import numpy as np
+from django.db.models import Q
+
+from financial_system.models.document_models import DocumentHeader, DocumentItem
+from financial_system.services.duplicate_detector import DuplicateDetector
+from financial_system.services.ledger_snapshot import LedgerSnapshot
+from users.models import Company, FinancialPeriod
+
+
+class PeriodAuditSnapshot:
+    """آرایه‌های ستونی سربرگ‌ها و آرتیکل‌های یک دوره برای تست‌های حسابرسی"""
+
+    def __init__(self, ledger: LedgerSnapshot, header_ids, document_numbers, header_date_keys,
+                 empty_description_count: int, duplicates: DuplicateDetector = None):
+        self.ledger = ledger
+        self.company = ledger.company
+        self.period = ledger.period
+        self.header_ids = np.asarray(header_ids, dtype=np.int64)
+        self.document_numbers = np.asarray(document_numbers, dtype=str)
+        self.header_date_keys = np.asarray(header_date_keys, dtype=np.int64)
+        self.empty_description_count = empty_description_count
+        self.duplicates = duplicates or DuplicateDetector(ledger)
+
+    @classmethod
+    def load(cls, company: Company, period: FinancialPeriod) -> 'PeriodAuditSnapshot':
+        """بارگذاری تصویر دفتر، سربرگ‌ها، تعداد آرتیکل‌های بدون شرح و شرح آرتیکل‌های هم‌مبلغ"""
+        ledger = LedgerSnapshot.load(company, period)
+        headers = list(
+            DocumentHeader.objects.filter(company=company, period=period).values_list(
+                'id', 'document_number', 'date_key'
+            ).order_by()
+        )
+        columns = list(zip(*headers)) if headers else [(), (), ()]
+        empty_description_count = DocumentItem.objects.filter(
+            document__company=company,
+            document__period=period
+        ).filter(Q(description__isnull=True) | Q(description='')).count()
+        duplicates = DuplicateDetector(ledger)
+        duplicates.load_details()
+        return cls(ledger, *columns, empty_description_count=empty_description_count, duplicates=duplicates)
+
+    def document_imbalance(self) -> np.ndarray:
+        """اختلاف بدهکار و بستانکار هر سند دارای آرتیکل (واحد جزء)"""
+        documents, position = np.unique(self.ledger.document_ids, return_inverse=True)
+        imbalance = np.zeros(documents.size, dtype=np.int64)
+        np.add.at(imbalance, position, self.ledger.debits - self.ledger.credits)
+        return imbalance
+
+    def account_turnover(self):
+        """گردش بدهکار و بستانکار هر حساب جدول تصویر (واحد جزء، به ترتیب accounts_index)"""
+        debit = np.zeros(self.ledger.accounts_index.size, dtype=np.int64)
+        credit = np.zeros_like(debit)
+        np.add.at(debit, self.ledger.account_position, self.ledger.debits)
+        np.add.at(credit, self.ledger.account_position, self.ledger.credits)
+        return debit, credit
+
+    def numeric_document_numbers(self) -> np.ndarray:
+        """شماره‌های عددی اسناد (شماره‌های غیرعددی کنار گذاشته می‌شوند)"""
+        numeric = np.char.isdigit(self.document_numbers) if self.document_numbers.size else np.array([], dtype=bool)
+        return self.document_numbers[numeric].astype(np.int64)
+
+    def summary(self) -> Dict[str, int]:
+        return {'documents': int(self.header_ids.size), 'items': len(self.ledger)}
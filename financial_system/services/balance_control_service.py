@@ -1,5 +1,7 @@
 # financial_system/services/balance_control_service.py
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import BooleanField, Count, ExpressionWrapper, F, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from typing import Dict, List, Optional, Tuple
@@ -8,6 +10,9 @@ from decimal import Decimal
 
 from financial_system.models.document_models import DocumentHeader, DocumentItem
 from financial_system.models.coding_models import ChartOfAccounts
+from financial_system.services.account_hierarchy import MINOR_UNITS, from_minor_units, minor_units_expression
+from financial_system.services.jalali_calendar import gregorian_to_date_key
+from financial_system.services.report_cache import ledger_batch, mark_ledger_changed
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -22,10 +27,14 @@ class BalanceControlService:
     def check_document_balance(self, document_header: DocumentHeader) -> Dict:
         """بررسی توازن یک سند مالی"""
         try:
-            # محاسبه جمع بدهکار و بستانکار از آرتیکل‌ها
-            items = document_header.items.all()
-            total_debit = sum(item.debit for item in items)
-            total_credit = sum(item.credit for item in items)
+            # محاسبه جمع بدهکار و بستانکار آرتیکل‌ها با یک کوئری تجمیعی
+            totals = document_header.items.aggregate(
+                total_debit=Coalesce(Sum('debit'), Decimal('0'), output_field=models.DecimalField()),
+                total_credit=Coalesce(Sum('credit'), Decimal('0'), output_field=models.DecimalField()),
+                items_count=Count('id')
+            )
+            total_debit = totals['total_debit']
+            total_credit = totals['total_credit']
             
             # بررسی توازن
             difference = abs(total_debit - total_credit)
@@ -35,7 +44,7 @@ class BalanceControlService:
             document_header.total_debit = total_debit
             document_header.total_credit = total_credit
             document_header.is_balanced = is_balanced
-            document_header.save()
+            document_header.save(update_fields=['total_debit', 'total_credit', 'is_balanced'])
             
             return {
                 'is_balanced': is_balanced,
@@ -43,13 +52,98 @@ class BalanceControlService:
                 'total_credit': total_credit,
                 'difference': difference,
                 'document_number': document_header.document_number,
-                'items_count': len(items)
+                'items_count': totals['items_count']
             }
             
         except Exception as e:
             logger.error(f"خطا در بررسی توازن سند {document_header.document_number}: {e}")
             raise
     
+    def unbalanced_documents(self, documents) -> List[Dict]:
+        """
+        اسناد نامتوازن یک مجموعه سربرگ با یک کوئری گروه‌بندی‌شده (HAVING) روی جمع مجدد آرتیکل‌ها.
+        جمع‌ها به صورت عدد صحیح واحد جزء محاسبه می‌شوند تا مقایسه با تحمل خطا در همه پایگاه‌داده‌ها دقیق باشد.
+        """
+        tolerance = int(self.tolerance * MINOR_UNITS)
+        rows = documents.annotate(
+            item_debit=Coalesce(Sum(minor_units_expression('items__debit')), 0),
+            item_credit=Coalesce(Sum(minor_units_expression('items__credit')), 0),
+            items_count=Count('items'),
+            last_row=Coalesce(Max('items__row_number'), 0)
+        ).annotate(
+            item_difference=F('item_debit') - F('item_credit')
+        ).filter(
+            Q(item_difference__gt=tolerance) | Q(item_difference__lt=-tolerance)
+        ).values(
+            'id', 'document_number', 'date_key', 'item_debit', 'item_credit', 'item_difference', 'items_count', 'last_row'
+        ).order_by('id')
+        
+        return [
+            {
+                'document_id': row['id'],
+                'document_number': row['document_number'],
+                'date_key': row['date_key'],
+                'total_debit': from_minor_units(row['item_debit']),
+                'total_credit': from_minor_units(row['item_credit']),
+                'difference': from_minor_units(abs(row['item_difference'])),
+                'needs_credit': row['item_difference'] > 0,
+                'items_count': row['items_count'],
+                'last_row': row['last_row']
+            }
+            for row in rows
+        ]
+    
+    def refresh_header_totals(self, company_id: int, period_id: int) -> int:
+        """
+        به‌روزرسانی جمع بدهکار، بستانکار و وضعیت توازن سربرگ‌های دوره با یک دستور UPDATE ... FROM
+        روی جمع گروه‌بندی‌شده آرتیکل‌ها؛ فقط سربرگ‌های تغییرکرده نوشته می‌شوند. خروجی تعداد سربرگ‌های به‌روزشده است.
+        """
+        if connection.vendor in ('postgresql', 'sqlite'):
+            header = connection.ops.quote_name(DocumentHeader._meta.db_table)
+            item = connection.ops.quote_name(DocumentItem._meta.db_table)
+            tolerance = float(self.tolerance)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    UPDATE {header}
+                    SET total_debit = totals.debit,
+                        total_credit = totals.credit,
+                        is_balanced = (ABS(totals.debit - totals.credit) <= %s)
+                    FROM (
+                        SELECT h.id AS document_id,
+                               ROUND(COALESCE(SUM(i.debit), 0), 2) AS debit,
+                               ROUND(COALESCE(SUM(i.credit), 0), 2) AS credit
+                        FROM {header} h
+                        LEFT JOIN {item} i ON i.document_id = h.id
+                        WHERE h.company_id = %s AND h.period_id = %s
+                        GROUP BY h.id
+                    ) AS totals
+                    WHERE {header}.id = totals.document_id
+                      AND ({header}.total_debit <> totals.debit
+                           OR {header}.total_credit <> totals.credit
+                           OR {header}.is_balanced <> (ABS(totals.debit - totals.credit) <= %s))
+                    """,
+                    [tolerance, company_id, period_id, tolerance]
+                )
+                updated = cursor.rowcount
+        else:
+            # پایگاه‌داده‌های بدون UPDATE ... FROM: زیرکوئری‌های هم‌بسته در یک دستور UPDATE
+            items = DocumentItem.objects.filter(document=OuterRef('pk')).order_by().values('document')
+            documents = DocumentHeader.objects.filter(company_id=company_id, period_id=period_id)
+            updated = documents.update(
+                total_debit=Coalesce(Subquery(items.annotate(total=Sum('debit')).values('total')), Decimal('0')),
+                total_credit=Coalesce(Subquery(items.annotate(total=Sum('credit')).values('total')), Decimal('0'))
+            )
+            documents.update(is_balanced=ExpressionWrapper(
+                Q(total_debit__lte=F('total_credit') + self.tolerance, total_credit__lte=F('total_debit') + self.tolerance),
+                output_field=BooleanField()
+            ))
+        
+        if updated:
+            # دستور خام سیگنال ذخیره ندارد؛ تغییر دفتر برای کش گزارش‌ها دستی ثبت می‌شود
+            mark_ledger_changed(company_id, period_id)
+        return updated
+    
     def analyze_balance_issues(self, document_header: DocumentHeader) -> Dict:
         """تحلیل مشکلات توازن و ارائه راه‌حل"""
         balance_check = self.check_document_balance(document_header)
@@ -264,46 +358,47 @@ class BalanceControlService:
                 'corrected': False
             }
     
+    def _adjustment_account(self) -> ChartOfAccounts:
+        """حساب تنظیمی تفاوت (در صورت نبود ایجاد می‌شود)"""
+        adjustment_account, created = ChartOfAccounts.objects.get_or_create(
+            code='999999',
+            defaults={
+                'name': 'حساب تنظیمی تفاوت',
+                'level': 'DETAIL',
+                'is_active': True
+            }
+        )
+        return adjustment_account
+    
+    def _adjustment_item(self, document_id: int, date_key: int, row_number: int, difference: Decimal,
+                         needs_credit: bool, adjustment_account: ChartOfAccounts) -> DocumentItem:
+        """آرتیکل تنظیمی یک سند (بستانکار وقتی جمع بدهکار بیشتر است و برعکس)"""
+        return DocumentItem(
+            document_id=document_id,
+            date_key=date_key,
+            row_number=row_number,
+            account=adjustment_account,
+            debit=Decimal('0') if needs_credit else difference,
+            credit=difference if needs_credit else Decimal('0'),
+            description='تنظیم تفاوت - بستانکار' if needs_credit else 'تنظیم تفاوت - بدهکار'
+        )
+    
     def _add_adjustment_item(self, document_header: DocumentHeader, difference: Decimal) -> Dict:
         """افزودن ردیف تنظیمی برای اصلاح توازن"""
         try:
-            # ایجاد حساب تنظیمی اگر وجود ندارد
-            adjustment_account, created = ChartOfAccounts.objects.get_or_create(
-                code='999999',
-                defaults={
-                    'name': 'حساب تنظیمی تفاوت',
-                    'level': 'DETAIL',
-                    'is_active': True
-                }
+            # تعیین نوع تنظیم (بدهکار یا بستانکار) و آخرین ردیف با یک کوئری تجمیعی
+            totals = document_header.items.aggregate(
+                total_debit=Sum('debit'), total_credit=Sum('credit'), last_row=Max('row_number')
             )
+            needs_credit = (totals['total_debit'] or 0) > (totals['total_credit'] or 0)
             
-            # تعیین نوع تنظیم (بدهکار یا بستانکار)
-            items = document_header.items.all()
-            total_debit = sum(item.debit for item in items)
-            total_credit = sum(item.credit for item in items)
-            
-            if total_debit > total_credit:
-                # نیاز به بستانکار
-                debit = Decimal('0')
-                credit = difference
-                description = 'تنظیم تفاوت - بستانکار'
-            else:
-                # نیاز به بدهکار
-                debit = difference
-                credit = Decimal('0')
-                description = 'تنظیم تفاوت - بدهکار'
-            
-            # ایجاد آرتیکل تنظیمی
-            max_row_number = items.aggregate(models.Max('row_number'))['row_number__max'] or 0
-            
-            DocumentItem.objects.create(
-                document=document_header,
-                row_number=max_row_number + 1,
-                account=adjustment_account,
-                debit=debit,
-                credit=credit,
-                description=description
+            # ایجاد آرتیکل تنظیمی (با سربرگ بارگذاری‌شده تا سیگنال ذخیره تغییر دفتر را ثبت کند)
+            adjustment = self._adjustment_item(
+                document_header.id, document_header.date_key, (totals['last_row'] or 0) + 1, difference, needs_credit,
+                self._adjustment_account()
             )
+            adjustment.document = document_header
+            adjustment.save()
             
             # بررسی مجدد توازن
             final_check = self.check_document_balance(document_header)
@@ -319,6 +414,66 @@ class BalanceControlService:
         except Exception as e:
             logger.error(f"خطا در افزودن ردیف تنظیمی: {e}")
             raise
+    
+    def apply_bulk_correction(self, company_id: int, period_id: int, document_ids: Optional[List[int]] = None) -> Dict:
+        """
+        اصلاح گروهی توازن: اسناد نامتوازن با یک کوئری HAVING یافته می‌شوند، برای همه در یک تراکنش ردیف تنظیمی
+        با bulk_create افزوده می‌شود و جمع سربرگ‌ها با یک دستور UPDATE ... FROM به‌روز می‌شود.
+        """
+        try:
+            with transaction.atomic(), ledger_batch():
+                documents = DocumentHeader.objects.filter(company_id=company_id, period_id=period_id)
+                if document_ids is not None:
+                    documents = documents.filter(id__in=document_ids)
+                unbalanced = self.unbalanced_documents(documents)
+                
+                if not unbalanced:
+                    return {
+                        'success': True,
+                        'message': 'سند نامتوازنی یافت نشد',
+                        'corrected': False,
+                        'corrected_documents': 0
+                    }
+                
+                adjustment_account = self._adjustment_account()
+                DocumentItem.objects.bulk_create(
+                    [
+                        self._adjustment_item(
+                            document['document_id'], document['date_key'], document['last_row'] + 1,
+                            document['difference'], document['needs_credit'], adjustment_account
+                        )
+                        for document in unbalanced
+                    ],
+                    batch_size=1000
+                )
+                refreshed_headers = self.refresh_header_totals(company_id, period_id)
+                # bulk_create سیگنال ذخیره ندارد
+                mark_ledger_changed(company_id, period_id)
+            
+            return {
+                'success': True,
+                'message': f'{len(unbalanced)} سند با ردیف تنظیمی اصلاح شد',
+                'corrected': True,
+                'corrected_documents': len(unbalanced),
+                'refreshed_headers': refreshed_headers,
+                'total_adjustment': sum((document['difference'] for document in unbalanced), Decimal('0')),
+                'adjustments': [
+                    {
+                        'document_number': document['document_number'],
+                        'amount': document['difference'],
+                        'side': 'credit' if document['needs_credit'] else 'debit'
+                    }
+                    for document in unbalanced
+                ]
+            }
+            
+        except Exception as e:
+            logger.error(f"خطا در اصلاح گروهی توازن اسناد {company_id}/{period_id}: {e}")
+            return {
+                'success': False,
+                'message': f'خطا در اعمال اصلاح: {str(e)}',
+                'corrected': False
+            }
 
 
 class DocumentBalanceTool:
@@ -336,17 +491,30 @@ class DocumentBalanceTool:
             )
             
             total_documents = documents.count()
-            balanced_documents = documents.filter(is_balanced=True).count()
-            unbalanced_documents = total_documents - balanced_documents
+            # اسناد نامتوازن با یک کوئری HAVING روی جمع مجدد آرتیکل‌ها (مستقل از پرچم ذخیره‌شده سربرگ)
+            unbalanced = self.balance_service.unbalanced_documents(documents)
+            unbalanced_documents = len(unbalanced)
+            balanced_documents = total_documents - unbalanced_documents
             
             # تحلیل اسناد نامتوازن
-            unbalanced_analysis = []
-            for doc in documents.filter(is_balanced=False):
-                analysis = self.balance_service.analyze_balance_issues(doc)
-                unbalanced_analysis.append({
-                    'document_number': doc.document_number,
-                    'analysis': analysis
-                })
+            unbalanced_analysis = [
+                {
+                    'document_number': row['document_number'],
+                    'analysis': {
+                        'has_issues': True,
+                        'balance_check': {
+                            'is_balanced': False,
+                            'total_debit': row['total_debit'],
+                            'total_credit': row['total_credit'],
+                            'difference': row['difference'],
+                            'document_number': row['document_number'],
+                            'items_count': row['items_count']
+                        },
+                        'correction_options': self.balance_service._get_correction_options(row['difference'])
+                    }
+                }
+                for row in unbalanced
+            ]
             
             return {
                 'company_id': company_id,
@@ -371,23 +539,21 @@ class DocumentBalanceTool:
             
             start_date = timezone.now() - timedelta(days=days_back)
             
+            # تاریخ سند رشته شمسی است؛ مقایسه روی کلید تاریخ عددی انجام می‌شود
             documents = DocumentHeader.objects.filter(
                 company_id=company_id,
-                document_date__gte=start_date
+                date_key__gte=gregorian_to_date_key(start_date.date())
             )
             
+            total_documents = documents.count()
+            unbalanced = self.balance_service.unbalanced_documents(documents)
             balance_stats = {
-                'total_documents': documents.count(),
-                'balanced_documents': documents.filter(is_balanced=True).count(),
-                'unbalanced_documents': documents.filter(is_balanced=False).count(),
-                'total_difference': Decimal('0')
+                'total_documents': total_documents,
+                'balanced_documents': total_documents - len(unbalanced),
+                'unbalanced_documents': len(unbalanced),
+                'total_difference': sum((row['difference'] for row in unbalanced), Decimal('0'))
             }
             
-            # محاسبه مجموع تفاوت‌ها
-            for doc in documents.filter(is_balanced=False):
-                balance_check = self.balance_service.check_document_balance(doc)
-                balance_stats['total_difference'] += balance_check['difference']
-            
             # تحلیل روند
             trend_analysis = self._analyze_balance_trend(documents)
             
@@ -424,7 +590,7 @@ class DocumentBalanceTool:
                 f"تفاوت کل توازن {balance_stats['total_difference']} ریال است - نیاز به توجه فوری"
             )
         
-        if balance_stats['balanced_documents'] / balance_stats['total_documents'] < 0.9:
+        if balance_stats['total_documents'] and balance_stats['balanced_documents'] / balance_stats['total_documents'] < 0.9:
             recommendations.append(
                 "نسبت اسناد متوازن کمتر از 90% است - نیاز به بهبود فرآیندها"
             )
@@ -4,21 +4,27 @@
 این سرویس برای تحلیل و کنترل توازن ترازنامه طراحی شده است.
 """
 
-from django.db.models import Sum, Q
 from decimal import Decimal
 from typing import Dict, List, Tuple
-from financial_system.models.document_models import DocumentHeader, DocumentItem
-from financial_system.models.coding_models import ChartOfAccounts
+from financial_system.services.ledger_snapshot import LedgerSnapshot
 from users.models import Company, FinancialPeriod
 
 
 class BalanceSheetAnalyzer:
     """تحلیل‌گر توازن ترازنامه"""
     
-    def __init__(self, company: Company, period: FinancialPeriod):
+    def __init__(self, company: Company, period: FinancialPeriod, snapshot: LedgerSnapshot = None):
         self.company = company
         self.period = period
         self.analysis_result = {}
+        self._snapshot = snapshot
+    
+    @property
+    def snapshot(self) -> LedgerSnapshot:
+        """تصویر ستونی دوره؛ در صورت نبود تصویر مشترک، یک بار بارگذاری می‌شود"""
+        if self._snapshot is None:
+            self._snapshot = LedgerSnapshot.load(self.company, self.period)
+        return self._snapshot
     
     def analyze_balance_sheet(self) -> Dict:
         """تحلیل کامل توازن ترازنامه"""
@@ -52,13 +58,7 @@ class BalanceSheetAnalyzer:
         """محاسبه جمع دارایی‌ها"""
         
         # کدهای حساب‌های دارایی (معمولاً با ۱ شروع می‌شوند)
-        asset_accounts = ChartOfAccounts.objects.filter(
-            code__startswith='1',
-            is_active=True
-        )
-        
-        # محاسبه مانده دارایی‌ها
-        asset_balance = self._calculate_accounts_balance(asset_accounts)
+        asset_balance = self._calculate_accounts_balance(['1'])
         
         return {
             'current_assets': self._calculate_current_assets(),
@@ -74,11 +74,7 @@ class BalanceSheetAnalyzer:
         total = Decimal('0')
         
         for code in current_asset_codes:
-            accounts = ChartOfAccounts.objects.filter(
-                code__startswith=code,
-                is_active=True
-            )
-            balance = self._calculate_accounts_balance(accounts)
+            balance = self._calculate_accounts_balance([code])
             current_assets[code] = balance
             total += balance
         
@@ -93,11 +89,7 @@ class BalanceSheetAnalyzer:
         total = Decimal('0')
         
         for code_prefix in non_current_asset_codes:
-            accounts = ChartOfAccounts.objects.filter(
-                code__startswith=code_prefix,
-                is_active=True
-            )
-            balance = self._calculate_accounts_balance(accounts)
+            balance = self._calculate_accounts_balance([code_prefix])
             non_current_assets[code_prefix] = balance
             total += balance
         
@@ -121,12 +113,7 @@ class BalanceSheetAnalyzer:
     def _calculate_liabilities(self) -> Dict:
         """محاسبه بدهی‌ها"""
         # کدهای حساب‌های بدهی (معمولاً با ۲ شروع می‌شوند)
-        liability_accounts = ChartOfAccounts.objects.filter(
-            code__startswith='2',
-            is_active=True
-        )
-        
-        liability_balance = self._calculate_accounts_balance(liability_accounts)
+        liability_balance = self._calculate_accounts_balance(['2'])
         
         return {
             'current_liabilities': self._calculate_current_liabilities(),
@@ -142,11 +129,7 @@ class BalanceSheetAnalyzer:
         total = Decimal('0')
         
         for code_prefix in current_liability_codes:
-            accounts = ChartOfAccounts.objects.filter(
-                code__startswith=code_prefix,
-                is_active=True
-            )
-            balance = self._calculate_accounts_balance(accounts)
+            balance = self._calculate_accounts_balance([code_prefix])
             current_liabilities[code_prefix] = balance
             total += balance
         
@@ -161,11 +144,7 @@ class BalanceSheetAnalyzer:
         total = Decimal('0')
         
         for code_prefix in non_current_liability_codes:
-            accounts = ChartOfAccounts.objects.filter(
-                code__startswith=code_prefix,
-                is_active=True
-            )
-            balance = self._calculate_accounts_balance(accounts)
+            balance = self._calculate_accounts_balance([code_prefix])
             non_current_liabilities[code_prefix] = balance
             total += balance
         
@@ -175,12 +154,7 @@ class BalanceSheetAnalyzer:
     def _calculate_equity(self) -> Dict:
         """محاسبه حقوق صاحبان سهام"""
         # کدهای حساب‌های حقوق صاحبان سهام (معمولاً با ۳ شروع می‌شوند)
-        equity_accounts = ChartOfAccounts.objects.filter(
-            code__startswith='3',
-            is_active=True
-        )
-        
-        equity_balance = self._calculate_accounts_balance(equity_accounts)
+        equity_balance = self._calculate_accounts_balance(['3'])
         
         return {
             'capital': self._calculate_capital(),
@@ -190,47 +164,18 @@ class BalanceSheetAnalyzer:
     
     def _calculate_capital(self) -> Decimal:
         """محاسبه سرمایه"""
-        capital_accounts = ChartOfAccounts.objects.filter(
-            code__startswith='31',  # حساب‌های سرمایه
-            is_active=True
-        )
-        return self._calculate_accounts_balance(capital_accounts)
+        return self._calculate_accounts_balance(['31'])  # حساب‌های سرمایه
     
     def _calculate_retained_earnings(self) -> Decimal:
         """محاسبه سود انباشته"""
-        retained_earnings_accounts = ChartOfAccounts.objects.filter(
-            code__startswith='32',  # حساب‌های سود انباشته
-            is_active=True
-        )
-        return self._calculate_accounts_balance(retained_earnings_accounts)
+        return self._calculate_accounts_balance(['32'])  # حساب‌های سود انباشته
     
-    def _calculate_accounts_balance(self, accounts) -> Decimal:
-        """محاسبه مانده حساب‌ها"""
-        total_debit = Decimal('0')
-        total_credit = Decimal('0')
-        
-        for account in accounts:
-            # محاسبه جمع بدهکار و بستانکار برای این حساب
-            items = DocumentItem.objects.filter(
-                account=account,
-                document__company=self.company,
-                document__period=self.period
-            )
-            
-            account_debit = items.aggregate(total=Sum('debit'))['total'] or Decimal('0')
-            account_credit = items.aggregate(total=Sum('credit'))['total'] or Decimal('0')
-            
-            total_debit += account_debit
-            total_credit += account_credit
-        
+    def _calculate_accounts_balance(self, prefixes: List[str]) -> Decimal:
+        """محاسبه مانده حساب‌های منطبق با پیشوندها از تصویر ستونی دوره"""
         # برای حساب‌های دارایی: مانده = بدهکار - بستانکار
         # برای حساب‌های بدهی و سرمایه: مانده = بستانکار - بدهکار
-        if accounts and accounts.first().code.startswith('1'):  # دارایی
-            balance = total_debit - total_credit
-        else:  # بدهی و سرمایه
-            balance = total_credit - total_debit
-        
-        return balance
+        is_asset = prefixes[0].startswith('1')
+        return self.snapshot.net(prefixes, debit_nature=is_asset)
     
     def _check_balance(self, total_assets: Dict, total_liabilities_equity: Dict) -> Dict:
         """کنترل توازن ترازنامه"""
@@ -304,25 +249,27 @@ class BalanceSheetAnalyzer:
         suspicious_accounts = []
         
         # حساب‌هایی با مانده منفی غیرعادی
-        all_accounts = ChartOfAccounts.objects.filter(is_active=True)
-        
-        for account in all_accounts:
-            balance = self._calculate_accounts_balance([account])
+        for account in self.snapshot.account_summary():
+            code = account['code']
+            if code.startswith('1'):
+                balance = account['debit'] - account['credit']
+            else:
+                balance = account['credit'] - account['debit']
             
             # اگر حساب دارایی باشد و مانده منفی داشته باشد
-            if account.code.startswith('1') and balance < Decimal('0'):
+            if code.startswith('1') and balance < Decimal('0'):
                 suspicious_accounts.append({
-                    'account': account.name,
-                    'code': account.code,
+                    'account': account['name'],
+                    'code': code,
                     'balance': balance,
                     'issue': 'مانده منفی در حساب دارایی'
                 })
             
             # اگر حساب بدهی/سرمایه باشد و مانده منفی داشته باشد
-            elif (account.code.startswith('2') or account.code.startswith('3')) and balance < Decimal('0'):
+            elif (code.startswith('2') or code.startswith('3')) and balance < Decimal('0'):
                 suspicious_accounts.append({
-                    'account': account.name,
-                    'code': account.code,
+                    'account': account['name'],
+                    'code': code,
                     'balance': balance,
                     'issue': 'مانده منفی در حساب بدهی/سرمایه'
                 })
@@ -4,23 +4,32 @@
 این سرویس برای تحلیل حساب‌های نقدی و بانکی طراحی شده است.
 """
 
-from django.db.models import Sum, Q, Count
 from decimal import Decimal
 from typing import Dict, List
-from datetime import datetime, timedelta
-from financial_system.models.document_models import DocumentHeader, DocumentItem
-from financial_system.models.coding_models import ChartOfAccounts
+import numpy as np
+from financial_system.services.account_hierarchy import from_minor_units, to_minor_units
+from financial_system.services.digit_analysis import round_amount_mask
+from financial_system.services.jalali_calendar import FRIDAY, weekdays
+from financial_system.services.ledger_snapshot import LedgerSnapshot
 from users.models import Company, FinancialPeriod
 
 
 class CashBankAnalyzer:
     """تحلیل‌گر حساب‌های صندوق و بانک"""
     
-    def __init__(self, company: Company, period: FinancialPeriod):
+    def __init__(self, company: Company, period: FinancialPeriod, snapshot: LedgerSnapshot = None):
         self.company = company
         self.period = period
         self.cash_account_codes = ['101']  # حساب‌های صندوق
         self.bank_account_codes = ['102']  # حساب‌های بانک
+        self._snapshot = snapshot
+    
+    @property
+    def snapshot(self) -> LedgerSnapshot:
+        """تصویر ستونی دوره؛ در صورت نبود تصویر مشترک، یک بار بارگذاری می‌شود"""
+        if self._snapshot is None:
+            self._snapshot = LedgerSnapshot.load(self.company, self.period)
+        return self._snapshot
     
     def analyze_cash_bank(self) -> Dict:
         """تحلیل کامل حساب‌های صندوق و بانک"""
@@ -42,36 +51,14 @@ class CashBankAnalyzer:
     
     def _analyze_cash_accounts(self) -> Dict:
         """تحلیل حساب‌های صندوق"""
-        cash_accounts = ChartOfAccounts.objects.filter(
-            code__startswith='101',
-            is_active=True
-        )
-        
-        analysis = {
-            'accounts': [],
-            'total_balance': Decimal('0'),
-            'total_receipts': Decimal('0'),
-            'total_payments': Decimal('0'),
-            'transaction_count': 0
-        }
-        
-        for account in cash_accounts:
-            account_analysis = self._analyze_single_account(account)
-            analysis['accounts'].append(account_analysis)
-            analysis['total_balance'] += account_analysis['balance']
-            analysis['total_receipts'] += account_analysis['total_receipts']
-            analysis['total_payments'] += account_analysis['total_payments']
-            analysis['transaction_count'] += account_analysis['transaction_count']
-        
-        return analysis
+        return self._analyze_account_group(self.cash_account_codes)
     
     def _analyze_bank_accounts(self) -> Dict:
         """تحلیل حساب‌های بانک"""
-        bank_accounts = ChartOfAccounts.objects.filter(
-            code__startswith='102',
-            is_active=True
-        )
-        
+        return self._analyze_account_group(self.bank_account_codes)
+    
+    def _analyze_account_group(self, prefixes: List[str]) -> Dict:
+        """تحلیل گروهی از حساب‌ها با پیشوندهای مشخص"""
         analysis = {
             'accounts': [],
             'total_balance': Decimal('0'),
@@ -80,7 +67,7 @@ class CashBankAnalyzer:
             'transaction_count': 0
         }
         
-        for account in bank_accounts:
+        for account in self.snapshot.account_summary(prefixes):
             account_analysis = self._analyze_single_account(account)
             analysis['accounts'].append(account_analysis)
             analysis['total_balance'] += account_analysis['balance']
@@ -90,71 +77,61 @@ class CashBankAnalyzer:
         
         return analysis
     
-    def _analyze_single_account(self, account: ChartOfAccounts) -> Dict:
+    def _analyze_single_account(self, account: Dict) -> Dict:
         """تحلیل یک حساب خاص"""
-        # دریافت تمام آرتیکل‌های مربوط به این حساب
-        items = DocumentItem.objects.filter(
-            account=account,
-            document__company=self.company,
-            document__period=self.period
-        ).select_related('document')
+        # آرتیکل‌های مربوط به این حساب در تصویر دوره
+        rows = self.snapshot.account_ids == account['account_id']
         
         # محاسبه مانده
-        total_debit = items.aggregate(total=Sum('debit'))['total'] or Decimal('0')
-        total_credit = items.aggregate(total=Sum('credit'))['total'] or Decimal('0')
+        total_debit = account['debit']
+        total_credit = account['credit']
         balance = total_debit - total_credit
         
         # تحلیل گردش
-        monthly_analysis = self._analyze_monthly_activity(items)
+        monthly_analysis = self._analyze_monthly_activity(rows)
         
         # شناسایی تراکنش‌های بزرگ
-        large_transactions = self._identify_large_transactions(items)
+        large_transactions = self._identify_large_transactions(rows)
         
         return {
-            'account_name': account.name,
-            'account_code': account.code,
+            'account_name': account['name'],
+            'account_code': account['code'],
             'balance': balance,
             'total_receipts': total_debit,
             'total_payments': total_credit,
-            'transaction_count': items.count(),
+            'transaction_count': account['transaction_count'],
             'monthly_analysis': monthly_analysis,
             'large_transactions': large_transactions,
-            'average_transaction_size': self._calculate_average_transaction_size(total_debit, total_credit, items.count())
+            'average_transaction_size': self._calculate_average_transaction_size(total_debit, total_credit, account['transaction_count'])
         }
     
-    def _analyze_monthly_activity(self, items) -> Dict:
+    def _analyze_monthly_activity(self, rows: np.ndarray) -> Dict:
         """تحلیل فعالیت ماهانه حساب"""
-        monthly_data = {}
-        
-        for item in items:
-            month_key = item.document.document_date.strftime('%Y-%m')
-            if month_key not in monthly_data:
-                monthly_data[month_key] = {
-                    'receipts': Decimal('0'),
-                    'payments': Decimal('0'),
-                    'transactions': 0
-                }
-            
-            monthly_data[month_key]['receipts'] += item.debit
-            monthly_data[month_key]['payments'] += item.credit
-            monthly_data[month_key]['transactions'] += 1
-        
-        return monthly_data
+        return {
+            month_key: {
+                'receipts': month['debit'],
+                'payments': month['credit'],
+                'transactions': month['transactions']
+            }
+            for month_key, month in self.snapshot.monthly((), rows=rows).items()
+        }
     
-    def _identify_large_transactions(self, items, threshold: Decimal = Decimal('10000000')) -> List[Dict]:
+    def _identify_large_transactions(self, rows: np.ndarray, threshold: Decimal = Decimal('10000000')) -> List[Dict]:
         """شناسایی تراکنش‌های بزرگ"""
-        large_transactions = []
+        snapshot = self.snapshot
+        flagged = rows & (snapshot.amounts >= to_minor_units([threshold])[0])
         
-        for item in items:
-            amount = max(item.debit, item.credit)
-            if amount >= threshold:
-                large_transactions.append({
-                    'document_number': item.document.document_number,
-                    'date': item.document.document_date,
-                    'amount': amount,
-                    'description': item.description,
-                    'type': 'دریافت' if item.debit > 0 else 'پرداخت'
-                })
+        large_transactions = []
+        for item, debit, credit in zip(snapshot.item_details(flagged),
+                                       snapshot.debits[flagged].tolist(),
+                                       snapshot.credits[flagged].tolist()):
+            large_transactions.append({
+                'document_number': item['document__document_number'],
+                'date': item['document__document_date'],
+                'amount': from_minor_units(max(debit, credit)),
+                'description': item['description'],
+                'type': 'دریافت' if debit > 0 else 'پرداخت'
+            })
         
         return large_transactions
     
@@ -200,27 +177,8 @@ class CashBankAnalyzer:
     
     def _get_current_liabilities(self) -> Decimal:
         """دریافت جمع بدهی‌های جاری"""
-        current_liability_accounts = ChartOfAccounts.objects.filter(
-            code__startswith='2',  # بدهی‌های جاری
-            is_active=True
-        )
-        
-        total_liabilities = Decimal('0')
-        for account in current_liability_accounts:
-            items = DocumentItem.objects.filter(
-                account=account,
-                document__company=self.company,
-                document__period=self.period
-            )
-            
-            account_debit = items.aggregate(total=Sum('debit'))['total'] or Decimal('0')
-            account_credit = items.aggregate(total=Sum('credit'))['total'] or Decimal('0')
-            
-            # برای حساب‌های بدهی: مانده = بستانکار - بدهکار
-            balance = account_credit - account_debit
-            total_liabilities += balance
-        
-        return total_liabilities
+        # برای حساب‌های بدهی: مانده = بستانکار - بدهکار
+        return self.snapshot.net(['2'], debit_nature=False)  # بدهی‌های جاری
     
     def _calculate_operating_cash_flow(self) -> Decimal:
         """محاسبه جریان نقدی عملیاتی"""
@@ -243,58 +201,41 @@ class CashBankAnalyzer:
     
     def _identify_suspicious_transactions(self) -> List[Dict]:
         """شناسایی تراکنش‌های مشکوک"""
-        suspicious_transactions = []
+        snapshot = self.snapshot
         
         # بررسی حساب‌های صندوق و بانک
-        cash_bank_accounts = ChartOfAccounts.objects.filter(
-            Q(code__startswith='101') | Q(code__startswith='102'),
-            is_active=True
-        )
+        rows = snapshot.row_mask(self.cash_account_codes + self.bank_account_codes)
         
-        for account in cash_bank_accounts:
-            items = DocumentItem.objects.filter(
-                account=account,
-                document__company=self.company,
-                document__period=self.period
-            ).select_related('document')
-            
-            for item in items:
-                # تراکنش‌های با مبلغ گرد
-                if self._is_round_amount(item.debit) or self._is_round_amount(item.credit):
-                    suspicious_transactions.append({
-                        'account': account.name,
-                        'document_number': item.document.document_number,
-                        'date': item.document.document_date,
-                        'amount': max(item.debit, item.credit),
-                        'issue': 'مبلغ گرد',
-                        'description': item.description
-                    })
-                
-                # تراکنش‌های در ساعات غیرعادی (اگر تاریخ‌شمار داشته باشیم)
-                if self._is_unusual_time(item.document.document_date):
-                    suspicious_transactions.append({
-                        'account': account.name,
-                        'document_number': item.document.document_number,
-                        'date': item.document.document_date,
-                        'amount': max(item.debit, item.credit),
-                        'issue': 'زمان غیرعادی',
-                        'description': item.description
-                    })
+        # تراکنش‌های با مبلغ گرد
+        round_rows = rows & (self._is_round_amount(snapshot.debits) | self._is_round_amount(snapshot.credits))
+        
+        # تراکنش‌های در روزهای تعطیل
+        unusual_rows = rows & self._is_unusual_time(snapshot.date_keys)
+        
+        suspicious_transactions = []
+        for flagged, issue in ((round_rows, 'مبلغ گرد'), (unusual_rows, 'زمان غیرعادی')):
+            positions = snapshot.account_position[flagged].tolist()
+            amounts = snapshot.amounts[flagged].tolist()
+            for item, position, amount in zip(snapshot.item_details(flagged), positions, amounts):
+                suspicious_transactions.append({
+                    'account': snapshot.account_names[position],
+                    'document_number': item['document__document_number'],
+                    'date': item['document__document_date'],
+                    'amount': from_minor_units(amount),
+                    'issue': issue,
+                    'description': item['description']
+                })
         
         return suspicious_transactions
     
-    def _is_round_amount(self, amount: Decimal) -> bool:
-        """بررسی گرد بودن مبلغ"""
-        if amount == Decimal('0'):
-            return False
-        
+    def _is_round_amount(self, amounts: np.ndarray) -> np.ndarray:
+        """بررسی گرد بودن مبالغ (بر حسب واحد جزء)"""
         # مبالغی که مضرب ۱,۰۰۰,۰۰۰ هستند
-        return amount % Decimal('1000000') == Decimal('0')
+        return round_amount_mask(amounts, 1000000)
     
-    def _is_unusual_time(self, date) -> bool:
-        """بررسی زمان غیرعادی (مثلاً آخر هفته)"""
-        # این یک نمونه ساده است - در نسخه کامل باید دقیق‌تر باشد
-        return date.weekday() >= 5  # شنبه و یکشنبه
+    def _is_unusual_time(self, date_keys: np.ndarray) -> np.ndarray:
+        """بررسی زمان غیرعادی (اسناد صادرشده در روز جمعه)"""
+        return weekdays(date_keys) == FRIDAY
     
     def _generate_recommendations(self, cash_analysis: Dict, bank_analysis: Dict) -> List[str]:
         """تولید توصیه‌های تحلیلی"""
@@ -0,0 +1,148 @@
+# financial_system/services/comparison_engine.py
+"""
+موتور مقایسه چندشرکتی و چنددوره‌ای
+گردش حساب‌های تمام شرکت‌ها و دوره‌ها با یک کوئری گروه‌بندی‌شده بر اساس (شرکت، دوره، کد حساب)
+خوانده می‌شود و به مکعب (حساب × شرکت × دوره) تبدیل می‌شود؛ اقلام و نسبت‌های درخواستی با
+موتور نسبت‌ها به صورت برداری روی کل مکعب محاسبه و رتبه و تغییرات آن‌ها استخراج می‌شود.
+"""
+
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from django.db.models import F
+
+from financial_system.models.document_models import DocumentItem
+from financial_system.services.ratio_engine import RatioEngine, load_balance_matrix, period_days
+from users.models import Company, FinancialPeriod
+
+# نام‌های فارسی شاخص‌ها ← (نام نسبت یا قلم در موتور نسبت‌ها، ضریب نمایش)
+# اقلام به ریال خوانده می‌شوند؛ ضریب درآمد و سود خالص آن‌ها را به میلیون ریال تبدیل می‌کند.
+COMPARISON_METRICS: Dict[str, Tuple[str, float]] = {
+    'نسبت جاری': ('current_ratio', 1),
+    'نسبت آنی': ('quick_ratio', 1),
+    'بازده دارایی': ('return_on_assets', 100),
+    'بازده حقوق صاحبان سهام': ('return_on_equity', 100),
+    'حاشیه سود': ('net_profit_margin', 100),
+    'حاشیه سود ناخالص': ('gross_profit_margin', 100),
+    'نسبت بدهی': ('debt_ratio', 1),
+    'درآمد': ('revenue', 0.000001),
+    'سود خالص': ('net_income', 0.000001),
+}
+
+# شاخص‌هایی که مقدار کمتر در آن‌ها بهتر است (رتبه‌بندی صعودی)
+LOWER_IS_BETTER = {
+    'debt_ratio', 'debt_to_equity', 'equity_multiplier', 'long_term_debt_to_equity', 'operating_ratio',
+    'days_inventory_outstanding', 'days_sales_outstanding', 'cash_conversion_cycle',
+}
+
+ALIGN_BY_PERIOD = 'period'
+ALIGN_BY_NAME = 'name'
+
+
+class ComparisonEngine:
+    """ماتریس مقایسه شاخص‌ها برای مجموعه‌ای از شرکت‌ها و دوره‌ها"""
+
+    def __init__(self, engine: RatioEngine = None):
+        self.engine = engine or RatioEngine()
+
+    def resolve_metric(self, metric: str) -> Tuple[str, float, bool]:
+        """نام موتور، ضریب نمایش و نسبت بودن یک شاخص (فارسی یا نام داخلی)"""
+        key, scale = COMPARISON_METRICS.get(metric, (metric, 1))
+        if key in self.engine.ratio_names:
+            return key, scale, True
+        if key in self.engine.line_index:
+            return key, scale, False
+        raise ValueError(f'شاخص نامعتبر: {metric}')
+
+    def compare(self, company_ids: Sequence[int], period_ids: Sequence[int], metrics: Iterable[str],
+                align_by: str = ALIGN_BY_PERIOD) -> Dict:
+        """مقایسه شاخص‌ها؛ ستون‌ها دوره‌ها هستند یا (با align_by='name') نام دوره‌ها برای هم‌ترازی سال‌های مالی شرکت‌ها"""
+        metrics = list(metrics)
+        resolved = [self.resolve_metric(metric) for metric in metrics]
+        company_ids = list(company_ids)
+        periods = {period.id: period for period in FinancialPeriod.objects.filter(id__in=period_ids)}
+        periods = [periods[period_id] for period_id in period_ids if period_id in periods]
+        companies = dict(Company.objects.filter(id__in=company_ids).values_list('id', 'name'))
+
+        # ستون‌های مکعب: هر دوره یا هر نام یکتای دوره
+        if align_by == ALIGN_BY_NAME:
+            labels = list(dict.fromkeys(period.name for period in periods))
+            column_of = {period.id: labels.index(period.name) for period in periods}
+            days = np.array(
+                [period_days(next(period for period in periods if period.name == label)) for label in labels],
+                dtype=np.float64
+            )
+        else:
+            labels = [str(period) for period in periods]
+            column_of = {period.id: position for position, period in enumerate(periods)}
+            days = np.array([period_days(period) for period in periods], dtype=np.float64)
+
+        # یک کوئری: کلید ستون = شرکت × دوره (شناسه دوره در ۳۲ بیت پایین)
+        codes, keys, debit, credit = load_balance_matrix(
+            DocumentItem.objects.filter(document__company_id__in=company_ids, document__period_id__in=list(column_of)),
+            F('document__company_id') * (1 << 32) + F('document__period_id')
+        )
+        company_count, period_count = len(company_ids), len(labels)
+        company_position = {company_id: position for position, company_id in enumerate(company_ids)}
+        keys = np.array(keys, dtype=np.int64)
+        cells = np.array(
+            [company_position[key >> 32] * period_count + column_of[key & 0xFFFFFFFF] for key in keys.tolist()],
+            dtype=np.int64
+        )
+
+        cube_debit = np.zeros((codes.size, company_count * period_count), dtype=np.int64)
+        cube_credit = np.zeros_like(cube_debit)
+        np.add.at(cube_debit.T, cells, debit.T)
+        np.add.at(cube_credit.T, cells, credit.T)
+        present = np.zeros(company_count * period_count, dtype=bool)
+        present[cells] = True
+
+        lines = self.engine.line_values(codes, cube_debit, cube_credit)
+        ratios = self.engine.ratio_values(lines, days=np.tile(days, company_count))
+        present = present.reshape(company_count, period_count)
+
+        result = {}
+        for metric, (key, scale, is_ratio) in zip(metrics, resolved):
+            if is_ratio:
+                values = ratios[self.engine.ratio_names.index(key)]
+            else:
+                values = lines[self.engine.line_index[key]] / 100
+            values = np.where(present, values.reshape(company_count, period_count) * scale, np.nan)
+            result[metric] = self._summarize(values, lower_is_better=key in LOWER_IS_BETTER)
+
+        return {
+            'companies': [{'id': company_id, 'name': companies.get(company_id, '')} for company_id in company_ids],
+            'periods': labels,
+            'metrics': result,
+        }
+
+    @staticmethod
+    def _summarize(values: np.ndarray, lower_is_better: bool = False) -> Dict:
+        """مقادیر، رتبه شرکت‌ها در هر دوره و تغییرات دوره به دوره (سلول‌های بدون داده None)"""
+        # رتبه ۱ بهترین شرکت هر دوره است؛ سلول‌های خالی به انتهای ترتیب می‌روند
+        ordering = np.where(np.isnan(values), np.inf, values if lower_is_better else -values)
+        ranks = np.argsort(np.argsort(ordering, axis=0, kind='stable'), axis=0) + 1
+
+        deltas = np.diff(values, axis=1)
+        previous = values[:, :-1]
+        delta_percent = np.full_like(deltas, np.nan)
+        np.divide(deltas * 100, np.abs(previous), out=delta_percent, where=(previous != 0) & ~np.isnan(previous))
+
+        # میانگین شرکت‌های دارای داده در هر دوره
+        counts = (~np.isnan(values)).sum(axis=0)
+        average = np.full(values.shape[1], np.nan)
+        np.divide(np.nansum(values, axis=0), counts, out=average, where=counts > 0)
+
+        return {
+            'values': _to_list(values),
+            'ranks': [[int(rank) if not np.isnan(value) else None for rank, value in zip(rank_row, value_row)]
+                      for rank_row, value_row in zip(ranks, values)],
+            'deltas': _to_list(deltas),
+            'delta_percent': _to_list(delta_percent),
+            'average': _to_list(average),
+        }
+
+
+def _to_list(array: np.ndarray) -> List:
+    """تبدیل آرایه به لیست قابل سریال‌سازی با None به جای NaN"""
+    return np.where(np.isnan(array), None, array).tolist()
@@ -0,0 +1,240 @@
+# financial_system/services/description_index.py
+"""
+نمایه MinHash/LSH شرح اسناد برای یافتن شرح‌های تقریباً تکراری
+شرح‌ها پس از یکسان‌سازی نویسه‌های فارسی به k-gramهای نویسه‌ای شکسته می‌شوند؛ امضای MinHash هر متن
+یکتا در باندهای LSH قرار می‌گیرد و فقط متن‌های هم‌سطل (نامزدها) با SequenceMatcher بررسی می‌شوند.
+شرح‌های کاملاً یکسان بدون مقایسه گروه می‌شوند. نمایه افزایشی است و اسناد جدید با add/add_many
+(مثلاً هنگام ورود اطلاعات) بدون بازسازی کل نمایه افزوده می‌شوند. امضای هر شرح هنگام امتیازدهی ریسک
+ذخیره می‌شود و نمایه از امضاهای ذخیره‌شده بدون محاسبه دوباره MinHash ساخته می‌شود.
+"""
+
+import re
+import zlib
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+ARABIC_TO_PERSIAN = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ك': 'ک', 'ة': 'ه', 'ۀ': 'ه', 'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ؤ': 'و',
+    '۰': '0', '۱': '1', '۲': '2', '۳': '3', '۴': '4', '۵': '5', '۶': '6', '۷': '7', '۸': '8', '۹': '9',
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4', '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+    '‌': ' ', '‍': '', 'ـ': '',
+})
+DIACRITICS = re.compile('[ً-ٰٟ]')
+NON_WORD = re.compile(r'[^\w\s]')
+WHITESPACE = re.compile(r'\s+')
+
+SHINGLE_SIZE = 3
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+SIMILARITY_THRESHOLD = 0.9
+# حداقل سهم مؤلفه‌های برابر امضا (برآورد Jaccard) پیش از مقایسه دقیق نامزدها
+MIN_SIGNATURE_AGREEMENT = 0.3
+
+_PRIME = (1 << 31) - 1
+_SEED = 20240101
+
+
+def normalize_persian(text: Optional[str]) -> str:
+    """یکسان‌سازی ی/ک عربی، ارقام، اعراب، نیم‌فاصله و علائم نگارشی"""
+    if not text:
+        return ''
+    text = DIACRITICS.sub('', str(text).translate(ARABIC_TO_PERSIAN)).lower()
+    return WHITESPACE.sub(' ', NON_WORD.sub(' ', text)).strip()
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """هش k-gramهای نویسه‌ای یک متن یکسان‌سازی‌شده"""
+    grams = {text[i:i + size] for i in range(max(len(text) - size + 1, 1))}
+    return np.fromiter((zlib.crc32(gram.encode('utf-8')) % _PRIME for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+class DescriptionLSHIndex:
+    """نمایه افزایشی شرح اسناد: گروه متن‌های یکسان و سطل‌های LSH متن‌های یکتا"""
+
+    def __init__(self, num_permutations: int = NUM_PERMUTATIONS, bands: int = LSH_BANDS,
+                 shingle_size: int = SHINGLE_SIZE):
+        if num_permutations % bands:
+            raise ValueError('تعداد جایگشت‌ها باید مضرب تعداد باندها باشد')
+        self.bands = bands
+        self.rows = num_permutations // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(_SEED)
+        self._a = rng.integers(1, _PRIME, num_permutations, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, num_permutations, dtype=np.uint64)
+        self._band_weights = rng.integers(1, 1 << 62, self.rows, dtype=np.uint64) | np.uint64(1)
+
+        self.texts: List[str] = []
+        self.text_index: Dict[str, int] = {}
+        self.members: List[List[int]] = []
+        self.document_text: Dict[int, int] = {}
+        self.descriptions: Dict[int, str] = {}
+        self.buckets: Dict[Tuple[int, int], List[int]] = {}
+        self._text_buckets: List[List[Tuple[int, int]]] = []
+        self._signature_blocks: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return len(self.document_text)
+
+    @classmethod
+    def build(cls, rows: Iterable[Tuple[int, str]], signatures: Optional[Dict[int, bytes]] = None,
+              **options) -> 'DescriptionLSHIndex':
+        """ساخت نمایه از جفت‌های (شناسه سند، شرح)، مثلاً values_list('id', 'description')"""
+        index = cls(**options)
+        index.add_many(rows, signatures)
+        return index
+
+    def add(self, document_id: int, description: str) -> None:
+        self.add_many([(document_id, description)])
+
+    def add_many(self, documents: Iterable[Tuple[int, str]], signatures: Optional[Dict[int, bytes]] = None) -> None:
+        """
+        افزودن اسناد؛ فقط متن‌های یکتای جدید MinHash و در سطل‌ها درج می‌شوند.
+        signatures امضاهای ذخیره‌شده (شناسه سند ← بایت‌ها) است که به جای محاسبه دوباره استفاده می‌شوند.
+        """
+        new_texts = []
+        stored: Dict[int, bytes] = {}
+        for document_id, description in documents:
+            text = normalize_persian(description)
+            if not text or document_id in self.document_text:
+                continue
+            text_id = self.text_index.get(text)
+            if text_id is None:
+                text_id = len(self.texts)
+                self.text_index[text] = text_id
+                self.texts.append(text)
+                self.members.append([])
+                new_texts.append(text_id)
+                if signatures and signatures.get(document_id):
+                    stored[text_id] = signatures[document_id]
+            self.members[text_id].append(document_id)
+            self.document_text[document_id] = text_id
+            self.descriptions[document_id] = description
+
+        if new_texts:
+            self._insert_signatures(new_texts, stored)
+
+    def signature_bytes(self, descriptions: List[str]) -> List[bytes]:
+        """امضای MinHash شرح‌ها برای ذخیره (برای شرح خالی بایت خالی)"""
+        texts = [normalize_persian(description) for description in descriptions]
+        present = [position for position, text in enumerate(texts) if text]
+        result = [b''] * len(texts)
+        for start in range(0, len(present), 4096):
+            chunk = present[start:start + 4096]
+            for position, signature in zip(chunk, self._minhash([texts[position] for position in chunk])):
+                result[position] = signature.tobytes()
+        return result
+
+    def _minhash(self, texts: List[str]) -> np.ndarray:
+        """امضای MinHash متن‌ها (متن × جایگشت) با یک عملیات برداری روی تمام k-gramها"""
+        hashes = [shingle_hashes(text, self.shingle_size) for text in texts]
+        offsets = np.cumsum([0] + [h.size for h in hashes[:-1]])
+        values = np.concatenate(hashes)
+        permuted = (self._a[:, None] * values[None, :] + self._b[:, None]) % np.uint64(_PRIME)
+        return np.minimum.reduceat(permuted, offsets, axis=1).T
+
+    def _signatures(self, text_ids: List[int], stored: Dict[int, bytes]) -> np.ndarray:
+        """امضای متن‌ها؛ امضاهای ذخیره‌شده خوانده و فقط بقیه محاسبه می‌شوند"""
+        signatures = np.empty((len(text_ids), self._a.size), dtype=np.uint64)
+        missing = []
+        for position, text_id in enumerate(text_ids):
+            if text_id in stored:
+                signatures[position] = np.frombuffer(stored[text_id], dtype=np.uint64)
+            else:
+                missing.append(position)
+        if missing:
+            signatures[missing] = self._minhash([self.texts[text_ids[position]] for position in missing])
+        return signatures
+
+    def _insert_signatures(self, text_ids: List[int], stored: Dict[int, bytes]) -> None:
+        keys = np.empty((0, self.bands), dtype=np.uint64)
+        for start in range(0, len(text_ids), 4096):
+            signatures = self._signatures(text_ids[start:start + 4096], stored)
+            self._signature_blocks.append(signatures)
+            chunk = signatures.reshape(-1, self.bands, self.rows)
+            keys = np.vstack([keys, (chunk * self._band_weights).sum(axis=2)])
+        for text_id, band_keys in zip(text_ids, keys.tolist()):
+            entries = [(band, key) for band, key in enumerate(band_keys)]
+            self._text_buckets.append(entries)
+            for entry in entries:
+                self.buckets.setdefault(entry, []).append(text_id)
+
+    def candidates(self, text_id: int) -> Set[int]:
+        """متن‌های یکتای هم‌سطل با یک متن در حداقل یک باند"""
+        found = set()
+        for entry in self._text_buckets[text_id]:
+            found.update(self.buckets[entry])
+        found.discard(text_id)
+        return found
+
+    def similarity(self, first_id: int, second_id: int, threshold: float = SIMILARITY_THRESHOLD) -> float:
+        """نسبت SequenceMatcher دو متن یکتا؛ صفر وقتی کران‌های سریع به آستانه نمی‌رسند"""
+        first, second = self.texts[first_id], self.texts[second_id]
+        # کران بالای نسبت از روی طول‌ها، پیش از ساخت SequenceMatcher
+        if 2 * min(len(first), len(second)) / (len(first) + len(second)) <= threshold:
+            return 0.0
+        matcher = SequenceMatcher(None, first, second)
+        return matcher.ratio() if matcher.quick_ratio() > threshold else 0.0
+
+    def similar_pairs(self, threshold: float = SIMILARITY_THRESHOLD) -> List[Dict]:
+        """
+        جفت اسناد مشابه به ترتیب شناسه؛ هر سند حداکثر در یک جفت.
+        شرح یکسان با امتیاز ۱ جفت می‌شود و در غیر این صورت نامزدها به ترتیب نزدیک‌ترین سند آزاد بعدی
+        بررسی می‌شوند تا اولین تشابه بیش از آستانه (همان ترتیب مقایسه دوبه‌دو).
+        """
+        processed: Set[int] = set()
+        scores: Dict[Tuple[int, int], float] = {}
+        filtered: Dict[int, List[int]] = {}
+        cursors = [0] * len(self.members)
+        for members in self.members:
+            members.sort()
+        signatures = np.vstack(self._signature_blocks) if self._signature_blocks else None
+
+        def candidate_texts(text_id: int) -> List[int]:
+            """نامزدهای LSH با برآورد Jaccard کافی از روی امضاها (یک بار برای هر متن یکتا)"""
+            if text_id not in filtered:
+                others = np.fromiter(self.candidates(text_id), dtype=np.int64)
+                if others.size:
+                    agreement = (signatures[others] == signatures[text_id]).mean(axis=1)
+                    others = others[agreement >= MIN_SIGNATURE_AGREEMENT]
+                filtered[text_id] = others.tolist()
+            return filtered[text_id]
+
+        def next_free(text_id: int, after: int) -> Optional[int]:
+            members = self.members[text_id]
+            position = cursors[text_id]
+            while position < len(members) and (members[position] <= after or members[position] in processed):
+                position += 1
+            cursors[text_id] = position
+            return members[position] if position < len(members) else None
+
+        pairs = []
+        for document_id in sorted(self.document_text):
+            if document_id in processed:
+                continue
+            text_id = self.document_text[document_id]
+            match, score = next_free(text_id, document_id), 1.0
+
+            if match is None:
+                waiting = []
+                for other in candidate_texts(text_id):
+                    candidate = next_free(other, document_id)
+                    if candidate is not None:
+                        waiting.append((candidate, other))
+                for candidate, other in sorted(waiting):
+                    key = (min(text_id, other), max(text_id, other))
+                    if key not in scores:
+                        scores[key] = self.similarity(key[0], key[1], threshold)
+                    if scores[key] > threshold:
+                        match, score = candidate, scores[key]
+                        break
+
+            if match is not None:
+                processed.update((document_id, match))
+                pairs.append({
+                    'doc1_id': document_id,
+                    'doc2_id': match,
+                    'similarity_score': round(score, 4),
+                })
+        return pairs
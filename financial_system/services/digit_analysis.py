@@ -0,0 +1,225 @@
+# financial_system/services/digit_analysis.py
+"""
+موتور تحلیل ارقام مبالغ (آزمون‌های بنفورد، مبالغ گرد و دو رقم آخر)
+مبالغ مثبت بدهکار و بستانکار (int64 بر حسب واحد جزء) یک بار به آرایه NumPy تبدیل می‌شوند و تمام
+آزمون‌ها (رقم اول، رقم دوم، دو رقم اول، دو رقم آخر، صفرهای انتهایی) برداری و بدون پیمایش آرتیکل‌ها
+محاسبه می‌شوند. انطباق با MAD (آستانه‌های Nigrini) و کای‌دو سنجیده می‌شود و هر آزمون بر اساس حساب،
+ماه یا مرکز هزینه قابل تفکیک است. خروجی موارد علامت‌خورده شناسه آرتیکل‌هاست.
+"""
+
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from financial_system.services.account_hierarchy import MINOR_UNITS
+from financial_system.services.jalali_calendar import month_label
+from financial_system.services.ledger_snapshot import LedgerSnapshot
+from financial_system.services.report_cache import cached_report
+from users.models import Company, FinancialPeriod
+
+_POW10 = 10 ** np.arange(19, dtype=np.int64)
+
+# آزمون‌ها: (نخستین رقم، توزیع مورد انتظار، آستانه‌های MAD، مقدار بحرانی کای‌دو در سطح ۰٫۰۵)
+_FIRST_TWO = np.log10(1 + 1 / np.arange(10, 100))
+DIGIT_TESTS = {
+    'first_digit': (1, np.log10(1 + 1 / np.arange(1, 10)), (0.006, 0.012, 0.015), 15.507),
+    'second_digit': (0, _FIRST_TWO.reshape(9, 10).sum(axis=0), (0.008, 0.010, 0.012), 16.919),
+    'first_two_digits': (10, _FIRST_TWO, (0.0012, 0.0018, 0.0022), 112.022),
+    'last_two_digits': (0, np.full(100, 0.01), None, 123.225),
+}
+CONFORMITY_LABELS = ('انطباق نزدیک', 'انطباق قابل قبول', 'انطباق حاشیه‌ای', 'عدم انطباق')
+
+# حداقل مبلغ (ریال) آزمون‌های دو رقمی، آماره z بحرانی و حداقل نمونه هر گروه
+MIN_TWO_DIGIT_AMOUNT = 10
+MIN_LAST_TWO_AMOUNT = 100
+Z_CRITICAL = 1.96
+MIN_GROUP_COUNT = 100
+
+
+def round_amount_mask(amounts: np.ndarray, unit: int) -> np.ndarray:
+    """مبالغ مثبت مضرب یک واحد ریالی (مبالغ بر حسب واحد جزء)"""
+    amounts = np.asarray(amounts, dtype=np.int64)
+    return (amounts > 0) & (amounts % (int(unit) * MINOR_UNITS) == 0)
+
+
+def magnitudes(values: np.ndarray) -> np.ndarray:
+    """توان ده بزرگ‌ترین رقم (floor(log10)) دقیق برای int64 مثبت"""
+    exponent = np.floor(np.log10(values.astype(np.float64))).astype(np.int64)
+    exponent = np.clip(exponent, 0, 18)
+    exponent -= (exponent > 0) & (values < _POW10[exponent])
+    exponent += (exponent < 18) & (values >= _POW10[np.minimum(exponent + 1, 18)])
+    return exponent
+
+
+class DigitAnalyzer:
+    """آزمون‌های رقمی روی آرایه مبالغ مثبت با شناسه آرتیکل و کلیدهای تفکیک"""
+
+    def __init__(self, amounts, item_ids=None, groups: Optional[Dict[str, np.ndarray]] = None,
+                 group_labels: Optional[Dict[str, Callable]] = None):
+        amounts = np.asarray(amounts, dtype=np.int64)
+        keep = amounts > 0
+        self.amounts = amounts[keep]
+        item_ids = np.arange(amounts.size) if item_ids is None else item_ids
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)[keep]
+        self.groups = {name: np.asarray(keys)[keep] for name, keys in (groups or {}).items()}
+        self.group_labels = group_labels or {}
+        self._cache = {}
+
+    @classmethod
+    def from_snapshot(cls, snapshot: LedgerSnapshot) -> 'DigitAnalyzer':
+        """مبالغ بدهکار و بستانکار تصویر دوره، قابل تفکیک بر اساس حساب، ماه و مرکز هزینه"""
+        rows = np.concatenate([np.flatnonzero(snapshot.debits > 0), np.flatnonzero(snapshot.credits > 0)])
+        amounts = np.concatenate([snapshot.debits[snapshot.debits > 0], snapshot.credits[snapshot.credits > 0]])
+        analyzer = cls(amounts, snapshot.item_ids[rows], groups={
+            'account': snapshot.codes[rows],
+            'month': snapshot.date_keys[rows] // 100,
+            'cost_center': snapshot.cost_centers[rows].astype(str),
+        }, group_labels={'month': month_label})
+        # ردیف تصویر و طرف (بدهکار/بستانکار) هر مبلغ برای جزئیات موارد علامت‌خورده
+        analyzer.rows = rows
+        analyzer.is_credit = np.arange(rows.size) >= np.count_nonzero(snapshot.debits > 0)
+        return analyzer
+
+    def __len__(self) -> int:
+        return int(self.amounts.size)
+
+    def digits(self, test: str):
+        """(رقم هر مبلغ برای آزمون، ماسک مبالغ مشمول آزمون)"""
+        if test not in self._cache:
+            values = self.amounts
+            if test == 'last_two_digits':
+                rials = values // MINOR_UNITS
+                self._cache[test] = (rials % 100, (values % MINOR_UNITS == 0) & (rials >= MIN_LAST_TWO_AMOUNT))
+            else:
+                exponent = magnitudes(values)
+                if test == 'first_digit':
+                    self._cache[test] = (values // _POW10[exponent], np.ones(values.size, dtype=bool))
+                else:
+                    first_two = values // _POW10[np.maximum(exponent - 1, 0)]
+                    eligible = (exponent > 0) & (values >= MIN_TWO_DIGIT_AMOUNT * MINOR_UNITS)
+                    self._cache[test] = (first_two % 10 if test == 'second_digit' else first_two, eligible)
+        return self._cache[test]
+
+    def benford(self, test: str = 'first_digit', rows: Optional[np.ndarray] = None) -> Dict:
+        """توزیع مشاهده‌شده در برابر انتظار برای یک آزمون (اختیاری روی زیرمجموعه rows)"""
+        low, expected, _, _ = DIGIT_TESTS[test]
+        digits, eligible = self.digits(test)
+        selected = eligible if rows is None else eligible & rows
+        counts = np.bincount(digits[selected] - low, minlength=expected.size)
+        return self._conformity(test, counts)
+
+    def _conformity(self, test: str, counts: np.ndarray) -> Dict:
+        low, expected, mad_bounds, chi_critical = DIGIT_TESTS[test]
+        total = int(counts.sum())
+        if not total:
+            return {'test': test, 'count': 0}
+
+        observed = counts / total
+        deviation = np.abs(observed - expected)
+        chi_square = float(((counts - total * expected) ** 2 / (total * expected)).sum())
+        mad = float(deviation.mean())
+        # آماره z هر رقم با اصلاح پیوستگی
+        correction = np.minimum(1 / (2 * total), deviation)
+        z_scores = (deviation - correction) / np.sqrt(expected * (1 - expected) / total)
+        spikes = np.flatnonzero((z_scores > Z_CRITICAL) & (observed > expected))
+
+        result = {
+            'test': test,
+            'count': total,
+            'chi_square': round(chi_square, 3),
+            'chi_square_critical': chi_critical,
+            'conforms': chi_square <= chi_critical,
+            'mad': round(mad, 5),
+            'digits': [
+                {
+                    'digit': low + index,
+                    'count': int(counts[index]),
+                    'observed': round(float(observed[index]), 5),
+                    'expected': round(float(expected[index]), 5),
+                    'z_score': round(float(z_scores[index]), 3),
+                }
+                for index in range(expected.size)
+            ],
+            'over_represented': [int(low + index) for index in spikes],
+        }
+        if mad_bounds:
+            result['conformity'] = CONFORMITY_LABELS[int(np.searchsorted(mad_bounds, mad, side='right'))]
+        return result
+
+    def by_group(self, name: str, test: str = 'first_digit', min_count: int = MIN_GROUP_COUNT) -> List[Dict]:
+        """MAD و کای‌دو هر گروه (حساب، ماه، مرکز هزینه) با یک bincount؛ به ترتیب نزولی MAD"""
+        low, expected, mad_bounds, chi_critical = DIGIT_TESTS[test]
+        digits, eligible = self.digits(test)
+        keys, inverse = np.unique(self.groups[name][eligible], return_inverse=True)
+        width = expected.size
+        counts = np.bincount(
+            inverse.reshape(-1) * width + (digits[eligible] - low), minlength=keys.size * width
+        ).reshape(keys.size, width)
+        totals = counts.sum(axis=1)
+
+        selected = np.flatnonzero(totals >= max(min_count, 1))
+        counts, totals = counts[selected], totals[selected, None]
+        mads = np.abs(counts / totals - expected).mean(axis=1)
+        chi_squares = ((counts - totals * expected) ** 2 / (totals * expected)).sum(axis=1)
+
+        label = self.group_labels.get(name, lambda key: key)
+        groups = []
+        for position in np.argsort(-mads, kind='stable'):
+            group = {
+                'group': label(keys[selected[position]].item()),
+                'count': int(totals[position, 0]),
+                'mad': round(float(mads[position]), 5),
+                'chi_square': round(float(chi_squares[position]), 3),
+                'conforms': bool(chi_squares[position] <= chi_critical),
+            }
+            if mad_bounds:
+                group['conformity'] = CONFORMITY_LABELS[int(np.searchsorted(mad_bounds, mads[position], side='right'))]
+            groups.append(group)
+        return groups
+
+    def trailing_zeros(self) -> Dict:
+        """توزیع تعداد صفرهای انتهایی مبالغ ریالی (۰ تا ۱۶)"""
+        zeros = np.zeros(self.amounts.size, dtype=np.int64)
+        remaining = np.ones(self.amounts.size, dtype=bool)
+        for power in range(3, 19):
+            remaining &= self.amounts % _POW10[power] == 0
+            if not remaining.any():
+                break
+            zeros += remaining
+        counts = np.bincount(zeros)
+        total = max(int(self.amounts.size), 1)
+        return {
+            'distribution': {int(count): int(value) for count, value in enumerate(counts) if value},
+            'round_share': round(float((zeros > 0).sum()) / total, 5),
+            'thousand_share': round(float((zeros >= 3).sum()) / total, 5),
+            'million_share': round(float((zeros >= 6).sum()) / total, 5),
+        }
+
+    def round_mask(self, unit: int) -> np.ndarray:
+        return round_amount_mask(self.amounts, unit)
+
+    def flagged(self, test: str = 'first_two_digits') -> np.ndarray:
+        """ماسک مبالغی که رقمشان در ارقام بیش از انتظار آزمون قرار دارد"""
+        digits, eligible = self.digits(test)
+        spikes = np.asarray(self.benford(test).get('over_represented', []), dtype=np.int64)
+        return eligible & np.isin(digits, spikes)
+
+    def flagged_item_ids(self, test: str = 'first_two_digits') -> List[int]:
+        """شناسه آرتیکل‌های علامت‌خورده یک آزمون (بدون تکرار)"""
+        return np.unique(self.item_ids[self.flagged(test)]).tolist()
+
+    def summary(self) -> Dict:
+        """تمام آزمون‌ها به همراه توزیع صفرهای انتهایی"""
+        result = {'amount_count': len(self), 'trailing_zeros': self.trailing_zeros()}
+        for test in DIGIT_TESTS:
+            result[test] = self.benford(test)
+        return result
+
+
+def period_digit_analysis(company: Company, period: FinancialPeriod) -> Dict:
+    """آزمون‌های رقمی دوره و آرتیکل‌های علامت‌خورده دو رقم اول در کش نسخه جاری دفتر"""
+    def compute():
+        analyzer = DigitAnalyzer.from_snapshot(LedgerSnapshot.load(company, period))
+        return {'summary': analyzer.summary(), 'flagged_item_ids': analyzer.flagged_item_ids('first_two_digits')}
+
+    return cached_report('digit_analysis', company.id, period.id, compute)
@@ -0,0 +1,173 @@
+# financial_system/services/duplicate_detector.py
+"""
+شناسایی تراکنش‌های تکراری و تقریباً تکراری در سطح آرتیکل
+آرتیکل‌های تصویر دوره بر اساس (حساب، طرف، مبلغ، روز) مرتب می‌شوند؛ شرح آرتیکل‌هایی که مبلغ و حسابشان
+تکرار شده با یک کوئری خوانده و مجموعه واژه‌های شرح (طرف حساب) پس از یکسان‌سازی جزء کلید می‌شود.
+هر دو آرتیکل هم‌کلید اسناد مختلف که حداکثر N روز فاصله دارند جفت تکراری‌اند و جفت‌های به هم پیوسته
+یک گروه تقریباً تکراری می‌سازند؛ در هر گروه آرتیکل‌های هم‌روز تکرار دقیق‌اند.
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from financial_system.services.account_hierarchy import from_minor_units
+from financial_system.services.description_index import normalize_persian
+from financial_system.services.jalali_calendar import day_numbers
+from financial_system.services.ledger_snapshot import LedgerSnapshot
+from financial_system.services.report_cache import cached_report
+from users.models import Company, FinancialPeriod
+
+# حداکثر فاصله روز دو آرتیکل هم‌مبلغ برای تکرار تقریبی
+DUPLICATE_WINDOW_DAYS = 3
+
+
+class DuplicateDetector:
+    """گروه‌بندی آرتیکل‌های هم‌حساب و هم‌مبلغ اسناد مختلف در بازه N روزه"""
+
+    def __init__(self, snapshot: LedgerSnapshot, window_days: int = DUPLICATE_WINDOW_DAYS):
+        self.snapshot = snapshot
+        self.window_days = window_days
+        self._details: Optional[Dict[int, Dict]] = None
+
+        debit_rows = np.flatnonzero(snapshot.debits > 0)
+        credit_rows = np.flatnonzero(snapshot.credits > 0)
+        rows = np.concatenate([debit_rows, credit_rows])
+        is_credit = np.arange(rows.size) >= debit_rows.size
+        amounts = np.concatenate([snapshot.debits[debit_rows], snapshot.credits[credit_rows]])
+        days = day_numbers(snapshot.date_keys[rows])
+
+        # آرتیکل‌های با تاریخ نامعتبر در مقایسه روزها شرکت نمی‌کنند
+        valid = days >= 0
+        order = np.lexsort((days[valid], amounts[valid], is_credit[valid], snapshot.account_position[rows[valid]]))
+        self.rows = rows[valid][order]
+        self.is_credit = is_credit[valid][order]
+        self.amounts = amounts[valid][order]
+        self.days = days[valid][order]
+
+        # کلید (حساب، طرف، مبلغ) و آرتیکل‌هایی که کلیدشان تکرار شده (تنها نامزدهای تکرار)
+        accounts = snapshot.account_position[self.rows]
+        same_amount = (
+            (accounts[1:] == accounts[:-1])
+            & (self.is_credit[1:] == self.is_credit[:-1])
+            & (self.amounts[1:] == self.amounts[:-1])
+        )
+        self.amount_keys = np.cumsum(np.r_[True, ~same_amount])[:self.rows.size] - 1
+        self.candidates = np.flatnonzero(np.bincount(self.amount_keys, minlength=1)[self.amount_keys] > 1)
+
+    def load_details(self) -> Dict[int, Dict]:
+        """
+        جزئیات (شرح، شماره و تاریخ سند) آرتیکل‌های نامزد با یک کوئری؛ فراخوانی‌های بعدی بدون کوئری‌اند.
+        تصویر حسابرسی آن را هنگام بارگذاری صدا می‌زند تا گروه‌بندی در نخ‌های کاری به پایگاه داده نرسد.
+        """
+        if self._details is None:
+            row_mask = np.zeros(len(self.snapshot), dtype=bool)
+            row_mask[self.rows[self.candidates]] = True
+            self._details = {item['id']: item for item in self.snapshot.item_details(row_mask)}
+        return self._details
+
+    def candidate_groups(self) -> List[np.ndarray]:
+        """
+        گروه‌ها (اندیس در آرایه‌های مرتب) با حداقل دو سند متمایز.
+        کلید گروه (حساب، طرف، مبلغ، واژه‌های شرح) است. همسایه‌های هر آرتیکل (هم‌کلیدهای حداکثر N روز بعد)
+        با searchsorted یافته می‌شوند و هر گروه مؤلفه همبند جفت‌های همسایه است؛ مرز گروه جایی است که
+        هیچ آرتیکل قبلی به آن نمی‌رسد، پس دو آرتیکل نزدیک هرگز در دو گروه جدا نمی‌افتند.
+        """
+        candidates = self.candidates
+        if candidates.size < 2:
+            return []
+        amount_keys = self.amount_keys
+
+        tokens = self._token_keys(candidates)
+        order = np.lexsort((self.days[candidates], tokens, amount_keys[candidates]))
+        ordered = candidates[order]
+        days = self.days[ordered]
+        documents = self.snapshot.document_ids[self.rows[ordered]]
+        same_key = (amount_keys[ordered][1:] == amount_keys[ordered][:-1]) & (tokens[order][1:] == tokens[order][:-1])
+        key_ids = np.cumsum(np.r_[False, ~same_key])
+
+        # روز در فضای یکتای کلیدها (فاصله کلیدها بیش از N روز) تا همسایه‌یابی از مرز کلید عبور نکند
+        positions = key_ids * (int(days.max() - days.min()) + self.window_days + 1) + (days - days.min())
+        reach = np.searchsorted(positions, positions + self.window_days, side='right')
+        # شروع گروه: هیچ آرتیکل قبلی همسایه‌ای در این موقعیت یا پس از آن ندارد
+        component_starts = np.r_[True, np.maximum.accumulate(reach)[:-1] <= np.arange(1, ordered.size)]
+        components = np.cumsum(component_starts) - 1
+
+        # گروه‌های با حداقل دو سند متمایز
+        pairs = np.unique(np.stack([components, documents]), axis=1)
+        kept = np.flatnonzero(np.bincount(pairs[0], minlength=components[-1] + 1) > 1)
+        bounds = np.r_[np.flatnonzero(component_starts), ordered.size]
+        return [ordered[bounds[component]:bounds[component + 1]] for component in kept.tolist()]
+
+    def _token_keys(self, indices: np.ndarray) -> np.ndarray:
+        """شناسه مجموعه واژه‌های یکسان‌سازی‌شده شرح هر آرتیکل"""
+        snapshot = self.snapshot
+        details = self.load_details()
+
+        token_ids: Dict[frozenset, int] = {}
+        keys = np.empty(indices.size, dtype=np.int64)
+        for position, row in enumerate(self.rows[indices].tolist()):
+            item = details.get(int(snapshot.item_ids[row]))
+            tokens = frozenset(normalize_persian(item['description'] if item else '').split())
+            keys[position] = token_ids.setdefault(tokens, len(token_ids))
+        return keys
+
+    def detect(self) -> Dict[str, List[Dict]]:
+        """گروه‌های تکرار دقیق و تقریبی (شامل دقیق‌ها) با جزئیات آرتیکل‌ها، با یک کوئری برای تمام گروه‌ها"""
+        groups = self.candidate_groups()
+        snapshot = self.snapshot
+        details = self.load_details()
+
+        exact, near = [], []
+        for group in groups:
+            entries = []
+            for index in group.tolist():
+                row = self.rows[index]
+                item = details.get(int(snapshot.item_ids[row]))
+                if item is None:
+                    continue
+                entries.append({
+                    'item_id': item['id'],
+                    'document_id': int(snapshot.document_ids[row]),
+                    'document_number': item['document__document_number'],
+                    'document_date': item['document__document_date'],
+                    'description': item['description'],
+                    '_day': int(self.days[index]),
+                })
+            if len({entry['document_id'] for entry in entries}) < 2:
+                continue
+
+            first = group[0]
+            position = snapshot.account_position[self.rows[first]]
+            summary = {
+                'account_code': str(snapshot.account_codes[position]),
+                'account_name': snapshot.account_names[position],
+                'amount': from_minor_units(self.amounts[first]),
+                'type': 'credit' if self.is_credit[first] else 'debit',
+            }
+
+            # تکرار دقیق: هم‌روز در اسناد مختلف (واژه‌های شرح در کل گروه یکسان است)
+            by_day = {}
+            for entry in entries:
+                by_day.setdefault(entry.pop('_day'), []).append(entry)
+            for same in by_day.values():
+                if len({entry['document_id'] for entry in same}) > 1:
+                    exact.append({**summary, 'count': len(same), 'items': same})
+
+            days = self.days[group]
+            near.append({
+                **summary,
+                'count': len(entries),
+                'day_span': int(days.max() - days.min()),
+                'items': entries,
+            })
+
+        return {'exact': exact, 'near': near}
+
+
+def duplicate_transactions(company: Company, period: FinancialPeriod) -> Dict[str, List[Dict]]:
+    """آرتیکل‌های تکراری و تقریباً تکراری دوره در کش نسخه جاری دفتر"""
+    return cached_report(
+        'duplicate_transactions', company.id, period.id,
+        lambda: DuplicateDetector(LedgerSnapshot.load(company, period)).detect()
+    )
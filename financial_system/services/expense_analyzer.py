@@ -4,21 +4,33 @@
 این سرویس برای تحلیل حساب‌های هزینه‌ای طراحی شده است.
 """
 
-from django.db.models import Sum, Q
 from decimal import Decimal
 from typing import Dict, List
-from financial_system.models.document_models import DocumentHeader, DocumentItem
-from financial_system.models.coding_models import ChartOfAccounts
+from financial_system.services.account_hierarchy import from_minor_units
+from financial_system.services.ledger_snapshot import LedgerSnapshot
+from financial_system.services.monthly_ledger import MonthlyLedgerMatrix, growth_rate, seasonality
 from users.models import Company, FinancialPeriod
 
 
 class ExpenseAnalyzer:
     """تحلیل‌گر حساب‌های هزینه‌ای"""
     
-    def __init__(self, company: Company, period: FinancialPeriod):
+    def __init__(self, company: Company, period: FinancialPeriod, snapshot: LedgerSnapshot = None):
         self.company = company
         self.period = period
         self.expense_account_codes = ['5']  # حساب‌های هزینه‌ای (معمولاً با ۵ شروع می‌شوند)
+        self._snapshot = snapshot
+        self._matrix = None
+    
+    @property
+    def matrix(self) -> MonthlyLedgerMatrix:
+        """ماتریس (حساب × ماه) دوره؛ از تصویر مشترک یا با یک کوئری گروه‌بندی‌شده"""
+        if self._matrix is None:
+            if self._snapshot is not None:
+                self._matrix = MonthlyLedgerMatrix.from_snapshot(self._snapshot)
+            else:
+                self._matrix = MonthlyLedgerMatrix.load(self.company, self.period)
+        return self._matrix
     
     def analyze_expenses(self) -> Dict:
         """تحلیل کامل حساب‌های هزینه‌ای"""
@@ -44,30 +56,17 @@ class ExpenseAnalyzer:
     
     def _calculate_total_expenses(self) -> Dict:
         """محاسبه کل هزینه‌ها"""
-        expense_accounts = ChartOfAccounts.objects.filter(
-            code__startswith='5',
-            is_active=True
-        )
-        
         total_expenses = Decimal('0')
         expense_details = {}
         
-        for account in expense_accounts:
-            items = DocumentItem.objects.filter(
-                account=account,
-                document__company=self.company,
-                document__period=self.period
-            )
+        # برای حساب‌های هزینه‌ای: هزینه = بدهکار - بستانکار
+        for account in self.matrix.account_totals(self.expense_account_codes):
+            account_expense = account['amount']
             
-            # برای حساب‌های هزینه‌ای: هزینه = بدهکار - بستانکار
-            account_debit = items.aggregate(total=Sum('debit'))['total'] or Decimal('0')
-            account_credit = items.aggregate(total=Sum('credit'))['total'] or Decimal('0')
-            account_expense = account_debit - account_credit
-            
-            expense_details[account.code] = {
-                'account_name': account.name,
+            expense_details[account['code']] = {
+                'account_name': account['name'],
                 'expense': account_expense,
-                'transaction_count': items.count()
+                'transaction_count': account['transaction_count']
             }
             
             total_expenses += account_expense
@@ -86,131 +85,48 @@ class ExpenseAnalyzer:
             'سایر هزینه‌ها': ['55', '56']       # سایر هزینه‌های عملیاتی و غیرعملیاتی
         }
         
-        analysis = {}
-        total = Decimal('0')
+        # جمع هر نوع با یک ضرب ماتریسی (نوع × حساب) در (حساب × ماه)
+        type_totals = self.matrix.group_matrix(expense_types).sum(axis=1)
+        total = from_minor_units(type_totals.sum())
         
-        for expense_type, codes in expense_types.items():
-            type_expense = Decimal('0')
-            type_details = {}
-            
-            for code_prefix in codes:
-                accounts = ChartOfAccounts.objects.filter(
-                    code__startswith=code_prefix,
-                    is_active=True
-                )
-                
-                for account in accounts:
-                    items = DocumentItem.objects.filter(
-                        account=account,
-                        document__company=self.company,
-                        document__period=self.period
-                    )
-                    
-                    account_debit = items.aggregate(total=Sum('debit'))['total'] or Decimal('0')
-                    account_credit = items.aggregate(total=Sum('credit'))['total'] or Decimal('0')
-                    account_expense = account_debit - account_credit
-                    
-                    type_details[account.code] = {
-                        'account_name': account.name,
-                        'expense': account_expense
-                    }
-                    
-                    type_expense += account_expense
-            
+        analysis = {}
+        for index, (expense_type, codes) in enumerate(expense_types.items()):
+            type_expense = from_minor_units(type_totals[index])
             analysis[expense_type] = {
                 'total': type_expense,
                 'percentage': (type_expense / total * 100) if total > 0 else Decimal('0'),
-                'details': type_details
+                'details': {
+                    account['code']: {
+                        'account_name': account['name'],
+                        'expense': account['amount']
+                    }
+                    for account in self.matrix.account_totals(codes)
+                }
             }
-            
-            total += type_expense
-        
-        # محاسبه درصدها
-        for expense_type in analysis:
-            if total > 0:
-                analysis[expense_type]['percentage'] = (analysis[expense_type]['total'] / total * 100)
         
         analysis['total'] = total
         return analysis
     
     def _analyze_monthly_trend(self) -> Dict:
         """تحلیل روند ماهانه هزینه‌ها"""
-        expense_accounts = ChartOfAccounts.objects.filter(
-            code__startswith='5',
-            is_active=True
-        )
-        
-        monthly_data = {}
-        
-        for account in expense_accounts:
-            items = DocumentItem.objects.filter(
-                account=account,
-                document__company=self.company,
-                document__period=self.period
-            ).select_related('document')
-            
-            for item in items:
-                month_key = item.document.document_date.strftime('%Y-%m')
-                if month_key not in monthly_data:
-                    monthly_data[month_key] = {
-                        'expense': Decimal('0'),
-                        'transactions': 0
-                    }
-                
-                # برای هزینه: بدهکار منهای بستانکار
-                monthly_data[month_key]['expense'] += (item.debit - item.credit)
-                monthly_data[month_key]['transactions'] += 1
+        # سری ماهانه (به ترتیب ماه) برای هزینه: بدهکار منهای بستانکار
+        series, counts = self.matrix.monthly(self.expense_account_codes)
+        labels = self.matrix.monthly_labels(self.expense_account_codes)
         
-        # مرتب‌سازی بر اساس ماه
-        sorted_months = sorted(monthly_data.keys())
         trend_analysis = {
-            'monthly_data': {month: monthly_data[month] for month in sorted_months},
-            'growth_rate': self._calculate_growth_rate(monthly_data),
-            'seasonality': self._analyze_seasonality(monthly_data)
+            'monthly_data': {
+                month: {
+                    'expense': from_minor_units(series[index]),
+                    'transactions': int(counts[index])
+                }
+                for index, month in enumerate(labels)
+            },
+            'growth_rate': growth_rate(series),
+            'seasonality': seasonality(labels, series)
         }
         
         return trend_analysis
     
-    def _calculate_growth_rate(self, monthly_data: Dict) -> Decimal:
-        """محاسبه نرخ رشد هزینه‌ها"""
-        if len(monthly_data) < 2:
-            return Decimal('0')
-        
-        sorted_months = sorted(monthly_data.keys())
-        first_month_expense = monthly_data[sorted_months[0]]['expense']
-        last_month_expense = monthly_data[sorted_months[-1]]['expense']
-        
-        if first_month_expense > 0:
-            growth_rate = ((last_month_expense - first_month_expense) / first_month_expense) * 100
-            return growth_rate
-        
-        return Decimal('0')
-    
-    def _analyze_seasonality(self, monthly_data: Dict) -> Dict:
-        """تحلیل فصلی بودن هزینه‌ها"""
-        if len(monthly_data) < 3:
-            return {'message': 'داده کافی برای تحلیل فصلی وجود ندارد'}
-        
-        # محاسبه میانگین ماهانه
-        monthly_totals = [data['expense'] for data in monthly_data.values()]
-        average_monthly = sum(monthly_totals) / len(monthly_totals)
-        
-        # شناسایی ماه‌های پیک و افت
-        peak_month = max(monthly_data, key=lambda x: monthly_data[x]['expense'])
-        low_month = min(monthly_data, key=lambda x: monthly_data[x]['expense'])
-        
-        peak_value = monthly_data[peak_month]['expense']
-        low_value = monthly_data[low_month]['expense']
-        
-        return {
-            'average_monthly': average_monthly,
-            'peak_month': peak_month,
-            'peak_value': peak_value,
-            'low_month': low_month,
-            'low_value': low_value,
-            'seasonality_index': (peak_value - low_value) / average_monthly if average_monthly > 0 else Decimal('0')
-        }
-    
     def _analyze_expense_composition(self) -> Dict:
         """تحلیل ترکیب هزینه‌ها"""
         expenses_by_type = self._analyze_expenses_by_type()
@@ -331,26 +247,8 @@ class ExpenseAnalyzer:
     
     def _get_total_revenue(self) -> Decimal:
         """دریافت کل درآمدها"""
-        # این یک نمونه ساده است - در نسخه کامل باید از RevenueAnalyzer استفاده شود
-        revenue_accounts = ChartOfAccounts.objects.filter(
-            code__startswith='4',
-            is_active=True
-        )
-        
-        total_revenue = Decimal('0')
-        for account in revenue_accounts:
-            items = DocumentItem.objects.filter(
-                account=account,
-                document__company=self.company,
-                document__period=self.period
-            )
-            
-            account_debit = items.aggregate(total=Sum('debit'))['total'] or Decimal('0')
-            account_credit = items.aggregate(total=Sum('credit'))['total'] or Decimal('0')
-            account_revenue = account_credit - account_debit
-            total_revenue += account_revenue
-        
-        return total_revenue
+        # از همان تصویر مشترک RevenueAnalyzer خوانده می‌شود: درآمد = بستانکار - بدهکار
+        return self.matrix.net(['4'], debit_nature=False)
     
     def _assess_cost_ratio(self, expense_type: str, ratio: Decimal) -> str:
         """ارزیابی نسبت هزینه"""
@@ -5,12 +5,15 @@
 """
 
 from typing import Dict, List, Any, Optional
-from datetime import datetime, timedelta
-from decimal import Decimal
+from datetime import datetime
 import json
 import logging
-from users.models import User, Company, FinancialPeriod
-from financial_system.models import FinancialData, RatioAnalysis, TrendAnalysis
+from users.models import FinancialPeriod
+from financial_system.services import history_store
+from financial_system.services.account_baselines import AMOUNT_ZSCORE, TIMING_DISTANCE, AccountBaselineService, baseline_versions
+from financial_system.services.live_updates import publish
+from financial_system.services.ratio_engine import period_financials
+from financial_system.services.report_cache import get_ledger_version
 
 
 class FinancialAlertSystem:
@@ -18,11 +21,24 @@ class FinancialAlertSystem:
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.alert_history = []
     
     def analyze_financial_data(self, company_id: int, period_id: int) -> Dict[str, Any]:
         """تحلیل داده‌های مالی و شناسایی هشدارها"""
         
+        versions = self._evaluation_versions(company_id, period_id)
+        result = self._evaluate(company_id, period_id)
+        if result['success']:
+            # ذخیره تاریخچه هشدار
+            try:
+                self._save_alert_history(result, versions)
+            except Exception as e:
+                self.logger.error(f"خطا در ذخیره تاریخچه هشدار: {str(e)}")
+            self._publish_alerts(result)
+        return result
+    
+    def _evaluate(self, company_id: int, period_id: int) -> Dict[str, Any]:
+        """اجرای کامل تحلیل‌ها بدون ذخیره و انتشار"""
+        
         try:
             # دریافت داده‌های مالی
             financial_data = self._get_financial_data(company_id, period_id)
@@ -37,10 +53,11 @@ class FinancialAlertSystem:
             ratio_alerts = self._analyze_ratios(financial_data)
             trend_alerts = self._analyze_trends(company_id, period_id)
             anomaly_alerts = self._detect_anomalies(financial_data)
+            baseline_alerts = self._detect_baseline_anomalies(company_id, period_id)
             risk_alerts = self._assess_financial_risks(financial_data)
             
             # ترکیب هشدارها
-            all_alerts = ratio_alerts + trend_alerts + anomaly_alerts + risk_alerts
+            all_alerts = ratio_alerts + trend_alerts + anomaly_alerts + baseline_alerts + risk_alerts
             
             # اولویت‌بندی هشدارها
             prioritized_alerts = self._prioritize_alerts(all_alerts)
@@ -48,9 +65,6 @@ class FinancialAlertSystem:
             # تولید گزارش هشدار
             alert_report = self._generate_alert_report(prioritized_alerts, company_id, period_id)
             
-            # ذخیره تاریخچه هشدار
-            self._save_alert_history(prioritized_alerts, company_id, period_id)
-            
             return {
                 'success': True,
                 'company_id': company_id,
@@ -70,81 +84,65 @@ class FinancialAlertSystem:
             }
     
     def _get_financial_data(self, company_id: int, period_id: int) -> Optional[Dict[str, Any]]:
-        """دریافت داده‌های مالی"""
+        """دریافت اقلام صورت‌های مالی دوره از دفتر (موتور نسبت‌ها، مشترک با تحلیل‌گرها)"""
         
         try:
-            # دریافت داده‌های مالی از مدل
-            financial_data = FinancialData.objects.filter(
-                company_id=company_id,
-                period_id=period_id
-            ).first()
+            period = FinancialPeriod.objects.select_related('company').get(pk=period_id, company_id=company_id)
+            financials = period_financials(period.company, period)
             
-            if not financial_data:
+            if not financials.months:
                 return None
             
-            # محاسبه نسبت‌های مالی
-            ratios = self._calculate_financial_ratios(financial_data)
+            line = financials.line
+            # استهلاک انباشته بستانکار دارایی ثابت است و در جریان نقد عملیاتی برگشت داده شده است
+            investing_cash_flow = -(line('fixed_assets') + line('marketable_securities') + line('depreciation'))
+            financing_cash_flow = line('short_term_debt') + line('long_term_debt') + line('total_equity')
             
             return {
                 'company_id': company_id,
                 'period_id': period_id,
                 'balance_sheet': {
-                    'total_assets': financial_data.total_assets,
-                    'total_liabilities': financial_data.total_liabilities,
-                    'equity': financial_data.equity,
-                    'current_assets': financial_data.current_assets,
-                    'current_liabilities': financial_data.current_liabilities
+                    'total_assets': line('total_assets'),
+                    'total_liabilities': line('total_liabilities'),
+                    'equity': line('total_equity'),
+                    'current_assets': line('current_assets'),
+                    'current_liabilities': line('current_liabilities')
                 },
                 'income_statement': {
-                    'revenue': financial_data.revenue,
-                    'cost_of_goods_sold': financial_data.cost_of_goods_sold,
-                    'gross_profit': financial_data.gross_profit,
-                    'operating_expenses': financial_data.operating_expenses,
-                    'net_income': financial_data.net_income
+                    'revenue': line('revenue'),
+                    'cost_of_goods_sold': line('cost_of_goods_sold'),
+                    'gross_profit': line('gross_profit'),
+                    'operating_expenses': line('operating_expenses'),
+                    'net_income': line('net_income')
                 },
                 'cash_flow': {
-                    'operating_cash_flow': financial_data.operating_cash_flow,
-                    'investing_cash_flow': financial_data.investing_cash_flow,
-                    'financing_cash_flow': financial_data.financing_cash_flow,
-                    'net_cash_flow': financial_data.net_cash_flow
+                    'operating_cash_flow': line('operating_cash_flow'),
+                    'investing_cash_flow': investing_cash_flow,
+                    'financing_cash_flow': financing_cash_flow,
+                    'net_cash_flow': line('operating_cash_flow') + investing_cash_flow + financing_cash_flow
                 },
-                'ratios': ratios
+                'ratios': self._calculate_financial_ratios(financials)
             }
             
+        except FinancialPeriod.DoesNotExist:
+            return None
         except Exception as e:
             self.logger.error(f"خطا در دریافت داده‌های مالی: {str(e)}")
             return None
     
-    def _calculate_financial_ratios(self, financial_data) -> Dict[str, Decimal]:
-        """محاسبه نسبت‌های مالی"""
+    def _calculate_financial_ratios(self, financials) -> Dict[str, float]:
+        """نسبت‌های مالی مورد نیاز هشدارها از نسبت‌های محاسبه‌شده موتور (مخرج صفر: نسبت صفر)"""
         
-        try:
-            ratios = {}
-            
-            # نسبت‌های نقدینگی
-            if financial_data.current_liabilities and financial_data.current_liabilities > 0:
-                ratios['current_ratio'] = financial_data.current_assets / financial_data.current_liabilities
-                ratios['quick_ratio'] = (financial_data.current_assets - financial_data.inventory) / financial_data.current_liabilities
-            
-            # نسبت‌های اهرمی
-            if financial_data.total_assets and financial_data.total_assets > 0:
-                ratios['debt_to_assets'] = financial_data.total_liabilities / financial_data.total_assets
-                ratios['debt_to_equity'] = financial_data.total_liabilities / financial_data.equity if financial_data.equity else 0
-            
-            # نسبت‌های سودآوری
-            if financial_data.revenue and financial_data.revenue > 0:
-                ratios['gross_margin'] = financial_data.gross_profit / financial_data.revenue
-                ratios['net_margin'] = financial_data.net_income / financial_data.revenue if financial_data.net_income else 0
-            
-            # نسبت‌های فعالیت
-            if financial_data.total_assets and financial_data.total_assets > 0:
-                ratios['asset_turnover'] = financial_data.revenue / financial_data.total_assets
-            
-            return ratios
-            
-        except Exception as e:
-            self.logger.error(f"خطا در محاسبه نسبت‌ها: {str(e)}")
-            return {}
+        ratios = financials.ratios()
+        return {
+            'current_ratio': ratios['current_ratio'],
+            'quick_ratio': ratios['quick_ratio'],
+            'debt_to_assets': ratios['debt_ratio'],
+            'debt_to_equity': ratios['debt_to_equity'],
+            'gross_margin': ratios['gross_profit_margin'],
+            'net_margin': ratios['net_profit_margin'],
+            'asset_turnover': ratios['asset_turnover'],
+        }
     
     def _analyze_ratios(self, financial_data: Dict) -> List[Dict[str, Any]]:
         """تحلیل نسبت‌های مالی و شناسایی هشدارها"""
@@ -238,11 +236,14 @@ class FinancialAlertSystem:
         alerts = []
         
         try:
-            # دریافت داده‌های تاریخی
-            historical_data = FinancialData.objects.filter(
-                company_id=company_id,
-                period_id__lt=period_id
-            ).order_by('-period_id')[:4]  # ۴ دوره قبلی
+            # اقلام دوره‌های قبلی از دفتر
+            historical_data = [
+                period_financials(period.company, period)
+                for period in FinancialPeriod.objects.select_related('company').filter(
+                    company_id=company_id,
+                    id__lt=period_id
+                ).order_by('-id')[:4]  # ۴ دوره قبلی
+            ]
             
             if len(historical_data) < 2:
                 return alerts
@@ -272,7 +273,7 @@ class FinancialAlertSystem:
         """تحلیل روند درآمد"""
         
         try:
-            revenues = [data.revenue for data in historical_data if data.revenue]
+            revenues = [data.line('revenue') for data in historical_data if data.line('revenue')]
             
             if len(revenues) < 2:
                 return None
@@ -319,7 +320,7 @@ class FinancialAlertSystem:
         """تحلیل روند سود"""
         
         try:
-            profits = [data.net_income for data in historical_data if data.net_income is not None]
+            profits = [data.line('net_income') for data in historical_data if data.months]
             
             if len(profits) < 2:
                 return None
@@ -371,8 +372,10 @@ class FinancialAlertSystem:
             current_ratios = []
             
             for data in historical_data:
-                if data.current_assets and data.current_liabilities and data.current_liabilities > 0:
-                    current_ratio = data.current_assets / data.current_liabilities
+                current_assets = data.line('current_assets')
+                current_liabilities = data.line('current_liabilities')
+                if current_assets and current_liabilities > 0:
+                    current_ratio = current_assets / current_liabilities
                     current_ratios.append(current_ratio)
             
             if len(current_ratios) < 2:
@@ -461,6 +464,57 @@ class FinancialAlertSystem:
             self.logger.error(f"خطا در شناسایی ناهنجاری‌ها: {str(e)}")
             return []
     
+    def _detect_baseline_anomalies(self, company_id: int, period_id: int) -> List[Dict[str, Any]]:
+        """ناهنجاری حساب‌ها در برابر خط مبنای دوره‌های پیشین (مبالغ پرت، جهش گردش ماهانه، جابجایی زمانی)"""
+        
+        alerts = []
+        
+        try:
+            period = FinancialPeriod.objects.select_related('company').get(pk=period_id, company_id=company_id)
+            scores = AccountBaselineService(period.company, period).score()
+            
+            for account in scores['amount_outliers']['accounts'][:5]:
+                alerts.append({
+                    'type': 'ناهنجاری',
+                    'severity': 'بالا' if account['max_zscore'] >= 2 * AMOUNT_ZSCORE else 'متوسط',
+                    'title': f"مبالغ غیرعادی در حساب {account['account_code']}",
+                    'description': f"{account['outlier_count']} آرتیکل حساب {account['account_name']} بسیار بزرگ‌تر از مبالغ معمول دوره‌های پیشین است",
+                    'metric': 'z مقاوم مبلغ',
+                    'value': account['max_zscore'],
+                    'threshold': AMOUNT_ZSCORE,
+                    'deviation': 'بالا'
+                })
+            
+            for anomaly in scores['volume_anomalies'][:5]:
+                alerts.append({
+                    'type': 'ناهنجاری',
+                    'severity': 'متوسط',
+                    'title': f"جهش گردش ماه {anomaly['month']} حساب {anomaly['account_code']}",
+                    'description': f"گردش {anomaly['volume']:,.0f} در برابر گردش معمول {anomaly['baseline_volume']:,.0f} حساب {anomaly['account_name']}",
+                    'metric': 'گردش ماهانه حساب',
+                    'value': anomaly['volume'],
+                    'threshold': anomaly['baseline_volume'],
+                    'deviation': 'بالا'
+                })
+            
+            for shift in scores['timing_shifts'][:5]:
+                alerts.append({
+                    'type': 'ناهنجاری',
+                    'severity': 'متوسط',
+                    'title': f"تغییر الگوی زمانی ثبت حساب {shift['account_code']}",
+                    'description': f"توزیع روزهای ثبت حساب {shift['account_name']} با دوره‌های پیشین متفاوت است (سهم پایان ماه {shift['end_of_month_share']:.0%} در برابر {shift['baseline_end_of_month_share']:.0%})",
+                    'metric': 'فاصله توزیع روز ماه',
+                    'value': shift['distance'],
+                    'threshold': TIMING_DISTANCE,
+                    'deviation': 'بالا'
+                })
+            
+            return alerts
+            
+        except Exception as e:
+            self.logger.error(f"خطا در مقایسه با خط مبنای حساب‌ها: {str(e)}")
+            return []
+    
     def _assess_financial_risks(self, financial_data: Dict) -> List[Dict[str, Any]]:
         """ارزیابی ریسک‌های مالی"""
         
@@ -705,41 +759,131 @@ class FinancialAlertSystem:
         
         return unique_recommendations
     
-    def _save_alert_history(self, alerts: List[Dict], company_id: int, period_id: int) -> None:
-        """ذخیره تاریخچه هشدار"""
+    def _evaluation_versions(self, company_id: int, period_id: int) -> Dict[str, Any]:
+        """نسخه دفتر دوره و دوره‌های خط مبنای آن؛ هشدارهای خط مبنا با تغییر هر کدام کهنه می‌شوند"""
         
-        history_entry = {
-            'timestamp': datetime.now(),
-            'company_id': company_id,
-            'period_id': period_id,
-            'alerts': alerts,
-            'total_alerts': len(alerts),
-            'high_priority_count': len([a for a in alerts if a['severity'] in ['بسیار بالا', 'بالا']])
+        return {
+            'ledger_version': get_ledger_version(company_id, period_id),
+            'baseline_versions': baseline_versions(company_id, period_id),
+        }
+    
+    @staticmethod
+    def _is_current(entry, versions: Dict[str, Any]) -> bool:
+        """آیا اجرای ذخیره‌شده با همین نسخه‌های دفتر محاسبه شده است"""
+        
+        return all(entry.summary.get(key) == value for key, value in versions.items())
+    
+    def _history_run(self, result: Dict[str, Any], versions: Dict[str, Any]) -> Dict[str, Any]:
+        """اجرای هشدار قابل ذخیره در جدول تاریخچه"""
+        
+        return {
+            'company_id': result['company_id'],
+            'period_id': result['period_id'],
+            'alerts': result['alerts'],
+            'summary': {
+                **versions,
+                'alert_report': result['alert_report'],
+                'recommendations': result['recommendations']
+            }
         }
+    
+    def _save_alert_history(self, result: Dict[str, Any], versions: Dict[str, Any]) -> None:
+        """ذخیره تاریخچه هشدار"""
         
-        self.alert_history.append(history_entry)
+        history_store.record_alert_runs([self._history_run(result, versions)])
+    
+    def _publish_alerts(self, result: Dict[str, Any]) -> None:
+        """انتشار خلاصه هشدارها برای داشبوردهای زنده"""
         
-        # محدود کردن تاریخچه به ۵۰ ورودی
-        if len(self.alert_history) > 50:
-            self.alert_history = self.alert_history[-50:]
+        publish(result['company_id'], result['period_id'], 'alerts', {
+            'total_alerts': result['total_alerts'],
+            'high_priority_alerts': result['high_priority_alerts']
+        })
     
     def get_alert_history(self, company_id: Optional[int] = None, days_back: int = 90) -> List[Dict[str, Any]]:
         """دریافت تاریخچه هشدار"""
         
-        cutoff_date = datetime.now() - timedelta(days=days_back)
+        return history_store.alert_history(company_id, days_back=days_back)
+    
+    def get_latest_alerts(self, company_id: int, period_id: int) -> Dict[str, Any]:
+        """هشدارهای پیش‌محاسبه‌شده آخرین ارزیابی دوره (بدون اجرای تحلیل)"""
         
-        filtered_history = [
-            entry for entry in self.alert_history
-            if entry['timestamp'] >= cutoff_date
+        entry = history_store.latest_alert_run(company_id, period_id)
+        if entry is None:
+            return {
+                'success': False,
+                'error': 'هنوز ارزیابی هشداری برای این دوره انجام نشده است'
+            }
+        
+        alerts = [
+            history_store.alert_from_record(record)
+            for record in entry.alerts.order_by('-priority_score', 'id')
         ]
+        return {
+            'success': True,
+            'company_id': company_id,
+            'period_id': period_id,
+            'evaluated_at': entry.created_at,
+            'is_stale': not self._is_current(entry, self._evaluation_versions(company_id, period_id)),
+            'total_alerts': entry.total_count,
+            'high_priority_alerts': len([a for a in alerts if a['severity'] == 'بسیار بالا']),
+            'alert_report': entry.summary.get('alert_report', {}),
+            'alerts': alerts,
+            'recommendations': entry.summary.get('recommendations', [])
+        }
+    
+    def evaluate_all(self, company_ids: Optional[List[int]] = None, force: bool = False) -> Dict[str, Any]:
+        """
+        ارزیابی زمان‌بندی‌شده هشدارها برای دوره‌های فعال همه شرکت‌های فعال.
+        دوره‌هایی که نسخه دفتر خودشان و دوره‌های خط مبنایشان از آخرین ارزیابی تغییر نکرده رد می‌شوند و اجراهای جدید با یک نوشتن گروهی
+        ذخیره می‌شوند؛ داشبوردها نتیجه را از جدول تاریخچه می‌خوانند.
+        """
+        
+        periods = FinancialPeriod.objects.filter(is_active=True, company__is_active=True)
+        if company_ids:
+            periods = periods.filter(company_id__in=company_ids)
+        periods = list(periods.values_list('id', 'company_id'))
+        latest = history_store.latest_alert_runs([period_id for period_id, _ in periods])
+        
+        runs, results, skipped, failed = [], [], 0, []
+        for period_id, company_id in periods:
+            versions = self._evaluation_versions(company_id, period_id)
+            previous = latest.get(period_id)
+            if not force and previous is not None and self._is_current(previous, versions):
+                skipped += 1
+                continue
+            
+            result = self._evaluate(company_id, period_id)
+            if not result['success']:
+                failed.append({'company_id': company_id, 'period_id': period_id, 'error': result['error']})
+                continue
+            runs.append(self._history_run(result, versions))
+            results.append(result)
         
-        if company_id:
-            filtered_history = [
-                entry for entry in filtered_history
-                if entry['company_id'] == company_id
-            ]
+        try:
+            history_store.record_alert_runs(runs)
+        except Exception as e:
+            self.logger.error(f"خطا در ذخیره گروهی هشدارها: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+        
+        for result in results:
+            self._publish_alerts(result)
+        pruned = history_store.prune_history()
         
-        return filtered_history
+        self.logger.info(
+            f"ارزیابی هشدارها: {len(runs)} دوره ارزیابی، {skipped} دوره بدون تغییر، {len(failed)} خطا"
+        )
+        return {
+            'success': True,
+            'evaluated_periods': len(runs),
+            'skipped_periods': skipped,
+            'failed_periods': failed,
+            'total_alerts': sum(len(run['alerts']) for run in runs),
+            'pruned_entries': pruned
+        }
 
 
 # ابزار LangChain برای سیستم هشدار مالی
@@ -763,6 +907,16 @@ class FinancialAlertTool:
                 'error': str(e)
             }
     
+    def get_latest_alerts(self, company_id: int, period_id: int) -> Dict:
+        """دریافت هشدارهای پیش‌محاسبه‌شده آخرین ارزیابی"""
+        try:
+            return self.alert_system.get_latest_alerts(company_id, period_id)
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
     def get_alert_history(self, company_id: Optional[int] = None, days_back: int = 90) -> Dict:
         """دریافت تاریخچه هشدار"""
         try:
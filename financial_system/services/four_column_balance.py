@@ -0,0 +1,168 @@
+# financial_system/services/four_column_balance.py
+"""
+تراز چهارستونی (مانده ابتدا، گردش بدهکار، گردش بستانکار، مانده انتها)
+آرتیکل‌های دوره با یک کوئری گروه‌بندی‌شده بر اساس حساب و بازه تاریخی (سطل) خوانده می‌شوند و
+مانده ابتدای هر بازه از جمع تجمعی سطل‌های قبلی به دست می‌آید؛ بنابراین تراز چهار فصل یک سال، یک ماه
+یا هر مجموعه دیگری از بازه‌ها با یک پیمایش تولید می‌شود. سطل‌بندی روی کلید تاریخ خود آرتیکل (بدون join سربرگ)
+انجام می‌شود و آرتیکل‌های با تاریخ نامعتبر (کلید صفر) در هیچ بازه‌ای شمرده نمی‌شوند و جداگانه گزارش می‌شوند.
+"""
+
+from datetime import timedelta
+from typing import Dict, List, Tuple
+
+import jdatetime
+import numpy as np
+from django.db.models import Case, Count, IntegerField, Sum, Value, When
+
+from financial_system.models.document_models import DocumentItem
+from financial_system.services.account_hierarchy import from_minor_units, minor_units_expression
+from financial_system.services.jalali_calendar import gregorian_to_date_key
+from users.models import Company, FinancialPeriod
+
+SEASONS = {
+    'spring': 'بهار',
+    'summer': 'تابستان',
+    'autumn': 'پاییز',
+    'winter': 'زمستان',
+}
+
+
+def month_bounds(year: int, month: int) -> Tuple[int, int]:
+    """بازه کلید تاریخ یک ماه شمسی (روز اول تا روز آخر ماه)"""
+    last_day = (jdatetime.date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)).day
+    return year * 10000 + month * 100 + 1, year * 10000 + month * 100 + last_day
+
+
+class FourColumnTrialBalance:
+    """موتور تراز چهارستونی برای هر مجموعه‌ای از بازه‌های تاریخی یک دوره مالی"""
+
+    def __init__(self, company: Company, period: FinancialPeriod):
+        self.company = company
+        self.period = period
+        # ماه و سال شمسی شروع سال مالی (در نبود تاریخ شروع، فروردین)
+        start_key = gregorian_to_date_key(period.start_date) if period.start_date else 0
+        self.start_year = start_key // 10000 if start_key else None
+        self.start_month = start_key // 100 % 100 if start_key else 1
+
+    def month_range(self, offset: int) -> Tuple[int, int]:
+        """بازه ماه offset ام سال مالی (از صفر)"""
+        months = self.start_month - 1 + offset
+        year = (self.start_year or self._first_year()) + months // 12
+        return month_bounds(year, months % 12 + 1)
+
+    def season_range(self, season: str) -> Tuple[int, int]:
+        """بازه یک فصل سال مالی (spring, summer, autumn, winter)"""
+        index = list(SEASONS).index(season)
+        return self.month_range(index * 3)[0], self.month_range(index * 3 + 2)[1]
+
+    def seasons(self) -> Dict[str, Tuple[int, int]]:
+        """بازه‌های چهار فصل سال مالی"""
+        return {season: self.season_range(season) for season in SEASONS}
+
+    def calendar_month_range(self, month: int) -> Tuple[int, int]:
+        """بازه یک ماه شمسی (۱ تا ۱۲) در سال مالی"""
+        return self.month_range((month - self.start_month) % 12)
+
+    def year_range(self) -> Tuple[int, int]:
+        """بازه کامل سال مالی (ماه اول تا دوازدهم)"""
+        return self.month_range(0)[0], self.month_range(11)[1]
+
+    def compute(self, ranges: Dict[str, Tuple[int, int]]) -> Dict[str, Dict]:
+        """
+        تراز چهارستونی تمام بازه‌ها (کلید تاریخ ابتدا و انتها، شامل هر دو) با یک کوئری.
+        آرتیکل‌های با تاریخ نامعتبر در سطل جداگانه‌ای جمع و در کلید undated هر گزارش اعلام می‌شوند.
+        """
+        # مرزهای سطل‌ها: هر سطل j آرتیکل‌های با کلید تاریخ کوچک‌تر از boundaries[j] را می‌گیرد
+        boundaries = sorted({key for start, end in ranges.values() for key in (start, end + 1)})
+        undated_bucket = len(boundaries) + 1
+        bucket = Case(
+            When(date_key__lte=0, then=Value(undated_bucket)),
+            *[When(date_key__lt=boundary, then=Value(position)) for position, boundary in enumerate(boundaries)],
+            default=Value(len(boundaries)),
+            output_field=IntegerField()
+        )
+        rows = list(
+            DocumentItem.objects.filter(
+                document__company=self.company,
+                document__period=self.period
+            ).annotate(bucket=bucket).values('account_id', 'account__code', 'account__name', 'bucket').annotate(
+                debit_total=Sum(minor_units_expression('debit')),
+                credit_total=Sum(minor_units_expression('credit')),
+                item_count=Count('id')
+            ).order_by()
+        )
+
+        account_ids, account_index = np.unique(
+            np.array([row['account_id'] for row in rows], dtype=np.int64), return_inverse=True
+        )
+        names = {row['account_id']: (row['account__code'], row['account__name']) for row in rows}
+        shape = (account_ids.size, undated_bucket + 1)
+        debit = np.zeros(shape, dtype=np.int64)
+        credit = np.zeros(shape, dtype=np.int64)
+        bucket_index = np.array([row['bucket'] for row in rows], dtype=np.int64)
+        np.add.at(debit, (account_index, bucket_index), np.array([row['debit_total'] or 0 for row in rows], dtype=np.int64))
+        np.add.at(credit, (account_index, bucket_index), np.array([row['credit_total'] or 0 for row in rows], dtype=np.int64))
+
+        undated = {
+            'items': sum(row['item_count'] for row in rows if row['bucket'] == undated_bucket),
+            'debit': from_minor_units(debit[:, undated_bucket].sum()),
+            'credit': from_minor_units(credit[:, undated_bucket].sum()),
+        }
+
+        # جمع تجمعی گردش تا پایان هر سطل (بدون سطل تاریخ نامعتبر)
+        cumulative_debit = np.cumsum(debit[:, :undated_bucket], axis=1)
+        cumulative_credit = np.cumsum(credit[:, :undated_bucket], axis=1)
+        order = sorted(range(account_ids.size), key=lambda position: names[int(account_ids[position])][0])
+
+        results = {}
+        for label, (start, end) in ranges.items():
+            before, through = boundaries.index(start), boundaries.index(end + 1)
+            opening = cumulative_debit[:, before] - cumulative_credit[:, before]
+            debit_turnover = cumulative_debit[:, through] - cumulative_debit[:, before]
+            credit_turnover = cumulative_credit[:, through] - cumulative_credit[:, before]
+            closing = opening + debit_turnover - credit_turnover
+            results[label] = self._build_report(
+                start, end, account_ids, names, order, opening, debit_turnover, credit_turnover, closing
+            )
+            results[label]['undated'] = undated
+        return results
+
+    def _build_report(self, start, end, account_ids, names, order, opening, debit_turnover,
+                      credit_turnover, closing) -> Dict:
+        """ردیف‌های حساب‌های دارای مانده یا گردش و جمع ستون‌ها"""
+        active = (opening != 0) | (debit_turnover != 0) | (credit_turnover != 0)
+        accounts: List[Dict] = []
+        for position in order:
+            if not active[position]:
+                continue
+            code, name = names[int(account_ids[position])]
+            accounts.append({
+                'account_id': int(account_ids[position]),
+                'account_code': code,
+                'account_name': name,
+                'beginning_balance': from_minor_units(opening[position]),
+                'debit_turnover': from_minor_units(debit_turnover[position]),
+                'credit_turnover': from_minor_units(credit_turnover[position]),
+                'ending_balance': from_minor_units(closing[position]),
+            })
+        return {
+            'start_date_key': start,
+            'end_date_key': end,
+            'accounts': accounts,
+            'totals': {
+                'beginning_balance': from_minor_units(opening[active].sum()),
+                'debit_turnover': from_minor_units(debit_turnover[active].sum()),
+                'credit_turnover': from_minor_units(credit_turnover[active].sum()),
+                'ending_balance': from_minor_units(closing[active].sum()),
+            },
+        }
+
+    def _first_year(self) -> int:
+        """سال شمسی نخستین سند دوره (وقتی تاریخ شروع دوره ثبت نشده است)"""
+        first_key = DocumentItem.objects.filter(
+            document__company=self.company,
+            document__period=self.period,
+            date_key__gt=0
+        ).order_by('date_key').values_list('date_key', flat=True).first()
+        self.start_year = first_key // 10000 if first_key else 0
+        return self.start_year
@@ -0,0 +1,157 @@
+# financial_system/services/history_store.py
+"""
+ذخیره‌گاه پایدار تاریخچه هشدارها، گزارش‌ها و بهبودهای مدل
+تاریخچه به جای فهرست درون‌حافظه‌ای هر نمونه (که با راه‌اندازی مجدد از بین می‌رفت و بین پردازه‌ها متفاوت
+بود) در جدول HistoryEntry ثبت می‌شود و هر هشدار یک ردیف AlertRecord با ستون‌های نمایه‌دار (شرکت، دوره،
+شدت، زمان) است. نوشتن اجراهای هشدار با bulk_create گروهی و خواندن با کوئری‌های بازه زمانی انجام می‌شود.
+"""
+
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Prefetch
+from django.utils import timezone
+
+from financial_system.models.history_models import AlertRecord, HistoryEntry
+
+# مدت نگهداری تاریخچه (روز)
+HISTORY_RETENTION_DAYS = getattr(settings, 'HISTORY_RETENTION_DAYS', 365)
+
+# شدت‌هایی که در شمارش اولویت بالا حساب می‌شوند
+HIGH_PRIORITY_SEVERITIES = ('بسیار بالا', 'بالا')
+
+# کلیدهای هشدار که ستون جداگانه دارند؛ بقیه کلیدها در جزئیات ذخیره می‌شوند
+_ALERT_COLUMNS = {'type': 'alert_type', 'severity': 'severity', 'priority_score': 'priority_score', 'title': 'title'}
+
+
+def record_entry(kind: str, company_id: Optional[int] = None, period_id: Optional[int] = None,
+                 reference: str = '', total_count: int = 0, high_priority_count: int = 0,
+                 summary: Optional[Dict[str, Any]] = None) -> HistoryEntry:
+    """ثبت یک ورودی تاریخچه"""
+    return HistoryEntry.objects.create(
+        kind=kind,
+        company_id=company_id,
+        period_id=period_id,
+        reference=reference or '',
+        total_count=total_count,
+        high_priority_count=high_priority_count,
+        summary=summary or {},
+    )
+
+
+def record_alert_runs(runs: List[Dict[str, Any]]) -> List[HistoryEntry]:
+    """
+    ثبت گروهی اجراهای هشدار؛ هر اجرا شامل company_id، period_id، alerts و summary است.
+    ورودی‌ها و تمام هشدارها هر کدام با یک bulk_create در یک تراکنش نوشته می‌شوند.
+    """
+    if not runs:
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        entries = HistoryEntry.objects.bulk_create([
+            HistoryEntry(
+                kind=HistoryEntry.KIND_ALERTS,
+                company_id=run['company_id'],
+                period_id=run['period_id'],
+                total_count=len(run['alerts']),
+                high_priority_count=sum(1 for alert in run['alerts'] if alert.get('severity') in HIGH_PRIORITY_SEVERITIES),
+                summary=run.get('summary') or {},
+                created_at=now,
+            )
+            for run in runs
+        ])
+        AlertRecord.objects.bulk_create(
+            [
+                AlertRecord(
+                    entry=entry,
+                    company_id=run['company_id'],
+                    period_id=run['period_id'],
+                    alert_type=str(alert.get('type', ''))[:64],
+                    severity=str(alert.get('severity', ''))[:16],
+                    priority_score=int(alert.get('priority_score', 0)),
+                    title=str(alert.get('title', ''))[:255],
+                    details={key: value for key, value in alert.items() if key not in _ALERT_COLUMNS},
+                    created_at=now,
+                )
+                for entry, run in zip(entries, runs)
+                for alert in run['alerts']
+            ],
+            batch_size=1000
+        )
+    return entries
+
+
+def record_alert_run(company_id: int, period_id: int, alerts: List[Dict[str, Any]],
+                     summary: Optional[Dict[str, Any]] = None) -> HistoryEntry:
+    """ثبت یک اجرای هشدار"""
+    return record_alert_runs([{'company_id': company_id, 'period_id': period_id, 'alerts': alerts, 'summary': summary}])[0]
+
+
+def history(kind: str, company_id: Optional[int] = None, period_id: Optional[int] = None,
+            days_back: Optional[int] = 90, until=None):
+    """ورودی‌های یک نوع تاریخچه در بازه زمانی (به ترتیب زمان ثبت)"""
+    entries = HistoryEntry.objects.filter(kind=kind)
+    if company_id:
+        entries = entries.filter(company_id=company_id)
+    if period_id:
+        entries = entries.filter(period_id=period_id)
+    if days_back is not None:
+        entries = entries.filter(created_at__gte=timezone.now() - timedelta(days=days_back))
+    if until is not None:
+        entries = entries.filter(created_at__lt=until)
+    return entries.order_by('created_at', 'id')
+
+
+def alert_from_record(record: AlertRecord) -> Dict[str, Any]:
+    """بازسازی دیکشنری هشدار از ردیف ذخیره‌شده"""
+    return {
+        'type': record.alert_type,
+        'severity': record.severity,
+        'title': record.title,
+        'priority_score': record.priority_score,
+        **record.details,
+    }
+
+
+def alert_history(company_id: Optional[int] = None, period_id: Optional[int] = None,
+                  days_back: Optional[int] = 90) -> List[Dict[str, Any]]:
+    """اجراهای هشدار بازه به همراه هشدارهای هر اجرا (دو کوئری)"""
+    entries = history(HistoryEntry.KIND_ALERTS, company_id, period_id, days_back).prefetch_related(
+        Prefetch('alerts', queryset=AlertRecord.objects.order_by('-priority_score', 'id'))
+    )
+    return [
+        {
+            'timestamp': entry.created_at,
+            'company_id': entry.company_id,
+            'period_id': entry.period_id,
+            'alerts': [alert_from_record(record) for record in entry.alerts.all()],
+            'total_alerts': entry.total_count,
+            'high_priority_count': entry.high_priority_count,
+        }
+        for entry in entries
+    ]
+
+
+def latest_alert_run(company_id: int, period_id: int) -> Optional[HistoryEntry]:
+    """آخرین اجرای هشدار شرکت و دوره"""
+    return HistoryEntry.objects.filter(
+        kind=HistoryEntry.KIND_ALERTS, company_id=company_id, period_id=period_id
+    ).order_by('-created_at', '-id').first()
+
+
+def latest_alert_runs(period_ids: List[int]) -> Dict[int, HistoryEntry]:
+    """آخرین اجرای هشدار هر دوره (برای ارزیابی گروهی) با یک کوئری گروه‌بندی‌شده و یک کوئری نمایه‌دار"""
+    last_ids = HistoryEntry.objects.filter(
+        kind=HistoryEntry.KIND_ALERTS, period_id__in=period_ids
+    ).values('period_id').annotate(last_id=Max('id')).values_list('last_id', flat=True)
+    return {entry.period_id: entry for entry in HistoryEntry.objects.filter(id__in=list(last_ids))}
+
+
+def prune_history(days: int = HISTORY_RETENTION_DAYS) -> int:
+    """حذف تاریخچه قدیمی‌تر از مدت نگهداری؛ خروجی تعداد ورودی‌های حذف‌شده است"""
+    cutoff = timezone.now() - timedelta(days=days)
+    AlertRecord.objects.filter(created_at__lt=cutoff).delete()
+    _, deleted = HistoryEntry.objects.filter(created_at__lt=cutoff).delete()
+    return deleted.get(HistoryEntry._meta.label, 0)
@@ -10,6 +10,7 @@ from financial_system.services.balance_sheet_analyzer import BalanceSheetAnalyze
 from financial_system.services.cash_bank_analyzer import CashBankAnalyzer
 from financial_system.services.revenue_analyzer import RevenueAnalyzer
 from financial_system.services.expense_analyzer import ExpenseAnalyzer
+from financial_system.services.ledger_snapshot import LedgerSnapshot
 from financial_system.services.report_generator import FinancialReportGenerator
 from users.models import Company, FinancialPeriod
 
@@ -20,12 +21,14 @@ class IntelligentRecommendationEngine:
     def __init__(self, company: Company, period: FinancialPeriod):
         self.company = company
         self.period = period
+        # تمام تحلیل‌گرها از یک تصویر ستونی مشترک دوره استفاده می‌کنند
+        self.snapshot = LedgerSnapshot.load(company, period)
         self.analyzers = {
-            'balance_sheet': BalanceSheetAnalyzer(company, period),
-            'cash_bank': CashBankAnalyzer(company, period),
-            'revenue': RevenueAnalyzer(company, period),
-            'expense': ExpenseAnalyzer(company, period),
-            'report': FinancialReportGenerator(company, period)
+            'balance_sheet': BalanceSheetAnalyzer(company, period, self.snapshot),
+            'cash_bank': CashBankAnalyzer(company, period, self.snapshot),
+            'revenue': RevenueAnalyzer(company, period, self.snapshot),
+            'expense': ExpenseAnalyzer(company, period, self.snapshot),
+            'report': FinancialReportGenerator(company, period, self.snapshot)
         }
     
     def generate_personalized_recommendations(self, user_context: Dict[str, Any] = None) -> Dict[str, Any]:
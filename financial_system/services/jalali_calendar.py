@@ -0,0 +1,85 @@
+# financial_system/services/jalali_calendar.py
+"""
+ابزارهای تقویم شمسی برای کلید تاریخ عددی اسناد (YYYYMMDD)
+"""
+
+from datetime import date
+from typing import Optional
+
+import jdatetime
+import numpy as np
+from django.conf import settings
+
+# در jdatetime روز هفته از شنبه (۰) تا جمعه (۶) شمرده می‌شود
+FRIDAY = 6
+THURSDAY = 5
+
+# تعطیلات رسمی با تاریخ ثابت شمسی (ماه، روز)؛ تعطیلات قمری هر سال در تنظیم JALALI_HOLIDAYS
+# به صورت کلید تاریخ (YYYYMMDD) افزوده می‌شوند
+FIXED_HOLIDAYS = {(1, 1), (1, 2), (1, 3), (1, 4), (1, 12), (1, 13), (3, 14), (3, 15), (11, 22), (12, 29)}
+
+
+def date_key_to_jalali(date_key: int) -> Optional[jdatetime.date]:
+    """تبدیل کلید تاریخ به تاریخ شمسی؛ برای کلید نامعتبر None"""
+    try:
+        return jdatetime.date(int(date_key) // 10000, int(date_key) // 100 % 100, int(date_key) % 100)
+    except (TypeError, ValueError):
+        return None
+
+
+def gregorian_to_date_key(value: date) -> int:
+    """تبدیل تاریخ میلادی (مثلاً ورودی فرم گزارش) به کلید تاریخ شمسی"""
+    jalali = jdatetime.date.fromgregorian(date=value)
+    return jalali.year * 10000 + jalali.month * 100 + jalali.day
+
+
+def month_label(month_key: int) -> str:
+    """نمایش کلید ماه (YYYYMM) به شکل YYYY-MM"""
+    return f"{int(month_key) // 100:04d}-{int(month_key) % 100:02d}"
+
+
+def weekdays(date_keys) -> np.ndarray:
+    """روز هفته شمسی برای آرایه‌ای از کلیدهای تاریخ (برای کلید نامعتبر -1)
+
+    تبدیل تقویم فقط روی کلیدهای یکتا انجام می‌شود و نتیجه به کل آرایه پخش می‌شود.
+    """
+    date_keys = np.asarray(date_keys, dtype=np.int64)
+    unique_keys, inverse = np.unique(date_keys, return_inverse=True)
+    unique_weekdays = np.array(
+        [jalali.weekday() if jalali else -1 for jalali in map(date_key_to_jalali, unique_keys.tolist())],
+        dtype=np.int64,
+    )
+    return unique_weekdays[inverse.reshape(date_keys.shape)]
+
+
+def holidays(date_keys) -> np.ndarray:
+    """ماسک تعطیلات رسمی (تاریخ‌های ثابت و تنظیم JALALI_HOLIDAYS) برای آرایه‌ای از کلیدهای تاریخ"""
+    date_keys = np.asarray(date_keys, dtype=np.int64)
+    fixed = np.array([month * 100 + day for month, day in sorted(FIXED_HOLIDAYS)], dtype=np.int64)
+    extra = np.array(list(getattr(settings, 'JALALI_HOLIDAYS', ())), dtype=np.int64)
+    return np.isin(date_keys % 10000, fixed) | np.isin(date_keys, extra)
+
+
+def days_to_month_end(date_keys) -> np.ndarray:
+    """تعداد روزهای باقی‌مانده تا پایان ماه شمسی (روز آخر ماه صفر، برای کلید نامعتبر -1)"""
+    date_keys = np.asarray(date_keys, dtype=np.int64)
+    unique_keys, inverse = np.unique(date_keys, return_inverse=True)
+    remaining = []
+    for jalali in map(date_key_to_jalali, unique_keys.tolist()):
+        if jalali is None:
+            remaining.append(-1)
+            continue
+        length = jdatetime.j_days_in_month[jalali.month - 1] + (jalali.month == 12 and jalali.isleap())
+        remaining.append(length - jalali.day)
+    return np.array(remaining, dtype=np.int64)[inverse.reshape(date_keys.shape)]
+
+
+def day_numbers(date_keys) -> np.ndarray:
+    """شماره روز پیوسته (ordinal میلادی) برای آرایه‌ای از کلیدهای تاریخ (برای کلید نامعتبر -1)"""
+    date_keys = np.asarray(date_keys, dtype=np.int64)
+    unique_keys, inverse = np.unique(date_keys, return_inverse=True)
+    unique_days = np.array(
+        [jalali.togregorian().toordinal() if jalali else -1 for jalali in map(date_key_to_jalali, unique_keys.tolist())],
+        dtype=np.int64,
+    )
+    return unique_days[inverse.reshape(date_keys.shape)]
@@ -0,0 +1,172 @@
+# financial_system/services/ledger_snapshot.py
+"""
+تصویر ستونی دفتر (Ledger Snapshot)
+آرتیکل‌های یک شرکت و دوره مالی یک بار به صورت آرایه‌های NumPy بارگذاری می‌شوند و
+تمام تحلیل‌گرهای یک درخواست از همین تصویر مشترک استفاده می‌کنند.
+"""
+
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from financial_system.models.coding_models import ChartOfAccounts
+from financial_system.models.document_models import DocumentItem
+from financial_system.services.account_hierarchy import from_minor_units, minor_units_expression, prefix_mask
+from financial_system.services.jalali_calendar import month_label
+from users.models import Company, FinancialPeriod
+
+
+class LedgerSnapshot:
+    """آرایه‌های ستونی آرتیکل‌های یک دوره: حساب، کد، کلید تاریخ، بدهکار، بستانکار و مرکز هزینه
+
+    مبالغ به صورت int64 بر حسب واحد جزء (ریال × ۱۰۰) نگهداری می‌شوند.
+    """
+
+    def __init__(self, company: Company, period: FinancialPeriod, item_ids, document_ids,
+                 account_ids, date_keys, debits, credits, cost_centers, accounts: Dict[int, Tuple]):
+        self.company = company
+        self.period = period
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.document_ids = np.asarray(document_ids, dtype=np.int64)
+        self.account_ids = np.asarray(account_ids, dtype=np.int64)
+        self.date_keys = np.asarray(date_keys, dtype=np.int64)
+        self.debits = np.asarray(debits, dtype=np.int64)
+        self.credits = np.asarray(credits, dtype=np.int64)
+        self.cost_centers = np.asarray(cost_centers, dtype=object)
+
+        # جدول حساب‌ها: هر آرتیکل فقط موقعیت حساب خود را نگه می‌دارد
+        self.accounts_index, self.account_position = np.unique(self.account_ids, return_inverse=True)
+        self.account_position = self.account_position.reshape(self.account_ids.shape)
+        self.account_codes = np.array(
+            [accounts.get(account_id, ('', '', False))[0] for account_id in self.accounts_index.tolist()],
+            dtype=str,
+        )
+        self.account_names = [accounts.get(account_id, ('', '', False))[1] for account_id in self.accounts_index.tolist()]
+        self.account_active = np.array(
+            [accounts.get(account_id, ('', '', False))[2] for account_id in self.accounts_index.tolist()],
+            dtype=bool,
+        )
+        self._cache = {}
+
+    @classmethod
+    def load(cls, company: Company, period: FinancialPeriod, documents_after: int = 0) -> 'LedgerSnapshot':
+        """بارگذاری تصویر دوره با یک پیمایش جدول آرتیکل‌ها (اختیاری فقط اسناد با شناسه بزرگ‌تر از documents_after)"""
+        items = DocumentItem.objects.filter(document__company=company, document__period=period)
+        if documents_after:
+            items = items.filter(document_id__gt=documents_after)
+        rows = list(
+            items.annotate(
+                debit_minor=minor_units_expression('debit'),
+                credit_minor=minor_units_expression('credit')
+            ).values_list(
+                'id', 'document_id', 'account_id', 'document__date_key',
+                'debit_minor', 'credit_minor', 'cost_center'
+            ).order_by()
+        )
+        columns = list(zip(*rows)) if rows else [()] * 7
+
+        account_ids = set(columns[2])
+        accounts = {
+            account_id: (code, name, is_active)
+            for account_id, code, name, is_active in ChartOfAccounts.objects.filter(
+                id__in=account_ids
+            ).values_list('id', 'code', 'name', 'is_active')
+        } if account_ids else {}
+
+        return cls(company, period, *columns[:6], cost_centers=columns[6], accounts=accounts)
+
+    def __len__(self) -> int:
+        return int(self.item_ids.size)
+
+    @property
+    def codes(self) -> np.ndarray:
+        """کد حساب هر آرتیکل"""
+        return self.account_codes[self.account_position]
+
+    @property
+    def amounts(self) -> np.ndarray:
+        """مبلغ هر آرتیکل (بزرگ‌تر از بدهکار و بستانکار)"""
+        return np.maximum(self.debits, self.credits)
+
+    def account_mask(self, prefixes: Iterable[str], active_only: bool = True) -> np.ndarray:
+        """ماسک حساب‌هایی که کدشان با یکی از پیشوندها شروع می‌شود"""
+        mask = prefix_mask(self.account_codes, prefixes)
+        if active_only:
+            mask &= self.account_active
+        return mask
+
+    def row_mask(self, prefixes: Iterable[str], active_only: bool = True) -> np.ndarray:
+        """ماسک آرتیکل‌های حساب‌های منطبق با پیشوندها"""
+        return self.account_mask(prefixes, active_only)[self.account_position]
+
+    def totals(self, prefixes: Iterable[str], active_only: bool = True) -> Tuple[Decimal, Decimal]:
+        """جمع بدهکار و بستانکار حساب‌های منطبق با پیشوندها"""
+        key = ('totals', tuple(prefixes), active_only)
+        if key not in self._cache:
+            mask = self.row_mask(key[1], active_only)
+            self._cache[key] = (
+                from_minor_units(self.debits[mask].sum()),
+                from_minor_units(self.credits[mask].sum()),
+            )
+        return self._cache[key]
+
+    def net(self, prefixes: Iterable[str], debit_nature: bool = True, active_only: bool = True) -> Decimal:
+        """مانده خالص با ماهیت حساب (بدهکار: بدهکار - بستانکار، بستانکار: بستانکار - بدهکار)"""
+        debit, credit = self.totals(prefixes, active_only)
+        return debit - credit if debit_nature else credit - debit
+
+    def account_summary(self, prefixes: Iterable[str] = ('',), active_only: bool = True) -> List[Dict]:
+        """گردش هر حساب منطبق با پیشوندها به ترتیب کد حساب"""
+        account_count = self.accounts_index.size
+        debit = np.zeros(account_count, dtype=np.int64)
+        credit = np.zeros(account_count, dtype=np.int64)
+        np.add.at(debit, self.account_position, self.debits)
+        np.add.at(credit, self.account_position, self.credits)
+        counts = np.bincount(self.account_position, minlength=account_count)
+
+        selected = np.flatnonzero(self.account_mask(prefixes, active_only))
+        selected = selected[np.argsort(self.account_codes[selected], kind='stable')]
+        return [
+            {
+                'account_id': int(self.accounts_index[position]),
+                'code': str(self.account_codes[position]),
+                'name': self.account_names[position],
+                'debit': from_minor_units(debit[position]),
+                'credit': from_minor_units(credit[position]),
+                'transaction_count': int(counts[position]),
+            }
+            for position in selected
+        ]
+
+    def monthly(self, prefixes: Iterable[str], active_only: bool = True, rows: np.ndarray = None) -> Dict[str, Dict]:
+        """گردش ماهانه (کلید YYYY-MM) حساب‌های منطبق با پیشوندها"""
+        mask = self.row_mask(prefixes, active_only) if rows is None else rows
+        month_keys = self.date_keys[mask] // 100
+        months, inverse = np.unique(month_keys, return_inverse=True)
+        debit = np.zeros(months.size, dtype=np.int64)
+        credit = np.zeros(months.size, dtype=np.int64)
+        np.add.at(debit, inverse, self.debits[mask])
+        np.add.at(credit, inverse, self.credits[mask])
+        counts = np.bincount(inverse, minlength=months.size)
+        return {
+            month_label(month): {
+                'debit': from_minor_units(debit[index]),
+                'credit': from_minor_units(credit[index]),
+                'transactions': int(counts[index]),
+            }
+            for index, month in enumerate(months.tolist())
+        }
+
+    def item_details(self, rows: np.ndarray) -> List[Dict]:
+        """جزئیات آرتیکل‌های انتخاب‌شده (فقط برای ردیف‌های علامت‌خورده، با یک کوئری روی کلید اصلی)"""
+        item_ids = self.item_ids[rows].tolist()
+        if not item_ids:
+            return []
+        details = {
+            row['id']: row
+            for row in DocumentItem.objects.filter(id__in=item_ids).values(
+                'id', 'description', 'document__document_number', 'document__document_date'
+            )
+        }
+        return [details[item_id] for item_id in item_ids if item_id in details]
@@ -5,16 +5,24 @@
 """
 
 from typing import Dict, List, Any
-from decimal import Decimal
-from users.models import Company, FinancialPeriod, FinancialFile, Document
+from financial_system.services.ratio_engine import PeriodFinancials, period_financials
+from users.models import Company, FinancialPeriod
 
 
 class LeverageRatioAnalyzer:
     """تحلیل‌گر نسبت‌های اهرمی"""
     
-    def __init__(self, company: Company, period: FinancialPeriod):
+    def __init__(self, company: Company, period: FinancialPeriod, financials: PeriodFinancials = None):
         self.company = company
         self.period = period
+        self._financials = financials
+    
+    @property
+    def financials(self) -> PeriodFinancials:
+        """اقلام صورت‌های مالی دوره از اسناد ثبت‌شده (نمونه مشترک نسخه جاری دفتر)"""
+        if self._financials is None:
+            self._financials = period_financials(self.company, self.period)
+        return self._financials
     
     def calculate_all_leverage_ratios(self) -> Dict[str, Any]:
         """محاسبه تمام نسبت‌های اهرمی"""
@@ -22,15 +30,22 @@ class LeverageRatioAnalyzer:
         # جمع‌آوری داده‌های مورد نیاز
         financial_data = self._collect_financial_data()
         
-        # محاسبه نسبت‌ها
+        # مقادیر نسبت‌ها از موتور برداری؛ متدهای زیر فقط تفسیر و جزئیات را می‌سازند
+        values = self.financials.ratios('leverage')
         ratios = {
-            'debt_ratio': self._calculate_debt_ratio(financial_data),
-            'debt_to_equity_ratio': self._calculate_debt_to_equity_ratio(financial_data),
-            'equity_multiplier': self._calculate_equity_multiplier(financial_data),
-            'times_interest_earned': self._calculate_times_interest_earned(financial_data),
-            'debt_service_coverage_ratio': self._calculate_debt_service_coverage_ratio(financial_data),
-            'fixed_charge_coverage_ratio': self._calculate_fixed_charge_coverage_ratio(financial_data),
-            'long_term_debt_to_equity': self._calculate_long_term_debt_to_equity(financial_data)
+            'debt_ratio': self._calculate_debt_ratio(financial_data, values['debt_ratio']),
+            'debt_to_equity_ratio': self._calculate_debt_to_equity_ratio(financial_data, values['debt_to_equity']),
+            'equity_multiplier': self._calculate_equity_multiplier(financial_data, values['equity_multiplier']),
+            'times_interest_earned': self._calculate_times_interest_earned(financial_data, values['interest_coverage']),
+            'debt_service_coverage_ratio': self._calculate_debt_service_coverage_ratio(
+                financial_data, values['debt_service_coverage_ratio']
+            ),
+            'fixed_charge_coverage_ratio': self._calculate_fixed_charge_coverage_ratio(
+                financial_data, values['fixed_charge_coverage_ratio']
+            ),
+            'long_term_debt_to_equity': self._calculate_long_term_debt_to_equity(
+                financial_data, values['long_term_debt_to_equity']
+            )
         }
         
         # تحلیل و ارزیابی
@@ -46,45 +61,39 @@ class LeverageRatioAnalyzer:
         }
     
     def _collect_financial_data(self) -> Dict[str, Any]:
-        """جمع‌آوری داده‌های مالی مورد نیاز"""
+        """جمع‌آوری داده‌های مالی مورد نیاز از مانده‌های ثبت‌شده دوره"""
         
-        # این بخش باید با مدل‌های واقعی یکپارچه شود
-        # فعلاً از داده‌های نمونه استفاده می‌کنیم
+        fin = self.financials
         
         return {
             'balance_sheet': {
-                'total_assets': Decimal('10000000000'),  # 10 میلیارد
-                'total_liabilities': Decimal('6000000000'),  # 6 میلیارد
-                'total_equity': Decimal('4000000000'),  # 4 میلیارد
-                'long_term_debt': Decimal('3000000000'),  # 3 میلیارد
-                'short_term_debt': Decimal('1000000000'),  # 1 میلیارد
-                'current_liabilities': Decimal('2000000000')  # 2 میلیارد
+                'total_assets': fin.line('total_assets'),
+                'total_liabilities': fin.line('total_liabilities'),
+                'total_equity': fin.line('total_equity'),
+                'long_term_debt': fin.line('long_term_debt'),
+                'short_term_debt': fin.line('short_term_debt'),
+                'current_liabilities': fin.line('current_liabilities')
             },
             'income_statement': {
-                'ebit': Decimal('1500000000'),  # 1.5 میلیارد
-                'net_income': Decimal('900000000'),  # 900 میلیون
-                'interest_expense': Decimal('300000000'),  # 300 میلیون
-                'tax_expense': Decimal('300000000'),  # 300 میلیون
-                'operating_income': Decimal('1800000000')  # 1.8 میلیارد
+                'ebit': fin.line('ebit'),
+                'net_income': fin.line('net_income'),
+                'interest_expense': fin.line('interest_expense'),
+                'tax_expense': fin.line('tax_expense'),
+                'operating_income': fin.line('operating_income')
             },
             'cash_flow': {
-                'operating_cash_flow': Decimal('1200000000'),  # 1.2 میلیارد
-                'principal_payments': Decimal('400000000'),  # 400 میلیون
-                'lease_payments': Decimal('100000000')  # 100 میلیون
+                'operating_cash_flow': fin.line('operating_cash_flow'),
+                'principal_payments': fin.line('principal_payments'),
+                'lease_payments': fin.line('lease_payments')
             }
         }
     
-    def _calculate_debt_ratio(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه نسبت بدهی"""
+    def _calculate_debt_ratio(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """نسبت بدهی"""
         
         total_liabilities = data['balance_sheet']['total_liabilities']
         total_assets = data['balance_sheet']['total_assets']
         
-        if total_assets == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = total_liabilities / total_assets
-        
         assessment = self._assess_debt_ratio(ratio)
         
         return {
@@ -100,7 +109,7 @@ class LeverageRatioAnalyzer:
             }
         }
     
-    def _assess_debt_ratio(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_debt_ratio(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی نسبت بدهی"""
         
         ratio_float = float(ratio)
@@ -131,17 +140,12 @@ class LeverageRatioAnalyzer:
                 'interpretation': 'ساختار سرمایه بحرانی - شرکت ممکن است با مشکلات مالی جدی مواجه شود'
             }
     
-    def _calculate_debt_to_equity_ratio(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه نسبت بدهی به سرمایه"""
+    def _calculate_debt_to_equity_ratio(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """نسبت بدهی به سرمایه"""
         
         total_liabilities = data['balance_sheet']['total_liabilities']
         total_equity = data['balance_sheet']['total_equity']
         
-        if total_equity == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = total_liabilities / total_equity
-        
         assessment = self._assess_debt_to_equity_ratio(ratio)
         
         return {
@@ -156,7 +160,7 @@ class LeverageRatioAnalyzer:
             }
         }
     
-    def _assess_debt_to_equity_ratio(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_debt_to_equity_ratio(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی نسبت بدهی به سرمایه"""
         
         ratio_float = float(ratio)
@@ -187,17 +191,12 @@ class LeverageRatioAnalyzer:
                 'interpretation': 'اهرم مالی بحرانی - شرکت ممکن است با مشکلات بازپرداخت بدهی مواجه شود'
             }
     
-    def _calculate_equity_multiplier(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه ضریب سرمایه"""
+    def _calculate_equity_multiplier(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """ضریب سرمایه"""
         
         total_assets = data['balance_sheet']['total_assets']
         total_equity = data['balance_sheet']['total_equity']
         
-        if total_equity == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = total_assets / total_equity
-        
         assessment = self._assess_equity_multiplier(ratio)
         
         return {
@@ -212,7 +211,7 @@ class LeverageRatioAnalyzer:
             }
         }
     
-    def _assess_equity_multiplier(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_equity_multiplier(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی ضریب سرمایه"""
         
         ratio_float = float(ratio)
@@ -243,17 +242,12 @@ class LeverageRatioAnalyzer:
                 'interpretation': 'اهرم مالی بحرانی - شرکت ممکن است با مشکلات مالی جدی مواجه شود'
             }
     
-    def _calculate_times_interest_earned(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه نسبت پوشش بهره"""
+    def _calculate_times_interest_earned(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """نسبت پوشش بهره"""
         
         ebit = data['income_statement']['ebit']
         interest_expense = data['income_statement']['interest_expense']
         
-        if interest_expense == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = ebit / interest_expense
-        
         assessment = self._assess_times_interest_earned(ratio)
         
         return {
@@ -268,7 +262,7 @@ class LeverageRatioAnalyzer:
             }
         }
     
-    def _assess_times_interest_earned(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_times_interest_earned(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی نسبت پوشش بهره"""
         
         ratio_float = float(ratio)
@@ -299,19 +293,14 @@ class LeverageRatioAnalyzer:
                 'interpretation': 'عدم توانایی در پرداخت بهره - شرکت نمی‌تواند بهره را پرداخت کند'
             }
     
-    def _calculate_debt_service_coverage_ratio(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه نسبت پوشش خدمات بدهی"""
+    def _calculate_debt_service_coverage_ratio(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """نسبت پوشش خدمات بدهی"""
         
         operating_cash_flow = data['cash_flow']['operating_cash_flow']
         principal_payments = data['cash_flow']['principal_payments']
         interest_expense = data['income_statement']['interest_expense']
         
-        total_debt_service = principal_payments + interest_expense
-        
-        if total_debt_service == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = operating_cash_flow / total_debt_service
+        total_debt_service = self.financials.line('debt_service')
         
         assessment = self._assess_debt_service_coverage_ratio(ratio)
         
@@ -329,7 +318,7 @@ class LeverageRatioAnalyzer:
             }
         }
     
-    def _assess_debt_service_coverage_ratio(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_debt_service_coverage_ratio(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی نسبت پوشش خدمات بدهی"""
         
         ratio_float = float(ratio)
@@ -360,19 +349,14 @@ class LeverageRatioAnalyzer:
                 'interpretation': 'عدم توانایی در پرداخت خدمات بدهی - شرکت نمی‌تواند خدمات بدهی را پرداخت کند'
             }
     
-    def _calculate_fixed_charge_coverage_ratio(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه نسبت پوشش هزینه‌های ثابت"""
+    def _calculate_fixed_charge_coverage_ratio(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """نسبت پوشش هزینه‌های ثابت"""
         
         ebit = data['income_statement']['ebit']
         lease_payments = data['cash_flow']['lease_payments']
         interest_expense = data['income_statement']['interest_expense']
         
-        fixed_charges = interest_expense + lease_payments
-        
-        if fixed_charges == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = (ebit + lease_payments) / fixed_charges
+        fixed_charges = self.financials.line('fixed_charges')
         
         assessment = self._assess_fixed_charge_coverage_ratio(ratio)
         
@@ -390,7 +374,7 @@ class LeverageRatioAnalyzer:
             }
         }
     
-    def _assess_fixed_charge_coverage_ratio(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_fixed_charge_coverage_ratio(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی نسبت پوشش هزینه‌های ثابت"""
         
         ratio_float = float(ratio)
@@ -421,17 +405,12 @@ class LeverageRatioAnalyzer:
                 'interpretation': 'عدم توانایی در پرداخت هزینه‌های ثابت - شرکت نمی‌تواند هزینه‌های ثابت را پرداخت کند'
             }
     
-    def _calculate_long_term_debt_to_equity(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه نسبت بدهی بلندمدت به سرمایه"""
+    def _calculate_long_term_debt_to_equity(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """نسبت بدهی بلندمدت به سرمایه"""
         
         long_term_debt = data['balance_sheet']['long_term_debt']
         total_equity = data['balance_sheet']['total_equity']
         
-        if total_equity == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = long_term_debt / total_equity
-        
         assessment = self._assess_long_term_debt_to_equity(ratio)
         
         return {
@@ -446,7 +425,7 @@ class LeverageRatioAnalyzer:
             }
         }
     
-    def _assess_long_term_debt_to_equity(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_long_term_debt_to_equity(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی نسبت بدهی بلندمدت به سرمایه"""
         
         ratio_float = float(ratio)
@@ -717,7 +696,7 @@ class LeverageRatioTool:
             company = Company.objects.get(id=company_id)
             period = FinancialPeriod.objects.get(id=period_id)
             
-            analyzer = LeverageRatioAnalyzer(company, period)
+            analyzer = LeverageRatioAnalyzer(company, period, financials=period_financials(company, period))
             result = analyzer.calculate_all_leverage_ratios()
             
             return {
@@ -6,15 +6,24 @@
 
 from typing import Dict, List, Any
 from decimal import Decimal
-from users.models import Company, FinancialPeriod, FinancialFile, Document
+from financial_system.services.ratio_engine import PeriodFinancials, period_financials
+from users.models import Company, FinancialPeriod
 
 
 class LiquidityRatioAnalyzer:
     """تحلیل‌گر نسبت‌های نقدینگی"""
     
-    def __init__(self, company: Company, period: FinancialPeriod):
+    def __init__(self, company: Company, period: FinancialPeriod, financials: PeriodFinancials = None):
         self.company = company
         self.period = period
+        self._financials = financials
+    
+    @property
+    def financials(self) -> PeriodFinancials:
+        """اقلام صورت‌های مالی دوره از اسناد ثبت‌شده (نمونه مشترک نسخه جاری دفتر)"""
+        if self._financials is None:
+            self._financials = period_financials(self.company, self.period)
+        return self._financials
     
     def calculate_all_liquidity_ratios(self) -> Dict[str, Any]:
         """محاسبه تمام نسبت‌های نقدینگی"""
@@ -22,14 +31,19 @@ class LiquidityRatioAnalyzer:
         # جمع‌آوری داده‌های مورد نیاز
         financial_data = self._collect_financial_data()
         
-        # محاسبه نسبت‌ها
+        # مقادیر نسبت‌ها از موتور برداری؛ متدهای زیر فقط تفسیر و جزئیات را می‌سازند
+        values = self.financials.ratios('liquidity')
         ratios = {
-            'current_ratio': self._calculate_current_ratio(financial_data),
-            'quick_ratio': self._calculate_quick_ratio(financial_data),
-            'cash_ratio': self._calculate_cash_ratio(financial_data),
-            'net_working_capital': self._calculate_net_working_capital(financial_data),
-            'operating_cash_flow_ratio': self._calculate_operating_cash_flow_ratio(financial_data),
-            'defensive_interval_ratio': self._calculate_defensive_interval_ratio(financial_data)
+            'current_ratio': self._calculate_current_ratio(financial_data, values['current_ratio']),
+            'quick_ratio': self._calculate_quick_ratio(financial_data, values['quick_ratio']),
+            'cash_ratio': self._calculate_cash_ratio(financial_data, values['cash_ratio']),
+            'net_working_capital': self._calculate_net_working_capital(financial_data, values['net_working_capital']),
+            'operating_cash_flow_ratio': self._calculate_operating_cash_flow_ratio(
+                financial_data, values['operating_cash_flow_ratio']
+            ),
+            'defensive_interval_ratio': self._calculate_defensive_interval_ratio(
+                financial_data, values['defensive_interval_ratio']
+            )
         }
         
         # تحلیل و ارزیابی
@@ -45,46 +59,42 @@ class LiquidityRatioAnalyzer:
         }
     
     def _collect_financial_data(self) -> Dict[str, Any]:
-        """جمع‌آوری داده‌های مالی مورد نیاز"""
+        """جمع‌آوری داده‌های مالی مورد نیاز از مانده‌های ثبت‌شده دوره"""
         
-        # این بخش باید با مدل‌های واقعی یکپارچه شود
-        # فعلاً از داده‌های نمونه استفاده می‌کنیم
+        fin = self.financials
         
         return {
             'current_assets': {
-                'cash': Decimal('500000000'),  # 500 میلیون
-                'cash_equivalents': Decimal('200000000'),  # 200 میلیون
-                'accounts_receivable': Decimal('800000000'),  # 800 میلیون
-                'inventory': Decimal('600000000'),  # 600 میلیون
-                'prepaid_expenses': Decimal('100000000'),  # 100 میلیون
-                'marketable_securities': Decimal('300000000'),  # 300 میلیون
-                'total': Decimal('2500000000')  # 2.5 میلیارد
+                'cash': fin.line('cash'),
+                'cash_equivalents': fin.line('cash_equivalents'),
+                'accounts_receivable': fin.line('accounts_receivable'),
+                'inventory': fin.line('inventory'),
+                'prepaid_expenses': fin.line('prepaid_expenses'),
+                'marketable_securities': fin.line('marketable_securities'),
+                'total': fin.line('current_assets')
             },
             'current_liabilities': {
-                'accounts_payable': Decimal('700000000'),  # 700 میلیون
-                'short_term_debt': Decimal('400000000'),  # 400 میلیون
-                'accrued_expenses': Decimal('200000000'),  # 200 میلیون
-                'unearned_revenue': Decimal('100000000'),  # 100 میلیون
-                'total': Decimal('1400000000')  # 1.4 میلیارد
+                'accounts_payable': fin.line('accounts_payable'),
+                'short_term_debt': fin.line('short_term_debt'),
+                'accrued_expenses': fin.line('accrued_expenses'),
+                'unearned_revenue': fin.line('unearned_revenue'),
+                'total': fin.line('current_liabilities')
             },
+            'quick_assets': fin.line('quick_assets'),
+            'cash_assets': fin.line('cash_assets'),
             'operating_data': {
-                'operating_cash_flow': Decimal('900000000'),  # 900 میلیون
-                'daily_operating_expenses': Decimal('5000000'),  # 5 میلیون
-                'annual_operating_expenses': Decimal('1825000000')  # 1.825 میلیارد
+                'operating_cash_flow': fin.line('operating_cash_flow'),
+                'daily_operating_expenses': fin.daily('operating_cash_expenses'),
+                'annual_operating_expenses': fin.daily('operating_cash_expenses') * 365
             }
         }
     
-    def _calculate_current_ratio(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه نسبت جاری"""
+    def _calculate_current_ratio(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """نسبت جاری"""
         
         current_assets = data['current_assets']['total']
         current_liabilities = data['current_liabilities']['total']
         
-        if current_liabilities == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = current_assets / current_liabilities
-        
         assessment = self._assess_current_ratio(ratio)
         
         return {
@@ -99,7 +109,7 @@ class LiquidityRatioAnalyzer:
             }
         }
     
-    def _assess_current_ratio(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_current_ratio(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی نسبت جاری"""
         
         ratio_float = float(ratio)
@@ -130,24 +140,12 @@ class LiquidityRatioAnalyzer:
                 'interpretation': 'نقدینگی بسیار پایین - شرکت در معرض ریسک ورشکستگی قرار دارد'
             }
     
-    def _calculate_quick_ratio(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه نسبت سریع (اسید تست)"""
-        
-        # دارایی‌های سریع = نقد + معادل نقد + حساب‌های دریافتنی + اوراق بهادار قابل فروش
-        quick_assets = (
-            data['current_assets']['cash'] +
-            data['current_assets']['cash_equivalents'] +
-            data['current_assets']['accounts_receivable'] +
-            data['current_assets']['marketable_securities']
-        )
+    def _calculate_quick_ratio(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """نسبت سریع (اسید تست)"""
         
+        quick_assets = data['quick_assets']
         current_liabilities = data['current_liabilities']['total']
         
-        if current_liabilities == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = quick_assets / current_liabilities
-        
         assessment = self._assess_quick_ratio(ratio)
         
         return {
@@ -168,7 +166,7 @@ class LiquidityRatioAnalyzer:
             }
         }
     
-    def _assess_quick_ratio(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_quick_ratio(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی نسبت سریع"""
         
         ratio_float = float(ratio)
@@ -199,22 +197,12 @@ class LiquidityRatioAnalyzer:
                 'interpretation': 'ریسک بالای ناتوانی در پرداخت بدهی‌های فوری'
             }
     
-    def _calculate_cash_ratio(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه نسبت نقدی"""
-        
-        cash_assets = (
-            data['current_assets']['cash'] +
-            data['current_assets']['cash_equivalents'] +
-            data['current_assets']['marketable_securities']
-        )
+    def _calculate_cash_ratio(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """نسبت نقدی"""
         
+        cash_assets = data['cash_assets']
         current_liabilities = data['current_liabilities']['total']
         
-        if current_liabilities == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = cash_assets / current_liabilities
-        
         assessment = self._assess_cash_ratio(ratio)
         
         return {
@@ -234,7 +222,7 @@ class LiquidityRatioAnalyzer:
             }
         }
     
-    def _assess_cash_ratio(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_cash_ratio(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی نسبت نقدی"""
         
         ratio_float = float(ratio)
@@ -265,14 +253,12 @@ class LiquidityRatioAnalyzer:
                 'interpretation': 'ذخایر نقدی ناکافی - شرکت در معرض ریسک نقدینگی شدید قرار دارد'
             }
     
-    def _calculate_net_working_capital(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه سرمایه در گردش خالص"""
+    def _calculate_net_working_capital(self, data: Dict, net_working_capital: float) -> Dict[str, Any]:
+        """سرمایه در گردش خالص"""
         
         current_assets = data['current_assets']['total']
         current_liabilities = data['current_liabilities']['total']
         
-        net_working_capital = current_assets - current_liabilities
-        
         assessment = self._assess_net_working_capital(net_working_capital, current_assets)
         
         return {
@@ -286,7 +272,7 @@ class LiquidityRatioAnalyzer:
             }
         }
     
-    def _assess_net_working_capital(self, nwc: Decimal, current_assets: Decimal) -> Dict[str, Any]:
+    def _assess_net_working_capital(self, nwc: float, current_assets: Decimal) -> Dict[str, Any]:
         """ارزیابی سرمایه در گردش خالص"""
         
         nwc_float = float(nwc)
@@ -318,17 +304,12 @@ class LiquidityRatioAnalyzer:
                 'interpretation': 'سرمایه در گردش قوی - شرکت حاشیه ایمنی بسیار خوبی دارد'
             }
     
-    def _calculate_operating_cash_flow_ratio(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه نسبت جریان نقدی عملیاتی"""
+    def _calculate_operating_cash_flow_ratio(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """نسبت جریان نقدی عملیاتی"""
         
         operating_cash_flow = data['operating_data']['operating_cash_flow']
         current_liabilities = data['current_liabilities']['total']
         
-        if current_liabilities == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = operating_cash_flow / current_liabilities
-        
         assessment = self._assess_operating_cash_flow_ratio(ratio)
         
         return {
@@ -343,7 +324,7 @@ class LiquidityRatioAnalyzer:
             }
         }
     
-    def _assess_operating_cash_flow_ratio(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_operating_cash_flow_ratio(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی نسبت جریان نقدی عملیاتی"""
         
         ratio_float = float(ratio)
@@ -374,23 +355,12 @@ class LiquidityRatioAnalyzer:
                 'interpretation': 'جریان نقدی عملیاتی ناکافی - شرکت نمی‌تواند بدهی‌های جاری را از عملیات پرداخت کند'
             }
     
-    def _calculate_defensive_interval_ratio(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه نسبت فاصله دفاعی"""
-        
-        defensive_assets = (
-            data['current_assets']['cash'] +
-            data['current_assets']['cash_equivalents'] +
-            data['current_assets']['marketable_securities'] +
-            data['current_assets']['accounts_receivable']
-        )
+    def _calculate_defensive_interval_ratio(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """نسبت فاصله دفاعی (روز)"""
         
+        defensive_assets = data['quick_assets']
         daily_operating_expenses = data['operating_data']['daily_operating_expenses']
         
-        if daily_operating_expenses == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = defensive_assets / daily_operating_expenses
-        
         assessment = self._assess_defensive_interval_ratio(ratio)
         
         return {
@@ -411,7 +381,7 @@ class LiquidityRatioAnalyzer:
             }
         }
     
-    def _assess_defensive_interval_ratio(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_defensive_interval_ratio(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی نسبت فاصله دفاعی"""
         
         days = float(ratio)
@@ -673,7 +643,7 @@ class LiquidityRatioTool:
             company = Company.objects.get(id=company_id)
             period = FinancialPeriod.objects.get(id=period_id)
             
-            analyzer = LiquidityRatioAnalyzer(company, period)
+            analyzer = LiquidityRatioAnalyzer(company, period, financials=period_financials(company, period))
             result = analyzer.calculate_all_liquidity_ratios()
             
             return {
@@ -0,0 +1,138 @@
+# financial_system/services/live_updates.py
+"""
+انتشار تغییرات زنده داشبورد (pub/sub درون‌پردازه‌ای)
+هر مشترک (جریان SSE یک داشبورد) روی کانال (شرکت، دوره) ثبت می‌شود و تغییرات فشرده (نسخه جدید دفتر،
+پایان ورود اطلاعات، هشدارها) فقط برای مشترکان همان کانال ارسال می‌شود؛ داشبورد بیکار هیچ هزینه‌ای ندارد.
+واسط پیش‌فرض محلی و درون‌پردازه‌ای است و با تنظیم LIVE_UPDATES_BROKER قابل جایگزینی است.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import threading
+from typing import Any, Dict, Optional, Set, Tuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# حداکثر پیام‌های در انتظار هر مشترک؛ در صورت پر شدن، مشترک پیام resync دریافت می‌کند
+LIVE_QUEUE_SIZE = 100
+
+
+class Subscription:
+    """صف پیام‌های یک مشترک روی حلقه رویداد خودش"""
+
+    def __init__(self, key: Tuple[int, int], loop: asyncio.AbstractEventLoop, size: int = LIVE_QUEUE_SIZE):
+        self.key = key
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+    def deliver(self, message: Dict[str, Any]) -> None:
+        """تحویل امن از هر نخ"""
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message: Dict[str, Any]) -> None:
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """پیام بعدی یا None پس از پایان مهلت"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalBroker:
+    """واسط انتشار محلی: مشترکان هر کانال (شرکت، دوره) در همین پردازه"""
+
+    def __init__(self, queue_size: int = LIVE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers: Dict[Tuple[int, int], Set[Subscription]] = {}
+        self._sequence = itertools.count(1)
+
+    def subscribe(self, company_id: int, period_id: int) -> Subscription:
+        """ثبت مشترک جدید؛ باید درون حلقه رویداد در حال اجرا فراخوانی شود"""
+        key = (int(company_id), int(period_id))
+        subscription = Subscription(key, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.key]
+
+    def has_subscribers(self, company_id: int, period_id: int) -> bool:
+        return bool(self._subscribers.get((int(company_id), int(period_id))))
+
+    def publish(self, company_id: int, period_id: int, event: str, data: Dict[str, Any]) -> int:
+        """ارسال یک تغییر به مشترکان کانال؛ تعداد مشترکان دریافت‌کننده را برمی‌گرداند"""
+        key = (int(company_id), int(period_id))
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+        if not subscribers:
+            return 0
+
+        message = {'id': next(self._sequence), 'event': event, 'data': data}
+        delivered = 0
+        for subscription in subscribers:
+            try:
+                subscription.deliver(message)
+                delivered += 1
+            except RuntimeError:
+                # حلقه رویداد مشترک بسته شده است
+                self.unsubscribe(subscription)
+        return delivered
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """واسط انتشار پردازه (LIVE_UPDATES_BROKER در settings یا واسط محلی)"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_path = getattr(settings, 'LIVE_UPDATES_BROKER', None)
+                _broker = import_string(broker_path)() if broker_path else LocalBroker()
+    return _broker
+
+
+def publish(company_id: Optional[int], period_id: Optional[int], event: str, data: Dict[str, Any]) -> int:
+    """انتشار یک تغییر؛ خطای واسط هرگز عملیات اصلی را متوقف نمی‌کند"""
+    if not company_id or not period_id:
+        return 0
+    try:
+        return get_broker().publish(company_id, period_id, event, data)
+    except Exception as e:
+        logger.warning(f"خطا در انتشار تغییر زنده {event}: {e}")
+        return 0
+
+
+def has_subscribers(company_id: int, period_id: int) -> bool:
+    try:
+        return get_broker().has_subscribers(company_id, period_id)
+    except Exception:
+        return False
+
+
+def format_event(event: str, data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    """قالب پیام server-sent events"""
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False, default=str)}')
+    return '\n'.join(lines) + '\n\n'
@@ -5,10 +5,12 @@
 """
 
 from typing import Dict, List, Any, Optional
-from datetime import datetime, timedelta
+from datetime import datetime
 from decimal import Decimal
 import json
 import logging
+from financial_system.models.history_models import HistoryEntry
+from financial_system.services import history_store
 # Remove problematic import - we'll use mock data for now
 # from users.models import User, Company, FinancialPeriod
 
@@ -18,7 +20,6 @@ class ModelImprovementSystem:
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.improvement_history = []
     
     def process_user_feedback(self, feedback_data: List[Dict]) -> Dict[str, Any]:
         """پردازش فیدبک کاربران و بهبود مدل"""
@@ -623,20 +624,19 @@ class ModelImprovementSystem:
     def _save_improvement_history(self, improvement_actions: List[Dict], 
                                 improvement_results: Dict) -> None:
         """ذخیره تاریخچه بهبود"""
-        
-        history_entry = {
-            'timestamp': datetime.now(),
-            'actions_applied': improvement_actions,
-            'results': improvement_results,
-            'performance_metrics': improvement_results.get('performance_metrics', {}),
-            'improvement_impact': improvement_results.get('improvement_impact', {})
-        }
-        
-        self.improvement_history.append(history_entry)
-        
-        # محدود کردن تاریخچه به ۱۰۰ ورودی
-        if len(self.improvement_history) > 100:
-            self.improvement_history = self.improvement_history[-100:]
+        try:
+            history_store.record_entry(
+                HistoryEntry.KIND_IMPROVEMENT,
+                total_count=len(improvement_actions),
+                summary={
+                    'actions_applied': improvement_actions,
+                    'results': improvement_results,
+                    'performance_metrics': improvement_results.get('performance_metrics', {}),
+                    'improvement_impact': improvement_results.get('improvement_impact', {})
+                }
+            )
+        except Exception as e:
+            self.logger.error(f"خطا در ذخیره تاریخچه بهبود: {str(e)}")
     
     def _generate_next_steps(self, improvement_results: Dict) -> List[Dict[str, Any]]:
         """تولید گام‌های بعدی"""
@@ -675,15 +675,10 @@ class ModelImprovementSystem:
     
     def get_improvement_history(self, days_back: int = 30) -> List[Dict[str, Any]]:
         """دریافت تاریخچه بهبود"""
-        
-        cutoff_date = datetime.now() - timedelta(days=days_back)
-        
-        recent_history = [
-            entry for entry in self.improvement_history
-            if entry['timestamp'] >= cutoff_date
+        return [
+            {'timestamp': entry.created_at, **entry.summary}
+            for entry in history_store.history(HistoryEntry.KIND_IMPROVEMENT, days_back=days_back)
         ]
-        
-        return recent_history
     
     def generate_improvement_report(self) -> Dict[str, Any]:
         """تولید گزارش بهبود"""
@@ -0,0 +1,158 @@
+# financial_system/services/monthly_ledger.py
+"""
+ماتریس ماهانه گردش حساب‌ها (حساب × ماه)
+گردش بدهکار، بستانکار و تعداد آرتیکل هر حساب در هر ماه با یک کوئری GROUP BY حساب و ماه
+(یا از تصویر ستونی مشترک دوره) ساخته می‌شود و جمع گروه‌های پیشوندی، روند، رشد، فصلی بودن
+و ترکیب به صورت برداری روی همین ماتریس فشرده محاسبه می‌شوند.
+"""
+
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from django.db.models import Count, ExpressionWrapper, F, IntegerField, Sum
+
+from financial_system.models.document_models import DocumentItem
+from financial_system.services.account_hierarchy import from_minor_units, minor_units_expression, prefix_mask
+from financial_system.services.jalali_calendar import month_label
+from financial_system.services.ledger_snapshot import LedgerSnapshot
+from users.models import Company, FinancialPeriod
+
+
+class MonthlyLedgerMatrix:
+    """گردش (حساب × ماه) یک دوره؛ مبالغ int64 بر حسب واحد جزء (ریال × ۱۰۰)"""
+
+    def __init__(self, account_codes, account_names, account_active, months, debit, credit, counts):
+        self.account_codes = np.asarray(account_codes, dtype=str)
+        self.account_names = list(account_names)
+        self.account_active = np.asarray(account_active, dtype=bool)
+        self.months = np.asarray(months, dtype=np.int64)
+        self.debit = np.asarray(debit, dtype=np.int64).reshape(self.account_codes.size, self.months.size)
+        self.credit = np.asarray(credit, dtype=np.int64).reshape(self.debit.shape)
+        self.counts = np.asarray(counts, dtype=np.int64).reshape(self.debit.shape)
+
+    @classmethod
+    def load(cls, company: Company, period: FinancialPeriod) -> 'MonthlyLedgerMatrix':
+        """ساخت ماتریس با یک کوئری گروه‌بندی‌شده بر اساس حساب و ماه"""
+        rows = list(
+            DocumentItem.objects.filter(
+                document__company=company,
+                document__period=period
+            ).annotate(
+                month_key=ExpressionWrapper(F('document__date_key') / 100, output_field=IntegerField())
+            ).values('account_id', 'account__code', 'account__name', 'account__is_active', 'month_key').annotate(
+                debit_total=Sum(minor_units_expression('debit')),
+                credit_total=Sum(minor_units_expression('credit')),
+                item_count=Count('id')
+            ).order_by()
+        )
+
+        account_ids, account_index = np.unique(
+            np.array([row['account_id'] for row in rows], dtype=np.int64), return_inverse=True
+        )
+        months, month_index = np.unique(np.array([row['month_key'] for row in rows], dtype=np.int64), return_inverse=True)
+        accounts = {row['account_id']: (row['account__code'], row['account__name'], row['account__is_active']) for row in rows}
+        shape = (account_ids.size, months.size)
+        debit = np.zeros(shape, dtype=np.int64)
+        credit = np.zeros(shape, dtype=np.int64)
+        counts = np.zeros(shape, dtype=np.int64)
+        cells = (account_index, month_index)
+        np.add.at(debit, cells, np.array([row['debit_total'] or 0 for row in rows], dtype=np.int64))
+        np.add.at(credit, cells, np.array([row['credit_total'] or 0 for row in rows], dtype=np.int64))
+        np.add.at(counts, cells, np.array([row['item_count'] for row in rows], dtype=np.int64))
+
+        details = [accounts[account_id] for account_id in account_ids.tolist()]
+        return cls(
+            [code for code, _, _ in details], [name for _, name, _ in details], [active for _, _, active in details],
+            months, debit, credit, counts
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot: LedgerSnapshot) -> 'MonthlyLedgerMatrix':
+        """ساخت ماتریس از تصویر ستونی مشترک، بدون کوئری اضافه"""
+        months, month_index = np.unique(snapshot.date_keys // 100, return_inverse=True)
+        shape = (snapshot.accounts_index.size, months.size)
+        debit = np.zeros(shape, dtype=np.int64)
+        credit = np.zeros(shape, dtype=np.int64)
+        counts = np.zeros(shape, dtype=np.int64)
+        cells = (snapshot.account_position, month_index.reshape(snapshot.date_keys.shape))
+        np.add.at(debit, cells, snapshot.debits)
+        np.add.at(credit, cells, snapshot.credits)
+        np.add.at(counts, cells, 1)
+        return cls(
+            snapshot.account_codes, snapshot.account_names, snapshot.account_active,
+            months, debit, credit, counts
+        )
+
+    def account_mask(self, prefixes: Iterable[str], active_only: bool = True) -> np.ndarray:
+        """ماسک حساب‌هایی که کدشان با یکی از پیشوندها شروع می‌شود"""
+        mask = prefix_mask(self.account_codes, prefixes)
+        if active_only:
+            mask &= self.account_active
+        return mask
+
+    def net_matrix(self, debit_nature: bool = True) -> np.ndarray:
+        """مانده خالص (حساب × ماه) با ماهیت حساب"""
+        return self.debit - self.credit if debit_nature else self.credit - self.debit
+
+    def account_totals(self, prefixes: Iterable[str], debit_nature: bool = True) -> List[Dict]:
+        """مانده خالص و تعداد آرتیکل هر حساب منطبق با پیشوندها به ترتیب کد حساب"""
+        selected = np.flatnonzero(self.account_mask(prefixes))
+        selected = selected[np.argsort(self.account_codes[selected], kind='stable')]
+        amounts = self.net_matrix(debit_nature)[selected].sum(axis=1)
+        counts = self.counts[selected].sum(axis=1)
+        return [
+            {
+                'code': str(self.account_codes[position]),
+                'name': self.account_names[position],
+                'amount': from_minor_units(amounts[index]),
+                'transaction_count': int(counts[index]),
+            }
+            for index, position in enumerate(selected)
+        ]
+
+    def group_matrix(self, groups: Dict[str, Iterable[str]], debit_nature: bool = True) -> np.ndarray:
+        """مانده خالص (گروه × ماه) برای گروه‌های پیشوندی با یک ضرب ماتریسی"""
+        membership = np.array([self.account_mask(prefixes) for prefixes in groups.values()], dtype=np.int64)
+        return membership.reshape(len(groups), self.account_codes.size) @ self.net_matrix(debit_nature)
+
+    def monthly(self, prefixes: Iterable[str], debit_nature: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """سری ماهانه مانده خالص و تعداد آرتیکل ماه‌های دارای گردش حساب‌های منطبق"""
+        mask = self.account_mask(prefixes)
+        counts = self.counts[mask].sum(axis=0)
+        present = counts > 0
+        return self.net_matrix(debit_nature)[mask].sum(axis=0)[present], counts[present]
+
+    def monthly_labels(self, prefixes: Iterable[str]) -> List[str]:
+        """برچسب YYYY-MM ماه‌های دارای گردش حساب‌های منطبق"""
+        present = self.counts[self.account_mask(prefixes)].sum(axis=0) > 0
+        return [month_label(month) for month in self.months[present].tolist()]
+
+    def net(self, prefixes: Iterable[str], debit_nature: bool = True) -> Decimal:
+        """مانده خالص کل حساب‌های منطبق با پیشوندها"""
+        return from_minor_units(self.net_matrix(debit_nature)[self.account_mask(prefixes)].sum())
+
+
+def growth_rate(series: np.ndarray) -> Decimal:
+    """درصد رشد آخرین ماه نسبت به نخستین ماه سری (صفر برای سری کوتاه یا پایه غیرمثبت)"""
+    if series.size < 2 or series[0] <= 0:
+        return Decimal('0')
+    return Decimal(int(series[-1] - series[0])) / Decimal(int(series[0])) * 100
+
+
+def seasonality(labels: List[str], series: np.ndarray) -> Dict:
+    """میانگین، ماه پیک و افت و شاخص فصلی سری ماهانه"""
+    if series.size < 3:
+        return {'message': 'داده کافی برای تحلیل فصلی وجود ندارد'}
+
+    average_monthly = from_minor_units(series.sum()) / series.size
+    peak, low = int(np.argmax(series)), int(np.argmin(series))
+    peak_value, low_value = from_minor_units(series[peak]), from_minor_units(series[low])
+    return {
+        'average_monthly': average_monthly,
+        'peak_month': labels[peak],
+        'peak_value': peak_value,
+        'low_month': labels[low],
+        'low_value': low_value,
+        'seasonality_index': (peak_value - low_value) / average_monthly if average_monthly > 0 else Decimal('0')
+    }
@@ -0,0 +1,173 @@
+# financial_system/services/posting_calendar.py
+"""
+هیستوگرام روزانه ثبت اسناد برای تحلیل شتاب پایان دوره (End-of-Period Rush)
+تعداد و مبلغ اسناد هر روز دوره با یک کوئری گروه‌بندی‌شده روی کلید تاریخ عددی خوانده می‌شود و تمرکز
+پایان دوره، پایان هر ماه، جمعه‌ها و تعطیلات رسمی (از تقویم شمسی) به صورت برداری از همین هیستوگرام به
+دست می‌آید. شاخص تمرکز نسبت سهم واقعی به سهم مورد انتظار با توزیع یکنواخت روزهاست؛ نتیجه برای هر
+نسخه دفتر در کش گزارش‌ها نگهداری می‌شود.
+"""
+
+from datetime import timedelta
+from typing import Dict, List
+
+import numpy as np
+from django.db.models import Count, Sum
+
+from financial_system.models.document_models import DocumentHeader
+from financial_system.services.account_hierarchy import from_minor_units, minor_units_expression
+from financial_system.services.jalali_calendar import (
+    FRIDAY, day_numbers, days_to_month_end, gregorian_to_date_key, holidays, month_label, weekdays
+)
+from financial_system.services.report_cache import cached_report
+from financial_system.services.risk_scoring import END_OF_PERIOD_DAYS
+from users.models import Company, FinancialPeriod
+
+# طول بازه پایان ماه (روز)
+MONTH_END_DAYS = 3
+
+# شاخص تمرکزی که از آن به بعد ماه در فهرست شتاب پایان ماه علامت می‌خورد
+RUSH_RATIO = 2.0
+
+
+class PostingHistogram:
+    """تعداد و مبلغ (واحد جزء) اسناد هر روز دوره به همراه ویژگی‌های تقویمی هر روز"""
+
+    def __init__(self, company: Company, period: FinancialPeriod, date_keys, documents, amounts):
+        self.company = company
+        self.period = period
+        self.date_keys = np.asarray(date_keys, dtype=np.int64)
+        self.documents = np.asarray(documents, dtype=np.int64)
+        self.amounts = np.asarray(amounts, dtype=np.int64)
+
+        self.period_end = gregorian_to_date_key(period.end_date)
+        self.period_days = max((period.end_date - period.start_date).days + 1, 1)
+        self.days_to_period_end = period.end_date.toordinal() - day_numbers(self.date_keys)
+        self.days_to_month_end = days_to_month_end(self.date_keys)
+        self.weekdays = weekdays(self.date_keys)
+        self.holidays = holidays(self.date_keys)
+        self.valid = self.weekdays >= 0
+        self._cache = {}
+
+    @classmethod
+    def load(cls, company: Company, period: FinancialPeriod) -> 'PostingHistogram':
+        """هیستوگرام روزانه با یک کوئری GROUP BY روی کلید تاریخ"""
+        rows = list(
+            DocumentHeader.objects.filter(company=company, period=period).values('date_key').annotate(
+                documents=Count('id'),
+                debit=Sum(minor_units_expression('total_debit')),
+                credit=Sum(minor_units_expression('total_credit')),
+            ).order_by('date_key').values_list('date_key', 'documents', 'debit', 'credit')
+        )
+        return cls(
+            company, period,
+            [row[0] or 0 for row in rows],
+            [row[1] for row in rows],
+            [(row[2] or 0) + (row[3] or 0) for row in rows],
+        )
+
+    def concentration(self, mask: np.ndarray, calendar_days: int) -> Dict:
+        """سهم تعداد و مبلغ روزهای ماسک و نسبت آن به سهم روزها از کل دوره"""
+        total_documents = int(self.documents.sum())
+        total_amount = int(self.amounts.sum())
+        documents = int(self.documents[mask].sum())
+        amount = int(self.amounts[mask].sum())
+        expected = calendar_days / self.period_days
+        document_share = documents / total_documents if total_documents else 0.0
+        amount_share = amount / total_amount if total_amount else 0.0
+        return {
+            'documents_count': documents,
+            'total_amount': float(from_minor_units(amount)),
+            'documents_share': round(document_share * 100, 2),
+            'amount_share': round(amount_share * 100, 2),
+            'expected_share': round(expected * 100, 2),
+            'concentration_ratio': round(amount_share / expected, 2) if expected else 0.0,
+        }
+
+    def _calendar_days(self, predicate) -> int:
+        """تعداد روزهای تقویمی دوره که در شرط صدق می‌کنند (مخرج سهم مورد انتظار)"""
+        if 'calendar' not in self._cache:
+            start = self.period.start_date
+            self._cache['calendar'] = np.array(
+                [gregorian_to_date_key(start + timedelta(days=offset)) for offset in range(self.period_days)],
+                dtype=np.int64,
+            )
+        return int(np.count_nonzero(predicate(self._cache['calendar'])))
+
+    def end_of_period(self, days: int = END_OF_PERIOD_DAYS) -> Dict:
+        """تمرکز بازه [پایان دوره - days، پایان دوره] (همان بازه امتیازدهی ریسک)"""
+        mask = self.valid & (self.days_to_period_end >= 0) & (self.days_to_period_end <= days)
+        return {'days': days, **self.concentration(mask, min(days + 1, self.period_days))}
+
+    def month_end(self, days: int = MONTH_END_DAYS) -> Dict:
+        """تمرکز روزهای پایانی هر ماه در کل دوره و به تفکیک ماه (با یک bincount)"""
+        mask = self.valid & (self.days_to_month_end >= 0) & (self.days_to_month_end < days)
+        overall = self.concentration(mask, self._calendar_days(lambda keys: days_to_month_end(keys) < days))
+
+        months, inverse = np.unique(self.date_keys[self.valid] // 100, return_inverse=True)
+        month_documents = np.bincount(inverse, weights=self.documents[self.valid], minlength=months.size)
+        end_documents = np.bincount(inverse, weights=self.documents[self.valid] * mask[self.valid], minlength=months.size)
+        # جمع مبالغ به صورت int64 دقیق
+        month_amounts = np.zeros(months.size, dtype=np.int64)
+        np.add.at(month_amounts, inverse, self.amounts[self.valid])
+        end_amounts = np.zeros(months.size, dtype=np.int64)
+        np.add.at(end_amounts, inverse, self.amounts[self.valid] * mask[self.valid])
+        # سهم مورد انتظار هر ماه: روزهای پایانی به طول ماه (۲۹ تا ۳۱ روز)
+        lengths = np.bincount(
+            inverse, weights=self.days_to_month_end[self.valid] + self.date_keys[self.valid] % 100, minlength=months.size
+        ) / np.maximum(np.bincount(inverse, minlength=months.size), 1)
+
+        monthly = []
+        for index, month in enumerate(months.tolist()):
+            share = float(end_amounts[index] / month_amounts[index]) if month_amounts[index] else 0.0
+            ratio = float(share * lengths[index] / days)
+            monthly.append({
+                'month': month_label(month),
+                'documents_count': int(month_documents[index]),
+                'total_amount': float(from_minor_units(month_amounts[index])),
+                'month_end_documents': int(end_documents[index]),
+                'month_end_amount': float(from_minor_units(end_amounts[index])),
+                'month_end_share': round(share * 100, 2),
+                'concentration_ratio': round(ratio, 2),
+                'is_rush': ratio >= RUSH_RATIO,
+            })
+        return {'days': days, **overall, 'months': monthly}
+
+    def weekends(self) -> Dict:
+        mask = self.valid & (self.weekdays == FRIDAY)
+        return self.concentration(mask, self._calendar_days(lambda keys: weekdays(keys) == FRIDAY))
+
+    def official_holidays(self) -> Dict:
+        """تعطیلات رسمی غیرجمعه (جمعه‌ها جداگانه شمرده می‌شوند)"""
+        mask = self.valid & self.holidays & (self.weekdays != FRIDAY)
+        result = self.concentration(mask, self._calendar_days(lambda keys: holidays(keys) & (weekdays(keys) != FRIDAY)))
+        result['dates'] = [self._day(index) for index in np.flatnonzero(mask).tolist()]
+        return result
+
+    def peak_days(self, limit: int = 10) -> List[Dict]:
+        order = np.argsort(-self.amounts, kind='stable')[:limit]
+        return [self._day(index) for index in order.tolist() if self.documents[index]]
+
+    def _day(self, index: int) -> Dict:
+        key = int(self.date_keys[index])
+        return {
+            'date': f"{key // 10000:04d}/{key // 100 % 100:02d}/{key % 100:02d}",
+            'documents_count': int(self.documents[index]),
+            'total_amount': float(from_minor_units(self.amounts[index])),
+        }
+
+
+def rush_analysis(company: Company, period: FinancialPeriod) -> Dict:
+    """تحلیل کامل شتاب ثبت (پایان دوره، پایان ماه‌ها، جمعه‌ها، تعطیلات) در کش نسخه جاری دفتر"""
+    def compute():
+        histogram = PostingHistogram.load(company, period)
+        return {
+            'total_documents': int(histogram.documents.sum()),
+            'total_amount': float(from_minor_units(histogram.amounts.sum())),
+            'end_of_period': histogram.end_of_period(),
+            'month_end': histogram.month_end(),
+            'weekends': histogram.weekends(),
+            'holidays': histogram.official_holidays(),
+            'peak_days': histogram.peak_days(),
+        }
+
+    return cached_report('posting_rush', company.id, period.id, compute)
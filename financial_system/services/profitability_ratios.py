@@ -6,15 +6,24 @@
 
 from typing import Dict, List, Any
 from decimal import Decimal
-from users.models import Company, FinancialPeriod, FinancialFile, Document
+from financial_system.services.ratio_engine import PeriodFinancials, period_financials
+from users.models import Company, FinancialPeriod
 
 
 class ProfitabilityRatioAnalyzer:
     """تحلیل‌گر نسبت‌های سودآوری"""
     
-    def __init__(self, company: Company, period: FinancialPeriod):
+    def __init__(self, company: Company, period: FinancialPeriod, financials: PeriodFinancials = None):
         self.company = company
         self.period = period
+        self._financials = financials
+    
+    @property
+    def financials(self) -> PeriodFinancials:
+        """اقلام صورت‌های مالی دوره از اسناد ثبت‌شده (نمونه مشترک نسخه جاری دفتر)"""
+        if self._financials is None:
+            self._financials = period_financials(self.company, self.period)
+        return self._financials
     
     def calculate_all_profitability_ratios(self) -> Dict[str, Any]:
         """محاسبه تمام نسبت‌های سودآوری"""
@@ -22,16 +31,17 @@ class ProfitabilityRatioAnalyzer:
         # جمع‌آوری داده‌های مورد نیاز
         financial_data = self._collect_financial_data()
         
-        # محاسبه نسبت‌ها
+        # مقادیر نسبت‌ها از موتور برداری؛ متدهای زیر فقط تفسیر و جزئیات را می‌سازند
+        values = self.financials.ratios('profitability')
         ratios = {
-            'gross_profit_margin': self._calculate_gross_profit_margin(financial_data),
-            'operating_profit_margin': self._calculate_operating_profit_margin(financial_data),
-            'net_profit_margin': self._calculate_net_profit_margin(financial_data),
-            'return_on_assets': self._calculate_return_on_assets(financial_data),
-            'return_on_equity': self._calculate_return_on_equity(financial_data),
-            'return_on_invested_capital': self._calculate_return_on_invested_capital(financial_data),
-            'ebitda_margin': self._calculate_ebitda_margin(financial_data),
-            'operating_ratio': self._calculate_operating_ratio(financial_data)
+            'gross_profit_margin': self._calculate_gross_profit_margin(financial_data, values['gross_profit_margin']),
+            'operating_profit_margin': self._calculate_operating_profit_margin(financial_data, values['operating_profit_margin']),
+            'net_profit_margin': self._calculate_net_profit_margin(financial_data, values['net_profit_margin']),
+            'return_on_assets': self._calculate_return_on_assets(financial_data, values['return_on_assets']),
+            'return_on_equity': self._calculate_return_on_equity(financial_data, values['return_on_equity']),
+            'return_on_invested_capital': self._calculate_return_on_invested_capital(financial_data, values['return_on_invested_capital']),
+            'ebitda_margin': self._calculate_ebitda_margin(financial_data, values['ebitda_margin']),
+            'operating_ratio': self._calculate_operating_ratio(financial_data, values['operating_ratio'])
         }
         
         # تحلیل و ارزیابی
@@ -47,48 +57,43 @@ class ProfitabilityRatioAnalyzer:
         }
     
     def _collect_financial_data(self) -> Dict[str, Any]:
-        """جمع‌آوری داده‌های مالی مورد نیاز"""
+        """جمع‌آوری داده‌های مالی مورد نیاز از مانده‌های ثبت‌شده دوره"""
         
-        # این بخش باید با مدل‌های واقعی یکپارچه شود
-        # فعلاً از داده‌های نمونه استفاده می‌کنیم
+        fin = self.financials
         
         return {
             'income_statement': {
-                'revenue': Decimal('8000000000'),  # 8 میلیارد
-                'cost_of_goods_sold': Decimal('5000000000'),  # 5 میلیارد
-                'gross_profit': Decimal('3000000000'),  # 3 میلیارد
-                'operating_expenses': Decimal('1500000000'),  # 1.5 میلیارد
-                'operating_income': Decimal('1500000000'),  # 1.5 میلیارد
-                'ebit': Decimal('1400000000'),  # 1.4 میلیارد
-                'ebitda': Decimal('1600000000'),  # 1.6 میلیارد
-                'interest_expense': Decimal('200000000'),  # 200 میلیون
-                'tax_expense': Decimal('300000000'),  # 300 میلیون
-                'net_income': Decimal('900000000')  # 900 میلیون
+                'revenue': fin.line('revenue'),
+                'cost_of_goods_sold': fin.line('cost_of_goods_sold'),
+                'gross_profit': fin.line('gross_profit'),
+                'operating_expenses': fin.line('operating_expenses'),
+                'operating_income': fin.line('operating_income'),
+                'ebit': fin.line('ebit'),
+                'ebitda': fin.line('ebitda'),
+                'interest_expense': fin.line('interest_expense'),
+                'tax_expense': fin.line('tax_expense'),
+                'net_income': fin.line('net_income')
             },
             'balance_sheet': {
-                'total_assets': Decimal('10000000000'),  # 10 میلیارد
-                'total_equity': Decimal('4000000000'),  # 4 میلیارد
-                'total_debt': Decimal('6000000000'),  # 6 میلیارد
-                'current_assets': Decimal('2500000000'),  # 2.5 میلیارد
-                'fixed_assets': Decimal('7500000000')  # 7.5 میلیارد
+                'total_assets': fin.line('total_assets'),
+                'total_equity': fin.line('total_equity'),
+                'total_debt': fin.line('total_debt'),
+                'current_assets': fin.line('current_assets'),
+                'fixed_assets': fin.line('fixed_assets')
             },
             'market_data': {
-                'market_capitalization': Decimal('12000000000'),  # 12 میلیارد
-                'shares_outstanding': Decimal('100000000')  # 100 میلیون سهم
+                # داده بازار در دفاتر ثبت نمی‌شود
+                'market_capitalization': Decimal('0'),
+                'shares_outstanding': Decimal('0')
             }
         }
     
-    def _calculate_gross_profit_margin(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه حاشیه سود ناخالص"""
+    def _calculate_gross_profit_margin(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """حاشیه سود ناخالص"""
         
         gross_profit = data['income_statement']['gross_profit']
         revenue = data['income_statement']['revenue']
         
-        if revenue == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = gross_profit / revenue
-        
         assessment = self._assess_gross_profit_margin(ratio)
         
         return {
@@ -104,7 +109,7 @@ class ProfitabilityRatioAnalyzer:
             }
         }
     
-    def _assess_gross_profit_margin(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_gross_profit_margin(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی حاشیه سود ناخالص"""
         
         percentage = float(ratio * 100)
@@ -135,17 +140,12 @@ class ProfitabilityRatioAnalyzer:
                 'interpretation': 'حاشیه سود ناخالص بسیار پایین - شرکت در معرض ریسک زیان قرار دارد'
             }
     
-    def _calculate_operating_profit_margin(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه حاشیه سود عملیاتی"""
+    def _calculate_operating_profit_margin(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """حاشیه سود عملیاتی"""
         
         operating_income = data['income_statement']['operating_income']
         revenue = data['income_statement']['revenue']
         
-        if revenue == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = operating_income / revenue
-        
         assessment = self._assess_operating_profit_margin(ratio)
         
         return {
@@ -161,7 +161,7 @@ class ProfitabilityRatioAnalyzer:
             }
         }
     
-    def _assess_operating_profit_margin(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_operating_profit_margin(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی حاشیه سود عملیاتی"""
         
         percentage = float(ratio * 100)
@@ -192,17 +192,12 @@ class ProfitabilityRatioAnalyzer:
                 'interpretation': 'حاشیه سود عملیاتی بسیار پایین - شرکت در معرض ریسک زیان عملیاتی قرار دارد'
             }
     
-    def _calculate_net_profit_margin(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه حاشیه سود خالص"""
+    def _calculate_net_profit_margin(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """حاشیه سود خالص"""
         
         net_income = data['income_statement']['net_income']
         revenue = data['income_statement']['revenue']
         
-        if revenue == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = net_income / revenue
-        
         assessment = self._assess_net_profit_margin(ratio)
         
         return {
@@ -218,7 +213,7 @@ class ProfitabilityRatioAnalyzer:
             }
         }
     
-    def _assess_net_profit_margin(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_net_profit_margin(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی حاشیه سود خالص"""
         
         percentage = float(ratio * 100)
@@ -249,17 +244,12 @@ class ProfitabilityRatioAnalyzer:
                 'interpretation': 'حاشیه سود خالص بسیار پایین - شرکت در معرض ریسک زیان قرار دارد'
             }
     
-    def _calculate_return_on_assets(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه بازده دارایی‌ها (ROA)"""
+    def _calculate_return_on_assets(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """بازده دارایی‌ها (ROA)"""
         
         net_income = data['income_statement']['net_income']
         total_assets = data['balance_sheet']['total_assets']
         
-        if total_assets == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = net_income / total_assets
-        
         assessment = self._assess_return_on_assets(ratio)
         
         return {
@@ -275,7 +265,7 @@ class ProfitabilityRatioAnalyzer:
             }
         }
     
-    def _assess_return_on_assets(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_return_on_assets(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی بازده دارایی‌ها"""
         
         percentage = float(ratio * 100)
@@ -306,17 +296,12 @@ class ProfitabilityRatioAnalyzer:
                 'interpretation': 'بازده دارایی‌ها بسیار پایین - شرکت استفاده ناکارآمدی از دارایی‌ها دارد'
             }
     
-    def _calculate_return_on_equity(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه بازده سرمایه (ROE)"""
+    def _calculate_return_on_equity(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """بازده سرمایه (ROE)"""
         
         net_income = data['income_statement']['net_income']
         total_equity = data['balance_sheet']['total_equity']
         
-        if total_equity == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = net_income / total_equity
-        
         assessment = self._assess_return_on_equity(ratio)
         
         return {
@@ -332,7 +317,7 @@ class ProfitabilityRatioAnalyzer:
             }
         }
     
-    def _assess_return_on_equity(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_return_on_equity(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی بازده سرمایه"""
         
         percentage = float(ratio * 100)
@@ -363,19 +348,14 @@ class ProfitabilityRatioAnalyzer:
                 'interpretation': 'بازده سرمایه بسیار پایین - شرکت سودآوری ناکافی برای سهامداران ایجاد می‌کند'
             }
     
-    def _calculate_return_on_invested_capital(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه بازده سرمایه سرمایه‌گذاری شده (ROIC)"""
+    def _calculate_return_on_invested_capital(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """بازده سرمایه سرمایه‌گذاری شده (ROIC)"""
         
         ebit = data['income_statement']['ebit']
         total_equity = data['balance_sheet']['total_equity']
         total_debt = data['balance_sheet']['total_debt']
         
-        invested_capital = total_equity + total_debt
-        
-        if invested_capital == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = ebit / invested_capital
+        invested_capital = self.financials.line('invested_capital')
         
         assessment = self._assess_return_on_invested_capital(ratio)
         
@@ -394,7 +374,7 @@ class ProfitabilityRatioAnalyzer:
             }
         }
     
-    def _assess_return_on_invested_capital(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_return_on_invested_capital(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی بازده سرمایه سرمایه‌گذاری شده"""
         
         percentage = float(ratio * 100)
@@ -425,17 +405,12 @@ class ProfitabilityRatioAnalyzer:
                 'interpretation': 'بازده سرمایه سرمایه‌گذاری شده بسیار پایین - شرکت استفاده ناکارآمدی از کل سرمایه دارد'
             }
     
-    def _calculate_ebitda_margin(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه حاشیه EBITDA"""
+    def _calculate_ebitda_margin(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """حاشیه EBITDA"""
         
         ebitda = data['income_statement']['ebitda']
         revenue = data['income_statement']['revenue']
         
-        if revenue == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = ebitda / revenue
-        
         assessment = self._assess_ebitda_margin(ratio)
         
         return {
@@ -451,7 +426,7 @@ class ProfitabilityRatioAnalyzer:
             }
         }
     
-    def _assess_ebitda_margin(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_ebitda_margin(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی حاشیه EBITDA"""
         
         percentage = float(ratio * 100)
@@ -482,17 +457,12 @@ class ProfitabilityRatioAnalyzer:
                 'interpretation': 'حاشیه EBITDA بسیار پایین - شرکت در معرض ریسک نقدینگی قرار دارد'
             }
     
-    def _calculate_operating_ratio(self, data: Dict) -> Dict[str, Any]:
-        """محاسبه نسبت عملیاتی"""
+    def _calculate_operating_ratio(self, data: Dict, ratio: float) -> Dict[str, Any]:
+        """نسبت عملیاتی"""
         
         operating_expenses = data['income_statement']['operating_expenses']
         revenue = data['income_statement']['revenue']
         
-        if revenue == 0:
-            ratio = Decimal('0')
-        else:
-            ratio = operating_expenses / revenue
-        
         assessment = self._assess_operating_ratio(ratio)
         
         return {
@@ -508,7 +478,7 @@ class ProfitabilityRatioAnalyzer:
             }
         }
     
-    def _assess_operating_ratio(self, ratio: Decimal) -> Dict[str, Any]:
+    def _assess_operating_ratio(self, ratio: float) -> Dict[str, Any]:
         """ارزیابی نسبت عملیاتی"""
         
         percentage = float(ratio * 100)
@@ -772,7 +742,7 @@ class ProfitabilityRatioTool:
             company = Company.objects.get(id=company_id)
             period = FinancialPeriod.objects.get(id=period_id)
             
-            analyzer = ProfitabilityRatioAnalyzer(company, period)
+            analyzer = ProfitabilityRatioAnalyzer(company, period, financials=period_financials(company, period))
             result = analyzer.calculate_all_profitability_ratios()
             
             return {
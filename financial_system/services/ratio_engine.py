@@ -0,0 +1,291 @@
+# financial_system/services/ratio_engine.py
+"""
+موتور نسبت‌های مالی مبتنی بر داده‌های واقعی دفتر
+گردش حساب‌ها با یک کوئری گروه‌بندی‌شده به ماتریس (حساب × ستون) تبدیل می‌شود، اقلام صورت‌های
+مالی از طریق نگاشت قابل تنظیم پیشوند کد حساب ← قلم با یک ضرب ماتریسی به دست می‌آیند و تمام
+نسبت‌های نقدینگی، فعالیت، اهرمی و سودآوری در یک محاسبه برداری روی همین اقلام حساب می‌شوند.
+"""
+
+from decimal import Decimal
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import ExpressionWrapper, F, IntegerField, Sum
+
+from financial_system.models.document_models import DocumentItem
+from financial_system.services.account_hierarchy import from_minor_units, minor_units_expression, prefix_mask
+from financial_system.services.report_cache import cached_report
+from users.models import Company, FinancialPeriod
+
+# نگاشت پیش‌فرض اقلام صورت‌های مالی: قلم ← (پیشوندهای کد حساب، ماهیت)
+# ماهیت debit/credit مانده خالص با علامت طبیعی است و debit_turnover/credit_turnover فقط گردش یک طرف.
+# با تنظیم FINANCIAL_STATEMENT_LINES در settings می‌توان هر قلم را بازنویسی کرد.
+DEFAULT_STATEMENT_LINES: Dict[str, Tuple[Sequence[str], str]] = {
+    # دارایی‌های جاری
+    'cash': (['101'], 'debit'),                       # صندوق
+    'cash_equivalents': (['102'], 'debit'),           # بانک
+    'accounts_receivable': (['103', '104'], 'debit'),  # اسناد و حساب‌های دریافتنی
+    'inventory': (['105'], 'debit'),                  # موجودی کالا
+    'prepaid_expenses': (['106'], 'debit'),           # پیش‌پرداخت‌ها
+    'marketable_securities': (['107'], 'debit'),      # سرمایه‌گذاری‌های کوتاه‌مدت
+    'current_assets': (['10'], 'debit'),
+    'fixed_assets': (['11'], 'debit'),
+    'total_assets': (['1'], 'debit'),
+    # بدهی‌ها و حقوق صاحبان سهام
+    'accounts_payable': (['21'], 'credit'),
+    'short_term_debt': (['22'], 'credit'),
+    'accrued_expenses': ([], 'credit'),
+    'unearned_revenue': ([], 'credit'),
+    'current_liabilities': (['21', '22'], 'credit'),
+    'long_term_debt': (['23', '24'], 'credit'),
+    'total_liabilities': (['2'], 'credit'),
+    'total_equity': (['3'], 'credit'),
+    # سود و زیان
+    'revenue': (['4'], 'credit'),
+    'cost_of_goods_sold': (['51'], 'debit'),
+    'operating_expenses': (['52', '53', '57'], 'debit'),  # هزینه‌های فروش، عمومی و اداری و استهلاک
+    'interest_expense': (['54'], 'debit'),
+    'other_expenses': (['55', '56'], 'debit'),
+    'tax_expense': ([], 'debit'),
+    'depreciation': (['57'], 'debit'),                # هزینه استهلاک (جزء هزینه‌های عملیاتی؛ در جریان نقد برگشت داده می‌شود)
+    # جریان‌های نقدی
+    'principal_payments': (['22', '23', '24'], 'debit_turnover'),  # بازپرداخت اصل تسهیلات
+    'lease_payments': ([], 'debit_turnover'),
+}
+
+# اقلام مشتق: ترکیب خطی اقلام قبلی (به ترتیب تعریف محاسبه می‌شوند)
+DERIVED_LINES: Dict[str, Dict[str, int]] = {
+    'gross_profit': {'revenue': 1, 'cost_of_goods_sold': -1},
+    'operating_income': {'gross_profit': 1, 'operating_expenses': -1},
+    'ebit': {'operating_income': 1, 'other_expenses': -1},
+    'net_income': {'ebit': 1, 'interest_expense': -1, 'tax_expense': -1},
+    'ebitda': {'ebit': 1, 'depreciation': 1},
+    'total_debt': {'short_term_debt': 1, 'long_term_debt': 1},
+    'invested_capital': {'total_equity': 1, 'total_debt': 1},
+    'cash_assets': {'cash': 1, 'cash_equivalents': 1, 'marketable_securities': 1},
+    'quick_assets': {'cash_assets': 1, 'accounts_receivable': 1},
+    'net_working_capital': {'current_assets': 1, 'current_liabilities': -1},
+    # جریان نقد عملیاتی به روش غیرمستقیم از گردش دوره
+    'operating_cash_flow': {
+        'net_income': 1, 'depreciation': 1, 'accounts_receivable': -1, 'inventory': -1,
+        'prepaid_expenses': -1, 'accounts_payable': 1, 'accrued_expenses': 1, 'unearned_revenue': 1,
+    },
+    'operating_cash_expenses': {'cost_of_goods_sold': 1, 'operating_expenses': 1, 'depreciation': -1},
+    'debt_service': {'principal_payments': 1, 'interest_expense': 1},
+    'fixed_charges': {'interest_expense': 1, 'lease_payments': 1},
+    'ebit_before_leases': {'ebit': 1, 'lease_payments': 1},
+}
+
+# تعریف نسبت‌ها: نام ← (گروه، صورت، مخرج، ضریب)
+# پیشوند average_ به میانگین مانده پایان ماه‌های قلم اشاره می‌کند؛ مخرج None یعنی خود مقدار قلم.
+# ضریب 'days' تعداد روزهای دوره است.
+RATIO_DEFINITIONS: Dict[str, Tuple[str, str, str, object]] = {
+    'current_ratio': ('liquidity', 'current_assets', 'current_liabilities', 1),
+    'quick_ratio': ('liquidity', 'quick_assets', 'current_liabilities', 1),
+    'cash_ratio': ('liquidity', 'cash_assets', 'current_liabilities', 1),
+    'net_working_capital': ('liquidity', 'net_working_capital', None, 1),
+    'operating_cash_flow_ratio': ('liquidity', 'operating_cash_flow', 'current_liabilities', 1),
+    'defensive_interval_ratio': ('liquidity', 'quick_assets', 'operating_cash_expenses', 'days'),
+
+    'inventory_turnover': ('activity', 'cost_of_goods_sold', 'average_inventory', 1),
+    'days_inventory_outstanding': ('activity', 'average_inventory', 'cost_of_goods_sold', 365),
+    'receivables_turnover': ('activity', 'revenue', 'average_accounts_receivable', 1),
+    'days_sales_outstanding': ('activity', 'average_accounts_receivable', 'revenue', 365),
+    'payables_turnover': ('activity', 'cost_of_goods_sold', 'average_accounts_payable', 1),
+    'days_payables_outstanding': ('activity', 'average_accounts_payable', 'cost_of_goods_sold', 365),
+    'asset_turnover': ('activity', 'revenue', 'total_assets', 1),
+    'fixed_asset_turnover': ('activity', 'revenue', 'fixed_assets', 1),
+    'working_capital_turnover': ('activity', 'revenue', 'net_working_capital', 1),
+
+    'debt_ratio': ('leverage', 'total_liabilities', 'total_assets', 1),
+    'debt_to_equity': ('leverage', 'total_liabilities', 'total_equity', 1),
+    'equity_multiplier': ('leverage', 'total_assets', 'total_equity', 1),
+    'interest_coverage': ('leverage', 'ebit', 'interest_expense', 1),
+    'debt_service_coverage_ratio': ('leverage', 'operating_cash_flow', 'debt_service', 1),
+    'fixed_charge_coverage_ratio': ('leverage', 'ebit_before_leases', 'fixed_charges', 1),
+    'long_term_debt_to_equity': ('leverage', 'long_term_debt', 'total_equity', 1),
+
+    'gross_profit_margin': ('profitability', 'gross_profit', 'revenue', 1),
+    'operating_profit_margin': ('profitability', 'operating_income', 'revenue', 1),
+    'net_profit_margin': ('profitability', 'net_income', 'revenue', 1),
+    'return_on_assets': ('profitability', 'net_income', 'total_assets', 1),
+    'return_on_equity': ('profitability', 'net_income', 'total_equity', 1),
+    'return_on_invested_capital': ('profitability', 'ebit', 'invested_capital', 1),
+    'ebitda_margin': ('profitability', 'ebitda', 'revenue', 1),
+    'operating_ratio': ('profitability', 'operating_expenses', 'revenue', 1),
+}
+
+# نسبت‌های ترکیبی: ترکیب خطی نسبت‌های پایه
+COMPOSITE_RATIOS: Dict[str, Tuple[str, Dict[str, int]]] = {
+    'cash_conversion_cycle': ('activity', {
+        'days_inventory_outstanding': 1, 'days_sales_outstanding': 1, 'days_payables_outstanding': -1,
+    }),
+}
+
+RATIO_FAMILIES = ('liquidity', 'activity', 'leverage', 'profitability')
+
+AVERAGE_PREFIX = 'average_'
+DAYS_IN_YEAR = 365
+
+
+def ratio_family(name: str) -> str:
+    """گروه یک نسبت (نقدینگی، فعالیت، اهرمی یا سودآوری)"""
+    return RATIO_DEFINITIONS[name][0] if name in RATIO_DEFINITIONS else COMPOSITE_RATIOS[name][0]
+
+
+def get_statement_lines() -> Dict[str, Tuple[Sequence[str], str]]:
+    """نگاشت اقلام صورت‌های مالی با اعمال بازنویسی‌های تنظیمات پروژه"""
+    lines = dict(DEFAULT_STATEMENT_LINES)
+    lines.update(getattr(settings, 'FINANCIAL_STATEMENT_LINES', {}))
+    return lines
+
+
+def period_days(period: FinancialPeriod) -> int:
+    """تعداد روزهای دوره مالی (در نبود تاریخ‌ها یک سال کامل)"""
+    if period.start_date and period.end_date and period.end_date >= period.start_date:
+        return (period.end_date - period.start_date).days + 1
+    return DAYS_IN_YEAR
+
+
+def load_balance_matrix(queryset, column_expression) -> Tuple[np.ndarray, List, np.ndarray, np.ndarray]:
+    """گردش بدهکار و بستانکار (حساب × ستون) با یک کوئری گروه‌بندی‌شده
+
+    خروجی: کدهای حساب، کلیدهای مرتب ستون‌ها و دو ماتریس int64 بر حسب واحد جزء.
+    """
+    rows = list(
+        queryset.annotate(column_key=column_expression).values('account__code', 'column_key').annotate(
+            debit_total=Sum(minor_units_expression('debit')),
+            credit_total=Sum(minor_units_expression('credit'))
+        ).order_by()
+    )
+
+    codes, account_index = np.unique(np.array([row['account__code'] for row in rows], dtype=str), return_inverse=True)
+    columns, column_index = np.unique(np.array([row['column_key'] for row in rows], dtype=np.int64), return_inverse=True)
+    debit = np.zeros((codes.size, columns.size), dtype=np.int64)
+    credit = np.zeros((codes.size, columns.size), dtype=np.int64)
+    np.add.at(debit, (account_index, column_index), np.array([row['debit_total'] or 0 for row in rows], dtype=np.int64))
+    np.add.at(credit, (account_index, column_index), np.array([row['credit_total'] or 0 for row in rows], dtype=np.int64))
+    return codes, columns.tolist(), debit, credit
+
+
+class RatioEngine:
+    """محاسبه برداری اقلام صورت‌های مالی و نسبت‌ها روی ماتریس گردش حساب‌ها"""
+
+    def __init__(self, statement_lines: Dict[str, Tuple[Sequence[str], str]] = None):
+        self.statement_lines = statement_lines if statement_lines is not None else get_statement_lines()
+        self.line_names = list(self.statement_lines) + list(DERIVED_LINES)
+        self.line_index = {name: position for position, name in enumerate(self.line_names)}
+        self.ratio_names = list(RATIO_DEFINITIONS) + list(COMPOSITE_RATIOS)
+
+    def coefficients(self, account_codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ماتریس‌های ضرایب (قلم × حساب) برای مانده خالص، گردش بدهکار و گردش بستانکار"""
+        shape = (len(self.line_names), account_codes.size)
+        net = np.zeros(shape, dtype=np.int64)
+        debit = np.zeros(shape, dtype=np.int64)
+        credit = np.zeros(shape, dtype=np.int64)
+        targets = {'debit': (net, 1), 'credit': (net, -1), 'debit_turnover': (debit, 1), 'credit_turnover': (credit, 1)}
+
+        for name, (prefixes, nature) in self.statement_lines.items():
+            matrix, sign = targets[nature]
+            matrix[self.line_index[name], prefix_mask(account_codes, prefixes)] = sign
+
+        for name, terms in DERIVED_LINES.items():
+            row = self.line_index[name]
+            for term, weight in terms.items():
+                source = self.line_index[term]
+                net[row] += weight * net[source]
+                debit[row] += weight * debit[source]
+                credit[row] += weight * credit[source]
+        return net, debit, credit
+
+    def line_values(self, account_codes: np.ndarray, debit: np.ndarray, credit: np.ndarray) -> np.ndarray:
+        """مقدار تمام اقلام برای هر ستون ماتریس گردش (قلم × ستون، واحد جزء)"""
+        net_coefficients, debit_coefficients, credit_coefficients = self.coefficients(account_codes)
+        return net_coefficients @ (debit - credit) + debit_coefficients @ debit + credit_coefficients @ credit
+
+    def ratio_values(self, closing: np.ndarray, average: np.ndarray = None, days=DAYS_IN_YEAR) -> np.ndarray:
+        """محاسبه تمام نسبت‌ها با یک عملیات برداری (نسبت × ستون)؛ مخرج صفر به نسبت صفر می‌انجامد"""
+        average = closing if average is None else average
+        columns = closing.shape[1]
+        base_count = len(RATIO_DEFINITIONS)
+        numerators = np.empty((base_count, columns), dtype=np.float64)
+        denominators = np.ones((base_count, columns), dtype=np.float64)
+        scales = np.ones((base_count, columns), dtype=np.float64)
+
+        for position, name in enumerate(self.ratio_names[:base_count]):
+            _, numerator, denominator, scale = RATIO_DEFINITIONS[name]
+            numerators[position] = self._line(numerator, closing, average)
+            if denominator is not None:
+                denominators[position] = self._line(denominator, closing, average)
+            scales[position] = days if scale == 'days' else scale
+
+        base = np.zeros_like(numerators)
+        np.divide(numerators * scales, denominators, out=base, where=denominators != 0)
+        # مقادیر مطلق (غیرنسبی) به ریال برگردانده می‌شوند
+        absolute = np.array([RATIO_DEFINITIONS[name][2] is None for name in self.ratio_names[:base_count]])
+        base[absolute] /= 100
+
+        weights = np.zeros((len(COMPOSITE_RATIOS), base_count), dtype=np.float64)
+        for row, (_, terms) in enumerate(COMPOSITE_RATIOS.values()):
+            for term, weight in terms.items():
+                weights[row, self.ratio_names.index(term)] = weight
+        return np.vstack([base, weights @ base])
+
+    def _line(self, name: str, closing: np.ndarray, average: np.ndarray) -> np.ndarray:
+        if name.startswith(AVERAGE_PREFIX):
+            return average[self.line_index[name[len(AVERAGE_PREFIX):]]]
+        return closing[self.line_index[name]]
+
+
+class PeriodFinancials:
+    """اقلام صورت‌های مالی و نسبت‌های یک دوره، محاسبه‌شده از اسناد ثبت‌شده"""
+
+    def __init__(self, company: Company, period: FinancialPeriod, engine: RatioEngine = None):
+        self.company = company
+        self.period = period
+        self.engine = engine or RatioEngine()
+        self.days = period_days(period)
+
+        month = ExpressionWrapper(F('document__date_key') / 100, output_field=IntegerField())
+        codes, self.months, debit, credit = load_balance_matrix(
+            DocumentItem.objects.filter(document__company=company, document__period=period),
+            month
+        )
+        monthly = self.engine.line_values(codes, debit, credit)
+        # مانده پایان هر ماه از جمع تجمعی گردش ماه‌ها
+        month_end = np.cumsum(monthly, axis=1)
+        self._closing = month_end[:, -1:] if self.months else np.zeros((len(self.engine.line_names), 1), dtype=np.int64)
+        self._average = (
+            np.rint(month_end.mean(axis=1, keepdims=True)).astype(np.int64) if self.months else self._closing
+        )
+        self._ratios = self.engine.ratio_values(self._closing, self._average, self.days)
+
+    def line(self, name: str) -> Decimal:
+        """مقدار پایان دوره یک قلم"""
+        return from_minor_units(self._closing[self.engine.line_index[name], 0])
+
+    def average(self, name: str) -> Decimal:
+        """میانگین مانده پایان ماه‌های یک قلم در دوره"""
+        return from_minor_units(self._average[self.engine.line_index[name], 0])
+
+    @property
+    def lines(self) -> Dict[str, Decimal]:
+        return {name: self.line(name) for name in self.engine.line_names}
+
+    def ratios(self, family: str = None) -> Dict[str, float]:
+        """نسبت‌های محاسبه‌شده (در صورت تعیین گروه، فقط نسبت‌های آن گروه)"""
+        return {
+            name: float(self._ratios[position, 0])
+            for position, name in enumerate(self.engine.ratio_names)
+            if family is None or ratio_family(name) == family
+        }
+
+    def daily(self, name: str) -> Decimal:
+        """مقدار روزانه یک قلم جریانی در طول دوره"""
+        return self.line(name) / self.days
+
+
+def period_financials(company: Company, period: FinancialPeriod) -> PeriodFinancials:
+    """نمونه مشترک اقلام و نسبت‌های دوره برای نسخه جاری دفتر؛ همه تحلیل‌گرهای یک شرکت و دوره از آن استفاده می‌کنند"""
+    return cached_report('period_financials', company.id, period.id, lambda: PeriodFinancials(company, period))
@@ -7,18 +7,28 @@
 from typing import Dict, List, Any, Optional
 from decimal import Decimal
 from datetime import datetime, timedelta
-from users.models import Company, FinancialPeriod, FinancialFile, Document
+import numpy as np
+from django.db.models import F
+from financial_system.models.document_models import DocumentItem
+from financial_system.services.account_hierarchy import from_minor_units
+from financial_system.services.ratio_engine import RatioEngine, load_balance_matrix, period_days
+from users.models import Company, FinancialPeriod
 
 
 class RatioTrendAnalyzer:
     """تحلیل‌گر روند نسبت‌های مالی"""
     
-    def __init__(self, company: Company):
+    def __init__(self, company: Company, engine: RatioEngine = None):
         self.company = company
+        self.engine = engine or RatioEngine()
+        self._line_matrix = np.zeros((len(self.engine.line_names), 0), dtype=np.int64)
+        self._trends = {}
     
     def analyze_ratio_trends(self, periods: List[FinancialPeriod]) -> Dict[str, Any]:
         """تحلیل روند نسبت‌های مالی در دوره‌های مختلف"""
         
+        periods = list(periods)
+        
         # جمع‌آوری داده‌های تاریخی
         historical_data = self._collect_historical_data(periods)
         
@@ -46,46 +56,39 @@ class RatioTrendAnalyzer:
         }
     
     def _collect_historical_data(self, periods: List[FinancialPeriod]) -> Dict[str, Any]:
-        """جمع‌آوری داده‌های تاریخی برای دوره‌های مختلف"""
+        """جمع‌آوری داده‌های تاریخی تمام دوره‌ها با یک کوئری گروه‌بندی‌شده (حساب × دوره)"""
         
-        historical_data = {}
+        codes, period_ids, debit, credit = load_balance_matrix(
+            DocumentItem.objects.filter(document__company=self.company, document__period__in=periods),
+            F('document__period_id')
+        )
         
-        for period in periods:
-            # این بخش باید با مدل‌های واقعی یکپارچه شود
-            # فعلاً از داده‌های نمونه استفاده می‌کنیم
-            
+        # ستون‌ها به ترتیب دوره‌های ورودی چیده می‌شوند؛ دوره بدون سند به ستون صفر (آخر) اشاره می‌کند
+        columns = np.array([period_ids.index(period.id) if period.id in period_ids else -1 for period in periods], dtype=np.int64)
+        zero_column = np.zeros((codes.size, 1), dtype=np.int64)
+        debit = np.hstack([debit, zero_column])[:, columns]
+        credit = np.hstack([credit, zero_column])[:, columns]
+        
+        # تمام اقلام و نسبت‌های همه دوره‌ها به صورت عملیات ستونی
+        self._line_matrix = self.engine.line_values(codes, debit, credit)
+        days = np.array([period_days(period) for period in periods], dtype=np.float64)
+        ratio_matrix = self.engine.ratio_values(self._line_matrix, days=days)
+        
+        # برازش خط روند تمام نسبت‌ها با یک حل کمترین مربعات
+        self._trends = dict(zip(self.engine.ratio_names, self._fit_trends(ratio_matrix)))
+        
+        historical_data = {}
+        for column, period in enumerate(periods):
             historical_data[period.name] = {
                 'period': period.name,
                 'date': period.start_date if period.start_date else datetime.now(),
                 'ratios': {
-                    # نسبت‌های نقدینگی
-                    'current_ratio': Decimal('1.8') + Decimal(str(0.1 * periods.index(period))),
-                    'quick_ratio': Decimal('1.2') + Decimal(str(0.05 * periods.index(period))),
-                    'cash_ratio': Decimal('0.3') + Decimal(str(0.02 * periods.index(period))),
-                    
-                    # نسبت‌های اهرمی
-                    'debt_ratio': Decimal('0.6') - Decimal(str(0.02 * periods.index(period))),
-                    'debt_to_equity': Decimal('1.5') - Decimal(str(0.05 * periods.index(period))),
-                    'interest_coverage': Decimal('4.0') + Decimal(str(0.3 * periods.index(period))),
-                    
-                    # نسبت‌های سودآوری
-                    'gross_profit_margin': Decimal('0.35') + Decimal(str(0.01 * periods.index(period))),
-                    'operating_profit_margin': Decimal('0.18') + Decimal(str(0.005 * periods.index(period))),
-                    'net_profit_margin': Decimal('0.12') + Decimal(str(0.003 * periods.index(period))),
-                    'return_on_assets': Decimal('0.08') + Decimal(str(0.002 * periods.index(period))),
-                    'return_on_equity': Decimal('0.15') + Decimal(str(0.004 * periods.index(period))),
-                    
-                    # نسبت‌های فعالیت
-                    'inventory_turnover': Decimal('6.0') + Decimal(str(0.2 * periods.index(period))),
-                    'receivables_turnover': Decimal('8.0') + Decimal(str(0.3 * periods.index(period))),
-                    'asset_turnover': Decimal('0.7') + Decimal(str(0.05 * periods.index(period))),
-                    'cash_conversion_cycle': Decimal('50.0') - Decimal(str(2.0 * periods.index(period)))
+                    name: float(ratio_matrix[row, column])
+                    for row, name in enumerate(self.engine.ratio_names)
                 },
                 'financial_data': {
-                    'revenue': Decimal('8000000000') * Decimal(str(1.1 ** periods.index(period))),
-                    'net_income': Decimal('900000000') * Decimal(str(1.08 ** periods.index(period))),
-                    'total_assets': Decimal('10000000000') * Decimal(str(1.05 ** periods.index(period))),
-                    'total_equity': Decimal('4000000000') * Decimal(str(1.06 ** periods.index(period)))
+                    name: from_minor_units(self._line_matrix[self.engine.line_index[name], column])
+                    for name in ('revenue', 'net_income', 'total_assets', 'total_equity')
                 }
             }
         
@@ -102,7 +105,7 @@ class RatioTrendAnalyzer:
         
         for ratio_name in liquidity_ratios:
             values = [historical_data[period]['ratios'][ratio_name] for period in periods]
-            trend = self._calculate_trend(values)
+            trend = self._trends[ratio_name]
             
             trends[ratio_name] = {
                 'values': [float(value) for value in values],
@@ -132,7 +135,7 @@ class RatioTrendAnalyzer:
         
         for ratio_name in leverage_ratios:
             values = [historical_data[period]['ratios'][ratio_name] for period in periods]
-            trend = self._calculate_trend(values)
+            trend = self._trends[ratio_name]
             
             trends[ratio_name] = {
                 'values': [float(value) for value in values],
@@ -165,7 +168,7 @@ class RatioTrendAnalyzer:
         
         for ratio_name in profitability_ratios:
             values = [historical_data[period]['ratios'][ratio_name] for period in periods]
-            trend = self._calculate_trend(values)
+            trend = self._trends[ratio_name]
             
             trends[ratio_name] = {
                 'values': [float(value) for value in values],
@@ -198,7 +201,7 @@ class RatioTrendAnalyzer:
         
         for ratio_name in activity_ratios:
             values = [historical_data[period]['ratios'][ratio_name] for period in periods]
-            trend = self._calculate_trend(values)
+            trend = self._trends[ratio_name]
             
             trends[ratio_name] = {
                 'values': [float(value) for value in values],
@@ -222,21 +225,15 @@ class RatioTrendAnalyzer:
         
         periods = list(historical_data.keys())
         
-        # محاسبه شاخص‌های کلیدی
-        key_metrics = {
-            'revenue_growth': self._calculate_growth_rate(
-                [historical_data[period]['financial_data']['revenue'] for period in periods]
-            ),
-            'net_income_growth': self._calculate_growth_rate(
-                [historical_data[period]['financial_data']['net_income'] for period in periods]
-            ),
-            'asset_growth': self._calculate_growth_rate(
-                [historical_data[period]['financial_data']['total_assets'] for period in periods]
-            ),
-            'equity_growth': self._calculate_growth_rate(
-                [historical_data[period]['financial_data']['total_equity'] for period in periods]
-            )
+        # محاسبه شاخص‌های کلیدی (نرخ رشد تمام اقلام با یک محاسبه برداری)
+        metric_lines = {
+            'revenue_growth': 'revenue',
+            'net_income_growth': 'net_income',
+            'asset_growth': 'total_assets',
+            'equity_growth': 'total_equity'
         }
+        rows = [self.engine.line_index[line] for line in metric_lines.values()]
+        key_metrics = dict(zip(metric_lines, self._growth_rates(self._line_matrix[rows])))
         
         # ارزیابی کلی روند مالی
         overall_assessment = self._assess_overall_financial_trend(key_metrics)
@@ -249,112 +246,92 @@ class RatioTrendAnalyzer:
     
     def _calculate_trend(self, values: List[Decimal]) -> Dict[str, Any]:
         """محاسبه روند خطی برای مجموعه‌ای از مقادیر"""
+        return self._fit_trends(np.array([[float(value) for value in values]], dtype=np.float64))[0]
+    
+    def _fit_trends(self, series: np.ndarray) -> List[Dict[str, Any]]:
+        """برازش خط روند برای تمام سری‌ها (سری × دوره) با یک حل کمترین مربعات NumPy"""
         
-        if len(values) < 2:
-            return {
-                'direction': 'ثابت',
-                'slope': Decimal('0'),
-                'r_squared': Decimal('0')
-            }
-        
-        # محاسبه شیب خط روند
-        n = len(values)
-        x_values = list(range(n))
-        y_values = [float(value) for value in values]
-        
-        # محاسبه میانگین‌ها
-        x_mean = sum(x_values) / n
-        y_mean = sum(y_values) / n
+        count, n = series.shape
+        if n < 2:
+            return [
+                {'direction': 'ثابت', 'slope': Decimal('0'), 'r_squared': Decimal('0')}
+                for _ in range(count)
+            ]
         
-        # محاسبه شیب
-        numerator = sum((x - x_mean) * (y - y_mean) for x, y in zip(x_values, y_values))
-        denominator = sum((x - x_mean) ** 2 for x in x_values)
-        
-        if denominator == 0:
-            slope = Decimal('0')
-        else:
-            slope = Decimal(str(numerator / denominator))
-        
-        # تعیین جهت روند
-        if slope > Decimal('0.01'):
-            direction = 'صعودی'
-        elif slope < Decimal('-0.01'):
-            direction = 'نزولی'
-        else:
-            direction = 'ثابت'
+        # ماتریس طراحی مشترک [1, t] برای تمام سری‌ها
+        design = np.column_stack([np.ones(n), np.arange(n, dtype=np.float64)])
+        values = series.T
+        coefficients, _, _, _ = np.linalg.lstsq(design, values, rcond=None)
+        slopes = coefficients[1]
         
         # محاسبه ضریب تعیین (R-squared)
-        if denominator == 0:
-            r_squared = Decimal('0')
-        else:
-            y_pred = [y_mean + slope * (x - x_mean) for x in x_values]
-            ss_res = sum((y - y_pred[i]) ** 2 for i, y in enumerate(y_values))
-            ss_tot = sum((y - y_mean) ** 2 for y in y_values)
-            
-            if ss_tot == 0:
-                r_squared = Decimal('1')
+        ss_res = ((values - design @ coefficients) ** 2).sum(axis=0)
+        ss_tot = ((values - values.mean(axis=0)) ** 2).sum(axis=0)
+        r_squared = np.ones(count)
+        np.subtract(1, ss_res / np.where(ss_tot == 0, 1, ss_tot), out=r_squared, where=ss_tot != 0)
+        
+        trends = []
+        for slope, r2 in zip(slopes.tolist(), r_squared.tolist()):
+            # تعیین جهت روند
+            if slope > 0.01:
+                direction = 'صعودی'
+            elif slope < -0.01:
+                direction = 'نزولی'
             else:
-                r_squared = Decimal('1') - Decimal(str(ss_res / ss_tot))
+                direction = 'ثابت'
+            
+            trends.append({
+                'direction': direction,
+                'slope': Decimal(str(slope)),
+                'r_squared': Decimal(str(r2))
+            })
         
-        return {
-            'direction': direction,
-            'slope': slope,
-            'r_squared': r_squared
-        }
+        return trends
     
     def _calculate_growth_rate(self, values: List[Decimal]) -> Dict[str, Any]:
         """محاسبه نرخ رشد برای مجموعه‌ای از مقادیر"""
+        return self._growth_rates(np.array([[float(value) for value in values]], dtype=np.float64))[0]
+    
+    def _growth_rates(self, series: np.ndarray) -> List[Dict[str, Any]]:
+        """نرخ رشد دوره‌ای، میانگین و نوسان برای تمام سری‌ها (سری × دوره) به صورت برداری"""
+        
+        series = series.astype(np.float64)
+        previous, current = series[:, :-1], series[:, 1:]
+        valid = previous != 0
+        
+        # محاسبه نرخ رشد دوره‌ای (دوره‌های با مقدار قبلی صفر کنار گذاشته می‌شوند)
+        rates = np.zeros_like(previous)
+        np.divide(current - previous, previous, out=rates, where=valid)
+        counts = valid.sum(axis=1)
+        
+        # محاسبه میانگین و انحراف معیار
+        avg_growth = np.where(valid, rates, 0).sum(axis=1) / np.maximum(counts, 1)
+        squared = np.where(valid, (rates - avg_growth[:, None]) ** 2, 0).sum(axis=1)
+        volatility = np.where(counts > 1, np.sqrt(squared / np.maximum(counts - 1, 1)), 0)
+        
+        results = []
+        for average, deviation in zip(avg_growth.tolist(), volatility.tolist()):
+            # تعیین روند
+            if average > 0.05:
+                trend = 'رشد قوی'
+            elif average > 0.02:
+                trend = 'رشد متوسط'
+            elif average > 0:
+                trend = 'رشد ضعیف'
+            elif average < -0.05:
+                trend = 'کاهش شدید'
+            elif average < -0.02:
+                trend = 'کاهش متوسط'
+            else:
+                trend = 'ثابت'
+            
+            results.append({
+                'average_growth': average,
+                'volatility': deviation,
+                'trend': trend
+            })
         
-        if len(values) < 2:
-            return {
-                'average_growth': Decimal('0'),
-                'volatility': Decimal('0'),
-                'trend': 'ثابت'
-            }
-        
-        # محاسبه نرخ رشد دوره‌ای
-        growth_rates = []
-        for i in range(1, len(values)):
-            if values[i-1] != Decimal('0'):
-                growth_rate = (values[i] - values[i-1]) / values[i-1]
-                growth_rates.append(growth_rate)
-        
-        if not growth_rates:
-            return {
-                'average_growth': Decimal('0'),
-                'volatility': Decimal('0'),
-                'trend': 'ثابت'
-            }
-        
-        # محاسبه میانگین و نوسان
-        avg_growth = sum(growth_rates) / len(growth_rates)
-        
-        # محاسبه انحراف معیار
-        if len(growth_rates) > 1:
-            variance = sum((rate - avg_growth) ** 2 for rate in growth_rates) / (len(growth_rates) - 1)
-            volatility = variance.sqrt()
-        else:
-            volatility = Decimal('0')
-        
-        # تعیین روند
-        if avg_growth > Decimal('0.05'):
-            trend = 'رشد قوی'
-        elif avg_growth > Decimal('0.02'):
-            trend = 'رشد متوسط'
-        elif avg_growth > Decimal('0'):
-            trend = 'رشد ضعیف'
-        elif avg_growth < Decimal('-0.05'):
-            trend = 'کاهش شدید'
-        elif avg_growth < Decimal('-0.02'):
-            trend = 'کاهش متوسط'
-        else:
-            trend = 'ثابت'
-        
-        return {
-            'average_growth': float(avg_growth),
-            'volatility': float(volatility),
-            'trend': trend
-        }
+        return results
     
     def _interpret_liquidity_trend(self, ratio_name: str, trend: Dict) -> str:
         """تفسیر روند نسبت نقدینگی"""
@@ -0,0 +1,173 @@
+# financial_system/services/report_cache.py
+"""
+کش گزارش‌ها بر اساس نسخه دفتر
+هر (شرکت، دوره) یک نسخه صعودی دارد که با ورود، ویرایش، حذف یا اصلاح خودکار اسناد افزایش می‌یابد.
+نتیجه گزارش‌ها زیر کلید (گزارش، پارامترها، نسخه دفتر) و بدون مهلت انقضا ذخیره می‌شود؛ بنابراین
+بلافاصله پس از هر تغییر باطل می‌شود، بین کاربران مشترک است و دوره‌های بسته فقط یک بار محاسبه می‌شوند.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import HttpResponseNotModified
+from django.utils import timezone
+from django.utils.cache import parse_etags, patch_cache_control, quote_etag
+
+from financial_system.models.document_models import LedgerVersion
+from financial_system.services.live_updates import has_subscribers, publish
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE_PREFIX = 'report'
+
+# کلیدها با نسخه دفتر باطل می‌شوند؛ مهلت (در صورت تنظیم REPORT_CACHE_TIMEOUT) فقط برای پاک‌سازی نسخه‌های قدیمی است
+REPORT_CACHE_TIMEOUT = getattr(settings, 'REPORT_CACHE_TIMEOUT', None)
+
+_state = threading.local()
+
+
+def get_ledger_version(company_id: int, period_id: int) -> int:
+    """نسخه جاری دفتر شرکت و دوره (صفر برای دفتر بدون تغییر ثبت‌شده)"""
+    version = LedgerVersion.objects.filter(
+        company_id=company_id, period_id=period_id
+    ).values_list('version', flat=True).first()
+    return version or 0
+
+
+def get_ledger_versions(company_id: int, period_ids) -> Dict[int, int]:
+    """نسخه جاری دفتر چند دوره شرکت با یک کوئری (صفر برای دوره بدون تغییر ثبت‌شده)"""
+    versions = dict(LedgerVersion.objects.filter(
+        company_id=company_id, period_id__in=list(period_ids)
+    ).values_list('period_id', 'version'))
+    return {period_id: versions.get(period_id, 0) for period_id in period_ids}
+
+
+def bump_ledger_version(company_id: int, period_id: int) -> None:
+    """افزایش اتمیک نسخه دفتر شرکت و دوره"""
+    updates = {'version': F('version') + 1, 'updated_at': timezone.now()}
+    if LedgerVersion.objects.filter(company_id=company_id, period_id=period_id).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            LedgerVersion.objects.create(company_id=company_id, period_id=period_id, version=1)
+    except IntegrityError:
+        # ردیف هم‌زمان توسط درخواست دیگری ایجاد شده است
+        LedgerVersion.objects.filter(company_id=company_id, period_id=period_id).update(**updates)
+
+
+def _pending() -> set:
+    if not hasattr(_state, 'pending'):
+        _state.pending = set()
+        _state.batch_depth = 0
+    return _state.pending
+
+
+def _flush_pending() -> None:
+    """افزایش نسخه تمام دفترهای تغییرکرده (یک بار برای هر شرکت و دوره)"""
+    pending = _pending()
+    while pending:
+        company_id, period_id = pending.pop()
+        try:
+            bump_ledger_version(company_id, period_id)
+            # نسخه جدید فقط برای داشبوردهای باز همین دفتر خوانده و ارسال می‌شود
+            if has_subscribers(company_id, period_id):
+                publish(company_id, period_id, 'ledger', {'version': get_ledger_version(company_id, period_id)})
+        except Exception as e:
+            logger.error(f"خطا در افزایش نسخه دفتر {company_id}/{period_id}: {e}")
+
+
+def mark_ledger_changed(company_id: Optional[int], period_id: Optional[int]) -> None:
+    """ثبت تغییر دفتر؛ نسخه پس از commit تراکنش جاری (یا پایان دسته جاری) یک بار افزایش می‌یابد"""
+    if not company_id or not period_id:
+        return
+    _pending().add((company_id, period_id))
+    if not _state.batch_depth:
+        transaction.on_commit(_flush_pending)
+
+
+@contextmanager
+def ledger_batch():
+    """تجمیع تغییرات یک عملیات گروهی (مانند ورود اطلاعات) در یک افزایش نسخه برای هر دفتر"""
+    _pending()
+    _state.batch_depth += 1
+    try:
+        yield
+    finally:
+        _state.batch_depth -= 1
+        if not _state.batch_depth:
+            transaction.on_commit(_flush_pending)
+
+
+def report_cache_key(report: str, company_id: int, period_id: int, version: int,
+                     params: Optional[Dict[str, Any]] = None) -> str:
+    """کلید کش گزارش؛ پارامترها با ترتیب ثابت هش می‌شوند"""
+    digest = hashlib.md5(
+        json.dumps(params or {}, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()[:16]
+    return f'{REPORT_CACHE_PREFIX}:{report}:{company_id}:{period_id}:v{version}:{digest}'
+
+
+def cached_report(report: str, company_id: int, period_id: int, compute: Callable[[], Any],
+                  params: Optional[Dict[str, Any]] = None) -> Any:
+    """نتیجه گزارش از کش نسخه جاری دفتر یا محاسبه و ذخیره آن؛ در صورت خطای کش فقط محاسبه می‌شود"""
+    key = report_cache_key(report, company_id, period_id, get_ledger_version(company_id, period_id), params)
+    try:
+        result = cache.get(key)
+        if result is not None:
+            logger.debug(f"گزارش از کش بازیابی شد: {key}")
+            return result
+    except Exception as e:
+        logger.warning(f"خطا در خواندن کش گزارش {key}: {e}")
+
+    result = compute()
+    try:
+        cache.set(key, result, REPORT_CACHE_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"خطا در ذخیره کش گزارش {key}: {e}")
+    return result
+
+
+def ledger_etag(report: str, per_user: bool = False,
+                extra_params: Optional[Callable[[int, int], Dict[str, Any]]] = None):
+    """
+    دکوراتور ویوهای GET گزارش: ETag قوی از پارامترهای درخواست و نسخه دفتر شرکت و دوره جلسه.
+    If-None-Match منطبق پیش از اجرای ویو (و هر تجمیعی) با 304 پاسخ داده می‌شود.
+    extra_params(company_id, period_id) وابستگی‌های دیگر گزارش (مثلاً نسخه دفتر دوره‌های خط مبنا) را به کلید می‌افزاید.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            company_id = request.session.get('current_company_id')
+            period_id = request.session.get('current_period_id')
+            if request.method not in ('GET', 'HEAD') or not company_id or not period_id:
+                return view_func(request, *args, **kwargs)
+
+            params = {'query': sorted(request.GET.lists()), 'args': args, 'kwargs': kwargs}
+            if per_user:
+                params['user'] = request.user.id
+            if extra_params is not None:
+                params['extra'] = extra_params(company_id, period_id)
+            key = report_cache_key(report, company_id, period_id, get_ledger_version(company_id, period_id), params)
+            etag = quote_etag(hashlib.md5(key.encode('utf-8')).hexdigest())
+
+            if etag in parse_etags(request.headers.get('If-None-Match', '')):
+                response = HttpResponseNotModified()
+            else:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response['ETag'] = etag
+            # مرورگر پیش از استفاده از نسخه ذخیره‌شده باید با سرور اعتبارسنجی کند
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
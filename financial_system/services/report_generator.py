@@ -12,20 +12,23 @@ from financial_system.services.balance_sheet_analyzer import BalanceSheetAnalyze
 from financial_system.services.cash_bank_analyzer import CashBankAnalyzer
 from financial_system.services.revenue_analyzer import RevenueAnalyzer
 from financial_system.services.expense_analyzer import ExpenseAnalyzer
+from financial_system.services.ledger_snapshot import LedgerSnapshot
 from users.models import Company, FinancialPeriod
 
 
 class FinancialReportGenerator:
     """تولیدکننده گزارش‌های مالی"""
     
-    def __init__(self, company: Company, period: FinancialPeriod):
+    def __init__(self, company: Company, period: FinancialPeriod, snapshot: LedgerSnapshot = None):
         self.company = company
         self.period = period
+        # تمام تحلیل‌گرها از یک تصویر ستونی مشترک دوره استفاده می‌کنند
+        self.snapshot = snapshot if snapshot is not None else LedgerSnapshot.load(company, period)
         self.analyzers = {
-            'balance_sheet': BalanceSheetAnalyzer(company, period),
-            'cash_bank': CashBankAnalyzer(company, period),
-            'revenue': RevenueAnalyzer(company, period),
-            'expense': ExpenseAnalyzer(company, period)
+            'balance_sheet': BalanceSheetAnalyzer(company, period, self.snapshot),
+            'cash_bank': CashBankAnalyzer(company, period, self.snapshot),
+            'revenue': RevenueAnalyzer(company, period, self.snapshot),
+            'expense': ExpenseAnalyzer(company, period, self.snapshot)
         }
     
     def generate_comprehensive_report(self) -> Dict[str, Any]:
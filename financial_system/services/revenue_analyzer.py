@@ -4,21 +4,33 @@
 این سرویس برای تحلیل حساب‌های درآمدی طراحی شده است.
 """
 
-from django.db.models import Sum, Q
 from decimal import Decimal
 from typing import Dict, List
-from financial_system.models.document_models import DocumentHeader, DocumentItem
-from financial_system.models.coding_models import ChartOfAccounts
+from financial_system.services.account_hierarchy import from_minor_units
+from financial_system.services.ledger_snapshot import LedgerSnapshot
+from financial_system.services.monthly_ledger import MonthlyLedgerMatrix, growth_rate, seasonality
 from users.models import Company, FinancialPeriod
 
 
 class RevenueAnalyzer:
     """تحلیل‌گر حساب‌های درآمدی"""
     
-    def __init__(self, company: Company, period: FinancialPeriod):
+    def __init__(self, company: Company, period: FinancialPeriod, snapshot: LedgerSnapshot = None):
         self.company = company
         self.period = period
         self.revenue_account_codes = ['4']  # حساب‌های درآمدی (معمولاً با ۴ شروع می‌شوند)
+        self._snapshot = snapshot
+        self._matrix = None
+    
+    @property
+    def matrix(self) -> MonthlyLedgerMatrix:
+        """ماتریس (حساب × ماه) دوره؛ از تصویر مشترک یا با یک کوئری گروه‌بندی‌شده"""
+        if self._matrix is None:
+            if self._snapshot is not None:
+                self._matrix = MonthlyLedgerMatrix.from_snapshot(self._snapshot)
+            else:
+                self._matrix = MonthlyLedgerMatrix.load(self.company, self.period)
+        return self._matrix
     
     def analyze_revenue(self) -> Dict:
         """تحلیل کامل حساب‌های درآمدی"""
@@ -42,30 +54,17 @@ class RevenueAnalyzer:
     
     def _calculate_total_revenue(self) -> Dict:
         """محاسبه کل درآمدها"""
-        revenue_accounts = ChartOfAccounts.objects.filter(
-            code__startswith='4',
-            is_active=True
-        )
-        
         total_revenue = Decimal('0')
         revenue_details = {}
         
-        for account in revenue_accounts:
-            items = DocumentItem.objects.filter(
-                account=account,
-                document__company=self.company,
-                document__period=self.period
-            )
+        # برای حساب‌های درآمدی: درآمد = بستانکار - بدهکار
+        for account in self.matrix.account_totals(self.revenue_account_codes, debit_nature=False):
+            account_revenue = account['amount']
             
-            # برای حساب‌های درآمدی: درآمد = بستانکار - بدهکار
-            account_debit = items.aggregate(total=Sum('debit'))['total'] or Decimal('0')
-            account_credit = items.aggregate(total=Sum('credit'))['total'] or Decimal('0')
-            account_revenue = account_credit - account_debit
-            
-            revenue_details[account.code] = {
-                'account_name': account.name,
+            revenue_details[account['code']] = {
+                'account_name': account['name'],
                 'revenue': account_revenue,
-                'transaction_count': items.count()
+                'transaction_count': account['transaction_count']
             }
             
             total_revenue += account_revenue
@@ -83,131 +82,48 @@ class RevenueAnalyzer:
             'سایر درآمدها': ['43', '44', '45']  # سایر درآمدهای عملیاتی و غیرعملیاتی
         }
         
-        analysis = {}
-        total = Decimal('0')
+        # جمع هر نوع با یک ضرب ماتریسی (نوع × حساب) در (حساب × ماه)
+        type_totals = self.matrix.group_matrix(revenue_types, debit_nature=False).sum(axis=1)
+        total = from_minor_units(type_totals.sum())
         
-        for revenue_type, codes in revenue_types.items():
-            type_revenue = Decimal('0')
-            type_details = {}
-            
-            for code_prefix in codes:
-                accounts = ChartOfAccounts.objects.filter(
-                    code__startswith=code_prefix,
-                    is_active=True
-                )
-                
-                for account in accounts:
-                    items = DocumentItem.objects.filter(
-                        account=account,
-                        document__company=self.company,
-                        document__period=self.period
-                    )
-                    
-                    account_debit = items.aggregate(total=Sum('debit'))['total'] or Decimal('0')
-                    account_credit = items.aggregate(total=Sum('credit'))['total'] or Decimal('0')
-                    account_revenue = account_credit - account_debit
-                    
-                    type_details[account.code] = {
-                        'account_name': account.name,
-                        'revenue': account_revenue
-                    }
-                    
-                    type_revenue += account_revenue
-            
+        analysis = {}
+        for index, (revenue_type, codes) in enumerate(revenue_types.items()):
+            type_revenue = from_minor_units(type_totals[index])
             analysis[revenue_type] = {
                 'total': type_revenue,
                 'percentage': (type_revenue / total * 100) if total > 0 else Decimal('0'),
-                'details': type_details
+                'details': {
+                    account['code']: {
+                        'account_name': account['name'],
+                        'revenue': account['amount']
+                    }
+                    for account in self.matrix.account_totals(codes, debit_nature=False)
+                }
             }
-            
-            total += type_revenue
-        
-        # محاسبه درصدها
-        for revenue_type in analysis:
-            if total > 0:
-                analysis[revenue_type]['percentage'] = (analysis[revenue_type]['total'] / total * 100)
         
         analysis['total'] = total
         return analysis
     
     def _analyze_monthly_trend(self) -> Dict:
         """تحلیل روند ماهانه درآمد"""
-        revenue_accounts = ChartOfAccounts.objects.filter(
-            code__startswith='4',
-            is_active=True
-        )
+        # سری ماهانه (به ترتیب ماه) برای درآمد: بستانکار منهای بدهکار
+        series, counts = self.matrix.monthly(self.revenue_account_codes, debit_nature=False)
+        labels = self.matrix.monthly_labels(self.revenue_account_codes)
         
-        monthly_data = {}
-        
-        for account in revenue_accounts:
-            items = DocumentItem.objects.filter(
-                account=account,
-                document__company=self.company,
-                document__period=self.period
-            ).select_related('document')
-            
-            for item in items:
-                month_key = item.document.document_date.strftime('%Y-%m')
-                if month_key not in monthly_data:
-                    monthly_data[month_key] = {
-                        'revenue': Decimal('0'),
-                        'transactions': 0
-                    }
-                
-                # برای درآمد: بستانکار منهای بدهکار
-                monthly_data[month_key]['revenue'] += (item.credit - item.debit)
-                monthly_data[month_key]['transactions'] += 1
-        
-        # مرتب‌سازی بر اساس ماه
-        sorted_months = sorted(monthly_data.keys())
         trend_analysis = {
-            'monthly_data': {month: monthly_data[month] for month in sorted_months},
-            'growth_rate': self._calculate_growth_rate(monthly_data),
-            'seasonality': self._analyze_seasonality(monthly_data)
+            'monthly_data': {
+                month: {
+                    'revenue': from_minor_units(series[index]),
+                    'transactions': int(counts[index])
+                }
+                for index, month in enumerate(labels)
+            },
+            'growth_rate': growth_rate(series),
+            'seasonality': seasonality(labels, series)
         }
         
         return trend_analysis
     
-    def _calculate_growth_rate(self, monthly_data: Dict) -> Decimal:
-        """محاسبه نرخ رشد درآمد"""
-        if len(monthly_data) < 2:
-            return Decimal('0')
-        
-        sorted_months = sorted(monthly_data.keys())
-        first_month_revenue = monthly_data[sorted_months[0]]['revenue']
-        last_month_revenue = monthly_data[sorted_months[-1]]['revenue']
-        
-        if first_month_revenue > 0:
-            growth_rate = ((last_month_revenue - first_month_revenue) / first_month_revenue) * 100
-            return growth_rate
-        
-        return Decimal('0')
-    
-    def _analyze_seasonality(self, monthly_data: Dict) -> Dict:
-        """تحلیل فصلی بودن درآمد"""
-        if len(monthly_data) < 3:
-            return {'message': 'داده کافی برای تحلیل فصلی وجود ندارد'}
-        
-        # محاسبه میانگین ماهانه
-        monthly_totals = [data['revenue'] for data in monthly_data.values()]
-        average_monthly = sum(monthly_totals) / len(monthly_totals)
-        
-        # شناسایی ماه‌های پیک و افت
-        peak_month = max(monthly_data, key=lambda x: monthly_data[x]['revenue'])
-        low_month = min(monthly_data, key=lambda x: monthly_data[x]['revenue'])
-        
-        peak_value = monthly_data[peak_month]['revenue']
-        low_value = monthly_data[low_month]['revenue']
-        
-        return {
-            'average_monthly': average_monthly,
-            'peak_month': peak_month,
-            'peak_value': peak_value,
-            'low_month': low_month,
-            'low_value': low_value,
-            'seasonality_index': (peak_value - low_value) / average_monthly if average_monthly > 0 else Decimal('0')
-        }
-    
     def _analyze_revenue_composition(self) -> Dict:
         """تحلیل ترکیب درآمد"""
         revenue_by_type = self._analyze_revenue_by_type()
@@ -0,0 +1,344 @@
+# financial_system/services/risk_scoring.py
+"""
+امتیازدهی افزایشی ریسک تقلب در مرحله ورود اطلاعات
+پس از هر ورود اطلاعات فقط اسناد جدید (شناسه بزرگ‌تر از آخرین سند امتیازدهی‌شده) بارگذاری می‌شوند و
+ویژگی‌های هر سند (سهم مبالغ گرد، پایان دوره، اثر انگشت تکرار، بیشینه z مبالغ در برابر خط مبنای حساب)
+و نمایه تجمعی هر حساب (تعداد، جمع، جمع مربعات، شمارش‌های ریسک) به‌روز و در جدول ریسک ذخیره می‌شوند.
+ابزارهای تقلب این جدول را با کوئری‌های نمایه‌دار می‌خوانند (بیشینه مبلغ آرتیکل برای سقف انتقال، امضای
+MinHash شرح برای شرح‌های مشابه). اگر دفتر پس از آخرین امتیازدهی خارج از ورود اطلاعات تغییر کرده باشد
+(ویرایش یا حذف)، جدول دوره با یک پیمایش برداری بازسازی می‌شود.
+"""
+
+import hashlib
+import logging
+from datetime import timedelta
+from typing import Dict, List
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from financial_system.models.document_models import DocumentHeader
+from financial_system.models.risk_models import AccountRiskProfile, DocumentRiskScore, RiskScoringState
+from financial_system.services.description_index import DescriptionLSHIndex
+from financial_system.services.digit_analysis import round_amount_mask
+from financial_system.services.jalali_calendar import gregorian_to_date_key
+from financial_system.services.ledger_snapshot import LedgerSnapshot
+from financial_system.services.report_cache import get_ledger_version
+from users.models import Company, FinancialPeriod
+
+logger = logging.getLogger(__name__)
+
+# واحد مبلغ گرد (ریال)، طول بازه پایان دوره (روز)، آستانه z مبلغ پرت و حداقل نمونه خط مبنای حساب
+RISK_ROUND_UNIT = 1000000
+END_OF_PERIOD_DAYS = 7
+OUTLIER_ZSCORE = 3.0
+MIN_BASELINE_ITEMS = 10
+
+# وزن هر ویژگی در امتیاز ریسک ۰ تا ۱۰۰
+RISK_WEIGHTS = {'round': 20, 'end_of_period': 15, 'duplicate': 30, 'outlier': 35}
+
+# حداکثر اسناد فهرست‌شده در پاسخ ابزارها
+DOCUMENT_LIST_LIMIT = 100
+
+_IN_BATCH = 500
+
+
+class RiskScoringService:
+    """جدول ریسک اسناد و حساب‌های یک شرکت و دوره"""
+
+    def __init__(self, company: Company, period: FinancialPeriod):
+        self.company = company
+        self.period = period
+        self._current = False
+
+    def _scope(self) -> Dict:
+        return {'company': self.company, 'period': self.period}
+
+    def score_import(self, previous_version: int, rebuild: bool = False) -> Dict:
+        """
+        مرحله امتیازدهی ورود اطلاعات؛ previous_version نسخه دفتر پیش از ورود است.
+        امتیازدهی افزایشی فقط وقتی معتبر است که جدول با نسخه پیش از ورود همگام بوده و ورود فقط یک نسخه افزوده باشد.
+        """
+        version = get_ledger_version(self.company.id, self.period.id)
+        state = RiskScoringState.objects.filter(**self._scope()).first()
+        incremental = (
+            not rebuild
+            and state is not None
+            and state.ledger_version == previous_version
+            and version <= previous_version + 1
+        )
+        return self._score(incremental, version)
+
+    def ensure_current(self) -> None:
+        """همگام‌سازی جدول با نسخه جاری دفتر؛ فقط وقتی نسخه ذخیره‌شده کهنه باشد بازسازی و در هر نمونه یک بار بررسی می‌شود"""
+        if self._current:
+            return
+        version = get_ledger_version(self.company.id, self.period.id)
+        state = RiskScoringState.objects.filter(**self._scope()).values_list('ledger_version', flat=True).first()
+        if state is None or state != version:
+            self._score(False, version)
+        self._current = True
+
+    def rebuild(self) -> Dict:
+        return self._score(False, get_ledger_version(self.company.id, self.period.id))
+
+    @transaction.atomic
+    def _score(self, incremental: bool, version: int) -> Dict:
+        scope = self._scope()
+        if incremental:
+            watermark = RiskScoringState.objects.filter(**scope).values_list('last_document_id', flat=True).first() or 0
+        else:
+            DocumentRiskScore.objects.filter(**scope).delete()
+            AccountRiskProfile.objects.filter(**scope).delete()
+            watermark = 0
+
+        headers = list(
+            DocumentHeader.objects.filter(**scope, id__gt=watermark).values_list(
+                'id', 'date_key', 'description'
+            ).order_by('id')
+        )
+        scored = self._score_documents(headers, watermark) if headers else 0
+
+        RiskScoringState.objects.update_or_create(
+            **scope,
+            defaults={'last_document_id': headers[-1][0] if headers else watermark, 'ledger_version': version},
+        )
+        logger.info(f"امتیازدهی ریسک {self.company.id}/{self.period.id}: {scored} سند ({'افزایشی' if incremental else 'کامل'})")
+        return {'incremental': incremental, 'scored_documents': scored, 'ledger_version': version}
+
+    def _score_documents(self, headers: List, watermark: int) -> int:
+        """محاسبه برداری ویژگی‌های اسناد جدید و به‌روزرسانی نمایه حساب‌ها"""
+        document_ids = np.array([header[0] for header in headers], dtype=np.int64)
+        header_dates = np.array([header[1] for header in headers], dtype=np.int64)
+        period_end = gregorian_to_date_key(self.period.end_date)
+        end_of_period_start = gregorian_to_date_key(self.period.end_date - timedelta(days=END_OF_PERIOD_DAYS))
+
+        snapshot = LedgerSnapshot.load(self.company, self.period, documents_after=watermark)
+        # اسنادی که پس از خواندن سربرگ‌ها ایجاد شده‌اند در امتیازدهی بعدی بررسی می‌شوند
+        known = np.isin(snapshot.document_ids, document_ids)
+        amounts = snapshot.amounts[known]
+        account_ids = snapshot.account_ids[known]
+        signed = (snapshot.debits - snapshot.credits)[known]
+        item_dates = snapshot.date_keys[known]
+        document_position = np.searchsorted(document_ids, snapshot.document_ids[known])
+        accounts, account_position = np.unique(account_ids, return_inverse=True)
+
+        positive = amounts > 0
+        is_round = round_amount_mask(amounts, RISK_ROUND_UNIT)
+        is_end_of_period = (item_dates >= end_of_period_start) & (item_dates <= period_end)
+
+        # خط مبنای حساب: نمایه ذخیره‌شده به علاوه آرتیکل‌های همین ورود
+        profiles = {
+            profile['account_id']: profile
+            for profile in AccountRiskProfile.objects.filter(
+                **self._scope(), account_id__in=accounts.tolist()
+            ).values()
+        } if watermark else {}
+        previous = np.array([
+            [profiles.get(account_id, {}).get(field, 0) for field in
+             ('item_count', 'amount_sum', 'amount_sum_squares', 'round_count', 'end_of_period_count', 'outlier_count', 'max_zscore')]
+            for account_id in accounts.tolist()
+        ], dtype=np.float64).reshape(accounts.size, 7)
+
+        counts = previous[:, 0] + np.bincount(account_position, weights=positive, minlength=accounts.size)
+        # جمع مبالغ به صورت int64 دقیق (بدون گذر از float)
+        sums = np.array([profiles.get(account_id, {}).get('amount_sum', 0) for account_id in accounts.tolist()], dtype=np.int64)
+        np.add.at(sums, account_position, amounts)
+        squares = previous[:, 2] + np.bincount(account_position, weights=amounts.astype(np.float64) ** 2, minlength=accounts.size)
+        means = np.divide(sums, counts, out=np.zeros(accounts.size), where=counts > 0)
+        stds = np.sqrt(np.maximum(np.divide(squares, counts, out=np.zeros(accounts.size), where=counts > 0) - means ** 2, 0))
+
+        usable = (counts >= MIN_BASELINE_ITEMS) & (stds > 0)
+        zscores = np.where(
+            positive & usable[account_position],
+            np.abs(amounts - means[account_position]) / np.where(stds > 0, stds, 1)[account_position],
+            0.0,
+        )
+        is_outlier = zscores >= OUTLIER_ZSCORE
+
+        self._save_profiles(accounts, counts, sums, squares, previous, account_position, is_round, is_end_of_period,
+                            is_outlier, zscores)
+
+        # ویژگی‌های هر سند
+        document_count = document_ids.size
+        item_counts = np.bincount(document_position, weights=positive, minlength=document_count)
+        totals = np.zeros(document_count, dtype=np.int64)
+        np.add.at(totals, document_position, amounts)
+        max_amounts = np.zeros(document_count, dtype=np.int64)
+        np.maximum.at(max_amounts, document_position, amounts)
+        round_counts = np.bincount(document_position, weights=is_round, minlength=document_count)
+        max_zscores = np.zeros(document_count)
+        np.maximum.at(max_zscores, document_position, zscores)
+        document_end_of_period = (header_dates >= end_of_period_start) & (header_dates <= period_end)
+        fingerprints = self._fingerprints(document_count, document_position, account_ids, signed)
+        duplicates = self._duplicate_fingerprints(fingerprints, incremental=bool(watermark))
+        signatures = DescriptionLSHIndex().signature_bytes([header[2] for header in headers])
+
+        scores = []
+        for index, document_id in enumerate(document_ids.tolist()):
+            round_share = float(round_counts[index] / item_counts[index]) if item_counts[index] else 0.0
+            is_duplicate = bool(fingerprints[index]) and fingerprints[index] in duplicates
+            scores.append(DocumentRiskScore(
+                document_id=document_id,
+                **self._scope(),
+                item_count=int(item_counts[index]),
+                total_amount=int(totals[index]),
+                max_amount=int(max_amounts[index]),
+                round_share=round_share,
+                is_end_of_period=bool(document_end_of_period[index]),
+                fingerprint=fingerprints[index],
+                is_duplicate=is_duplicate,
+                max_zscore=float(max_zscores[index]),
+                description_signature=signatures[index],
+                risk_score=risk_score(round_share, bool(document_end_of_period[index]), is_duplicate, float(max_zscores[index])),
+            ))
+        DocumentRiskScore.objects.bulk_create(scores, batch_size=1000)
+        return len(scores)
+
+    def _save_profiles(self, accounts, counts, sums, squares, previous, account_position, is_round, is_end_of_period,
+                       is_outlier, zscores) -> None:
+        """درج یا به‌روزرسانی نمایه حساب‌ها با یک دستور گروهی"""
+        size = accounts.size
+        max_zscores = previous[:, 6].copy()
+        np.maximum.at(max_zscores, account_position, zscores)
+        round_counts = previous[:, 3] + np.bincount(account_position, weights=is_round, minlength=size)
+        end_counts = previous[:, 4] + np.bincount(account_position, weights=is_end_of_period, minlength=size)
+        outlier_counts = previous[:, 5] + np.bincount(account_position, weights=is_outlier, minlength=size)
+        AccountRiskProfile.objects.bulk_create(
+            [
+                AccountRiskProfile(
+                    **self._scope(),
+                    account_id=int(accounts[index]),
+                    item_count=int(counts[index]),
+                    amount_sum=int(sums[index]),
+                    amount_sum_squares=float(squares[index]),
+                    round_count=int(round_counts[index]),
+                    end_of_period_count=int(end_counts[index]),
+                    outlier_count=int(outlier_counts[index]),
+                    max_zscore=float(max_zscores[index]),
+                )
+                for index in range(size)
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['company', 'period', 'account'],
+            update_fields=['item_count', 'amount_sum', 'amount_sum_squares', 'round_count', 'end_of_period_count',
+                           'outlier_count', 'max_zscore'],
+        )
+
+    @staticmethod
+    def _fingerprints(document_count: int, document_position, account_ids, signed) -> List[str]:
+        """اثر انگشت هر سند: هش آرتیکل‌های مرتب‌شده (حساب، مبلغ علامت‌دار)؛ برای سند بدون آرتیکل رشته خالی"""
+        order = np.lexsort((signed, account_ids, document_position))
+        rows = np.stack([account_ids[order], signed[order]], axis=1)
+        boundaries = np.searchsorted(document_position[order], np.arange(document_count + 1))
+        return [
+            hashlib.md5(rows[start:end].tobytes()).hexdigest() if end > start else ''
+            for start, end in zip(boundaries[:-1].tolist(), boundaries[1:].tolist())
+        ]
+
+    def _duplicate_fingerprints(self, fingerprints: List[str], incremental: bool) -> set:
+        """اثر انگشت‌های تکراری در همین ورود یا در اسناد امتیازدهی‌شده قبلی (که تکراری علامت می‌خورند)"""
+        seen, duplicates = set(), set()
+        for fingerprint in fingerprints:
+            if fingerprint:
+                (duplicates if fingerprint in seen else seen).add(fingerprint)
+        if not incremental:
+            return duplicates
+
+        candidates = list(seen)
+        existing = set()
+        for start in range(0, len(candidates), _IN_BATCH):
+            existing.update(DocumentRiskScore.objects.filter(
+                **self._scope(), fingerprint__in=candidates[start:start + _IN_BATCH]
+            ).values_list('fingerprint', flat=True))
+        if existing:
+            existing_list = list(existing)
+            for start in range(0, len(existing_list), _IN_BATCH):
+                DocumentRiskScore.objects.filter(
+                    **self._scope(), fingerprint__in=existing_list[start:start + _IN_BATCH], is_duplicate=False
+                ).update(is_duplicate=True, risk_score=F('risk_score') + RISK_WEIGHTS['duplicate'])
+        return duplicates | existing
+
+    def top_documents(self, limit: int = 20) -> List[Dict]:
+        """پرریسک‌ترین اسناد دوره (کوئری نمایه‌دار روی جدول ریسک)"""
+        self.ensure_current()
+        return list(
+            DocumentRiskScore.objects.filter(**self._scope()).order_by('-risk_score').values(
+                'document_id', 'document__document_number', 'document__document_date', 'item_count',
+                'round_share', 'is_end_of_period', 'is_duplicate', 'max_zscore', 'risk_score'
+            )[:limit]
+        )
+
+    def account_profiles(self, limit: int = 20, order_by=('-outlier_count', '-max_zscore')) -> List[Dict]:
+        """حساب‌ها به ترتیب تعداد مبالغ پرت و بیشینه z (یا ترتیب داده‌شده)"""
+        self.ensure_current()
+        return list(
+            AccountRiskProfile.objects.filter(**self._scope()).order_by(*order_by).values(
+                'account__code', 'account__name', 'item_count', 'round_count', 'end_of_period_count',
+                'outlier_count', 'max_zscore'
+            )[:limit]
+        )
+
+    def documents(self, limit: int = DOCUMENT_LIST_LIMIT, order_by: str = '-risk_score', **filters) -> List[Dict]:
+        """اسناد جدول ریسک با فیلتر روی ویژگی‌های ذخیره‌شده (کوئری نمایه‌دار)"""
+        self.ensure_current()
+        return list(
+            DocumentRiskScore.objects.filter(**self._scope(), **filters).order_by(order_by, 'document_id').values(
+                'document_id', 'document__document_number', 'document__document_date', 'document__description',
+                'item_count', 'total_amount', 'max_amount', 'round_share', 'is_end_of_period', 'is_duplicate',
+                'max_zscore', 'risk_score'
+            )[:limit]
+        )
+
+    def count(self, **filters) -> int:
+        self.ensure_current()
+        return DocumentRiskScore.objects.filter(**self._scope(), **filters).count()
+
+    def document_ids(self, **filters):
+        """زیرکوئری شناسه اسناد منطبق برای فیلتر آرتیکل‌ها"""
+        self.ensure_current()
+        return DocumentRiskScore.objects.filter(**self._scope(), **filters).values('document_id')
+
+    def duplicate_groups(self) -> List[Dict]:
+        """گروه اسناد با اثر انگشت آرتیکل یکسان (نمایه اثر انگشت)"""
+        self.ensure_current()
+        groups: Dict[str, List[Dict]] = {}
+        for document in DocumentRiskScore.objects.filter(**self._scope(), is_duplicate=True).order_by(
+            'fingerprint', 'document_id'
+        ).values('fingerprint', 'document_id', 'document__document_number', 'document__document_date', 'total_amount'):
+            groups.setdefault(document.pop('fingerprint'), []).append(document)
+        return [{'fingerprint': fingerprint, 'count': len(documents), 'documents': documents}
+                for fingerprint, documents in groups.items()]
+
+    def description_signatures(self) -> List:
+        """(شناسه سند، شماره سند، شرح، امضای MinHash) اسناد دارای شرح"""
+        self.ensure_current()
+        return list(
+            DocumentRiskScore.objects.filter(**self._scope()).exclude(description_signature=b'').values_list(
+                'document_id', 'document__document_number', 'document__description', 'description_signature'
+            )
+        )
+
+    def summary(self) -> Dict:
+        """شمارش‌های ریسک دوره با یک کوئری تجمعی"""
+        self.ensure_current()
+        return DocumentRiskScore.objects.filter(**self._scope()).aggregate(
+            documents=Count('id'),
+            end_of_period_documents=Count('id', filter=Q(is_end_of_period=True)),
+            duplicate_documents=Count('id', filter=Q(is_duplicate=True)),
+            outlier_documents=Count('id', filter=Q(max_zscore__gte=OUTLIER_ZSCORE)),
+            total_amount=Sum('total_amount'),
+        )
+
+
+def risk_score(round_share: float, is_end_of_period: bool, is_duplicate: bool, max_zscore: float) -> float:
+    """امتیاز ریسک ۰ تا ۱۰۰ از ویژگی‌های سند"""
+    return round(
+        RISK_WEIGHTS['round'] * round_share
+        + RISK_WEIGHTS['end_of_period'] * is_end_of_period
+        + RISK_WEIGHTS['duplicate'] * is_duplicate
+        + RISK_WEIGHTS['outlier'] * min(max_zscore / OUTLIER_ZSCORE, 1.0),
+        2,
+    )
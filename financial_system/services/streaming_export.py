@@ -0,0 +1,207 @@
+# financial_system/services/streaming_export.py
+"""
+خروجی جریانی (Streaming) گزارش‌ها به CSV و Excel
+ردیف‌ها با iterator (کرسر سمت سرور در PostgreSQL) دسته‌دسته از دیتابیس خوانده می‌شوند و هر دو
+قالب بلافاصله و تکه‌تکه برای کاربر ارسال می‌شوند: XLSX مستقیماً به صورت بسته zip با توصیف‌گر داده
+(بدون نیاز به پیمایش خروجی) ساخته می‌شود و XML کاربرگ ردیف به ردیف فشرده و ارسال می‌شود، بنابراین نه
+فایل موقتی لازم است و نه مصرف حافظه به تعداد ردیف‌ها بستگی دارد.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from decimal import Decimal
+from itertools import chain
+from typing import Iterable, Iterator, List, Optional, Sequence
+from xml.sax.saxutils import escape, quoteattr
+
+from django.db.models import Count, Sum
+from django.http import StreamingHttpResponse
+
+from financial_system.models.document_models import DocumentHeader, DocumentItem, make_date_key
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+# تعداد ردیف هر دسته خواندن از دیتابیس و هر تکه ارسالی CSV
+EXPORT_CHUNK_SIZE = 2000
+
+LEDGER_HEADER = ['کد حساب', 'نام حساب', 'تاریخ', 'شماره سند', 'ردیف', 'شرح', 'مرکز هزینه', 'بدهکار', 'بستانکار', 'مانده']
+DOCUMENT_HEADER = ['شماره سند', 'تاریخ', 'نوع سند', 'شرح', 'تعداد ردیف', 'جمع بدهکار', 'جمع بستانکار']
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# اجزای ثابت بسته XLSX تک‌کاربرگی (کاربرگ به صورت جریانی نوشته می‌شود)
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name={name} sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+_XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView rightToLeft="1" workbookViewId="0"/></sheetViews><sheetData>'
+)
+_XLSX_SHEET_END = '</sheetData></worksheet>'
+
+# نویسه‌های کنترلی که در XML مجاز نیستند
+_XML_ILLEGAL = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# نویسه‌های غیرمجاز در نام کاربرگ Excel
+_SHEET_NAME_ILLEGAL = re.compile(r'[\\/?*\[\]:]')
+
+
+def stream_csv(header: Sequence[str], rows: Iterable[Sequence]) -> Iterator[bytes]:
+    """تولید تکه‌های CSV (با BOM برای نمایش درست فارسی در Excel)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+
+    for index, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if index % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """مقصد نوشتن غیرقابل پیمایش zip که بایت‌های نوشته‌شده را تا ارسال تکه بعدی نگه می‌دارد"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _xlsx_cell(value) -> str:
+    """XML یک خانه: اعداد مقدار عددی و بقیه رشته درون‌خطی"""
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_XML_ILLEGAL.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def stream_xlsx(title: str, header: Sequence[str], rows: Iterable[Sequence]) -> Iterator[bytes]:
+    """تولید تکه‌های فایل XLSX تک‌کاربرگی (راست‌به‌چپ) هم‌زمان با خواندن ردیف‌ها"""
+    buffer = _ChunkBuffer()
+    sheet_name = _SHEET_NAME_ILLEGAL.sub(' ', title)[:31] or 'Sheet1'
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        archive.writestr('xl/workbook.xml', _XLSX_WORKBOOK.format(name=quoteattr(sheet_name)))
+        yield buffer.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(_XLSX_SHEET_START.encode('utf-8'))
+            for index, row in enumerate(chain([header], rows), start=1):
+                sheet.write(f'<row>{"".join(_xlsx_cell(value) for value in row)}</row>'.encode('utf-8'))
+                if index % EXPORT_CHUNK_SIZE == 0:
+                    chunk = buffer.drain()
+                    if chunk:
+                        yield chunk
+            sheet.write(_XLSX_SHEET_END.encode('utf-8'))
+    yield buffer.drain()
+
+
+def export_response(export_format: str, filename: str, title: str, header: Sequence[str], rows: Iterable[Sequence]):
+    """پاسخ HTTP جریانی برای قالب CSV یا XLSX"""
+    if export_format == 'xlsx':
+        response = StreamingHttpResponse(stream_xlsx(title, header, rows), content_type=XLSX_CONTENT_TYPE)
+        response['Content-Disposition'] = f'attachment; filename="{filename}.xlsx"'
+        return response
+
+    response = StreamingHttpResponse(stream_csv(header, rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def ledger_rows(company_id: int, period_id: int, account_code: Optional[str] = None,
+                start_date: Optional[str] = None, end_date: Optional[str] = None) -> Iterator[List]:
+    """ردیف‌های دفتر کل به ترتیب حساب و تاریخ با مانده جاری هر حساب"""
+    queryset = DocumentItem.objects.filter(
+        document__company_id=company_id,
+        document__period_id=period_id
+    )
+    if account_code:
+        queryset = queryset.filter(account__code__startswith=account_code)
+    if start_date:
+        queryset = queryset.filter(document__date_key__gte=make_date_key(start_date))
+    if end_date:
+        queryset = queryset.filter(document__date_key__lte=make_date_key(end_date))
+
+    rows = queryset.order_by(
+        'account__code', 'document__date_key', 'document__document_number', 'row_number'
+    ).values_list(
+        'account__code', 'account__name', 'document__document_date', 'document__document_number',
+        'row_number', 'description', 'cost_center', 'debit', 'credit'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    current_code, balance = None, Decimal('0')
+    for code, name, date, number, row_number, description, cost_center, debit, credit in rows:
+        if code != current_code:
+            current_code, balance = code, Decimal('0')
+        balance += debit - credit
+        yield [code, name, date, number, row_number, description, cost_center, debit, credit, balance]
+
+
+def document_rows(company_id: int, period_id: int) -> Iterator[List]:
+    """ردیف‌های فهرست اسناد با جمع بدهکار و بستانکار هر سند"""
+    rows = DocumentHeader.objects.filter(
+        company_id=company_id,
+        period_id=period_id
+    ).annotate(
+        item_count=Count('items'),
+        items_debit=Sum('items__debit'),
+        items_credit=Sum('items__credit')
+    ).order_by('date_key', 'document_number').values_list(
+        'document_number', 'document_date', 'document_type', 'description',
+        'item_count', 'items_debit', 'items_credit'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    for row in rows:
+        yield [*row[:5], row[5] or Decimal('0'), row[6] or Decimal('0')]
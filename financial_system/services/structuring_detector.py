@@ -0,0 +1,127 @@
+# financial_system/services/structuring_detector.py
+"""
+شناسایی تفکیک مبالغ (structuring) پیرامون سقف مجاز
+برای هر حساب (حساب‌های تفصیلی همان طرف حساب‌اند) و هر طرف بدهکار/بستانکار، آرتیکل‌های زیر سقف بر اساس
+روز مرتب می‌شوند و جمع پنجره‌های لغزان N روزه با جمع تجمعی و searchsorted در O(n log n) محاسبه می‌شود.
+پنجره‌هایی که جمعشان به سقف می‌رسد در حالی که هر آرتیکل به تنهایی زیر سقف است علامت می‌خورند و
+پنجره‌های هم‌پوشان یک حساب در یک مورد ادغام می‌شوند. قواعد (سقف، طول بازه، حداقل تعداد) برای هر شرکت
+در StructuringRule تنظیم می‌شوند.
+"""
+
+from decimal import Decimal
+from typing import Dict, List
+
+import numpy as np
+
+from financial_system.models.control_models import StructuringRule
+from financial_system.services.account_hierarchy import from_minor_units, to_minor_units
+from financial_system.services.jalali_calendar import day_numbers
+from financial_system.services.ledger_snapshot import LedgerSnapshot
+from financial_system.services.report_cache import cached_report
+from users.models import Company, FinancialPeriod
+
+# قاعده پیش‌فرض شرکت‌های بدون قاعده ثبت‌شده (سقف انتقال وجه ابزار ThresholdHitTool)
+DEFAULT_STRUCTURING_THRESHOLD = Decimal('50000000')
+DEFAULT_STRUCTURING_WINDOW_DAYS = 7
+DEFAULT_STRUCTURING_MIN_ITEMS = 2
+
+# فاصله کلید گروه‌ها در کلید ترکیبی (گروه، روز)؛ بزرگ‌تر از هر شماره روز
+_GROUP_STRIDE = 10 ** 7
+
+
+def structuring_rules(company: Company) -> List[StructuringRule]:
+    """قواعد فعال شرکت یا قاعده پیش‌فرض (ذخیره‌نشده) روی همه حساب‌ها"""
+    rules = list(StructuringRule.objects.filter(company=company, is_active=True).order_by('account_prefix'))
+    return rules or [StructuringRule(
+        company=company,
+        account_prefix='',
+        threshold_amount=DEFAULT_STRUCTURING_THRESHOLD,
+        window_days=DEFAULT_STRUCTURING_WINDOW_DAYS,
+        min_items=DEFAULT_STRUCTURING_MIN_ITEMS,
+    )]
+
+
+class StructuringDetector:
+    """پنجره‌های لغزان روزانه روی آرتیکل‌های زیر سقف تصویر دوره"""
+
+    def __init__(self, snapshot: LedgerSnapshot):
+        self.snapshot = snapshot
+        debit_rows = np.flatnonzero(snapshot.debits > 0)
+        credit_rows = np.flatnonzero(snapshot.credits > 0)
+        self.rows = np.concatenate([debit_rows, credit_rows])
+        self.is_credit = np.arange(self.rows.size) >= debit_rows.size
+        self.amounts = np.concatenate([snapshot.debits[debit_rows], snapshot.credits[credit_rows]])
+        self.days = day_numbers(snapshot.date_keys[self.rows])
+
+    def windows(self, rule: StructuringRule) -> List[Dict]:
+        """موارد تفکیک یک قاعده: پنجره‌های ادغام‌شده با جمع به سقف رسیده و آرتیکل‌های تکی زیر سقف"""
+        snapshot = self.snapshot
+        threshold = int(to_minor_units([rule.threshold_amount])[0])
+        selected = (
+            (self.amounts < threshold)
+            & (self.days >= 0)
+            & snapshot.row_mask([rule.account_prefix or ''], active_only=False)[self.rows]
+        )
+        if np.count_nonzero(selected) < max(rule.min_items, 2):
+            return []
+
+        groups = snapshot.account_position[self.rows[selected]] * 2 + self.is_credit[selected]
+        days = self.days[selected]
+        order = np.lexsort((days, groups))
+        rows, groups, days = self.rows[selected][order], groups[order], days[order]
+        amounts = self.amounts[selected][order]
+        is_credit = self.is_credit[selected][order]
+
+        # شروع پنجره هر آرتیکل: اولین آرتیکل همان گروه با روز >= روز آرتیکل - (N - 1)
+        keys = groups.astype(np.int64) * _GROUP_STRIDE + days
+        starts = np.searchsorted(keys, keys - (max(rule.window_days, 1) - 1), side='left')
+        cumulative = np.concatenate([[0], np.cumsum(amounts)])
+        ends = np.arange(keys.size)
+        totals = cumulative[ends + 1] - cumulative[starts]
+        flagged = np.flatnonzero((totals >= threshold) & (ends - starts + 1 >= max(rule.min_items, 2)))
+        if not flagged.size:
+            return []
+
+        # ادغام پنجره‌های هم‌پوشان یک گروه (پنجره‌ها به ترتیب انتها مرتب‌اند)
+        new_incident = np.r_[True, (starts[flagged[1:]] > flagged[:-1]) | (groups[flagged[1:]] != groups[flagged[:-1]])]
+        first_start = starts[flagged[new_incident]]
+        last_end = np.maximum.reduceat(flagged, np.flatnonzero(new_incident))
+        peak = np.maximum.reduceat(totals[flagged], np.flatnonzero(new_incident))
+
+        incidents = []
+        for incident, (start, end) in enumerate(zip(first_start.tolist(), last_end.tolist())):
+            position = snapshot.account_position[rows[start]]
+            span = slice(start, end + 1)
+            incidents.append({
+                'rule_account_prefix': rule.account_prefix,
+                'account_code': str(snapshot.account_codes[position]),
+                'account_name': snapshot.account_names[position],
+                'type': 'credit' if is_credit[start] else 'debit',
+                'items_count': end - start + 1,
+                'total_amount': from_minor_units(amounts[span].sum()),
+                'max_window_total': from_minor_units(peak[incident]),
+                'max_item_amount': from_minor_units(amounts[span].max()),
+                'first_date_key': int(snapshot.date_keys[rows[start]]),
+                'last_date_key': int(snapshot.date_keys[rows[end]]),
+                'item_ids': snapshot.item_ids[rows[span]].tolist(),
+            })
+        return incidents
+
+    def detect(self, rules: List[StructuringRule]) -> List[Dict]:
+        """موارد تمام قواعد به ترتیب نزولی بیشینه جمع پنجره"""
+        incidents = []
+        for rule in rules:
+            incidents.extend(self.windows(rule))
+        return sorted(incidents, key=lambda incident: incident['max_window_total'], reverse=True)
+
+
+def structuring_incidents(company: Company, period: FinancialPeriod) -> List[Dict]:
+    """موارد تفکیک مبالغ دوره با قواعد فعال شرکت در کش نسخه جاری دفتر (قواعد جزء کلید کش‌اند)"""
+    rules = structuring_rules(company)
+    params = {'rules': [
+        (rule.account_prefix, str(rule.threshold_amount), rule.window_days, rule.min_items) for rule in rules
+    ]}
+    return cached_report(
+        'structuring', company.id, period.id,
+        lambda: StructuringDetector(LedgerSnapshot.load(company, period)).detect(rules), params
+    )
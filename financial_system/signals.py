@@ -0,0 +1,24 @@
+# financial_system/signals.py
+"""
+سیگنال‌های دفتر: ثبت تغییر اسناد برای افزایش نسخه دفتر و باطل شدن کش گزارش‌ها
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from financial_system.models.document_models import DocumentHeader, DocumentItem
+from financial_system.services.report_cache import mark_ledger_changed
+
+
+@receiver([post_save, post_delete], sender=DocumentHeader)
+def document_header_changed(sender, instance, **kwargs):
+    mark_ledger_changed(instance.company_id, instance.period_id)
+
+
+# آرتیکل‌ها گیرنده post_delete ندارند تا حذف آبشاری و گروهی آن‌ها با یک DELETE انجام شود؛
+# مسیرهای حذف گروهی (پاک‌سازی، rollback، بازنویسی سند در ورود اطلاعات) تغییر دفتر را خود ثبت می‌کنند.
+@receiver(post_save, sender=DocumentItem)
+def document_item_saved(sender, instance, **kwargs):
+    # فقط با سربرگ بارگذاری‌شده؛ فراخواننده‌ای که سربرگ را ندارد تغییر را خود ثبت می‌کند
+    if DocumentItem.document.is_cached(instance):
+        mark_ledger_changed(instance.document.company_id, instance.document.period_id)
@@ -0,0 +1,16 @@
+# financial_system/tasks.py
+"""
+تسک‌های زمان‌بندی‌شده سیستم مالی (Celery)
+"""
+
+from typing import Dict, List, Optional
+
+from celery import shared_task
+
+
+@shared_task
+def evaluate_alerts(company_ids: Optional[List[int]] = None, force: bool = False) -> Dict:
+    """ارزیابی گروهی هشدارهای همه شرکت‌ها و ذخیره در جدول تاریخچه"""
+    from financial_system.services.financial_alert_system import FinancialAlertSystem
+
+    return FinancialAlertSystem().evaluate_all(company_ids, force=force)
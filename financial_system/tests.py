@@ -1,3 +1,313 @@
-from django.test import TestCase
+import datetime
+from decimal import Decimal
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+
+from financial_system.models import (
+    ChartOfAccounts, DocumentHeader, DocumentItem, DocumentRiskScore, RiskScoringState, StructuringRule
+)
+from financial_system.services.account_ledger import AccountLedger
+from financial_system.services.description_index import DescriptionLSHIndex, normalize_persian
+from financial_system.services.duplicate_detector import DuplicateDetector
+from financial_system.services.ledger_snapshot import LedgerSnapshot
+from financial_system.services.report_cache import get_ledger_version, ledger_batch, mark_ledger_changed
+from financial_system.services.risk_scoring import RISK_WEIGHTS, RiskScoringService
+from financial_system.services.structuring_detector import StructuringDetector, structuring_rules
+from users.models import Company, CustomUser, FinancialPeriod
+
+
+class DescriptionIndexTests(SimpleTestCase):
+    """جفت‌یابی شرح‌های تقریباً تکراری با نمایه MinHash/LSH"""
+
+    def test_normalize_persian_unifies_letters_and_digits(self):
+        self.assertEqual(normalize_persian('پرداخت قبض مركزي ۱۲'), normalize_persian('پرداخت  قبض مرکزی، 12'))
+
+    def test_identical_descriptions_pair_with_full_score(self):
+        index = DescriptionLSHIndex.build([(1, 'خرید کالا'), (2, 'خريد كالا')])
+        self.assertEqual(index.similar_pairs(), [{'doc1_id': 1, 'doc2_id': 2, 'similarity_score': 1.0}])
+
+    def test_near_duplicates_pair_and_unrelated_do_not(self):
+        index = DescriptionLSHIndex.build([
+            (1, 'پرداخت قبض برق شعبه مرکزی تهران'),
+            (2, 'فروش کالا به مشتری'),
+            (3, 'پرداخت قبض برق شعبه مرکزی تهرن'),
+        ])
+        pairs = index.similar_pairs()
+        self.assertEqual([(pair['doc1_id'], pair['doc2_id']) for pair in pairs], [(1, 3)])
+        self.assertGreater(pairs[0]['similarity_score'], 0.9)
+        self.assertLess(pairs[0]['similarity_score'], 1.0)
+
+    def test_each_document_pairs_once(self):
+        index = DescriptionLSHIndex.build([(document_id, 'هزینه حمل') for document_id in range(1, 6)])
+        self.assertEqual([(pair['doc1_id'], pair['doc2_id']) for pair in index.similar_pairs()], [(1, 2), (3, 4)])
+
+    def test_incremental_and_stored_signatures_match_full_build(self):
+        rows = [(document_id, f'پرداخت هزینه شماره {document_id % 4} به شرکت الف') for document_id in range(1, 21)]
+        rows += [(21, 'دریافت وجه از مشتری ب'), (22, 'دريافت وجه از مشتري ب')]
+        expected = DescriptionLSHIndex.build(rows).similar_pairs()
+
+        incremental = DescriptionLSHIndex.build(rows[:10])
+        incremental.add_many(rows[10:])
+        self.assertEqual(incremental.similar_pairs(), expected)
+
+        signatures = dict(zip(
+            [document_id for document_id, _ in rows],
+            DescriptionLSHIndex().signature_bytes([description for _, description in rows])
+        ))
+        self.assertEqual(DescriptionLSHIndex.build(rows, signatures).similar_pairs(), expected)
+
+
+class LedgerTestCase(TestCase):
+    """شرکت، دوره مالی ۱۴۰۲ و حساب‌های مشترک آزمون‌های دفتر"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='tester')
+        cls.company = Company.objects.create(
+            name='شرکت آزمون', economic_code='1', national_code='1',
+            fiscal_year_start=datetime.date(2023, 3, 21), fiscal_year_end=datetime.date(2024, 3, 19),
+            created_by=cls.user
+        )
+        cls.period = FinancialPeriod.objects.create(
+            company=cls.company, name='۱۴۰۲', start_date=datetime.date(2023, 3, 21),
+            end_date=datetime.date(2024, 3, 19), created_by=cls.user
+        )
+        cls.accounts = {
+            code: ChartOfAccounts.objects.create(code=code, name=name, level='CLASS')
+            for code, name in [('102', 'بانک'), ('53', 'هزینه‌های اداری')]
+        }
+
+    @classmethod
+    def document(cls, number: str, date: str, amount, description: str = '', account: str = '53') -> DocumentHeader:
+        """سند دو آرتیکلی: بدهکار حساب داده‌شده و بستانکار بانک"""
+        header = DocumentHeader.objects.create(
+            document_number=number, document_type='SANAD', document_date=date, description=description,
+            company=cls.company, period=cls.period
+        )
+        DocumentItem.objects.create(
+            document=header, row_number=1, account=cls.accounts[account], debit=amount, credit=0, description=description
+        )
+        DocumentItem.objects.create(
+            document=header, row_number=2, account=cls.accounts['102'], debit=0, credit=amount, description=description
+        )
+        return header
+
+    def snapshot(self) -> LedgerSnapshot:
+        return LedgerSnapshot.load(self.company, self.period)
+
+
+class DuplicateDetectorTests(LedgerTestCase):
+    """گروه‌بندی آرتیکل‌های تکراری و تقریباً تکراری"""
+
+    def near_groups(self):
+        result = DuplicateDetector(self.snapshot()).detect()
+        return result, [group for group in result['near'] if group['account_code'] == '53']
+
+    def test_close_items_are_never_split_across_groups(self):
+        for day in [10, 10, 12, 14, 20]:
+            self.document(f'D{day}-{DocumentHeader.objects.count()}', f'1402/05/{day:02d}', 5000000, 'پرداخت به شرکت الف')
+
+        result, near = self.near_groups()
+        self.assertEqual(len(near), 1)
+        self.assertEqual(near[0]['count'], 4)
+        self.assertEqual(near[0]['day_span'], 4)
+        self.assertEqual(
+            sorted(item['document_date'] for item in near[0]['items']),
+            ['1402/05/10', '1402/05/10', '1402/05/12', '1402/05/14']
+        )
+        exact = [group for group in result['exact'] if group['account_code'] == '53']
+        self.assertEqual([group['count'] for group in exact], [2])
+
+    def test_chain_of_close_items_forms_one_group(self):
+        for day in [1, 3, 5, 7, 9]:
+            self.document(f'C{day}', f'1402/05/{day:02d}', 777000, 'پرداخت به شرکت الف')
+        _, near = self.near_groups()
+        self.assertEqual([(group['count'], group['day_span']) for group in near], [(5, 8)])
+
+    def test_items_further_apart_than_window_are_not_duplicates(self):
+        for day in [1, 5, 9, 13]:
+            self.document(f'F{day}', f'1402/05/{day:02d}', 777000, 'پرداخت به شرکت الف')
+        self.assertEqual(self.near_groups()[1], [])
+
+    def test_description_tokens_and_amount_are_part_of_the_key(self):
+        self.document('A1', '1402/05/01', 777000, 'پرداخت به شرکت الف')
+        self.document('A2', '1402/05/02', 777000, 'شرکت الف پرداخت به')
+        self.document('B1', '1402/05/02', 777000, 'پرداخت به شرکت ب')
+        self.document('M1', '1402/05/02', 778000, 'پرداخت به شرکت الف')
+        _, near = self.near_groups()
+        self.assertEqual(
+            [sorted(item['document_number'] for item in group['items']) for group in near], [['A1', 'A2']]
+        )
+
+    def test_items_of_one_document_are_not_duplicates(self):
+        header = self.document('S1', '1402/05/01', 777000, 'پرداخت به شرکت الف')
+        DocumentItem.objects.create(
+            document=header, row_number=3, account=self.accounts['53'], debit=777000, credit=0,
+            description='پرداخت به شرکت الف'
+        )
+        self.assertEqual(self.near_groups()[1], [])
+
+
+class StructuringDetectorTests(LedgerTestCase):
+    """پنجره‌های لغزان تفکیک مبالغ زیر سقف"""
+
+    def setUp(self):
+        self.document('S1', '1402/03/01', 20000000)
+        self.document('S2', '1402/03/03', 20000000)
+        self.document('S3', '1402/03/06', 15000000)
+        self.document('S4', '1402/05/06', 45000000)
+
+    def incidents(self):
+        return StructuringDetector(self.snapshot()).detect(structuring_rules(self.company))
+
+    def test_default_rule_merges_overlapping_windows(self):
+        incidents = [incident for incident in self.incidents() if incident['account_code'] == '53']
+        self.assertEqual(len(incidents), 1)
+        self.assertEqual(incidents[0]['items_count'], 3)
+        self.assertEqual(incidents[0]['total_amount'], Decimal('55000000'))
+        self.assertEqual((incidents[0]['first_date_key'], incidents[0]['last_date_key']), (14020301, 14020306))
+        self.assertEqual({incident['type'] for incident in self.incidents()}, {'debit', 'credit'})
+
+    def test_company_rule_sets_prefix_threshold_and_window(self):
+        StructuringRule.objects.create(
+            company=self.company, account_prefix='53', threshold_amount=Decimal('30000000'), window_days=3
+        )
+        incidents = self.incidents()
+        # S4 به تنهایی از سقف بیشتر است و S3 در پنجره سه روزه S2 نیست
+        self.assertEqual([(incident['account_code'], incident['items_count']) for incident in incidents], [('53', 2)])
+        self.assertEqual(incidents[0]['total_amount'], Decimal('40000000'))
+
+    def test_sweep_matches_brute_force_windows(self):
+        rng = np.random.default_rng(1)
+        size = 400
+        date_keys = 14020100 + rng.integers(1, 30, size)
+        account_ids = rng.integers(1, 6, size)
+        debits = rng.integers(1, 60, size) * 100
+        snapshot = LedgerSnapshot(
+            None, None, np.arange(size), np.arange(size), account_ids, date_keys, debits, np.zeros(size), [''] * size,
+            {account_id: (str(account_id), '', True) for account_id in range(1, 6)}
+        )
+        rule = StructuringRule(account_prefix='', threshold_amount=Decimal('30'), window_days=3, min_items=2)
+        flagged = {item for incident in StructuringDetector(snapshot).windows(rule) for item in incident['item_ids']}
+
+        expected = set()
+        days = date_keys % 100
+        for account_id in range(1, 6):
+            rows = np.flatnonzero((account_ids == account_id) & (debits < 3000))
+            for row in rows:
+                window = rows[(days[rows] >= days[row] - 2) & (days[rows] <= days[row])]
+                if debits[window].sum() >= 3000 and window.size >= 2:
+                    expected.update(window.tolist())
+        self.assertTrue(expected)
+        self.assertEqual(flagged, expected)
+
+
+class RiskScoringTests(LedgerTestCase):
+    """امتیازدهی افزایشی ریسک در ورود اطلاعات"""
+
+    def setUp(self):
+        self.first = self.document('R1', '1402/02/01', 3000000, 'خرید ملزومات')
+        self.document('R2', '1402/02/05', 1234567, 'پرداخت قبض')
+        self.service = RiskScoringService(self.company, self.period)
+        self.service.rebuild()
+
+    def import_documents(self, *documents):
+        """ورود اسناد در یک دسته (یک افزایش نسخه دفتر) و امتیازدهی مرحله ورود"""
+        previous_version = get_ledger_version(self.company.id, self.period.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            with ledger_batch():
+                headers = [self.document(*document) for document in documents]
+                mark_ledger_changed(self.company.id, self.period.id)
+        return headers, RiskScoringService(self.company, self.period).score_import(previous_version)
+
+    def test_import_scores_only_documents_after_watermark(self):
+        scores = dict(DocumentRiskScore.objects.values_list('document_id', 'id'))
+        (header,), result = self.import_documents(('R3', '1402/03/01', 2500000, 'خرید اثاثیه'))
+
+        self.assertTrue(result['incremental'])
+        self.assertEqual(result['scored_documents'], 1)
+        self.assertEqual(RiskScoringState.objects.get(company=self.company, period=self.period).last_document_id, header.id)
+        # امتیاز اسناد قبلی دوباره ساخته نشده است
+        self.assertEqual(
+            dict(DocumentRiskScore.objects.exclude(document=header).values_list('document_id', 'id')), scores
+        )
+
+    def test_import_back_marks_earlier_duplicate(self):
+        before = DocumentRiskScore.objects.get(document=self.first)
+        self.assertFalse(before.is_duplicate)
+
+        (header,), result = self.import_documents(('R3', '1402/03/01', 3000000, 'خرید ملزومات'))
+
+        self.assertTrue(result['incremental'])
+        after = DocumentRiskScore.objects.get(document=self.first)
+        self.assertTrue(after.is_duplicate)
+        self.assertAlmostEqual(after.risk_score, before.risk_score + RISK_WEIGHTS['duplicate'])
+        self.assertTrue(DocumentRiskScore.objects.get(document=header).is_duplicate)
+        self.assertEqual(self.service.duplicate_groups()[0]['count'], 2)
+
+    def test_ledger_change_outside_import_rebuilds(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_ledger_changed(self.company.id, self.period.id)
+        _, result = self.import_documents(('R3', '1402/03/01', 2500000, 'خرید اثاثیه'))
+
+        self.assertFalse(result['incremental'])
+        self.assertEqual(result['scored_documents'], 3)
+        self.assertEqual(DocumentRiskScore.objects.filter(company=self.company, period=self.period).count(), 3)
+
+
+class AccountLedgerTests(LedgerTestCase):
+    """صفحه‌بندی کلیدی دفتر حساب و زیردرخت آن"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        parent = cls.accounts['53']
+        for code in ('5301', '5302'):
+            cls.accounts[code] = ChartOfAccounts.objects.create(code=code, name=code, level='SUBCLASS', parent=parent)
+        # تاریخ‌ها عمداً خارج از ترتیب شناسه ثبت می‌شوند و چند سند هم‌تاریخ‌اند
+        for number, (date, account, amount) in enumerate([
+            ('1402/03/01', '5301', 100), ('1402/01/15', '5302', 200), ('1402/03/01', '5302', 300),
+            ('1402/02/10', '5301', 400), ('1402/01/15', '5301', 500), ('1402/03/01', '5301', 600),
+            ('1402/04/20', '5302', 700),
+        ]):
+            cls.document(f'L{number}', date, amount, account=account)
+
+    def ledger(self, include_subtree=True) -> AccountLedger:
+        return AccountLedger(self.company.id, self.period.id, self.accounts['53'], include_subtree=include_subtree)
+
+    def all_pages(self, ledger, page_size, **options):
+        pages = [ledger.page(page_size=page_size, **options)]
+        while pages[-1]['next_cursor']:
+            pages.append(ledger.page(cursor=pages[-1]['next_cursor'], page_size=page_size))
+        return pages
+
+    def test_subtree_pages_follow_ledger_order_with_running_balance(self):
+        expected = list(
+            DocumentItem.objects.filter(account__code__in=['5301', '5302']).order_by(
+                'date_key', 'document_id', 'row_number', 'id'
+            ).values_list('id', flat=True)
+        )
+        pages = self.all_pages(self.ledger(), page_size=2)
+
+        self.assertEqual([item['item_id'] for page in pages for item in page['items']], expected)
+        self.assertEqual(len(pages), 4)
+        for previous, page in zip(pages, pages[1:]):
+            self.assertEqual(page['opening_balance'], previous['closing_balance'])
+        self.assertEqual(pages[-1]['closing_balance'], Decimal('2800'))
+        self.assertFalse(pages[-1]['has_more'])
+
+    def test_start_date_opens_with_earlier_balance(self):
+        pages = self.all_pages(self.ledger(), page_size=10, start_date='1402/03/01')
+        self.assertEqual(pages[0]['opening_balance'], Decimal('1100'))
+        self.assertEqual([item['debit'] for item in pages[0]['items']], [Decimal(100), Decimal(300), Decimal(600), Decimal(700)])
+
+    def test_single_account_ledger_excludes_subtree(self):
+        self.assertEqual(self.ledger(include_subtree=False).page()['items'], [])
+
+    def test_cursor_of_another_ledger_is_rejected(self):
+        cursor = self.ledger().page(page_size=1)['next_cursor']
+        with self.assertRaises(ValueError):
+            self.ledger(include_subtree=False).page(cursor=cursor)
+        with self.assertRaises(ValueError):
+            self.ledger().page(cursor=cursor + 'x')
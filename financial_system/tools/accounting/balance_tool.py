@@ -3,9 +3,15 @@
 """
 
 from typing import Dict, Any, Optional
+import jdatetime
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
 
+from financial_system.models.document_models import make_date_key
+from financial_system.services.four_column_balance import SEASONS, FourColumnTrialBalance
+from financial_system.services.jalali_calendar import date_key_to_jalali
+from users.models import Company, FinancialPeriod
+
 
 class BalanceInput(BaseModel):
     """ورودی ابزار تراز چهارستونی"""
@@ -19,7 +25,19 @@ class BalanceInput(BaseModel):
     )
     season: str = Field(
         default="spring",
-        description="فصل: spring, summer, autumn, winter"
+        description="فصل: spring, summer, autumn, winter، all برای هر چهار فصل یا year برای کل سال مالی"
+    )
+    month: Optional[int] = Field(
+        default=None,
+        description="ماه شمسی (۱ تا ۱۲) در سال مالی؛ در صورت تعیین به جای فصل استفاده می‌شود"
+    )
+    start_date: Optional[str] = Field(
+        default=None,
+        description="ابتدای بازه دلخواه به تاریخ شمسی (مثلاً 1402/03/15)؛ بدون آن از ابتدای سال مالی"
+    )
+    end_date: Optional[str] = Field(
+        default=None,
+        description="انتهای بازه دلخواه به تاریخ شمسی؛ بدون آن تا پایان سال مالی"
     )
 
 
@@ -28,7 +46,9 @@ class BalanceTool(BaseTool):
     
     name: str = "balance_tool"
     description: str = """
-    ابزار تولید تراز کل چهارستونی شامل مانده ابتدای دوره، گردش بدهکار، گردش بستانکار و مانده انتهای دوره.
+    ابزار تولید تراز کل چهارستونی شامل مانده ابتدای دوره، گردش بدهکار، گردش بستانکار و مانده انتهای دوره
+    برای یک فصل، هر چهار فصل، کل سال مالی، یک ماه (month) یا بازه دلخواه (start_date / end_date).
+    آرتیکل‌های با تاریخ نامعتبر در هیچ بازه‌ای شمرده نمی‌شوند و در undated گزارش می‌شوند.
     کاربرد: تراز چهارستونی، تراز چهار ستونی، تراز کل، گردش حساب‌ها
     """
     args_schema: type = BalanceInput
@@ -37,24 +57,70 @@ class BalanceTool(BaseTool):
         self, 
         company_id: int = 1,
         period_id: int = 1,
-        season: str = "spring"
+        season: str = "spring",
+        month: Optional[int] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None
     ) -> Dict[str, Any]:
         """اجرای ابزار تراز چهارستونی"""
         
         try:
-            # مپینگ فصل به نام فارسی
-            season_map = {
-                "spring": "بهار",
-                "summer": "تابستان", 
-                "autumn": "پاییز",
-                "winter": "زمستان"
+            company = Company.objects.get(id=company_id)
+            period = FinancialPeriod.objects.get(id=period_id, company=company)
+            engine = FourColumnTrialBalance(company, period)
+
+            # بازه‌ها و عنوان هر کدام؛ فصل‌های کل سال با یک پیمایش آرتیکل‌ها محاسبه می‌شوند
+            if start_date or end_date:
+                year_start, year_end = engine.year_range()
+                start_key = make_date_key(start_date) if start_date else year_start
+                end_key = make_date_key(end_date) if end_date else year_end
+                if not start_key or not end_key or start_key > end_key:
+                    return {
+                        "success": False,
+                        "error": f"بازه تاریخ نامعتبر: {start_date or ''} تا {end_date or ''}",
+                        "response_type": "error"
+                    }
+                season = "custom"
+                ranges = {season: (start_key, end_key)}
+                titles = {season: "بازه دلخواه"}
+            elif month is not None:
+                if not 1 <= int(month) <= 12:
+                    return {
+                        "success": False,
+                        "error": f"ماه نامعتبر: {month}",
+                        "response_type": "error"
+                    }
+                season = "month"
+                ranges = {season: engine.calendar_month_range(int(month))}
+                titles = {season: f"ماه {jdatetime.date.j_months_fa[int(month) - 1]}"}
+            elif season == "year":
+                ranges = {season: engine.year_range()}
+                titles = {season: "سال مالی"}
+            elif season == "all":
+                ranges = engine.seasons()
+                titles = {key: f"فصل {label}" for key, label in SEASONS.items()}
+            elif season in SEASONS:
+                ranges = {season: engine.season_range(season)}
+                titles = {season: f"فصل {SEASONS[season]}"}
+            else:
+                return {
+                    "success": False,
+                    "error": f"فصل نامعتبر: {season}",
+                    "response_type": "error"
+                }
+
+            balances = engine.compute(ranges)
+            reports = {
+                key: self._format_balance_data(company, period, titles[key], balance)
+                for key, balance in balances.items()
+            }
+            balance_data = reports[season] if season in reports else {
+                "report_title": "تراز کل چهارستونی - فصول سال مالی",
+                "company_id": company_id,
+                "period_id": period_id,
+                "seasons": reports,
+                "formatted_report": "\n".join(report["formatted_report"] for report in reports.values())
             }
-            
-            season_name = season_map.get(season, season)
-            
-            # در این نسخه از داده‌های نمونه استفاده می‌کنیم
-            # در نسخه واقعی باید از دیتابیس خوانده شود
-            balance_data = self._generate_sample_balance_data(company_id, period_id, season_name)
             
             return {
                 "success": True,
@@ -62,9 +128,15 @@ class BalanceTool(BaseTool):
                 "data": balance_data,
                 "company_id": company_id,
                 "period_id": period_id,
-                "season": season_name
+                "season": SEASONS.get(season, titles.get(season, season))
             }
             
+        except (Company.DoesNotExist, FinancialPeriod.DoesNotExist):
+            return {
+                "success": False,
+                "error": "شرکت یا دوره مالی یافت نشد",
+                "response_type": "error"
+            }
         except Exception as e:
             return {
                 "success": False,
@@ -72,130 +144,69 @@ class BalanceTool(BaseTool):
                 "response_type": "error"
             }
 
-    def _generate_sample_balance_data(self, company_id: int, period_id: int, season: str) -> Dict[str, Any]:
-        """تولید داده‌های نمونه برای تراز چهارستونی"""
+    def _format_balance_data(self, company, period, title: str, balance: Dict[str, Any]) -> Dict[str, Any]:
+        """ساخت خروجی و گزارش متنی تراز چهارستونی یک بازه (فصل، ماه، سال یا بازه دلخواه)"""
         
-        # حساب‌های نمونه با گردش مالی
+        # مبالغ ریالی با دقت واحد کوچک‌تر، برای خروجی قابل سریال‌سازی به float تبدیل می‌شوند
+        columns = ("beginning_balance", "debit_turnover", "credit_turnover", "ending_balance")
         accounts_data = [
             {
-                "account_name": "صندوق",
-                "beginning_balance": 50000000,
-                "debit_turnover": 25000000,
-                "credit_turnover": 15000000,
-                "ending_balance": 60000000
-            },
-            {
-                "account_name": "بانک",
-                "beginning_balance": 200000000,
-                "debit_turnover": 80000000,
-                "credit_turnover": 120000000,
-                "ending_balance": 160000000
-            },
-            {
-                "account_name": "اسناد دریافتنی",
-                "beginning_balance": 150000000,
-                "debit_turnover": 100000000,
-                "credit_turnover": 80000000,
-                "ending_balance": 170000000
-            },
-            {
-                "account_name": "موجودی کالا",
-                "beginning_balance": 300000000,
-                "debit_turnover": 200000000,
-                "credit_turnover": 250000000,
-                "ending_balance": 250000000
-            },
-            {
-                "account_name": "دارایی‌های ثابت",
-                "beginning_balance": 800000000,
-                "debit_turnover": 100000000,
-                "credit_turnover": 50000000,
-                "ending_balance": 850000000
-            },
-            {
-                "account_name": "اسناد پرداختنی",
-                "beginning_balance": 120000000,
-                "debit_turnover": 60000000,
-                "credit_turnover": 80000000,
-                "ending_balance": 140000000
-            },
-            {
-                "account_name": "حساب‌های پرداختنی",
-                "beginning_balance": 80000000,
-                "debit_turnover": 40000000,
-                "credit_turnover": 60000000,
-                "ending_balance": 100000000
-            },
-            {
-                "account_name": "وام‌های بلندمدت",
-                "beginning_balance": 400000000,
-                "debit_turnover": 50000000,
-                "credit_turnover": 100000000,
-                "ending_balance": 450000000
-            },
-            {
-                "account_name": "سرمایه",
-                "beginning_balance": 500000000,
-                "debit_turnover": 0,
-                "credit_turnover": 0,
-                "ending_balance": 500000000
-            },
-            {
-                "account_name": "سود انباشته",
-                "beginning_balance": 100000000,
-                "debit_turnover": 0,
-                "credit_turnover": 50000000,
-                "ending_balance": 150000000
+                "account_code": account["account_code"],
+                "account_name": account["account_name"],
+                **{column: float(account[column]) for column in columns}
             }
+            for account in balance["accounts"]
         ]
-        
-        # محاسبه جمع‌ها
-        total_beginning_balance = sum(acc["beginning_balance"] for acc in accounts_data)
-        total_debit_turnover = sum(acc["debit_turnover"] for acc in accounts_data)
-        total_credit_turnover = sum(acc["credit_turnover"] for acc in accounts_data)
-        total_ending_balance = sum(acc["ending_balance"] for acc in accounts_data)
+        totals = {column: float(balance["totals"][column]) for column in columns}
+        start_date = date_key_to_jalali(balance["start_date_key"]).strftime("%Y/%m/%d")
+        end_date = date_key_to_jalali(balance["end_date_key"]).strftime("%Y/%m/%d")
         
         # ساخت گزارش
         report = f"""
-📊 **تراز کل چهارستونی - فصل {season}**
+📊 **تراز کل چهارستونی - {title}**
 
-شرکت: {company_id} | دوره مالی: {period_id}
+شرکت: {company.name} | دوره مالی: {period.name} | از {start_date} تا {end_date}
 
-| حساب | مانده ابتدای دوره | گردش بدهکار | گردش بستانکار | مانده انتهای دوره |
-|-------|-------------------|-------------|---------------|-------------------|
+| کد | حساب | مانده ابتدای دوره | گردش بدهکار | گردش بستانکار | مانده انتهای دوره |
+|-----|-------|-------------------|-------------|---------------|-------------------|
 """
         
         for account in accounts_data:
-            report += f"| {account['account_name']} | {account['beginning_balance']:,} | {account['debit_turnover']:,} | {account['credit_turnover']:,} | {account['ending_balance']:,} |\n"
+            report += f"| {account['account_code']} | {account['account_name']} | {account['beginning_balance']:,.0f} | {account['debit_turnover']:,.0f} | {account['credit_turnover']:,.0f} | {account['ending_balance']:,.0f} |\n"
         
         report += f"""
-| **جمع** | **{total_beginning_balance:,}** | **{total_debit_turnover:,}** | **{total_credit_turnover:,}** | **{total_ending_balance:,}** |
+| | **جمع** | **{totals['beginning_balance']:,.0f}** | **{totals['debit_turnover']:,.0f}** | **{totals['credit_turnover']:,.0f}** | **{totals['ending_balance']:,.0f}** |
 
 **تحلیل کلی:**
-- جمع گردش بدهکار: {total_debit_turnover:,} ریال
-- جمع گردش بستانکار: {total_credit_turnover:,} ریال  
-- تفاوت گردش: {total_debit_turnover - total_credit_turnover:,} ریال
-- جمع نهایی مانده‌ها: {total_ending_balance:,} ریال
+- جمع گردش بدهکار: {totals['debit_turnover']:,.0f} ریال
+- جمع گردش بستانکار: {totals['credit_turnover']:,.0f} ریال  
+- تفاوت گردش: {totals['debit_turnover'] - totals['credit_turnover']:,.0f} ریال
+- جمع نهایی مانده‌ها: {totals['ending_balance']:,.0f} ریال
 
 **نکات مهم:**
-- تراز چهارستونی وضعیت گردش حساب‌ها را به وضوح نشان می‌دهد
+- مانده‌ها با علامت بدهکار مثبت و بستانکار منفی نمایش داده می‌شوند
 - مانده ابتدای دوره + گردش بدهکار - گردش بستانکار = مانده انتهای دوره
-- این گزارش برای تحلیل عملکرد فصلی بسیار مفید است
-
-**تاریخ تولید:** امروز
 """
+        undated = balance["undated"]
+        if undated["items"]:
+            report += (
+                f"- {undated['items']} آرتیکل با تاریخ نامعتبر (بدهکار {float(undated['debit']):,.0f}، "
+                f"بستانکار {float(undated['credit']):,.0f} ریال) در هیچ بازه‌ای شمرده نشده است\n"
+            )
         
         return {
-            "report_title": f"تراز کل چهارستونی - فصل {season}",
-            "company_id": company_id,
-            "period_id": period_id,
-            "season": season,
+            "report_title": f"تراز کل چهارستونی - {title}",
+            "company_id": company.id,
+            "period_id": period.id,
+            "season": title,
+            "start_date": start_date,
+            "end_date": end_date,
             "accounts": accounts_data,
-            "totals": {
-                "beginning_balance": total_beginning_balance,
-                "debit_turnover": total_debit_turnover,
-                "credit_turnover": total_credit_turnover,
-                "ending_balance": total_ending_balance
+            "totals": totals,
+            "undated": {
+                "items": undated["items"],
+                "debit": float(undated["debit"]),
+                "credit": float(undated["credit"])
             },
             "formatted_report": report
         }
@@ -204,7 +215,10 @@ class BalanceTool(BaseTool):
         self, 
         company_id: int = 1,
         period_id: int = 1,
-        season: str = "spring"
+        season: str = "spring",
+        month: Optional[int] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None
     ) -> Dict[str, Any]:
         """اجرای Async ابزار تراز چهارستونی"""
-        return self._run(company_id, period_id, season)
+        return self._run(company_id, period_id, season, month, start_date, end_date)
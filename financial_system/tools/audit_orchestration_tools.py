@@ -1,14 +1,34 @@
-from decimal import Decimal
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from django.db.models import Q, Sum, Count, F
-from django.db.models.functions import Coalesce
-from financial_system.models import FinancialPeriod, DocumentItem, DocumentHeader
+from django.db.models import Value
+from financial_system.models import DocumentItem
+from financial_system.services.account_hierarchy import MINOR_UNITS, from_minor_units
+from financial_system.services.audit_snapshot import PeriodAuditSnapshot
+from financial_system.services.digit_analysis import round_amount_mask
+from financial_system.services.jalali_calendar import gregorian_to_date_key
+from financial_system.services.ratio_engine import RatioEngine, load_balance_matrix
+from financial_system.tools.cash_flow_tools import cash_flow_line_prefixes, get_cash_flow_sections, section_totals
+from users.models import FinancialPeriod
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
+import numpy as np
 import json
 import asyncio
 from typing import List, Dict, Any
 
+logger = logging.getLogger(__name__)
+
+# سقف مجاز مبلغ هر آرتیکل (ریال)
+THRESHOLD_LIMIT = 50000000
+# مبالغ مضرب این مقدار (ریال) گرد شمرده می‌شوند
+ROUND_NUMBER_UNIT = 10
+# تعداد روزهای پایانی دوره برای تست هجوم اسناد
+END_OF_PERIOD_DAYS = 7
+# حداکثر تعداد نخ‌های اجرای هم‌زمان خانواده‌های تست
+AUDIT_MAX_WORKERS = 4
+
 
 class ComprehensiveAuditInput(BaseModel):
     period_id: int = Field(description="ID دوره مالی مورد نظر")
@@ -26,7 +46,7 @@ class ComprehensiveAuditTool(BaseTool):
 
     def _run(self, period_id: int, previous_period_id: int, audit_types: List[str]) -> dict:
         try:
-            p = FinancialPeriod.objects.get(pk=period_id)
+            p = FinancialPeriod.objects.select_related('company').get(pk=period_id)
             p_prev = FinancialPeriod.objects.get(pk=previous_period_id)
         except FinancialPeriod.DoesNotExist:
             return {"error": "دوره مالی یافت نشد"}
@@ -36,24 +56,29 @@ class ComprehensiveAuditTool(BaseTool):
             "previous_period_title": str(p_prev),
             "audit_timestamp": datetime.now().isoformat(),
             "audit_types": audit_types,
-            "results": {}
+            "results": {},
+            "timings": {}
         }
 
-        # اجرای تست‌های یکپارچگی
-        if "integrity" in audit_types:
-            audit_results["results"]["integrity"] = self._run_integrity_audit(p)
-
-        # اجرای تست‌های تقلب
-        if "fraud" in audit_types:
-            audit_results["results"]["fraud"] = self._run_fraud_audit(p)
-
-        # اجرای تست‌های مالی
-        if "ratios" in audit_types:
-            audit_results["results"]["ratios"] = self._run_financial_ratios_audit(p, p_prev)
+        # بارگذاری یک‌باره تصویر دوره؛ خانواده‌های تست بدون کوئری روی همین آرایه‌ها اجرا می‌شوند
+        started = time.perf_counter()
+        snapshot = PeriodAuditSnapshot.load(p.company, p)
+        previous_lines = self._load_previous_lines(p.company, p_prev) if "ratios" in audit_types else None
+        audit_results["timings"]["snapshot"] = round(time.perf_counter() - started, 4)
+
+        families = {
+            "integrity": lambda: self._run_integrity_audit(snapshot),
+            "fraud": lambda: self._run_fraud_audit(snapshot),
+            "ratios": lambda: self._run_financial_ratios_audit(snapshot, previous_lines),
+            "cash_flow": lambda: self._run_cash_flow_audit(snapshot),
+        }
+        selected = [family for family in families if family in audit_types]
 
-        # اجرای تست‌های جریان وجوه نقد
-        if "cash_flow" in audit_types:
-            audit_results["results"]["cash_flow"] = self._run_cash_flow_audit(p)
+        # اجرای هم‌زمان خانواده‌های تست (عملیات numpy قفل GIL را آزاد می‌کنند)
+        with ThreadPoolExecutor(max_workers=min(AUDIT_MAX_WORKERS, len(selected)) or 1) as executor:
+            futures = {family: executor.submit(self._timed, families[family]) for family in selected}
+            for family in selected:
+                audit_results["results"][family], audit_results["timings"][family] = futures[family].result()
 
         # محاسبه امتیاز کلی حسابرسی
         audit_results["overall_score"] = self._calculate_audit_score(audit_results["results"])
@@ -61,16 +86,34 @@ class ComprehensiveAuditTool(BaseTool):
 
         return audit_results
 
-    def _run_integrity_audit(self, period) -> Dict[str, Any]:
+    @staticmethod
+    def _timed(family) -> tuple:
+        """اجرای یک خانواده تست و زمان آن (ثانیه)؛ خطای هر خانواده در نتیجه همان خانواده ثبت می‌شود"""
+        started = time.perf_counter()
+        try:
+            result = family()
+        except Exception as e:
+            logger.error(f"خطا در اجرای تست حسابرسی: {e}")
+            result = {"error": str(e)}
+        return result, round(time.perf_counter() - started, 4)
+
+    @staticmethod
+    def _load_previous_lines(company, previous_period) -> np.ndarray:
+        """اقلام صورت‌های مالی دوره قبل (یک کوئری گروه‌بندی‌شده)"""
+        engine = RatioEngine()
+        codes, _, debit, credit = load_balance_matrix(
+            DocumentItem.objects.filter(document__company=company, document__period=previous_period),
+            Value(0)
+        )
+        return engine.line_values(codes, debit, credit)[:, 0] if debit.size else np.zeros(len(engine.line_names), dtype=np.int64)
+
+    def _run_integrity_audit(self, snapshot: PeriodAuditSnapshot) -> Dict[str, Any]:
         """اجرای تست‌های یکپارچگی"""
         integrity_results = {}
+        ledger = snapshot.ledger
 
-        # 1. بررسی تراز بودن اسناد
-        unbalanced_docs = DocumentHeader.objects.filter(
-            period=period
-        ).annotate(
-            diff=F('total_debit') - F('total_credit')
-        ).exclude(diff=0).count()
+        # 1. بررسی تراز بودن اسناد (از جمع آرتیکل‌های هر سند)
+        unbalanced_docs = int(np.count_nonzero(snapshot.document_imbalance()))
         integrity_results["balance_check"] = {
             "unbalanced_documents": unbalanced_docs,
             "status": "PASS" if unbalanced_docs == 0 else "FAIL",
@@ -78,11 +121,7 @@ class ComprehensiveAuditTool(BaseTool):
         }
 
         # 2. آرتیکل‌های بدون شرح
-        empty_desc_count = DocumentItem.objects.filter(
-            document__period=period
-        ).filter(
-            Q(description__isnull=True) | Q(description='')
-        ).count()
+        empty_desc_count = snapshot.empty_description_count
         integrity_results["empty_description"] = {
             "count": empty_desc_count,
             "status": "PASS" if empty_desc_count == 0 else "WARNING",
@@ -90,10 +129,7 @@ class ComprehensiveAuditTool(BaseTool):
         }
 
         # 3. اسناد بدون آرتیکل
-        orphan_headers = DocumentHeader.objects.filter(
-            period=period,
-            items__isnull=True
-        ).count()
+        orphan_headers = int(np.count_nonzero(~np.isin(snapshot.header_ids, ledger.document_ids)))
         integrity_results["orphan_headers"] = {
             "count": orphan_headers,
             "status": "PASS" if orphan_headers == 0 else "FAIL",
@@ -101,26 +137,17 @@ class ComprehensiveAuditTool(BaseTool):
         }
 
         # 4. مبالغ منفی
-        negative_amounts = DocumentItem.objects.filter(
-            document__period=period
-        ).filter(
-            Q(debit__lt=0) | Q(credit__lt=0)
-        ).count()
+        negative_amounts = int(np.count_nonzero((ledger.debits < 0) | (ledger.credits < 0)))
         integrity_results["negative_amounts"] = {
             "count": negative_amounts,
             "status": "PASS" if negative_amounts == 0 else "FAIL",
             "severity": "HIGH" if negative_amounts > 0 else "LOW"
         }
 
-        # 5. توالی شماره اسناد
-        document_numbers = list(DocumentHeader.objects.filter(
-            period=period
-        ).order_by('document_number').values_list('document_number', flat=True))
-        
-        if document_numbers:
-            min_num = min(document_numbers)
-            max_num = max(document_numbers)
-            missing_sequences = len(set(range(min_num, max_num + 1)) - set(document_numbers))
+        # 5. توالی شماره اسناد (فقط شماره‌های عددی)
+        document_numbers = np.unique(snapshot.numeric_document_numbers())
+        if document_numbers.size:
+            missing_sequences = int(document_numbers[-1] - document_numbers[0] + 1 - document_numbers.size)
         else:
             missing_sequences = 0
 
@@ -132,17 +159,14 @@ class ComprehensiveAuditTool(BaseTool):
 
         return integrity_results
 
-    def _run_fraud_audit(self, period) -> Dict[str, Any]:
+    def _run_fraud_audit(self, snapshot: PeriodAuditSnapshot) -> Dict[str, Any]:
         """اجرای تست‌های تقلب"""
         fraud_results = {}
+        ledger = snapshot.ledger
 
         # 1. شناسایی مبالغ بالای سقف مجاز
-        LIMIT = Decimal('50000000')
-        threshold_hits = DocumentItem.objects.filter(
-            document__period=period
-        ).filter(
-            Q(debit__gte=LIMIT) | Q(credit__gte=LIMIT)
-        ).count()
+        limit = THRESHOLD_LIMIT * MINOR_UNITS
+        threshold_hits = int(np.count_nonzero((ledger.debits >= limit) | (ledger.credits >= limit)))
         fraud_results["threshold_hits"] = {
             "count": threshold_hits,
             "status": "PASS" if threshold_hits == 0 else "FAIL",
@@ -150,11 +174,9 @@ class ComprehensiveAuditTool(BaseTool):
         }
 
         # 2. شناسایی مبالغ گرد
-        round_number_count = 0
-        items = DocumentItem.objects.filter(document__period=period)
-        for item in items:
-            if (item.debit > 0 and item.debit % 10 == 0) or (item.credit > 0 and item.credit % 10 == 0):
-                round_number_count += 1
+        round_number_count = int(np.count_nonzero(
+            round_amount_mask(ledger.debits, ROUND_NUMBER_UNIT) | round_amount_mask(ledger.credits, ROUND_NUMBER_UNIT)
+        ))
 
         fraud_results["round_number_bias"] = {
             "count": round_number_count,
@@ -162,14 +184,13 @@ class ComprehensiveAuditTool(BaseTool):
             "severity": "MEDIUM" if round_number_count > 10 else "LOW"
         }
 
-        # 3. شناسایی اسناد پایانی دوره
-        last_week_start = period.end_date - timedelta(days=7)
-        eop_documents = DocumentHeader.objects.filter(
-            period=period,
-            document_date__gte=last_week_start,
-            document_date__lte=period.end_date
-        ).count()
-        total_documents = DocumentHeader.objects.filter(period=period).count()
+        # 3. شناسایی اسناد پایانی دوره (بازه کلید تاریخ شمسی روزهای پایانی)
+        period = snapshot.period
+        last_week_start = gregorian_to_date_key(period.end_date - timedelta(days=END_OF_PERIOD_DAYS))
+        period_end = gregorian_to_date_key(period.end_date)
+        date_keys = snapshot.header_date_keys
+        eop_documents = int(np.count_nonzero((date_keys >= last_week_start) & (date_keys <= period_end)))
+        total_documents = int(date_keys.size)
         eop_percentage = (eop_documents / total_documents * 100) if total_documents > 0 else 0
 
         fraud_results["end_of_period_rush"] = {
@@ -180,157 +201,86 @@ class ComprehensiveAuditTool(BaseTool):
         }
 
         # 4. شناسایی اسناد تکراری
-        duplicates = DocumentHeader.objects.filter(
-            period=period
-        ).values('document_number').annotate(
-            count=Count('id')
-        ).filter(count__gt=1).count()
+        _, number_counts = np.unique(snapshot.document_numbers, return_counts=True)
+        duplicates = int(np.count_nonzero(number_counts > 1))
         fraud_results["duplicate_documents"] = {
             "count": duplicates,
             "status": "PASS" if duplicates == 0 else "FAIL",
             "severity": "HIGH" if duplicates > 0 else "LOW"
         }
 
+        # 5. آرتیکل‌های هم‌حساب و هم‌مبلغ اسناد مختلف در بازه چند روزه
+        duplicate_transactions = len(snapshot.duplicates.candidate_groups())
+        fraud_results["duplicate_transactions"] = {
+            "count": duplicate_transactions,
+            "status": "PASS" if duplicate_transactions == 0 else "WARNING",
+            "severity": "MEDIUM" if duplicate_transactions > 0 else "LOW"
+        }
+
         return fraud_results
 
-    def _run_financial_ratios_audit(self, period, previous_period) -> Dict[str, Any]:
+    def _run_financial_ratios_audit(self, snapshot: PeriodAuditSnapshot, previous_lines: np.ndarray) -> Dict[str, Any]:
         """اجرای تست‌های نسبت‌های مالی"""
         ratio_results = {}
+        ledger = snapshot.ledger
+        engine = RatioEngine()
+
+        # گردش هر حساب در دوره و اقلام صورت‌های مالی (واحد جزء)
+        account_debit, account_credit = snapshot.account_turnover()
+        lines = engine.line_values(ledger.account_codes, account_debit[:, None], account_credit[:, None])[:, 0]
+
+        def line(values, name):
+            return from_minor_units(values[engine.line_index[name]])
+
+        # نسبت جاری
+        current_liabilities = line(lines, 'current_liabilities')
+        current_ratio = line(lines, 'current_assets') / current_liabilities if current_liabilities > 0 else None
+        ratio_results["current_ratio"] = {
+            "value": float(current_ratio) if current_ratio else None,
+            "status": "PASS" if current_ratio and current_ratio > 1.5 else "WARNING",
+            "severity": "HIGH" if current_ratio and current_ratio < 1 else "MEDIUM" if current_ratio and current_ratio < 1.5 else "LOW"
+        }
 
-        # محاسبه نسبت‌های مالی
-        try:
-            # نسبت جاری
-            current_assets = DocumentItem.objects.filter(
-                document__period=period,
-                account__code__startswith=['11', '12', '13']
-            ).aggregate(
-                total=Coalesce(Sum('debit'), Decimal(0)) - Coalesce(Sum('credit'), Decimal(0))
-            )['total'] or Decimal(0)
-
-            current_liabilities = DocumentItem.objects.filter(
-                document__period=period,
-                account__code__startswith=['21', '22']
-            ).aggregate(
-                total=Coalesce(Sum('credit'), Decimal(0)) - Coalesce(Sum('debit'), Decimal(0))
-            )['total'] or Decimal(0)
-
-            current_ratio = current_assets / current_liabilities if current_liabilities > 0 else None
-            ratio_results["current_ratio"] = {
-                "value": float(current_ratio) if current_ratio else None,
-                "status": "PASS" if current_ratio and current_ratio > 1.5 else "WARNING",
-                "severity": "HIGH" if current_ratio and current_ratio < 1 else "MEDIUM" if current_ratio and current_ratio < 1.5 else "LOW"
-            }
-
-            # نسبت بدهی به حقوق صاحبان سهام
-            total_liabilities = DocumentItem.objects.filter(
-                document__period=period,
-                account__code__startswith='2'
-            ).aggregate(
-                total=Coalesce(Sum('credit'), Decimal(0)) - Coalesce(Sum('debit'), Decimal(0))
-            )['total'] or Decimal(0)
-
-            total_equity = DocumentItem.objects.filter(
-                document__period=period,
-                account__code__startswith='4'
-            ).aggregate(
-                total=Coalesce(Sum('credit'), Decimal(0)) - Coalesce(Sum('debit'), Decimal(0))
-            )['total'] or Decimal(0)
-
-            debt_to_equity = total_liabilities / total_equity if total_equity > 0 else None
-            ratio_results["debt_to_equity"] = {
-                "value": float(debt_to_equity) if debt_to_equity else None,
-                "status": "PASS" if debt_to_equity and debt_to_equity < 1 else "WARNING",
-                "severity": "HIGH" if debt_to_equity and debt_to_equity > 2 else "MEDIUM" if debt_to_equity and debt_to_equity > 1 else "LOW"
-            }
-
-            # ROA
-            revenue = DocumentItem.objects.filter(
-                document__period=period,
-                account__group='Revenue'
-            ).aggregate(total=Coalesce(Sum('credit'), Decimal(0)))['total']
-
-            expense = DocumentItem.objects.filter(
-                document__period=period,
-                account__group='Expense'
-            ).aggregate(total=Coalesce(Sum('debit'), Decimal(0)))['total']
-
-            net_income = revenue - expense
-
-            current_assets_total = DocumentItem.objects.filter(
-                document__period=period,
-                account__code__startswith='1'
-            ).aggregate(
-                total=Coalesce(Sum('debit'), Decimal(0)) - Coalesce(Sum('credit'), Decimal(0))
-            )['total'] or Decimal(0)
-
-            previous_assets = DocumentItem.objects.filter(
-                document__period=previous_period,
-                account__code__startswith='1'
-            ).aggregate(
-                total=Coalesce(Sum('debit'), Decimal(0)) - Coalesce(Sum('credit'), Decimal(0))
-            )['total'] or Decimal(0)
-
-            average_assets = (current_assets_total + previous_assets) / 2
-            roa = (net_income / average_assets) * 100 if average_assets > 0 else None
-
-            ratio_results["roa"] = {
-                "value": float(roa) if roa else None,
-                "status": "PASS" if roa and roa > 5 else "WARNING",
-                "severity": "HIGH" if roa and roa < 0 else "MEDIUM" if roa and roa < 5 else "LOW"
-            }
+        # نسبت بدهی به حقوق صاحبان سهام
+        total_equity = line(lines, 'total_equity')
+        debt_to_equity = line(lines, 'total_liabilities') / total_equity if total_equity > 0 else None
+        ratio_results["debt_to_equity"] = {
+            "value": float(debt_to_equity) if debt_to_equity else None,
+            "status": "PASS" if debt_to_equity and debt_to_equity < 1 else "WARNING",
+            "severity": "HIGH" if debt_to_equity and debt_to_equity > 2 else "MEDIUM" if debt_to_equity and debt_to_equity > 1 else "LOW"
+        }
 
-        except Exception as e:
-            ratio_results["error"] = str(e)
+        # ROA بر اساس میانگین دارایی‌های دوره جاری و قبل
+        average_assets = (line(lines, 'total_assets') + line(previous_lines, 'total_assets')) / 2
+        roa = (line(lines, 'net_income') / average_assets) * 100 if average_assets > 0 else None
+
+        ratio_results["roa"] = {
+            "value": float(roa) if roa else None,
+            "status": "PASS" if roa and roa > 5 else "WARNING",
+            "severity": "HIGH" if roa and roa < 0 else "MEDIUM" if roa and roa < 5 else "LOW"
+        }
 
         return ratio_results
 
-    def _run_cash_flow_audit(self, period) -> Dict[str, Any]:
-        """اجرای تست‌های جریان وجوه نقد"""
+    def _run_cash_flow_audit(self, snapshot: PeriodAuditSnapshot) -> Dict[str, Any]:
+        """اجرای تست‌های جریان وجوه نقد (همان نگاشت بخش‌های ابزار شبیه‌سازی جریان وجوه نقد)"""
         cash_flow_results = {}
+        ledger = snapshot.ledger
+
+        sections = get_cash_flow_sections()
+        account_debit, account_credit = snapshot.account_turnover()
+        account_net = account_debit - account_credit
+        line_amounts = {
+            line: int(account_net[ledger.account_mask(prefixes, active_only=False)].sum())
+            for line, prefixes in cash_flow_line_prefixes(sections).items()
+        }
+        operating = from_minor_units(section_totals(sections, line_amounts).get('operating', 0))
 
-        try:
-            # شبیه‌سازی جریان وجوه نقد
-            # درآمدها و هزینه‌ها
-            revenue = DocumentItem.objects.filter(
-                document__period=period,
-                account__group='Revenue'
-            ).aggregate(total=Coalesce(Sum('credit'), Decimal(0)))['total']
-
-            expense = DocumentItem.objects.filter(
-                document__period=period,
-                account__group='Expense'
-            ).aggregate(total=Coalesce(Sum('debit'), Decimal(0)))['total']
-
-            net_income = revenue - expense
-
-            # استهلاک
-            dep = DocumentItem.objects.filter(
-                document__period=period,
-                account__code__startswith='69'
-            ).aggregate(total=Coalesce(Sum('debit'), Decimal(0)))['total'] or Decimal(0)
-
-            # تغییرات سرمایه در گردش
-            wc_dr = DocumentItem.objects.filter(
-                document__period=period,
-                account__code__startswith=['11', '12', '13', '14']
-            ).aggregate(total=Coalesce(Sum('debit'), Decimal(0)))['total'] or Decimal(0)
-
-            wc_cr = DocumentItem.objects.filter(
-                document__period=period,
-                account__code__startswith=['11', '12', '13', '14']
-            ).aggregate(total=Coalesce(Sum('credit'), Decimal(0)))['total'] or Decimal(0)
-
-            delta_wc = wc_dr - wc_cr
-            operating = net_income + dep - delta_wc
-
-            cash_flow_results["operating_cash_flow"] = {
-                "value": float(operating),
-                "status": "PASS" if operating > 0 else "WARNING",
-                "severity": "HIGH" if operating < 0 else "LOW"
-            }
-
-        except Exception as e:
-            cash_flow_results["error"] = str(e)
+        cash_flow_results["operating_cash_flow"] = {
+            "value": float(operating),
+            "status": "PASS" if operating > 0 else "WARNING",
+            "severity": "HIGH" if operating < 0 else "LOW"
+        }
 
         return cash_flow_results
 
@@ -549,6 +499,7 @@ class AuditReportGeneratorTool(BaseTool):
             "round_number_bias": "شناسایی مبالغ گرد (ریسک تقلب)",
             "end_of_period_rush": "شناسایی اسناد ثبت شده در روزهای پایانی دوره",
             "duplicate_documents": "شناسایی اسناد تکراری",
+            "duplicate_transactions": "شناسایی آرتیکل‌های هم‌حساب و هم‌مبلغ در اسناد مختلف طی چند روز",
             "current_ratio": "محاسبه نسبت جاری (نقدینگی کوتاه مدت)",
             "debt_to_equity": "محاسبه نسبت بدهی به حقوق صاحبان سهام",
             "roa": "محاسبه بازده دارایی‌ها",
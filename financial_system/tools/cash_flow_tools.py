@@ -1,11 +1,63 @@
-from decimal import Decimal
-from django.db.models import Sum, Q
-from django.db.models.functions import Coalesce
-from financial_system.models import FinancialPeriod, DocumentItem, ChartOfAccounts
+from typing import Dict, Sequence
+
+from django.conf import settings
+from django.db.models import BigIntegerField, Case, ExpressionWrapper, F, IntegerField, Q, Sum, Value, When
+from financial_system.models import DocumentItem
+from financial_system.services.account_hierarchy import from_minor_units, minor_units_expression
+from financial_system.services.jalali_calendar import month_label
+from financial_system.services.ratio_engine import get_statement_lines
+from users.models import FinancialPeriod
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
 
 
+# نگاشت پیش‌فرض بخش‌های جریان وجوه نقد (روش غیرمستقیم): بخش ← {قلم صورت‌های مالی: علامت}
+# مقدار هر قلم گردش خالص بدهکار منهای بستانکار پیشوندهای آن است؛ افزایش هر حساب غیرنقدی با علامت
+# منفی اثر می‌گذارد (افزایش دارایی مصرف وجه، افزایش بدهی و درآمد منبع وجه) و استهلاک به سود برگشت داده می‌شود.
+# استهلاک انباشته بستانکار دارایی ثابت است، پس همان مبلغ از بخش سرمایه‌گذاری کم می‌شود تا دو بار شمرده نشود.
+# پیشوندهای اقلام از FINANCIAL_STATEMENT_LINES و خود نگاشت از CASH_FLOW_SECTIONS در settings قابل تنظیم است.
+DEFAULT_CASH_FLOW_SECTIONS: Dict[str, Dict[str, int]] = {
+    'operating': {
+        'revenue': -1, 'cost_of_goods_sold': -1, 'operating_expenses': -1, 'interest_expense': -1,
+        'other_expenses': -1, 'tax_expense': -1, 'depreciation': 1,
+        'accounts_receivable': -1, 'inventory': -1, 'prepaid_expenses': -1,
+        'accounts_payable': -1, 'accrued_expenses': -1, 'unearned_revenue': -1,
+    },
+    'investing': {'fixed_assets': -1, 'marketable_securities': -1, 'depreciation': -1},
+    'financing': {'short_term_debt': -1, 'long_term_debt': -1, 'total_equity': -1},
+}
+
+
+def get_cash_flow_sections() -> Dict[str, Dict[str, int]]:
+    """نگاشت بخش‌های جریان وجوه نقد با اعمال بازنویسی‌های تنظیمات پروژه"""
+    sections = dict(DEFAULT_CASH_FLOW_SECTIONS)
+    sections.update(getattr(settings, 'CASH_FLOW_SECTIONS', {}))
+    return sections
+
+
+def cash_flow_line_prefixes(sections: Dict[str, Dict[str, int]]) -> Dict[str, Sequence[str]]:
+    """پیشوندهای کد حساب هر قلم به‌کاررفته در بخش‌های جریان وجوه نقد"""
+    statement_lines = get_statement_lines()
+    lines = sorted({line for weights in sections.values() for line in weights})
+    return {line: statement_lines.get(line, ([], 'debit'))[0] for line in lines}
+
+
+def section_totals(sections: Dict[str, Dict[str, int]], line_amounts: Dict[str, int]) -> Dict[str, int]:
+    """مبلغ هر بخش از گردش خالص (بدهکار منهای بستانکار) اقلام با علامت نگاشت"""
+    return {
+        section: sum(sign * (line_amounts.get(line) or 0) for line, sign in weights.items())
+        for section, weights in sections.items()
+    }
+
+
+def prefix_condition(prefixes: Sequence[str]) -> Q:
+    """شرط حساب‌هایی که کدشان با یکی از پیشوندها شروع می‌شود"""
+    condition = Q(pk__in=[])
+    for prefix in prefixes:
+        condition |= Q(account__code__startswith=prefix)
+    return condition
+
+
 class CashFlowInput(BaseModel):
     period_id: int = Field(description="ID دوره مالی مورد نظر")
 
@@ -14,7 +66,7 @@ class CashFlowSimulationTool(BaseTool):
     name: str = "cash_flow_simulation"
     description: str = (
         "شبیه‌سازی جریان وجوه نقد (روش غیرمستقیم) برای یک دوره مالی خاص. "
-        "خروجی شامل سه مقدار Operating، Investing و Financing است."
+        "خروجی شامل سه مقدار Operating، Investing و Financing به تفکیک ماه است."
     )
     args_schema: type = CashFlowInput
 
@@ -24,75 +76,35 @@ class CashFlowSimulationTool(BaseTool):
         except FinancialPeriod.DoesNotExist:
             return {"error": "دوره مالی یافت نشد"}
 
-        # 1) Net Income ≈ Revenue – Expense
-        revenue_query = DocumentItem.objects.filter(
-            document__period=p,
-            account__group='Revenue'
-        ).aggregate(s=Coalesce(Sum('credit'), Decimal(0)))
-        revenue = revenue_query['s']
-
-        expense_query = DocumentItem.objects.filter(
-            document__period=p,
-            account__group='Expense'
-        ).aggregate(s=Coalesce(Sum('debit'), Decimal(0)))
-        expense = expense_query['s']
-
-        net_income = revenue - expense
-
-        # 2) Depreciation / Amortisation (add back)
-        dep_query = DocumentItem.objects.filter(
-            document__period=p,
-            account__code__startswith='69'  # استهلاک
-        ).aggregate(s=Coalesce(Sum('debit'), Decimal(0)))
-        dep = dep_query['s']
-
-        # 3) ΔWorking-Capital
-        # Use Q objects for multiple account code prefixes
-        wc_q = Q(account__code__startswith='11') | Q(account__code__startswith='12') | \
-               Q(account__code__startswith='13') | Q(account__code__startswith='14')
-        wc_dr_query = DocumentItem.objects.filter(
-            document__period=p
-        ).filter(wc_q).aggregate(s=Coalesce(Sum('debit'), Decimal(0)))
-        wc_dr = wc_dr_query['s']
-
-        wc_cr_query = DocumentItem.objects.filter(
-            document__period=p
-        ).filter(wc_q).aggregate(s=Coalesce(Sum('credit'), Decimal(0)))
-        wc_cr = wc_cr_query['s']
-
-        delta_wc = wc_dr - wc_cr
-
-        operating = net_income + dep - delta_wc
-
-        # 4) Investing
-        inv_q = Q(account__code__startswith='31') | Q(account__code__startswith='32') | \
-                Q(account__code__startswith='33')
-        inv_dr_query = DocumentItem.objects.filter(
-            document__period=p
-        ).filter(inv_q).aggregate(s=Coalesce(Sum('debit'), Decimal(0)))
-        inv_dr = inv_dr_query['s']
-
-        inv_cr_query = DocumentItem.objects.filter(
-            document__period=p
-        ).filter(inv_q).aggregate(s=Coalesce(Sum('credit'), Decimal(0)))
-        inv_cr = inv_cr_query['s']
-
-        investing = inv_dr - inv_cr
-
-        # 5) Financing
-        fin_q = Q(account__code__startswith='41') | Q(account__code__startswith='42') | \
-                Q(account__code__startswith='43') | Q(account__code__startswith='44')
-        fin_cr_query = DocumentItem.objects.filter(
-            document__period=p
-        ).filter(fin_q).aggregate(s=Coalesce(Sum('credit'), Decimal(0)))
-        fin_cr = fin_cr_query['s']
-
-        fin_dr_query = DocumentItem.objects.filter(
-            document__period=p
-        ).filter(fin_q).aggregate(s=Coalesce(Sum('debit'), Decimal(0)))
-        fin_dr = fin_dr_query['s']
-
-        financing = fin_cr - fin_dr
+        sections = get_cash_flow_sections()
+        prefixes = cash_flow_line_prefixes(sections)
+
+        # یک پیمایش: گردش خالص هر قلم با Sum(Case(When)) شرطی، گروه‌بندی‌شده بر اساس ماه
+        net_amount = minor_units_expression('debit') - minor_units_expression('credit')
+        buckets = {
+            line: Sum(Case(
+                When(prefix_condition(prefixes[line]), then=net_amount),
+                default=Value(0),
+                output_field=BigIntegerField()
+            ))
+            for line in prefixes if prefixes[line]
+        }
+        rows = list(
+            DocumentItem.objects.filter(document__period=p).filter(
+                prefix_condition([prefix for line in buckets for prefix in prefixes[line]])
+            ).annotate(
+                month_key=ExpressionWrapper(F('document__date_key') / 100, output_field=IntegerField())
+            ).values('month_key').annotate(**buckets).order_by('month_key')
+        ) if buckets else []
+
+        monthly = []
+        totals = {section: 0 for section in sections}
+        for row in rows:
+            month = {"month": month_label(row['month_key'])}
+            for section, amount in section_totals(sections, row).items():
+                totals[section] += amount
+                month[section] = float(from_minor_units(amount))
+            monthly.append(month)
 
         # ذخیره (اختیاری) - commenting out for now as model might not exist
         # from .models import CashFlowResult
@@ -105,9 +117,9 @@ class CashFlowSimulationTool(BaseTool):
 
         return {
             "period_title": str(p),
-            "operating": float(operating),
-            "investing": float(investing),
-            "financing": float(financing)
+            **{section: float(from_minor_units(amount)) for section, amount in totals.items()},
+            "net_cash_flow": float(from_minor_units(sum(totals.values()))),
+            "monthly": monthly
         }
 
     async def _arun(self, *args, **kwargs):
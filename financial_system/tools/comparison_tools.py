@@ -4,139 +4,11 @@ from typing import Dict, Any
 def compare_financial_ratios_tool(company_id: int, period1_id: int, period2_id: int, ratio_type: str = "نسبت آنی") -> str:
     """ابزار مقایسه نسبت‌های مالی بین دو دوره از داده‌های واقعی"""
     try:
-        from django.db.models import Sum
-        from financial_system.models.document_models import DocumentItem
+        from financial_system.services.comparison_engine import ComparisonEngine
         
-        def calculate_ratio(company_id, period_id, ratio_type):
-            """محاسبه نسبت مالی برای یک دوره خاص"""
-            if ratio_type == "نسبت جاری":
-                # محاسبه نسبت جاری
-                current_assets_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='11'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                current_liabilities_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='21'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                current_assets = (current_assets_data['total_debit'] or 0) - (current_assets_data['total_credit'] or 0)
-                current_liabilities = (current_liabilities_data['total_credit'] or 0) - (current_liabilities_data['total_debit'] or 0)
-                
-                return current_assets / current_liabilities if current_liabilities != 0 else 0
-                
-            elif ratio_type == "نسبت آنی":
-                # محاسبه نسبت آنی
-                current_assets_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='11'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                inventory_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='114'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                current_liabilities_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='21'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                current_assets = (current_assets_data['total_debit'] or 0) - (current_assets_data['total_credit'] or 0)
-                inventory = (inventory_data['total_debit'] or 0) - (inventory_data['total_credit'] or 0)
-                current_liabilities = (current_liabilities_data['total_credit'] or 0) - (current_liabilities_data['total_debit'] or 0)
-                
-                return (current_assets - inventory) / current_liabilities if current_liabilities != 0 else 0
-                
-            elif ratio_type == "بازده دارایی":
-                # محاسبه بازده دارایی‌ها
-                total_assets_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='1'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                revenue_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='4'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                expense_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='5'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                total_assets = (total_assets_data['total_debit'] or 0) - (total_assets_data['total_credit'] or 0)
-                total_revenue = (revenue_data['total_credit'] or 0) - (revenue_data['total_debit'] or 0)
-                total_expenses = (expense_data['total_debit'] or 0) - (expense_data['total_credit'] or 0)
-                net_income = total_revenue - total_expenses
-                
-                return (net_income / total_assets * 100) if total_assets != 0 else 0
-                
-            elif ratio_type == "حاشیه سود":
-                # محاسبه حاشیه سود
-                revenue_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='4'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                expense_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='5'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                total_revenue = (revenue_data['total_credit'] or 0) - (revenue_data['total_debit'] or 0)
-                total_expenses = (expense_data['total_debit'] or 0) - (expense_data['total_credit'] or 0)
-                net_income = total_revenue - total_expenses
-                
-                return (net_income / total_revenue * 100) if total_revenue != 0 else 0
-                
-            else:
-                return 0
-        
-        # محاسبه نسبت‌ها برای دو دوره
-        ratio1 = calculate_ratio(company_id, period1_id, ratio_type)
-        ratio2 = calculate_ratio(company_id, period2_id, ratio_type)
+        # هر دو دوره با یک کوئری گروه‌بندی‌شده محاسبه می‌شوند
+        comparison = ComparisonEngine().compare([company_id], [period1_id, period2_id], [ratio_type])
+        ratio1, ratio2 = (value or 0 for value in comparison['metrics'][ratio_type]['values'][0])
         
         # تحلیل تغییرات
         change = ratio2 - ratio1
@@ -166,119 +38,11 @@ def compare_financial_ratios_tool(company_id: int, period1_id: int, period2_id:
 def analyze_trend_tool(company_id: int, metric: str, periods: list) -> str:
     """ابزار تحلیل روند شاخص‌های مالی از داده‌های واقعی"""
     try:
-        from django.db.models import Sum
-        from financial_system.models.document_models import DocumentItem
-        
-        def calculate_metric(company_id, period_id, metric):
-            """محاسبه متریک مالی برای یک دوره خاص"""
-            if metric == "نسبت آنی":
-                # محاسبه نسبت آنی
-                current_assets_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='11'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                inventory_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='114'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                current_liabilities_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='21'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                current_assets = (current_assets_data['total_debit'] or 0) - (current_assets_data['total_credit'] or 0)
-                inventory = (inventory_data['total_debit'] or 0) - (inventory_data['total_credit'] or 0)
-                current_liabilities = (current_liabilities_data['total_credit'] or 0) - (current_liabilities_data['total_debit'] or 0)
-                
-                return (current_assets - inventory) / current_liabilities if current_liabilities != 0 else 0
-                
-            elif metric == "نسبت جاری":
-                # محاسبه نسبت جاری
-                current_assets_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='11'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                current_liabilities_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='21'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                current_assets = (current_assets_data['total_debit'] or 0) - (current_assets_data['total_credit'] or 0)
-                current_liabilities = (current_liabilities_data['total_credit'] or 0) - (current_liabilities_data['total_debit'] or 0)
-                
-                return current_assets / current_liabilities if current_liabilities != 0 else 0
-                
-            elif metric == "درآمد":
-                # محاسبه درآمد
-                revenue_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='4'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                total_revenue = (revenue_data['total_credit'] or 0) - (revenue_data['total_debit'] or 0)
-                return total_revenue / 1000000  # تبدیل به میلیون ریال
-                
-            elif metric == "سود خالص":
-                # محاسبه سود خالص
-                revenue_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='4'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                expense_data = DocumentItem.objects.filter(
-                    document__company_id=company_id,
-                    document__period_id=period_id,
-                    account__code__startswith='5'
-                ).aggregate(
-                    total_debit=Sum('debit'),
-                    total_credit=Sum('credit')
-                )
-                
-                total_revenue = (revenue_data['total_credit'] or 0) - (revenue_data['total_debit'] or 0)
-                total_expenses = (expense_data['total_debit'] or 0) - (expense_data['total_credit'] or 0)
-                net_income = total_revenue - total_expenses
-                
-                return net_income / 1000000  # تبدیل به میلیون ریال
-                
-            else:
-                return 0
+        from financial_system.services.comparison_engine import ComparisonEngine
         
-        # محاسبه متریک برای تمام دوره‌ها
-        values = []
-        for period_id in periods:
-            value = calculate_metric(company_id, period_id, metric)
-            values.append(value)
+        # محاسبه متریک برای تمام دوره‌ها با یک کوئری گروه‌بندی‌شده
+        comparison = ComparisonEngine().compare([company_id], list(periods), [metric])
+        values = [value or 0 for value in comparison['metrics'][metric]['values'][0]]
         
         # تحلیل روند
         if len(values) > 1:
@@ -318,3 +82,14 @@ def analyze_trend_tool(company_id: int, metric: str, periods: list) -> str:
         
     except Exception as e:
         return f"خطا در تحلیل روند: {str(e)}"
+
+def compare_companies_tool(company_ids: list, period_ids: list, metrics: list, align_by: str = "name") -> Dict[str, Any]:
+    """ابزار مقایسه چند شرکت در چند دوره (ماتریس مقادیر، رتبه‌ها و تغییرات دوره به دوره)"""
+    try:
+        from financial_system.services.comparison_engine import ComparisonEngine
+        
+        comparison = ComparisonEngine().compare(company_ids, period_ids, metrics, align_by=align_by)
+        return {'success': True, **comparison}
+        
+    except Exception as e:
+        return {'success': False, 'error': f"خطا در مقایسه شرکت‌ها: {str(e)}"}
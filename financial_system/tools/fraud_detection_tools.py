@@ -1,10 +1,17 @@
 from decimal import Decimal
 from datetime import timedelta
-from django.db.models import Q, Sum, Count, Window, F
+from django.db.models import Q, Count, Window
 from django.db.models.functions import Lag, TruncDate, Coalesce
 from django.utils import timezone
-from difflib import SequenceMatcher
-from financial_system.models import FinancialPeriod, DocumentItem, DocumentHeader
+from financial_system.models import DocumentItem, DocumentHeader
+from financial_system.services.description_index import DescriptionLSHIndex, SIMILARITY_THRESHOLD
+from financial_system.services.digit_analysis import period_digit_analysis
+from financial_system.services.duplicate_detector import duplicate_transactions
+from financial_system.services.structuring_detector import structuring_incidents
+from financial_system.services.account_hierarchy import from_minor_units, to_minor_units
+from financial_system.services.posting_calendar import rush_analysis
+from financial_system.services.risk_scoring import DOCUMENT_LIST_LIMIT, RISK_ROUND_UNIT, RiskScoringService
+from users.models import FinancialPeriod
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
 import hashlib
@@ -22,18 +29,20 @@ class ThresholdHitTool(BaseTool):
 
     def _run(self, period_id: int) -> dict:
         try:
-            p = FinancialPeriod.objects.get(pk=period_id)
+            p = FinancialPeriod.objects.select_related('company').get(pk=period_id)
         except FinancialPeriod.DoesNotExist:
             return {"error": "دوره مالی یافت نشد"}
 
         # سقف مجاز انتقال وجه - مثال: 50,000,000 ریال
         LIMIT = Decimal('50000000')
         
+        # فقط آرتیکل‌های اسنادی که بیشینه مبلغ ذخیره‌شده در جدول ریسک به سقف می‌رسد (نمایه بیشینه مبلغ)
+        scoring = RiskScoringService(p.company, p)
         threshold_hits = DocumentItem.objects.filter(
-            document__period=p
+            document_id__in=scoring.document_ids(max_amount__gte=int(to_minor_units([LIMIT])[0]))
         ).filter(
             Q(debit__gte=LIMIT) | Q(credit__gte=LIMIT)
-        ).select_related('document', 'account').values(
+        ).values(
             'document__document_number',
             'document__document_date',
             'account__code',
@@ -43,11 +52,17 @@ class ThresholdHitTool(BaseTool):
             'description'
         )
         
+        # تفکیک مبالغ: جمع پنجره‌های چند روزه هر حساب به سقف قاعده شرکت می‌رسد و هر آرتیکل زیر سقف است
+        # (نتیجه برای هر نسخه دفتر کش می‌شود)
+        structuring = structuring_incidents(p.company, p)
+
         return {
             "period_title": str(p),
             "threshold_limit": float(LIMIT),
             "threshold_hits_count": threshold_hits.count(),
-            "threshold_hits": list(threshold_hits)
+            "threshold_hits": list(threshold_hits),
+            "structuring_incidents_count": len(structuring),
+            "structuring_incidents": structuring
         }
 
     async def _arun(self, *args, **kwargs):
@@ -56,51 +71,36 @@ class ThresholdHitTool(BaseTool):
 
 class RoundNumberBiasTool(BaseTool):
     name: str = "round_number_bias_detection"
-    description: str = "شناسایی اسناد با مبالغی که رقم آخرشان صفر است (Round-Number Bias)"
+    description: str = "شناسایی اسناد و حساب‌ها با سهم بالای مبالغ گرد و آزمون‌های رقمی بنفورد (Round-Number Bias)"
     args_schema: type = FraudDetectionInput
 
     def _run(self, period_id: int) -> dict:
         try:
-            p = FinancialPeriod.objects.get(pk=period_id)
+            p = FinancialPeriod.objects.select_related('company').get(pk=period_id)
         except FinancialPeriod.DoesNotExist:
             return {"error": "دوره مالی یافت نشد"}
 
-        # شناسایی مبالغی که رقم آخرشان صفر است
-        round_number_items = []
-        
-        items = DocumentItem.objects.filter(
-            document__period=p
-        ).select_related('document', 'account')
-        
-        for item in items:
-            # بررسی بدهکار
-            if item.debit > 0 and item.debit % 10 == 0:
-                round_number_items.append({
-                    'document_number': item.document.document_number,
-                    'document_date': item.document.document_date,
-                    'account_code': item.account.code,
-                    'account_name': item.account.name,
-                    'amount': float(item.debit),
-                    'type': 'debit',
-                    'description': item.description
-                })
-            
-            # بررسی بستانکار
-            if item.credit > 0 and item.credit % 10 == 0:
-                round_number_items.append({
-                    'document_number': item.document.document_number,
-                    'document_date': item.document.document_date,
-                    'account_code': item.account.code,
-                    'account_name': item.account.name,
-                    'amount': float(item.credit),
-                    'type': 'credit',
-                    'description': item.description
-                })
-        
+        # سهم مبالغ گرد هر سند و شمار مبالغ گرد هر حساب از جدول ریسک (محاسبه‌شده هنگام ورود اطلاعات)
+        scoring = RiskScoringService(p.company, p)
+        round_documents = scoring.documents(order_by='-round_share', round_share__gt=0)
+        for document in round_documents:
+            document['total_amount'] = float(from_minor_units(document['total_amount']))
+            document['max_amount'] = float(from_minor_units(document['max_amount']))
+        round_accounts = [
+            profile for profile in scoring.account_profiles(order_by=('-round_count', '-item_count'))
+            if profile['round_count']
+        ]
+        # آزمون‌های رقمی بنفورد روی تمام مبالغ (برای هر نسخه دفتر کش می‌شود)
+        digits = period_digit_analysis(p.company, p)
+
         return {
             "period_title": str(p),
-            "round_number_items_count": len(round_number_items),
-            "round_number_items": round_number_items
+            "round_unit": RISK_ROUND_UNIT,
+            "round_number_documents_count": scoring.count(round_share__gt=0),
+            "round_number_documents": round_documents,
+            "round_number_accounts": round_accounts,
+            "digit_analysis": digits['summary'],
+            "benford_flagged_item_ids": digits['flagged_item_ids']
         }
 
     async def _arun(self, *args, **kwargs):
@@ -109,52 +109,48 @@ class RoundNumberBiasTool(BaseTool):
 
 class EndOfPeriodRushTool(BaseTool):
     name: str = "end_of_period_rush_detection"
-    description: str = "شناسایی اسنادی که در روزهای پایانی دوره ثبت شده‌اند (End-of-Period Rush)"
+    description: str = (
+        "شناسایی تمرکز ثبت اسناد در روزهای پایانی دوره و ماه‌ها، جمعه‌ها و تعطیلات رسمی (End-of-Period Rush). "
+        "eop_documents_count تعداد کل اسناد پایان دوره است و eop_documents حداکثر eop_documents_limit سند "
+        "جدیدتر را فهرست می‌کند؛ eop_documents_truncated نشان می‌دهد فهرست کوتاه شده است."
+    )
     args_schema: type = FraudDetectionInput
 
     def _run(self, period_id: int) -> dict:
         try:
-            p = FinancialPeriod.objects.get(pk=period_id)
+            p = FinancialPeriod.objects.select_related('company').get(pk=period_id)
         except FinancialPeriod.DoesNotExist:
             return {"error": "دوره مالی یافت نشد"}
 
-        # شناسایی اسناد در هفته پایانی دوره
-        last_week_start = p.end_date - timedelta(days=7)
-        
-        eop_documents = DocumentHeader.objects.filter(
-            period=p,
-            document_date__gte=last_week_start,
-            document_date__lte=p.end_date
-        ).select_related('period').annotate(
-            total_amount=F('total_debit') + F('total_credit')
-        ).values(
-            'document_number',
-            'document_date',
-            'description',
-            'total_debit',
-            'total_credit',
-            'total_amount'
-        ).order_by('-document_date')
-        
-        # محاسبه آمار
-        total_eop_amount = sum([doc['total_amount'] for doc in eop_documents])
-        total_period_amount = DocumentHeader.objects.filter(
-            period=p
-        ).aggregate(
-            total=Sum(F('total_debit') + F('total_credit'))
-        )['total'] or 0
-        
-        eop_percentage = (total_eop_amount / total_period_amount * 100) if total_period_amount > 0 else 0
-        
+        # هیستوگرام روزانه با یک کوئری گروه‌بندی‌شده؛ نتیجه برای هر نسخه دفتر کش می‌شود
+        analysis = rush_analysis(p.company, p)
+        # اسناد پایان دوره از جدول ریسک (نمایه پایان دوره)؛ فهرست به DOCUMENT_LIST_LIMIT سند محدود است
+        eop_documents = RiskScoringService(p.company, p).documents(
+            limit=DOCUMENT_LIST_LIMIT, order_by='-document__date_key', is_end_of_period=True
+        )
+        end_of_period = analysis['end_of_period']
+        last_week_start = p.end_date - timedelta(days=end_of_period['days'])
+
         return {
             "period_title": str(p),
             "last_week_start": last_week_start.isoformat(),
             "period_end": p.end_date.isoformat(),
-            "eop_documents_count": eop_documents.count(),
-            "eop_documents_percentage": round(eop_percentage, 2),
-            "total_eop_amount": float(total_eop_amount),
-            "total_period_amount": float(total_period_amount),
-            "eop_documents": list(eop_documents)
+            "eop_documents_count": end_of_period['documents_count'],
+            "eop_documents_percentage": end_of_period['amount_share'],
+            "eop_concentration_ratio": end_of_period['concentration_ratio'],
+            "total_eop_amount": end_of_period['total_amount'],
+            "total_period_amount": analysis['total_amount'],
+            "eop_documents": [
+                {**document, 'total_amount': float(from_minor_units(document['total_amount'])),
+                 'max_amount': float(from_minor_units(document['max_amount']))}
+                for document in eop_documents
+            ],
+            "eop_documents_limit": DOCUMENT_LIST_LIMIT,
+            "eop_documents_truncated": end_of_period['documents_count'] > len(eop_documents),
+            "month_end": analysis['month_end'],
+            "weekends": analysis['weekends'],
+            "holidays": analysis['holidays'],
+            "peak_days": analysis['peak_days']
         }
 
     async def _arun(self, *args, **kwargs):
@@ -168,41 +164,56 @@ class DuplicateDocumentTool(BaseTool):
 
     def _run(self, period_id: int) -> dict:
         try:
-            p = FinancialPeriod.objects.get(pk=period_id)
+            p = FinancialPeriod.objects.select_related('company').get(pk=period_id)
         except FinancialPeriod.DoesNotExist:
             return {"error": "دوره مالی یافت نشد"}
 
-        # شناسایی شماره اسناد تکراری
+        # شناسایی شماره اسناد تکراری (تمام گروه‌ها با یک کوئری و زیرکوئری شماره‌های تکراری)
         duplicates = DocumentHeader.objects.filter(
             period=p
         ).values('document_number').annotate(
             count=Count('id')
-        ).filter(count__gt=1)
-        
-        duplicate_details = []
-        for dup in duplicates:
-            documents = DocumentHeader.objects.filter(
-                period=p,
-                document_number=dup['document_number']
-            ).values(
-                'id',
-                'document_number',
-                'document_date',
-                'description',
-                'total_debit',
-                'total_credit'
-            )
-            duplicate_details.append({
-                'document_number': dup['document_number'],
-                'count': dup['count'],
-                'documents': list(documents)
-            })
-        
+        ).filter(count__gt=1).values('document_number')
+
+        groups = {}
+        for document in DocumentHeader.objects.filter(
+            period=p,
+            document_number__in=duplicates
+        ).values(
+            'id',
+            'document_number',
+            'document_date',
+            'description',
+            'total_debit',
+            'total_credit'
+        ).order_by('document_number', 'id'):
+            groups.setdefault(document['document_number'], []).append(document)
+
+        duplicate_details = [
+            {'document_number': number, 'count': len(documents), 'documents': documents}
+            for number, documents in groups.items()
+        ]
+
+        # اسناد با آرتیکل‌های یکسان: گروه‌های اثر انگشت جدول ریسک (نمایه اثر انگشت)
+        fingerprint_groups = RiskScoringService(p.company, p).duplicate_groups()
+        for group in fingerprint_groups:
+            for document in group['documents']:
+                document['total_amount'] = float(from_minor_units(document['total_amount']))
+
+        # تکرار آرتیکل‌ها: هم‌حساب و هم‌مبلغ در اسناد مختلف (هم‌روز با شرح یکسان، یا در بازه چند روزه)
+        transactions = duplicate_transactions(p.company, p)
+
         return {
             "period_title": str(p),
             "duplicate_groups_count": len(duplicate_details),
             "duplicate_documents_count": sum([group['count'] for group in duplicate_details]),
-            "duplicate_details": duplicate_details
+            "duplicate_details": duplicate_details,
+            "identical_document_groups_count": len(fingerprint_groups),
+            "identical_document_groups": fingerprint_groups,
+            "exact_duplicate_transactions_count": len(transactions['exact']),
+            "near_duplicate_transactions_count": len(transactions['near']),
+            "exact_duplicate_transactions": transactions['exact'],
+            "near_duplicate_transactions": transactions['near']
         }
 
     async def _arun(self, *args, **kwargs):
@@ -216,39 +227,30 @@ class DescriptionSimilarityTool(BaseTool):
 
     def _run(self, period_id: int) -> dict:
         try:
-            p = FinancialPeriod.objects.get(pk=period_id)
+            p = FinancialPeriod.objects.select_related('company').get(pk=period_id)
         except FinancialPeriod.DoesNotExist:
             return {"error": "دوره مالی یافت نشد"}
 
-        headers = DocumentHeader.objects.filter(
-            period=p
-        ).exclude(
-            Q(description__isnull=True) | Q(description='')
-        ).values('id', 'document_number', 'description')
-        
+        # امضاهای MinHash ذخیره‌شده در جدول ریسک؛ فقط سطل‌های LSH ساخته و جفت‌های نامزد هم‌سطل مقایسه می‌شوند
+        documents = RiskScoringService(p.company, p).description_signatures()
+        numbers = {doc_id: number for doc_id, number, _, _ in documents}
+        index = DescriptionLSHIndex.build(
+            [(doc_id, description) for doc_id, _, description, _ in documents],
+            signatures={doc_id: bytes(signature) for doc_id, _, _, signature in documents}
+        )
+
         similar_pairs = []
-        processed = set()
-        
-        for i, a in enumerate(headers):
-            for b in headers[i+1:]:
-                if a['id'] in processed or b['id'] in processed:
-                    continue
-                    
-                if a['description'] and b['description']:
-                    score = SequenceMatcher(None, a['description'], b['description']).ratio()
-                    if score > 0.9:
-                        similar_pairs.append({
-                            'doc1_id': a['id'],
-                            'doc1_number': a['document_number'],
-                            'doc1_description': a['description'],
-                            'doc2_id': b['id'],
-                            'doc2_number': b['document_number'],
-                            'doc2_description': b['description'],
-                            'similarity_score': round(score, 4)
-                        })
-                        processed.add(a['id'])
-                        processed.add(b['id'])
-        
+        for pair in index.similar_pairs(SIMILARITY_THRESHOLD):
+            similar_pairs.append({
+                'doc1_id': pair['doc1_id'],
+                'doc1_number': numbers[pair['doc1_id']],
+                'doc1_description': index.descriptions[pair['doc1_id']],
+                'doc2_id': pair['doc2_id'],
+                'doc2_number': numbers[pair['doc2_id']],
+                'doc2_description': index.descriptions[pair['doc2_id']],
+                'similarity_score': pair['similarity_score']
+            })
+
         return {
             "period_title": str(p),
             "similar_pairs_count": len(similar_pairs),
@@ -257,3 +259,30 @@ class DescriptionSimilarityTool(BaseTool):
 
     async def _arun(self, *args, **kwargs):
         return self._run(*args, **kwargs)
+
+
+class FraudRiskRankingTool(BaseTool):
+    name: str = "fraud_risk_ranking"
+    description: str = "رتبه‌بندی اسناد و حساب‌ها بر اساس امتیاز ریسک تقلب محاسبه‌شده هنگام ورود اطلاعات"
+    args_schema: type = FraudDetectionInput
+
+    def _run(self, period_id: int) -> dict:
+        try:
+            p = FinancialPeriod.objects.select_related('company').get(pk=period_id)
+        except FinancialPeriod.DoesNotExist:
+            return {"error": "دوره مالی یافت نشد"}
+
+        # جدول ریسک افزایشی است؛ فقط در صورت تغییر دفتر خارج از ورود اطلاعات بازسازی می‌شود
+        scoring = RiskScoringService(p.company, p)
+        summary = scoring.summary()
+        summary['total_amount'] = from_minor_units(summary['total_amount'] or 0)
+
+        return {
+            "period_title": str(p),
+            "summary": summary,
+            "top_documents": scoring.top_documents(),
+            "account_profiles": scoring.account_profiles()
+        }
+
+    async def _arun(self, *args, **kwargs):
+        return self._run(*args, **kwargs)
@@ -22,6 +22,16 @@ urlpatterns = [
     path('api/trial_balance/', views.trial_balance_api, name='trial_balance_api'),
     path('reports/trial_balance/export/', views.export_trial_balance, name='export_trial_balance'),
     
+    # خروجی جریانی دفتر کل و فهرست اسناد
+    path('reports/ledger/export/', views.export_general_ledger, name='export_general_ledger'),
+    path('reports/documents/export/', views.export_documents, name='export_documents'),
+    
+    # دفتر معین/کل با صفحه‌بندی کرسری
+    path('api/ledger/', views.account_ledger_api, name='account_ledger_api'),
+    
+    # جریان زنده تغییرات داشبورد (SSE، اجرای ASGI)
+    path('api/live/', views.live_updates_stream, name='live_updates_stream'),
+    
     # چت بات پیشرفته - سیستم جدید
     # path('advanced-chat/', advanced_chat_interface, name='advanced_chat'),
     # path('api/advanced-chat/', AdvancedFinancialChatView.as_view(), name='advanced_chat_api'),
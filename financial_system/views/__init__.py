@@ -6,11 +6,18 @@
 from .financial_chat import FinancialChatView
 from .advanced_financial_chat import AdvancedFinancialChatView
 from .trial_balance import trial_balance_report, trial_balance_api, export_trial_balance
+from .exports import export_general_ledger, export_documents
+from .ledger import account_ledger_api
+from .live import live_updates_stream
 
 __all__ = [
     'FinancialChatView',
     'AdvancedFinancialChatView',
     'trial_balance_report',
     'trial_balance_api',
-    'export_trial_balance'
+    'export_trial_balance',
+    'export_general_ledger',
+    'export_documents',
+    'account_ledger_api',
+    'live_updates_stream'
 ]
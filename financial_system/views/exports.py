@@ -0,0 +1,71 @@
+# financial_system/views/exports.py
+"""
+خروجی جریانی دفتر کل و فهرست اسناد (CSV و Excel)
+"""
+
+import logging
+
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import redirect
+from django.utils import timezone
+
+from financial_system.services.streaming_export import (
+    DOCUMENT_HEADER, EXPORT_FORMATS, LEDGER_HEADER, document_rows, export_response, ledger_rows
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _export_format(request):
+    """قالب خروجی درخواستی (پیش‌فرض CSV)"""
+    export_format = request.GET.get('format', 'csv').lower()
+    return export_format if export_format in EXPORT_FORMATS else 'csv'
+
+
+@login_required
+def export_general_ledger(request):
+    """خروجی جریانی دفتر کل (قابل فیلتر با پیشوند کد حساب و بازه تاریخ شمسی)"""
+    company_id = request.session.get('current_company_id')
+    period_id = request.session.get('current_period_id')
+
+    if not company_id or not period_id:
+        messages.error(request, 'لطفاً ابتدا شرکت و دوره مالی را انتخاب کنید.')
+        return redirect('financial_system:reports')
+
+    try:
+        rows = ledger_rows(
+            company_id, period_id,
+            account_code=request.GET.get('account'),
+            start_date=request.GET.get('start_date'),
+            end_date=request.GET.get('end_date')
+        )
+        filename = f'general_ledger_{timezone.now().strftime("%Y%m%d_%H%M")}'
+        return export_response(_export_format(request), filename, 'دفتر کل', LEDGER_HEADER, rows)
+
+    except Exception as e:
+        logger.error(f"خطا در خروجی دفتر کل: {e}")
+        messages.error(request, f'خطا در تولید خروجی: {str(e)}')
+        return redirect('financial_system:reports')
+
+
+@login_required
+def export_documents(request):
+    """خروجی جریانی فهرست اسناد دوره"""
+    company_id = request.session.get('current_company_id')
+    period_id = request.session.get('current_period_id')
+
+    if not company_id or not period_id:
+        messages.error(request, 'لطفاً ابتدا شرکت و دوره مالی را انتخاب کنید.')
+        return redirect('financial_system:reports')
+
+    try:
+        filename = f'documents_{timezone.now().strftime("%Y%m%d_%H%M")}'
+        return export_response(
+            _export_format(request), filename, 'فهرست اسناد', DOCUMENT_HEADER, document_rows(company_id, period_id)
+        )
+
+    except Exception as e:
+        logger.error(f"خطا در خروجی فهرست اسناد: {e}")
+        messages.error(request, f'خطا در تولید خروجی: {str(e)}')
+        return redirect('financial_system:reports')
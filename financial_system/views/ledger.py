@@ -0,0 +1,75 @@
+# financial_system/views/ledger.py
+"""
+دفتر معین/کل حساب با مانده جاری و صفحه‌بندی کرسری
+"""
+
+import logging
+
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+
+from financial_system.models.coding_models import ChartOfAccounts
+from financial_system.services.account_ledger import DEFAULT_PAGE_SIZE, AccountLedger
+
+logger = logging.getLogger(__name__)
+
+
+@login_required
+def account_ledger_api(request):
+    """
+    API دفتر حساب: ?account_id=شناسه یا ?account=کد&level=سطح، به همراه subtree=1&cursor=...&start_date=1402/01/01&page_size=100
+    کد حساب فقط همراه سطح یکتاست؛ کدی که در چند سطح وجود دارد بدون سطح خطای 400 می‌دهد.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'متد غیرمجاز'}, status=405)
+
+    company_id = request.session.get('current_company_id')
+    period_id = request.session.get('current_period_id')
+
+    if not company_id or not period_id:
+        return JsonResponse({'error': 'شرکت و دوره مالی انتخاب نشده'}, status=400)
+
+    account_id = request.GET.get('account_id')
+    account_code = request.GET.get('account')
+    if account_id:
+        accounts = ChartOfAccounts.objects.filter(pk=account_id) if account_id.isdigit() else ChartOfAccounts.objects.none()
+    elif account_code:
+        accounts = ChartOfAccounts.objects.filter(code=account_code)
+        if request.GET.get('level'):
+            accounts = accounts.filter(level=request.GET['level'])
+    else:
+        return JsonResponse({'error': 'کد یا شناسه حساب مشخص نشده'}, status=400)
+
+    matches = list(accounts[:2])
+    if not matches:
+        return JsonResponse({'error': f'حساب {account_id or account_code} یافت نشد'}, status=404)
+    if len(matches) > 1:
+        levels = list(accounts.values_list('level', flat=True))
+        return JsonResponse({
+            'error': f'کد حساب {account_code} در چند سطح وجود دارد؛ سطح (level) یا شناسه حساب (account_id) را مشخص کنید',
+            'levels': levels
+        }, status=400)
+    account = matches[0]
+
+    try:
+        page_size = int(request.GET.get('page_size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        page_size = DEFAULT_PAGE_SIZE
+
+    try:
+        ledger = AccountLedger(
+            company_id, period_id, account,
+            include_subtree=request.GET.get('subtree', '1') not in ('0', 'false')
+        )
+        data = ledger.page(
+            cursor=request.GET.get('cursor'),
+            start_date=request.GET.get('start_date'),
+            page_size=page_size
+        )
+        return JsonResponse({'type': 'account_ledger', 'title': f'دفتر حساب {account.name}', 'data': data})
+
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"خطا در API دفتر حساب: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
@@ -0,0 +1,74 @@
+# financial_system/views/live.py
+"""
+جریان زنده داشبورد با server-sent events (نیازمند اجرای ASGI از طریق chatbot/asgi.py)
+"""
+
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+
+from financial_system.services.live_updates import format_event, get_broker
+from financial_system.services.report_cache import get_ledger_version
+
+logger = logging.getLogger(__name__)
+
+# فاصله پیام نگه‌داری اتصال و حداکثر عمر هر جریان (مرورگر پس از آن خودکار دوباره وصل می‌شود)
+LIVE_HEARTBEAT_SECONDS = 15
+LIVE_STREAM_SECONDS = 300
+LIVE_RETRY_MS = 3000
+
+
+def _session_context(request):
+    """کاربر و شرکت/دوره جلسه (دسترسی همگام به جلسه)"""
+    return (
+        request.user.is_authenticated,
+        request.session.get('current_company_id'),
+        request.session.get('current_period_id'),
+    )
+
+
+async def live_updates_stream(request):
+    """جریان SSE تغییرات شرکت و دوره جاری: ledger، import_completed، alerts و resync"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'متد غیرمجاز'}, status=405)
+
+    is_authenticated, company_id, period_id = await sync_to_async(_session_context)(request)
+    if not is_authenticated:
+        return JsonResponse({'error': 'ورود به سیستم لازم است'}, status=401)
+    if not company_id or not period_id:
+        return JsonResponse({'error': 'شرکت و دوره مالی انتخاب نشده'}, status=400)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'جریان زنده فقط در اجرای ASGI در دسترس است'}, status=501)
+
+    response = StreamingHttpResponse(_event_stream(company_id, period_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def _event_stream(company_id: int, period_id: int):
+    """پیام‌های یک مشترک تا پایان عمر جریان"""
+    broker = get_broker()
+    subscription = broker.subscribe(company_id, period_id)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LIVE_STREAM_SECONDS
+    try:
+        yield f'retry: {LIVE_RETRY_MS}\n\n'
+        version = await sync_to_async(get_ledger_version)(company_id, period_id)
+        yield format_event('hello', {'ledger_version': version})
+
+        while loop.time() < deadline:
+            message = await subscription.get(min(LIVE_HEARTBEAT_SECONDS, max(deadline - loop.time(), 0)))
+            if message is None:
+                yield ': ping\n\n'
+                continue
+            yield format_event(message['event'], message['data'], message['id'])
+            if subscription.overflowed:
+                # پیام‌هایی از دست رفته است؛ داشبورد باید داده کامل را دوباره بگیرد
+                subscription.overflowed = False
+                yield format_event('resync', {})
+    finally:
+        broker.unsubscribe(subscription)
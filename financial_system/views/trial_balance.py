@@ -1,16 +1,24 @@
 # financial_system/views/trial_balance.py
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.db.models import Sum, Count, Q
 from django.utils import timezone
 import json
+import logging
 from datetime import datetime
 
+import numpy as np
+
 from users.models import Company, FinancialPeriod
 from financial_system.models.document_models import DocumentItem
 from financial_system.models.coding_models import ChartOfAccounts
+from financial_system.services.account_hierarchy import AccountHierarchy, to_minor_units, from_minor_units
+from financial_system.services.report_cache import ledger_etag
+from financial_system.services.streaming_export import EXPORT_FORMATS, export_response
+
+logger = logging.getLogger(__name__)
 
 @login_required
 def trial_balance_report(request):
@@ -27,6 +35,7 @@ def trial_balance_report(request):
     
     # دریافت پارامترهای فیلتر
     level_filter = request.GET.get('level', 'ALL')
+    max_depth = _parse_depth(request.GET.get('depth'))
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
     
@@ -44,7 +53,7 @@ def trial_balance_report(request):
     # تولید گزارش
     try:
         report_data = _generate_trial_balance_with_filters(
-            company_id, period_id, level_filter, start_date, end_date
+            company_id, period_id, level_filter, start_date, end_date, max_depth
         )
         
         context = {
@@ -54,6 +63,13 @@ def trial_balance_report(request):
             'report_slug': 'trial_balance',
             'report_data': report_data,
             'level_filter': level_filter,
+            'max_depth': max_depth,
+            'depth_options': [
+                {'value': '', 'label': 'همه سطوح درخت'},
+                {'value': 0, 'label': 'فقط حساب‌های کل'},
+                {'value': 1, 'label': 'تا سطح معین'},
+                {'value': 2, 'label': 'تا سطح تفصیلی'},
+            ],
             'start_date': start_date.strftime('%Y-%m-%d') if start_date else '',
             'end_date': end_date.strftime('%Y-%m-%d') if end_date else '',
             'account_levels': [
@@ -74,8 +90,12 @@ def trial_balance_report(request):
         messages.error(request, f'خطا در تولید گزارش: {str(e)}')
         return redirect('financial_system:reports')
 
-def _generate_trial_balance_with_filters(company_id, period_id, level_filter='ALL', start_date=None, end_date=None):
-    """تولید تراز آزمایشی با فیلترهای سطح و تاریخ"""
+def _generate_trial_balance_with_filters(company_id, period_id, level_filter='ALL', start_date=None, end_date=None, max_depth=None):
+    """تولید تراز آزمایشی سلسله مراتبی با فیلترهای سطح، عمق و تاریخ
+
+    گردش حساب‌ها با یک کوئری گروه‌بندی‌شده خوانده می‌شود و سپس به صورت برداری
+    در تمام سطوح (کل، معین، تفصیلی) روی درخت کدینگ تجمیع می‌شود.
+    """
     try:
         # ساخت کوئری پایه
         base_query = DocumentItem.objects.filter(
@@ -89,52 +109,62 @@ def _generate_trial_balance_with_filters(company_id, period_id, level_filter='AL
         if end_date:
             base_query = base_query.filter(document__document_date__lte=end_date)
         
-        # اگر سطح خاصی انتخاب شده، فیلتر سطح حساب
-        if level_filter != 'ALL':
-            base_query = base_query.filter(account__level=level_filter)
-        
-        # جمع‌بندی گردش حساب‌ها
-        account_turnover = base_query.values(
-            'account__code',
-            'account__name',
-            'account__level'
-        ).annotate(
+        # جمع‌بندی گردش حساب‌ها در سطح حساب ثبت‌شده
+        account_turnover = list(base_query.values('account_id').annotate(
             total_debit=Sum('debit'),
             total_credit=Sum('credit'),
             transaction_count=Count('id')
-        ).order_by('account__code')
+        ).order_by())
+        
+        # تجمیع گردش به تمام اجداد هر حساب
+        hierarchy = AccountHierarchy()
+        account_ids = [row['account_id'] for row in account_turnover]
+        debits = to_minor_units([row['total_debit'] for row in account_turnover])
+        credits = to_minor_units([row['total_credit'] for row in account_turnover])
+        counts = np.array([row['transaction_count'] for row in account_turnover], dtype=np.int64)
+        rolled_debit, rolled_credit, rolled_count = hierarchy.rollup(account_ids, debits, credits, counts)
+        
+        # انتخاب گره‌های قابل نمایش (باز و بسته کردن بر اساس سطح و عمق)
+        visible = rolled_count > 0
+        if level_filter != 'ALL':
+            visible &= hierarchy.levels == level_filter
+        if max_depth is not None:
+            visible &= hierarchy.depths <= max_depth
         
         # محاسبه مانده هر حساب
         accounts_data = []
-        total_debit = 0
-        total_credit = 0
         
-        for account in account_turnover:
-            debit = account['total_debit'] or 0
-            credit = account['total_credit'] or 0
+        for position in hierarchy.tree_order:
+            if not visible[position]:
+                continue
+            
+            debit = from_minor_units(rolled_debit[position])
+            credit = from_minor_units(rolled_credit[position])
             balance = debit - credit
             
             # تعیین نوع مانده
             balance_type = 'بدهکار' if balance > 0 else 'بستانکار' if balance < 0 else 'صفر'
             
+            node = hierarchy.node(position)
             accounts_data.append({
-                'account_code': account['account__code'],
-                'account_name': account['account__name'] or 'بدون نام',
-                'account_level': account['account__level'],
-                'account_level_display': _get_level_display(account['account__level']),
+                **node,
+                'account_name': node['account_name'] or 'بدون نام',
+                'account_level_display': _get_level_display(node['account_level']),
+                'is_expandable': node['has_children'] and (max_depth is None or node['depth'] < max_depth),
                 'debit': debit,
                 'credit': credit,
                 'balance': abs(balance),
                 'balance_type': balance_type,
-                'transaction_count': account['transaction_count'],
+                'transaction_count': int(rolled_count[position]),
                 'formatted_debit': f"{debit:,.0f} ریال",
                 'formatted_credit': f"{credit:,.0f} ریال",
                 'formatted_balance': f"{abs(balance):,.0f} ریال",
                 'balance_display': f"{abs(balance):,.0f} ریال ({balance_type})"
             })
-            
-            total_debit += debit
-            total_credit += credit
+        
+        # جمع کل از گردش مستقیم حساب‌ها گرفته می‌شود تا سطوح تجمیعی دوبار شمرده نشوند
+        total_debit = from_minor_units(debits.sum())
+        total_credit = from_minor_units(credits.sum())
         
         # محاسبه مانده کل
         total_balance = total_debit - total_credit
@@ -159,6 +189,7 @@ def _generate_trial_balance_with_filters(company_id, period_id, level_filter='AL
             },
             'filters': {
                 'level_filter': level_filter,
+                'max_depth': max_depth,
                 'start_date': start_date,
                 'end_date': end_date,
                 'level_filter_display': _get_level_display(level_filter) if level_filter != 'ALL' else 'همه سطوح'
@@ -180,6 +211,14 @@ def _generate_trial_balance_with_filters(company_id, period_id, level_filter='AL
             'data': {'error': f'خطا در تولید گزارش: {str(e)}'}
         }
 
+def _parse_depth(value):
+    """خواندن عمق نمایش درخت از پارامتر درخواست (خالی یعنی همه سطوح)"""
+    try:
+        depth = int(value)
+    except (TypeError, ValueError):
+        return None
+    return depth if depth >= 0 else None
+
 def _get_level_display(level_code):
     """نمایش فارسی سطح حساب"""
     level_map = {
@@ -223,6 +262,7 @@ def _calculate_level_statistics(accounts_data):
     return level_stats
 
 @login_required
+@ledger_etag('trial_balance')
 def trial_balance_api(request):
     """API برای دریافت تراز آزمایشی"""
     if request.method == 'GET':
@@ -235,6 +275,7 @@ def trial_balance_api(request):
             
             # دریافت پارامترهای فیلتر
             level_filter = request.GET.get('level', 'ALL')
+            max_depth = _parse_depth(request.GET.get('depth'))
             start_date = request.GET.get('start_date')
             end_date = request.GET.get('end_date')
             
@@ -250,7 +291,7 @@ def trial_balance_api(request):
             
             # تولید گزارش
             report_data = _generate_trial_balance_with_filters(
-                company_id, period_id, level_filter, start_date, end_date
+                company_id, period_id, level_filter, start_date, end_date, max_depth
             )
             
             return JsonResponse(report_data)
@@ -273,20 +314,38 @@ def export_trial_balance(request):
     
     # دریافت پارامترهای فیلتر
     level_filter = request.GET.get('level', 'ALL')
+    max_depth = _parse_depth(request.GET.get('depth'))
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
     
     try:
         # تولید گزارش
         report_data = _generate_trial_balance_with_filters(
-            company_id, period_id, level_filter, start_date, end_date
+            company_id, period_id, level_filter, start_date, end_date, max_depth
         )
         
-        # در اینجا می‌توانید خروجی Excel یا PDF تولید کنید
-        # فعلاً فقط JSON برمی‌گردانیم
-        response = JsonResponse(report_data)
-        response['Content-Disposition'] = f'attachment; filename="trial_balance_{timezone.now().strftime("%Y%m%d_%H%M")}.json"'
-        return response
+        filename = f'trial_balance_{timezone.now().strftime("%Y%m%d_%H%M")}'
+        export_format = request.GET.get('format', 'xlsx').lower()
+        
+        if 'error' in report_data['data']:
+            raise ValueError(report_data['data']['error'])
+        
+        # خروجی JSON برای سازگاری با نسخه قبلی
+        if export_format not in EXPORT_FORMATS:
+            response = JsonResponse(report_data)
+            response['Content-Disposition'] = f'attachment; filename="{filename}.json"'
+            return response
+        
+        header = ['کد حساب', 'نام حساب', 'سطح', 'بدهکار', 'بستانکار', 'مانده', 'نوع مانده', 'تعداد آرتیکل']
+        rows = (
+            [
+                account['account_code'], account['account_name'], account['account_level_display'],
+                account['debit'], account['credit'], account['balance'], account['balance_type'],
+                account['transaction_count']
+            ]
+            for account in report_data['data']['accounts']
+        )
+        return export_response(export_format, filename, 'تراز آزمایشی', header, rows)
         
     except Exception as e:
         logger.error(f"خطا در خروجی تراز آزمایشی: {e}")